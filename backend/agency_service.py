@@ -4,8 +4,10 @@ Enables agencies to resell with sub-accounts and custom branding
 """
 
 import os
+import uuid
+import calendar
 import stripe
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Dict, Optional, List, Any
 from enum import Enum
 import hashlib
@@ -15,6 +17,9 @@ STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY", "")
 if STRIPE_SECRET_KEY:
     stripe.api_key = STRIPE_SECRET_KEY
 
+AGENCY_DB_ENABLED = bool(os.getenv("DATABASE_URL"))
+AGENCY_PAGE_SIZE_MAX = 200
+
 
 class AgencyTier(Enum):
     STARTER = "starter"       # Up to 5 sub-accounts
@@ -278,6 +283,184 @@ class AgencyManager:
         }
 
 
+# Agency analytics from the hourly call rollups
+
+# Sort keys accepted by the agency analytics endpoint -> per_client column
+AGENCY_SORT_COLUMNS = {
+    "calls": "calls",
+    "minutes": "talk_seconds",
+    "bookings": "booked",
+    "revenue": "client_monthly_price",
+    "client_name": "client_name",
+}
+
+# One round-trip: per-client sums over call_metrics_hourly (one GROUP BY over
+# every sub-account's buckets), the agency totals row, and the requested page
+_AGENCY_ANALYTICS_SQL = """
+    WITH per_client AS (
+        SELECT s.id AS sub_account_id, s.business_id, s.client_name, s.status, s.client_monthly_price,
+               COALESCE(sum(r.calls), 0) AS calls,
+               COALESCE(sum(r.booked), 0) AS booked,
+               COALESCE(sum(r.duration_seconds), 0) AS talk_seconds
+        FROM sub_accounts s
+        LEFT JOIN call_metrics_hourly r
+            ON r.business_id = s.business_id AND r.hour_bucket >= $2 AND r.hour_bucket < $3
+        WHERE s.agency_id = $1
+        GROUP BY s.id
+    ),
+    page AS (
+        SELECT *, row_number() OVER (ORDER BY {column} {direction}, sub_account_id) AS position
+        FROM per_client
+        ORDER BY position
+        LIMIT $4 OFFSET $5
+    )
+    SELECT 'total' AS kind, 0::bigint AS position, a.name AS agency_name, a.tier,
+           NULL::uuid AS sub_account_id, NULL::uuid AS business_id, NULL AS client_name, NULL AS status,
+           count(p.sub_account_id) AS clients,
+           count(p.sub_account_id) FILTER (WHERE p.status = 'active') AS active_clients,
+           COALESCE(sum(p.client_monthly_price) FILTER (WHERE p.status = 'active'), 0) AS client_monthly_price,
+           COALESCE(sum(p.calls), 0) AS calls,
+           COALESCE(sum(p.booked), 0) AS booked,
+           COALESCE(sum(p.talk_seconds), 0) AS talk_seconds
+    FROM agencies a
+    LEFT JOIN per_client p ON true
+    WHERE a.id = $1
+    GROUP BY a.name, a.tier
+    UNION ALL
+    SELECT 'client', position, NULL, NULL, sub_account_id, business_id, client_name, status,
+           1, (status = 'active')::int, client_monthly_price, calls, booked, talk_seconds
+    FROM page
+    ORDER BY position
+"""
+
+
+def agency_analytics_sql(sort: str = "calls", order: str = "desc") -> str:
+    """The agency analytics query for a whitelisted sort key; raises ValueError"""
+    if sort not in AGENCY_SORT_COLUMNS:
+        raise ValueError(f"sort must be one of {', '.join(AGENCY_SORT_COLUMNS)}")
+    if order not in ("asc", "desc"):
+        raise ValueError("order must be asc or desc")
+    return _AGENCY_ANALYTICS_SQL.format(column=AGENCY_SORT_COLUMNS[sort], direction=order.upper())
+
+
+def billing_period(now: Optional[datetime] = None) -> tuple:
+    """Start and end of the calendar month containing now (naive UTC)"""
+    now = now or datetime.utcnow()
+    start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return start, start + timedelta(days=calendar.monthrange(now.year, now.month)[1])
+
+
+def agency_analytics_from_rows(
+    rows: List[Dict],
+    now: datetime,
+    page: int = 1,
+    page_size: int = 50,
+    sort: str = "calls",
+    order: str = "desc"
+) -> Optional[Dict]:
+    """
+    Build the agency analytics response from the totals row and page of client
+    rows returned by the agency analytics query. Minutes are projected to the
+    end of the billing month at the month-to-date rate; projected overage is
+    shared between clients by their projected minutes.
+    """
+    totals = next((row for row in rows if row["kind"] == "total"), None)
+    if totals is None:
+        return None
+    tier = AGENCY_TIERS[AgencyTier(totals["tier"] or AgencyTier.STARTER.value)]
+    period_start, period_end = billing_period(now)
+    elapsed = max((now - period_start) / (period_end - period_start), 1 / 24 / 31)  # At least an hour in
+
+    included = tier["included_minutes"]
+    rate = tier["per_minute_overage"]
+    minutes = float(totals["talk_seconds"]) / 60
+    projected = minutes / elapsed
+    overage_amount = max(0, minutes - included) * rate
+    projected_overage = max(0, projected - included) * rate
+    monthly_revenue = float(totals["client_monthly_price"])
+
+    clients = []
+    for row in rows:
+        if row["kind"] != "client":
+            continue
+        client_minutes = float(row["talk_seconds"]) / 60
+        client_projected = client_minutes / elapsed
+        clients.append({
+            "sub_account_id": str(row["sub_account_id"]),
+            "business_id": str(row["business_id"]),
+            "client_name": row["client_name"],
+            "status": row["status"],
+            "monthly_price": float(row["client_monthly_price"] or 0),
+            "calls": int(row["calls"]),
+            "minutes": round(client_minutes, 2),
+            "bookings": int(row["booked"]),
+            "projected_minutes": round(client_projected, 2),
+            "projected_overage_share": round(projected_overage * client_projected / projected, 2) if projected else 0
+        })
+
+    return {
+        "agency_name": totals["agency_name"],
+        "tier": totals["tier"],
+        "period": {"start": period_start.isoformat(), "end": period_end.isoformat()},
+        "sub_accounts": {
+            "total": int(totals["clients"]),
+            "active": int(totals["active_clients"]),
+            "limit": tier["max_sub_accounts"]
+        },
+        "usage": {
+            "total_calls": int(totals["calls"]),
+            "total_minutes": round(minutes, 2),
+            "total_bookings": int(totals["booked"]),
+            "included_minutes": included,
+            "remaining_minutes": max(0, round(included - minutes, 2)),
+            "projected_minutes": round(projected, 2)
+        },
+        "financials": {
+            "monthly_revenue": monthly_revenue,
+            "platform_cost": tier["monthly_price"],
+            "overage_amount": round(overage_amount, 2),
+            "projected_overage_amount": round(projected_overage, 2),
+            "net_profit": round(monthly_revenue - tier["monthly_price"] - overage_amount, 2)
+        },
+        "clients": clients,
+        "pagination": {
+            "page": page,
+            "page_size": page_size,
+            "total": int(totals["clients"]),
+            "sort": sort,
+            "order": order
+        }
+    }
+
+
+async def fetch_agency_analytics(
+    agency_id: str,
+    page: int = 1,
+    page_size: int = 50,
+    sort: str = "calls",
+    order: str = "desc"
+) -> Optional[Dict]:
+    """Month-to-date agency analytics with a page of per-client rows (None if no such agency)"""
+    query = agency_analytics_sql(sort, order)
+    page = max(1, page)
+    page_size = min(max(1, page_size), AGENCY_PAGE_SIZE_MAX)
+    now = datetime.utcnow()
+    period_start, period_end = billing_period(now)
+
+    from database_postgres import get_connection
+
+    async with get_connection() as conn:
+        rows = await conn.fetch(
+            query,
+            uuid.UUID(agency_id),
+            period_start.replace(tzinfo=timezone.utc),
+            period_end.replace(tzinfo=timezone.utc),
+            page_size,
+            (page - 1) * page_size
+        )
+    return agency_analytics_from_rows([dict(row) for row in rows], now, page, page_size, sort, order)
+
+
 # Stripe integration for agency billing
 async def create_agency_subscription(
     agency: Agency,
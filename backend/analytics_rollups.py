@@ -0,0 +1,551 @@
+"""
+Analytics Rollups for CallBot AI
+Hourly per-business call metrics maintained as calls are ingested
+"""
+
+import os
+import uuid
+import asyncio
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from analytics_sketches import HyperLogLog, TDigest
+
+ROLLUP_REPAIR_INTERVAL = int(os.getenv("ROLLUP_REPAIR_INTERVAL", "900"))  # seconds
+ROLLUP_REPAIR_WINDOW_HOURS = int(os.getenv("ROLLUP_REPAIR_WINDOW_HOURS", "48"))
+ROLLUP_REPAIR_CHUNK_HOURS = int(os.getenv("ROLLUP_REPAIR_CHUNK_HOURS", "168"))  # most hours one transaction rebuilds
+
+# Talk-time histogram: bucket 0 is "not talked", bucket i holds
+# DURATION_BOUNDS[i-1] <= duration < DURATION_BOUNDS[i], the last is open
+DURATION_BOUNDS = [1, 15, 30, 60, 120, 300, 600, 1200]
+HISTOGRAM_SIZE = len(DURATION_BOUNDS) + 1
+OPEN_BUCKET_CEILING = 3600  # Upper edge assumed for the open bucket when interpolating
+
+# GROUPING(day, hour, dow) bit masks: a set bit means the column is rolled up
+GROUPING_TOTAL = 0b111
+GROUPING_DAY = 0b011
+GROUPING_HOUR = 0b101
+GROUPING_DOW = 0b110
+
+HOUR = 3600
+DAY = 86400
+WEEK = 7 * DAY
+
+# Chart series bucket sizes, smallest first (month width is nominal, for sizing only)
+SERIES_BUCKETS = {"hour": HOUR, "day": DAY, "week": WEEK, "month": 30 * DAY}
+
+
+def duration_bucket(duration: int) -> int:
+    return bisect_right(DURATION_BOUNDS, duration) if duration > 0 else 0
+
+
+def hour_bucket(created_at: datetime) -> datetime:
+    """UTC hour containing a timestamp (naive values are taken as UTC)"""
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def bucket_floor(seconds, bucket: str) -> np.ndarray:
+    """Start (epoch seconds) of the hour/day/week/month bucket containing each timestamp"""
+    seconds = np.asarray(seconds, dtype=np.int64)
+    if bucket == "month":
+        return seconds.astype("datetime64[s]").astype("datetime64[M]").astype("datetime64[s]").astype(np.int64)
+    if bucket == "week":
+        # Weeks start on Monday; 1970-01-01 was a Thursday
+        days = seconds // DAY
+        return (days - (days + 3) % 7) * DAY
+    return seconds - seconds % SERIES_BUCKETS[bucket]
+
+
+def bucket_range(start: int, end: int, bucket: str) -> np.ndarray:
+    """Every bucket start from the bucket containing start through the one containing end"""
+    first, last = bucket_floor([start, end], bucket)
+    if bucket == "month":
+        months = np.arange(
+            np.datetime64(int(first), "s").astype("datetime64[M]"),
+            np.datetime64(int(last), "s").astype("datetime64[M]") + 1
+        )
+        return months.astype("datetime64[s]").astype(np.int64)
+    return np.arange(first, last + 1, SERIES_BUCKETS[bucket], dtype=np.int64)
+
+
+def call_delta(duration: Optional[int], status: Optional[str], booked: Optional[bool]) -> Dict:
+    """One call's contribution to its hourly rollup (same rules as the dashboard)"""
+    duration = duration or 0
+    histogram = [0] * HISTOGRAM_SIZE
+    histogram[duration_bucket(duration)] = 1
+    return {
+        "calls": 1,
+        "answered": int(status == "completed" or duration > 0),
+        "missed": int(status == "missed" or duration == 0),
+        "talked": int(duration > 0),
+        "booked": int(bool(booked)),
+        "duration_seconds": duration,
+        "duration_histogram": histogram
+    }
+
+
+def histogram_percentile(histogram, q: float) -> float:
+    """
+    Percentile of talk time (calls with duration > 0) from a histogram,
+    interpolating linearly inside the bucket that holds it.
+    """
+    talked = np.asarray(histogram[1:], dtype=np.float64)
+    total = talked.sum()
+    if not total:
+        return 0
+    lower = np.array(DURATION_BOUNDS, dtype=np.float64)
+    upper = np.append(lower[1:], OPEN_BUCKET_CEILING)
+
+    rank = q * total
+    cumulative = np.cumsum(talked)
+    i = int(np.searchsorted(cumulative, rank, side="left"))
+    i = min(i, len(talked) - 1)
+    before = cumulative[i] - talked[i]
+    fraction = (rank - before) / talked[i] if talked[i] else 0
+    return float(lower[i] + fraction * (upper[i] - lower[i]))
+
+
+def merge_rollup_sketches(rows: List[Dict]) -> Tuple[Optional[TDigest], Optional[HyperLogLog]]:
+    """
+    Merge the duration digests and caller sketches of any set of buckets (a
+    time range, or several businesses). A sketch comes back as None when some
+    bucket predates sketches and has not been repaired yet.
+    """
+    digests, callers = [], HyperLogLog()
+    complete = True
+    for row in rows:
+        if row.get("caller_hll") is None:
+            complete = False
+            continue
+        callers.merge(HyperLogLog.from_bytes(row["caller_hll"]))
+        digests.append(TDigest.from_bytes(row.get("duration_digest")))
+    if not complete:
+        return None, None
+    return TDigest.merged(digests), callers
+
+
+def rollup_aggregate_rows(rows: List[Dict], bucket: str = "day") -> List[Dict]:
+    """
+    Turn hourly rollup rows into the totals / per-series-bucket / per-hour /
+    per-weekday rows the dashboard is built from. Series rows (GROUPING_DAY)
+    carry the start of their hour, day, week or month bucket in "day". Work
+    is proportional to the number of buckets, not calls.
+    """
+    rows = [row for row in rows if row["calls"]]
+    if not rows:
+        return []
+
+    seconds = np.array([int(hour_bucket(row["hour_bucket"]).timestamp()) for row in rows], dtype=np.int64)
+    columns = {
+        name: np.array([row[name] for row in rows], dtype=np.int64)
+        for name in ("calls", "answered", "missed", "talked", "booked", "duration_seconds")
+    }
+    histograms = np.array([row["duration_histogram"] for row in rows], dtype=np.int64)
+
+    total_histogram = histograms.sum(axis=0)
+    digest, callers = merge_rollup_sketches(rows)
+    talked = columns["talked"].any()
+    if digest is not None:
+        p50, p90 = digest.quantile(0.5), digest.quantile(0.9)
+    else:
+        p50, p90 = histogram_percentile(total_histogram, 0.5), histogram_percentile(total_histogram, 0.9)
+    result = [{
+        "grouping": GROUPING_TOTAL, "day": None, "hour": None, "dow": None,
+        "total": int(columns["calls"].sum()),
+        "answered": int(columns["answered"].sum()),
+        "missed": int(columns["missed"].sum()),
+        "talked": int(columns["talked"].sum()),
+        "talk_seconds": int(columns["duration_seconds"].sum()),
+        "booked": int(columns["booked"].sum()),
+        "p50": p50 if talked else None,
+        "p90": p90 if talked else None,
+        "unique_callers": callers.count() if callers is not None else None
+    }]
+
+    bucket_starts, day_index = np.unique(bucket_floor(seconds, bucket), return_inverse=True)
+    day_calls = np.bincount(day_index, weights=columns["calls"])
+    day_booked = np.bincount(day_index, weights=columns["booked"])
+    day_seconds = np.bincount(day_index, weights=columns["duration_seconds"])
+    for i, start in enumerate(bucket_starts):
+        result.append({
+            "grouping": GROUPING_DAY,
+            "day": datetime(1970, 1, 1) + timedelta(seconds=int(start)),
+            "hour": None, "dow": None,
+            "total": int(day_calls[i]),
+            "booked": int(day_booked[i]),
+            "talk_seconds": int(day_seconds[i])
+        })
+
+    hour_calls = np.bincount((seconds // HOUR) % 24, weights=columns["calls"], minlength=24)
+    for hour in np.flatnonzero(hour_calls):
+        result.append({"grouping": GROUPING_HOUR, "day": None, "hour": int(hour), "dow": None,
+                       "total": int(hour_calls[hour])})
+
+    # 1970-01-01 was a Thursday (ISO weekday 4)
+    dow_calls = np.bincount((seconds // DAY + 3) % 7, weights=columns["calls"], minlength=7)
+    for dow in np.flatnonzero(dow_calls):
+        result.append({"grouping": GROUPING_DOW, "day": None, "hour": None, "dow": int(dow) + 1,
+                       "total": int(dow_calls[dow])})
+    return result
+
+
+# =============================================================================
+# SQL
+# =============================================================================
+
+INSERT_CALL_SQL = """
+    INSERT INTO calls (business_id, vapi_call_id, caller_phone, duration, summary, created_at)
+    VALUES ($1, $2, $3, $4, $5, $6)
+    ON CONFLICT (vapi_call_id) DO NOTHING
+    RETURNING id, created_at, duration, status, appointment_booked
+"""
+
+UPSERT_ROLLUP_SQL = """
+    INSERT INTO call_metrics_hourly (
+        business_id, hour_bucket, calls, answered, missed, talked, booked,
+        duration_seconds, duration_histogram, updated_at
+    )
+    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, NOW())
+    ON CONFLICT (business_id, hour_bucket) DO UPDATE SET
+        calls = call_metrics_hourly.calls + EXCLUDED.calls,
+        answered = call_metrics_hourly.answered + EXCLUDED.answered,
+        missed = call_metrics_hourly.missed + EXCLUDED.missed,
+        talked = call_metrics_hourly.talked + EXCLUDED.talked,
+        booked = call_metrics_hourly.booked + EXCLUDED.booked,
+        duration_seconds = call_metrics_hourly.duration_seconds + EXCLUDED.duration_seconds,
+        duration_histogram = ARRAY(
+            SELECT a + b
+            FROM unnest(call_metrics_hourly.duration_histogram, EXCLUDED.duration_histogram)
+                WITH ORDINALITY AS h(a, b, i)
+            ORDER BY i
+        ),
+        updated_at = NOW()
+    RETURNING duration_digest, caller_hll
+"""
+
+SELECT_ROLLUPS_SQL = """
+    SELECT hour_bucket, calls, answered, missed, talked, booked, duration_seconds, duration_histogram,
+           duration_digest, caller_hll
+    FROM call_metrics_hourly
+    WHERE business_id = $1 AND hour_bucket >= $2 AND hour_bucket <= $3
+    ORDER BY hour_bucket
+"""
+
+# Totals for several labelled windows in one scan. Windows may overlap (e.g.
+# last 30 days vs. the same range a week earlier), so buckets are joined to
+# every window containing them rather than labelled with a CASE.
+SELECT_PERIOD_ROLLUPS_SQL = """
+    SELECT p.period,
+           COALESCE(sum(r.calls), 0) AS total,
+           COALESCE(sum(r.answered), 0) AS answered,
+           COALESCE(sum(r.missed), 0) AS missed,
+           COALESCE(sum(r.talked), 0) AS talked,
+           COALESCE(sum(r.booked), 0) AS booked,
+           COALESCE(sum(r.duration_seconds), 0) AS talk_seconds
+    FROM unnest($2::text[], $3::timestamptz[], $4::timestamptz[]) AS p(period, period_start, period_end)
+    LEFT JOIN call_metrics_hourly r
+        ON r.business_id = $1 AND r.hour_bucket >= p.period_start AND r.hour_bucket < p.period_end
+    GROUP BY p.period
+"""
+
+
+def _histogram_sql(column: str = "duration") -> str:
+    edges = [0] + DURATION_BOUNDS
+    buckets = [f"count(*) FILTER (WHERE {column} <= 0)"]
+    for low, high in zip(edges[1:], edges[2:]):
+        buckets.append(f"count(*) FILTER (WHERE {column} >= {low} AND {column} < {high})")
+    buckets.append(f"count(*) FILTER (WHERE {column} >= {edges[-1]})")
+    return "ARRAY[" + ", ".join(buckets) + "]::int[]"
+
+
+# Recompute one business's buckets in [$1, $3) from raw calls, replacing what
+# is there and dropping buckets whose calls were deleted
+REPAIR_ROLLUPS_SQL = f"""
+    WITH fresh AS (
+        SELECT
+            business_id,
+            date_trunc('hour', created_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS hour_bucket,
+            count(*) AS calls,
+            count(*) FILTER (WHERE status = 'completed' OR duration > 0) AS answered,
+            count(*) FILTER (WHERE status = 'missed' OR duration = 0) AS missed,
+            count(*) FILTER (WHERE duration > 0) AS talked,
+            count(*) FILTER (WHERE booked) AS booked,
+            COALESCE(sum(duration), 0) AS duration_seconds,
+            {_histogram_sql()} AS duration_histogram
+        FROM (
+            SELECT business_id, created_at, status,
+                   COALESCE(duration, 0) AS duration,
+                   COALESCE(appointment_booked, false) AS booked
+            FROM calls
+            WHERE business_id = $2 AND created_at >= $1 AND created_at < $3
+        ) c
+        GROUP BY 1, 2
+    ),
+    upserted AS (
+        INSERT INTO call_metrics_hourly (
+            business_id, hour_bucket, calls, answered, missed, talked, booked,
+            duration_seconds, duration_histogram, updated_at
+        )
+        SELECT business_id, hour_bucket, calls, answered, missed, talked, booked,
+               duration_seconds, duration_histogram, NOW()
+        FROM fresh
+        ON CONFLICT (business_id, hour_bucket) DO UPDATE SET
+            calls = EXCLUDED.calls,
+            answered = EXCLUDED.answered,
+            missed = EXCLUDED.missed,
+            talked = EXCLUDED.talked,
+            booked = EXCLUDED.booked,
+            duration_seconds = EXCLUDED.duration_seconds,
+            duration_histogram = EXCLUDED.duration_histogram,
+            updated_at = NOW()
+        WHERE (call_metrics_hourly.calls, call_metrics_hourly.answered, call_metrics_hourly.missed,
+               call_metrics_hourly.talked, call_metrics_hourly.booked,
+               call_metrics_hourly.duration_seconds, call_metrics_hourly.duration_histogram)
+           IS DISTINCT FROM (EXCLUDED.calls, EXCLUDED.answered, EXCLUDED.missed,
+                             EXCLUDED.talked, EXCLUDED.booked,
+                             EXCLUDED.duration_seconds, EXCLUDED.duration_histogram)
+           OR call_metrics_hourly.caller_hll IS NULL
+        RETURNING business_id, hour_bucket
+    ),
+    removed AS (
+        DELETE FROM call_metrics_hourly r
+        WHERE r.business_id = $2 AND r.hour_bucket >= $1 AND r.hour_bucket < $3
+          AND NOT EXISTS (
+              SELECT 1 FROM fresh f
+              WHERE f.business_id = r.business_id AND f.hour_bucket = r.hour_bucket
+          )
+        RETURNING r.business_id, r.hour_bucket
+    ),
+    bumped AS (
+        INSERT INTO call_metrics_versions (business_id, version)
+        SELECT DISTINCT business_id, 1 FROM (
+            SELECT business_id FROM upserted UNION ALL SELECT business_id FROM removed
+        ) changed
+        ON CONFLICT (business_id) DO UPDATE
+        SET version = call_metrics_versions.version + 1, updated_at = NOW()
+    )
+    SELECT business_id, hour_bucket, false AS removed FROM upserted
+    UNION ALL
+    SELECT business_id, hour_bucket, true AS removed FROM removed
+"""
+
+# Businesses with calls or buckets in [$1, $2), i.e. everything a repair might touch
+REPAIR_BUSINESSES_SQL = """
+    SELECT business_id FROM calls WHERE created_at >= $1 AND created_at < $2
+    UNION
+    SELECT business_id FROM call_metrics_hourly WHERE hour_bucket >= $1 AND hour_bucket < $2
+"""
+
+# Per-business transaction-scoped advisory locks: ingests share the lock, a
+# repair takes it exclusively, so a recount never overwrites an increment and
+# only the business being repaired waits
+ROLLUP_LOCK_SQL = "SELECT pg_advisory_xact_lock(hashtext('call_metrics_hourly:' || $1::text))"
+ROLLUP_SHARED_LOCK_SQL = "SELECT pg_advisory_xact_lock_shared(hashtext('call_metrics_hourly:' || $1::text))"
+
+# Raw calls of the given buckets, for rebuilding their sketches
+SELECT_BUCKET_CALLS_SQL = """
+    SELECT c.business_id, b.hour_bucket, COALESCE(c.duration, 0) AS duration, c.caller_phone
+    FROM unnest($1::uuid[], $2::timestamptz[]) AS b(business_id, hour_bucket)
+    JOIN calls c
+      ON c.business_id = b.business_id
+     AND c.created_at >= b.hour_bucket
+     AND c.created_at < b.hour_bucket + interval '1 hour'
+"""
+
+UPDATE_SKETCHES_SQL = """
+    UPDATE call_metrics_hourly
+    SET duration_digest = $3, caller_hll = $4
+    WHERE business_id = $1 AND hour_bucket = $2
+"""
+
+# Bumped in the same transaction as every rollup change so cached analytics
+# responses keyed on it go stale exactly when the numbers do
+BUMP_VERSION_SQL = """
+    INSERT INTO call_metrics_versions (business_id, version)
+    VALUES ($1, 1)
+    ON CONFLICT (business_id) DO UPDATE
+    SET version = call_metrics_versions.version + 1, updated_at = NOW()
+    RETURNING version
+"""
+
+SELECT_VERSION_SQL = "SELECT version FROM call_metrics_versions WHERE business_id = $1"
+
+
+# =============================================================================
+# Database operations
+# =============================================================================
+
+async def apply_call(conn, business_id, created_at: datetime, duration: Optional[int],
+                     status: Optional[str] = "completed", booked: Optional[bool] = False,
+                     caller: Optional[str] = None):
+    """
+    Add one call to its hourly bucket (run inside the transaction that stored
+    the call). The upsert locks the bucket row, so the sketch read-modify-write
+    below cannot interleave with another ingest, and the shared advisory lock
+    keeps it from interleaving with a repair of the same business.
+    """
+    bid = business_id if isinstance(business_id, uuid.UUID) else uuid.UUID(str(business_id))
+    bucket = hour_bucket(created_at)
+    delta = call_delta(duration, status, booked)
+    await conn.execute(ROLLUP_SHARED_LOCK_SQL, bid)
+    row = await conn.fetchrow(
+        UPSERT_ROLLUP_SQL,
+        bid,
+        bucket,
+        delta["calls"], delta["answered"], delta["missed"], delta["talked"], delta["booked"],
+        delta["duration_seconds"], delta["duration_histogram"]
+    )
+
+    digest = TDigest.from_bytes(row["duration_digest"] if row else None)
+    callers = HyperLogLog.from_bytes(row["caller_hll"] if row else None)
+    if delta["talked"]:
+        digest.add(delta["duration_seconds"])
+    callers.add(caller)
+    await conn.execute(UPDATE_SKETCHES_SQL, bid, bucket, digest.to_bytes(), callers.to_bytes())
+    await conn.fetchval(BUMP_VERSION_SQL, bid)
+
+
+async def rebuild_sketches(conn, buckets: List[Tuple[uuid.UUID, datetime]]):
+    """Recompute the digest and distinct-caller sketch of each bucket from raw calls"""
+    if not buckets:
+        return
+    sketches = {key: (TDigest(), HyperLogLog()) for key in buckets}
+    rows = await conn.fetch(
+        SELECT_BUCKET_CALLS_SQL, [b for b, _ in buckets], [h for _, h in buckets]
+    )
+    for row in rows:
+        digest, callers = sketches[(row["business_id"], row["hour_bucket"])]
+        if row["duration"] > 0:
+            digest.add(row["duration"])
+        callers.add(row["caller_phone"])
+    await conn.executemany(UPDATE_SKETCHES_SQL, [
+        (business_id, bucket, digest.to_bytes(), callers.to_bytes())
+        for (business_id, bucket), (digest, callers) in sketches.items()
+    ])
+
+
+async def fetch_rollup_version(conn, business_id: str) -> int:
+    return await conn.fetchval(SELECT_VERSION_SQL, uuid.UUID(business_id)) or 0
+
+
+async def record_end_of_call(
+    conn,
+    business_id,
+    vapi_call_id: Optional[str],
+    caller_phone: Optional[str],
+    duration: Optional[int],
+    summary: str = "",
+    created_at: Optional[datetime] = None
+) -> Optional[str]:
+    """
+    Store a call from an end-of-call report and update its rollup atomically.
+    Returns the new call id, or None when the report was already recorded.
+    """
+    created_at = created_at or datetime.now(timezone.utc)
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+
+    async with conn.transaction():
+        row = await conn.fetchrow(
+            INSERT_CALL_SQL,
+            business_id if isinstance(business_id, uuid.UUID) else uuid.UUID(str(business_id)),
+            vapi_call_id, caller_phone, int(duration or 0), summary, created_at
+        )
+        if row is None:
+            return None  # Duplicate delivery of the same report
+        await apply_call(
+            conn, business_id, row["created_at"], row["duration"],
+            row["status"], row["appointment_booked"], caller_phone
+        )
+    return str(row["id"])
+
+
+async def repair_rollups(conn, since: datetime, business_id: Optional[str] = None,
+                         until: Optional[datetime] = None) -> int:
+    """
+    Rebuild buckets from raw calls created in [since, until) (catches late,
+    duplicated or edited calls). Returns the number of buckets changed.
+
+    Each business is rebuilt in its own transaction, at most
+    ROLLUP_REPAIR_CHUNK_HOURS at a time, holding that business's advisory
+    lock exclusively, so concurrent ingests for it wait until the rebuild
+    commits and an increment is never overwritten by a stale recount.
+    Ingests for other businesses don't wait.
+    """
+    since = hour_bucket(since)
+    until = hour_bucket(until or datetime.now(timezone.utc)) + timedelta(hours=1)
+    if business_id:
+        businesses = [uuid.UUID(business_id)]
+    else:
+        businesses = [row["business_id"] for row in await conn.fetch(REPAIR_BUSINESSES_SQL, since, until)]
+
+    changed = 0
+    for bid in businesses:
+        start = since
+        while start < until:
+            end = min(start + timedelta(hours=ROLLUP_REPAIR_CHUNK_HOURS), until)
+            async with conn.transaction():
+                await conn.execute(ROLLUP_LOCK_SQL, bid)
+                rows = await conn.fetch(REPAIR_ROLLUPS_SQL, start, bid, end)
+                await rebuild_sketches(conn, [
+                    (row["business_id"], row["hour_bucket"]) for row in rows if not row["removed"]
+                ])
+            changed += len(rows)
+            start = end
+    return changed
+
+
+async def fetch_rollups(conn, business_id: str, start_date: datetime, end_date: datetime) -> List[Dict]:
+    rows = await conn.fetch(
+        SELECT_ROLLUPS_SQL,
+        uuid.UUID(business_id),
+        hour_bucket(start_date),
+        end_date.replace(tzinfo=timezone.utc) if end_date.tzinfo is None else end_date
+    )
+    return [dict(row) for row in rows]
+
+
+def _utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+async def fetch_period_rollups(conn, business_id: str,
+                               windows: List[Tuple[str, datetime, datetime]]) -> Dict[str, Dict]:
+    """Rollup totals keyed by period label for each (label, start, end) window"""
+    rows = await conn.fetch(
+        SELECT_PERIOD_ROLLUPS_SQL,
+        uuid.UUID(business_id),
+        [label for label, _, _ in windows],
+        [hour_bucket(start) for _, start, _ in windows],
+        [_utc(end) for _, _, end in windows]
+    )
+    return {row["period"]: dict(row) for row in rows}
+
+
+async def repair_loop(acquire, interval: int = ROLLUP_REPAIR_INTERVAL,
+                      window_hours: int = ROLLUP_REPAIR_WINDOW_HOURS):
+    """
+    Repair recent buckets at startup and then every `interval` seconds.
+    `acquire` is an async context manager factory yielding a connection
+    (e.g. pool.acquire). An empty rollup table is backfilled from the
+    oldest call.
+    """
+    while True:
+        try:
+            async with acquire() as conn:
+                since = datetime.now(timezone.utc) - timedelta(hours=window_hours)
+                if not await conn.fetchval("SELECT EXISTS (SELECT 1 FROM call_metrics_hourly)"):
+                    since = await conn.fetchval("SELECT min(created_at) FROM calls") or since
+                changed = await repair_rollups(conn, since)
+                if changed:
+                    print(f"Rollup repair: {changed} hourly buckets corrected")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Rollup repair failed: {e}")
+        await asyncio.sleep(interval)
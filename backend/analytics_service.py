@@ -3,11 +3,31 @@ Advanced Analytics Service for CallBot AI
 ROI metrics, conversion tracking, and business intelligence
 """
 
-from datetime import datetime, timedelta
-from typing import Dict, Optional, List, Any
+import os
+import re
+import time
+import calendar
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, List, Any, Tuple, Union
 from enum import Enum
-from collections import defaultdict
-import statistics
+
+import numpy as np
+
+from analytics_rollups import (
+    GROUPING_TOTAL, GROUPING_DAY, GROUPING_HOUR, GROUPING_DOW, SERIES_BUCKETS,
+    bucket_floor, bucket_range, fetch_period_rollups, fetch_rollup_version, fetch_rollups, rollup_aggregate_rows
+)
+
+ANALYTICS_DB_ENABLED = bool(os.getenv("DATABASE_URL"))
+ANALYTICS_VERSION_CHECK_SECONDS = float(os.getenv("ANALYTICS_VERSION_CHECK_SECONDS", "2"))
+CHART_TARGET_POINTS = int(os.getenv("CHART_TARGET_POINTS", "60"))  # Max points per chart series
+
+SECONDS_PER_DAY = 86400
+UNIX_EPOCH = datetime(1970, 1, 1)
+NAN = float("nan")
+WEEKDAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+SERIES_LABEL_UNITS = {"hour": "m", "day": "D", "week": "D", "month": "M"}  # datetime_as_string units
 
 
 class TimeRange(Enum):
@@ -57,13 +77,182 @@ def get_date_range(time_range: TimeRange, custom_start: datetime = None, custom_
     return today - timedelta(days=30), now
 
 
+# How far back the comparison window sits: "previous" is the window of the
+# same length immediately before the current one
+COMPARISON_OFFSETS = ("previous", "week", "month", "year")
+
+
+def shift_months(value: datetime, months: int) -> datetime:
+    """Move a datetime by whole calendar months, clamping the day (Mar 31 - 1 month = Feb 28)"""
+    month_index = value.year * 12 + value.month - 1 + months
+    year, month = divmod(month_index, 12)
+    day = min(value.day, calendar.monthrange(year, month + 1)[1])
+    return value.replace(year=year, month=month + 1, day=day)
+
+
+def comparison_windows(start_date: datetime, end_date: datetime, offset: str = "previous") -> List[Tuple[str, datetime, datetime]]:
+    """(label, start, end) for the current window and the one it is compared against"""
+    if offset == "previous":
+        shift = lambda d: d - (end_date - start_date)
+    elif offset == "week":
+        shift = lambda d: d - timedelta(days=7)
+    elif offset == "month":
+        shift = lambda d: shift_months(d, -1)
+    elif offset == "year":
+        shift = lambda d: shift_months(d, -12)
+    else:
+        raise ValueError(f"Unknown comparison offset: {offset}")
+    return [("current", start_date, end_date), ("previous", shift(start_date), shift(end_date))]
+
+
+def _to_utc_naive(value: Any) -> Optional[datetime]:
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _epoch_seconds(value: datetime) -> int:
+    return int(_to_utc_naive(value).replace(tzinfo=timezone.utc).timestamp())
+
+
+def chart_bucket(start_date: datetime, end_date: datetime, target_points: int = CHART_TARGET_POINTS) -> str:
+    """Smallest series bucket (hour, day, week, month) that keeps a range within target_points"""
+    span = max(_epoch_seconds(end_date) - _epoch_seconds(start_date), 0)
+    for bucket, width in SERIES_BUCKETS.items():
+        if span // width + 1 <= target_points:
+            return bucket
+    return "month"
+
+
+def bucket_series(
+    seconds: np.ndarray,
+    columns: Dict[str, np.ndarray],
+    start_date: datetime,
+    end_date: datetime,
+    bucket: str
+) -> Tuple[List[str], Dict[str, np.ndarray]]:
+    """
+    Sum each column into every bucket between start_date and end_date, empty
+    buckets included. Timestamps outside the range are dropped.
+    """
+    starts = bucket_range(_epoch_seconds(start_date), _epoch_seconds(end_date), bucket)
+    floors = bucket_floor(seconds, bucket)
+    index = np.searchsorted(starts, floors)
+    inside = index < len(starts)
+    inside[inside] = starts[index[inside]] == floors[inside]
+    sums = {
+        name: np.bincount(index[inside], weights=np.asarray(values, dtype=np.float64)[inside], minlength=len(starts))
+        for name, values in columns.items()
+    }
+    labels = np.datetime_as_string(starts.astype("datetime64[s]"), unit=SERIES_LABEL_UNITS[bucket]).tolist()
+    return labels, sums
+
+
+class CallFrame:
+    """
+    Columnar view of a batch of calls for vectorized analytics.
+
+    Built once from call dicts (or DB records); every metric, histogram and
+    daily series is then computed with NumPy operations over these arrays.
+    Naive timestamps are treated as UTC.
+    """
+
+    STATUS_CODES = {"completed": 1, "missed": 2}  # anything else is 0
+
+    __slots__ = ("duration", "created_at", "has_time", "booked", "status", "caller")
+
+    def __init__(self, duration: np.ndarray, created_at: np.ndarray, has_time: np.ndarray,
+                 booked: np.ndarray, status: np.ndarray, caller: Optional[np.ndarray] = None):
+        self.duration = duration      # float64 seconds
+        self.created_at = created_at  # int64 epoch seconds (0 where has_time is False)
+        self.has_time = has_time      # bool
+        self.booked = booked          # bool
+        self.status = status          # int8 status code
+        self.caller = np.zeros(len(duration), dtype=np.int64) if caller is None else caller  # int64 hash, 0 = unknown
+
+    @classmethod
+    def from_calls(cls, calls: List[Dict]) -> "CallFrame":
+        status_codes = cls.STATUS_CODES
+        duration = np.array([c.get("duration") or 0 for c in calls], dtype=np.float64)
+        booked = np.array([bool(c.get("appointment_booked")) for c in calls], dtype=bool)
+        status = np.array([status_codes.get(c.get("status"), 0) for c in calls], dtype=np.int8)
+        caller = np.array([hash(c.get("caller_phone") or 0) for c in calls], dtype=np.int64)
+
+        created = [c.get("created_at") for c in calls]
+        try:
+            seconds = [(value - UNIX_EPOCH).total_seconds() if value is not None else NAN for value in created]
+        except TypeError:
+            # Aware datetimes or ISO strings: normalize to naive UTC and retry
+            created = [_to_utc_naive(value) for value in created]
+            seconds = [(value - UNIX_EPOCH).total_seconds() if value is not None else NAN for value in created]
+
+        seconds = np.array(seconds, dtype=np.float64)
+        has_time = ~np.isnan(seconds)
+        created_at = np.where(has_time, seconds, 0).astype(np.int64)
+        return cls(duration, created_at, has_time, booked, status, caller)
+
+    @classmethod
+    def of(cls, calls: Union["CallFrame", List[Dict], None]) -> "CallFrame":
+        """Accept either a frame or a list of call dicts"""
+        if isinstance(calls, CallFrame):
+            return calls
+        return cls.from_calls(calls or [])
+
+    def __len__(self) -> int:
+        return len(self.duration)
+
+    def select(self, mask: np.ndarray) -> "CallFrame":
+        return CallFrame(self.duration[mask], self.created_at[mask], self.has_time[mask],
+                         self.booked[mask], self.status[mask], self.caller[mask])
+
+    def between(self, start: datetime, end: datetime) -> "CallFrame":
+        """Calls with start <= created_at <= end (calls without a timestamp are dropped)"""
+        lo = int(_to_utc_naive(start).replace(tzinfo=timezone.utc).timestamp())
+        hi = int(_to_utc_naive(end).replace(tzinfo=timezone.utc).timestamp())
+        return self.select(self.has_time & (self.created_at >= lo) & (self.created_at <= hi))
+
+    @property
+    def timed(self) -> np.ndarray:
+        """Epoch seconds of calls that have a timestamp"""
+        return self.created_at[self.has_time]
+
+
 class CallAnalytics:
     """Analytics calculations for calls"""
 
     @staticmethod
-    def calculate_metrics(calls: List[Dict]) -> Dict:
+    def calculate_metrics(calls: Union[CallFrame, List[Dict]]) -> Dict:
         """Calculate comprehensive call metrics"""
-        if not calls:
+        frame = CallFrame.of(calls)
+        duration = frame.duration
+        talked = duration > 0
+        return CallAnalytics.format_metrics(
+            total=len(frame),
+            answered=int(np.count_nonzero((frame.status == 1) | talked)),
+            missed=int(np.count_nonzero((frame.status == 2) | (duration == 0))),
+            talked=int(np.count_nonzero(talked)),
+            talk_seconds=float(duration[talked].sum()),
+            appointments=int(np.count_nonzero(frame.booked))
+        )
+
+    @staticmethod
+    def format_metrics(
+        total: int,
+        answered: int,
+        missed: int,
+        talked: int,
+        talk_seconds: float,
+        appointments: int
+    ) -> Dict:
+        """Build the call metrics dict from counts (shared by in-memory and SQL paths)"""
+        if not total:
             return {
                 "total_calls": 0,
                 "answered_calls": 0,
@@ -75,15 +264,8 @@ class CallAnalytics:
                 "conversion_rate": 0
             }
 
-        total = len(calls)
-        answered = sum(1 for c in calls if c.get("status") == "completed" or c.get("duration", 0) > 0)
-        missed = sum(1 for c in calls if c.get("status") == "missed" or c.get("duration", 0) == 0)
-
-        durations = [c.get("duration", 0) for c in calls if c.get("duration", 0) > 0]
-        total_duration = sum(durations)
-        avg_duration = statistics.mean(durations) if durations else 0
-
-        appointments = sum(1 for c in calls if c.get("appointment_booked", False))
+        total_duration = talk_seconds
+        avg_duration = total_duration / talked if talked else 0
 
         return {
             "total_calls": total,
@@ -97,25 +279,33 @@ class CallAnalytics:
         }
 
     @staticmethod
-    def calculate_hourly_distribution(calls: List[Dict]) -> Dict[int, int]:
+    def calculate_hourly_distribution(calls: Union[CallFrame, List[Dict]]) -> Dict[int, int]:
         """Calculate call distribution by hour"""
-        distribution = defaultdict(int)
-        for call in calls:
-            if call.get("created_at"):
-                hour = call["created_at"].hour if isinstance(call["created_at"], datetime) else 0
-                distribution[hour] += 1
-        return dict(distribution)
+        counts = np.bincount((CallFrame.of(calls).timed // 3600) % 24, minlength=24)
+        return {int(hour): int(counts[hour]) for hour in np.flatnonzero(counts)}
+
+    @staticmethod
+    def duration_percentiles(calls: Union[CallFrame, List[Dict]]) -> Dict[str, float]:
+        """Median and p90 talk time (linear interpolation, same as percentile_cont)"""
+        duration = CallFrame.of(calls).duration
+        talked = duration[duration > 0]
+        if not len(talked):
+            return {"p50": 0, "p90": 0}
+        p50, p90 = np.percentile(talked, [50, 90])
+        return {"p50": round(float(p50), 2), "p90": round(float(p90), 2)}
+
+    @staticmethod
+    def count_unique_callers(calls: Union[CallFrame, List[Dict]]) -> int:
+        """Exact number of distinct caller numbers"""
+        caller = CallFrame.of(calls).caller
+        return len(np.unique(caller[caller != 0]))
 
     @staticmethod
-    def calculate_daily_distribution(calls: List[Dict]) -> Dict[str, int]:
+    def calculate_daily_distribution(calls: Union[CallFrame, List[Dict]]) -> Dict[str, int]:
         """Calculate call distribution by day of week"""
-        days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-        distribution = defaultdict(int)
-        for call in calls:
-            if call.get("created_at"):
-                day = call["created_at"].weekday() if isinstance(call["created_at"], datetime) else 0
-                distribution[days[day]] += 1
-        return dict(distribution)
+        # 1970-01-01 was a Thursday (weekday 3)
+        counts = np.bincount((CallFrame.of(calls).timed // SECONDS_PER_DAY + 3) % 7, minlength=7)
+        return {WEEKDAY_NAMES[day]: int(counts[day]) for day in np.flatnonzero(counts)}
 
 
 class ROIAnalytics:
@@ -133,21 +323,36 @@ class ROIAnalytics:
 
     def calculate_roi(
         self,
-        calls: List[Dict],
+        calls: Union[CallFrame, List[Dict]],
         appointments: List[Dict],
         closed_deals: int = 0,
         revenue_generated: float = 0
     ) -> Dict:
         """Calculate comprehensive ROI metrics"""
 
-        # Call stats
-        total_calls = len(calls)
-        answered = sum(1 for c in calls if c.get("duration", 0) > 0)
-        total_minutes = sum(c.get("duration", 0) for c in calls) / 60
-
-        # Appointment stats
-        total_appointments = len(appointments)
-        confirmed_appointments = sum(1 for a in appointments if a.get("status") == "confirmed")
+        frame = CallFrame.of(calls)
+        return self.roi_from_totals(
+            total_calls=len(frame),
+            answered=int(np.count_nonzero(frame.duration > 0)),
+            total_seconds=float(frame.duration.sum()),
+            total_appointments=len(appointments),
+            confirmed_appointments=sum(1 for a in appointments if a.get("status") == "confirmed"),
+            closed_deals=closed_deals,
+            revenue_generated=revenue_generated
+        )
+
+    def roi_from_totals(
+        self,
+        total_calls: int,
+        answered: int,
+        total_seconds: float,
+        total_appointments: int,
+        confirmed_appointments: int,
+        closed_deals: int = 0,
+        revenue_generated: float = 0
+    ) -> Dict:
+        """Build ROI metrics from aggregate totals (shared by in-memory and SQL paths)"""
+        total_minutes = total_seconds / 60
 
         # Calculate estimated values
         estimated_lead_value = total_calls * self.avg_lead_value * 0.3  # 30% of calls are quality leads
@@ -235,6 +440,78 @@ class ROIAnalytics:
         }
 
 
+class CompiledLeadRules:
+    """
+    A business's lead scoring rules with every keyword signal compiled into
+    one case-insensitive regex, so a transcript is scored in a single pass.
+    Each signal is a named group inside an optional lookahead, so matching
+    consumes no text: keywords of different signals that overlap ("insurance
+    quote" and "quote") are all found.
+    """
+
+    __slots__ = ("signals", "pattern", "_groups", "duration_thresholds", "appointment_points", "callback_points")
+
+    def __init__(
+        self,
+        signals: Dict[str, Dict],
+        duration_thresholds: List[Tuple[int, int]],
+        appointment_points: int,
+        callback_points: int
+    ):
+        self.signals = {
+            name: {"keywords": [k.lower() for k in rule.get("keywords", []) if k.strip()], "points": int(rule.get("points", 0))}
+            for name, rule in signals.items()
+        }
+        self.duration_thresholds = sorted(((int(t), int(p)) for t, p in duration_thresholds), reverse=True)
+        self.appointment_points = appointment_points
+        self.callback_points = callback_points
+
+        self._groups = {}
+        alternatives, lookaheads = [], []
+        for i, (name, rule) in enumerate(self.signals.items()):
+            if not rule["keywords"]:
+                continue
+            group = f"s{i}"
+            self._groups[group] = name
+            keywords = "|".join(re.escape(k) for k in sorted(set(rule["keywords"]), key=len, reverse=True))
+            alternatives.append(keywords)
+            lookaheads.append(f"(?:(?=(?P<{group}>{keywords})))?")
+        # Substring matching, as the per-keyword `in` scans did. The leading
+        # lookahead only lets a match start where some keyword does
+        self.pattern = re.compile(
+            "(?=" + "|".join(alternatives) + ")" + "".join(lookaheads), re.IGNORECASE
+        ) if alternatives else None
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict] = None) -> "CompiledLeadRules":
+        """Defaults from LeadScoring.SCORING_RULES, overridden by a business's config"""
+        config = config or {}
+        rules = LeadScoring.SCORING_RULES
+        signals = {
+            name: {"keywords": list(keywords), "points": rules[name]["value"]}
+            for name, keywords in LeadScoring.DEFAULT_KEYWORDS.items()
+        }
+        for name, rule in (config.get("signals") or {}).items():
+            signals[name] = {**signals.get(name, {"keywords": [], "points": 0}), **rule}
+        return cls(
+            signals,
+            config.get("duration_thresholds") or rules["call_duration"]["thresholds"],
+            int(config.get("appointment_booked", rules["appointment_booked"]["value"])),
+            int(config.get("callback_requested", rules["callback_requested"]["value"]))
+        )
+
+    def match_signals(self, transcript: str) -> set:
+        """Names of the keyword signals present in a transcript"""
+        found = set()
+        if not transcript or self.pattern is None:
+            return found
+        for match in self.pattern.finditer(transcript):
+            found.update(self._groups[group] for group, text in match.groupdict().items() if text is not None)
+            if len(found) == len(self._groups):
+                break
+        return found
+
+
 class LeadScoring:
     """Lead scoring based on call interactions"""
 
@@ -271,16 +548,30 @@ class LeadScoring:
         }
     }
 
+    DEFAULT_KEYWORDS = {
+        "pricing_discussed": ["price", "cost", "how much", "fee", "rate", "quote"],
+        "urgency_expressed": ["urgent", "asap", "emergency", "today", "right away", "immediately"]
+    }
+
+    _default_rules: Optional[CompiledLeadRules] = None
+
+    @classmethod
+    def default_rules(cls) -> CompiledLeadRules:
+        if cls._default_rules is None:
+            cls._default_rules = CompiledLeadRules.from_config()
+        return cls._default_rules
+
     @classmethod
-    def score_lead(cls, call_data: Dict) -> Dict:
+    def score_lead(cls, call_data: Dict, rules: Optional[CompiledLeadRules] = None) -> Dict:
         """Score a lead based on call data"""
+        rules = rules or cls.default_rules()
         score = 0
         breakdown = {}
 
         # Duration score
-        duration = call_data.get("duration", 0)
+        duration = call_data.get("duration") or 0
         duration_score = 0
-        for threshold, points in cls.SCORING_RULES["call_duration"]["thresholds"]:
+        for threshold, points in rules.duration_thresholds:
             if duration >= threshold:
                 duration_score = points
                 break
@@ -289,32 +580,19 @@ class LeadScoring:
 
         # Appointment booked
         if call_data.get("appointment_booked"):
-            points = cls.SCORING_RULES["appointment_booked"]["value"]
-            score += points
-            breakdown["appointment_booked"] = points
+            score += rules.appointment_points
+            breakdown["appointment_booked"] = rules.appointment_points
 
         # Callback requested
         if call_data.get("callback_requested"):
-            points = cls.SCORING_RULES["callback_requested"]["value"]
-            score += points
-            breakdown["callback_requested"] = points
-
-        # Analyze transcript for signals
-        transcript = call_data.get("transcript", "").lower()
+            score += rules.callback_points
+            breakdown["callback_requested"] = rules.callback_points
 
-        # Pricing discussed
-        pricing_keywords = ["price", "cost", "how much", "fee", "rate", "quote"]
-        if any(kw in transcript for kw in pricing_keywords):
-            points = cls.SCORING_RULES["pricing_discussed"]["value"]
+        # Transcript signals (pricing, urgency, and any business-specific ones)
+        for name in rules.match_signals(call_data.get("transcript") or ""):
+            points = rules.signals[name]["points"]
             score += points
-            breakdown["pricing_discussed"] = points
-
-        # Urgency signals
-        urgency_keywords = ["urgent", "asap", "emergency", "today", "right away", "immediately"]
-        if any(kw in transcript for kw in urgency_keywords):
-            points = cls.SCORING_RULES["urgency_expressed"]["value"]
-            score += points
-            breakdown["urgency_expressed"] = points
+            breakdown[name] = points
 
         # Determine grade
         if score >= 80:
@@ -347,20 +625,39 @@ class DashboardMetrics:
 
     @staticmethod
     def generate_overview(
-        calls: List[Dict],
+        calls: Union[CallFrame, List[Dict]],
         appointments: List[Dict],
         time_range: TimeRange = TimeRange.LAST_30_DAYS
     ) -> Dict:
         """Generate overview metrics for dashboard"""
+        frame = CallFrame.of(calls)
+        statuses = [a.get("status") for a in appointments]
+        appointment_counts = {
+            status: statuses.count(status)
+            for status in ("pending", "confirmed", "completed", "cancelled")
+        }
+        appointment_counts["total"] = len(appointments)
 
-        call_metrics = CallAnalytics.calculate_metrics(calls)
+        return DashboardMetrics.overview_from_metrics(
+            CallAnalytics.calculate_metrics(frame),
+            CallAnalytics.duration_percentiles(frame),
+            appointment_counts,
+            time_range,
+            unique_callers=CallAnalytics.count_unique_callers(frame)
+        )
 
-        # Appointment metrics
-        total_appointments = len(appointments)
-        pending = sum(1 for a in appointments if a.get("status") == "pending")
-        confirmed = sum(1 for a in appointments if a.get("status") == "confirmed")
-        completed = sum(1 for a in appointments if a.get("status") == "completed")
-        cancelled = sum(1 for a in appointments if a.get("status") == "cancelled")
+    @staticmethod
+    def overview_from_metrics(
+        call_metrics: Dict,
+        percentiles: Dict[str, float],
+        appointment_counts: Dict[str, int],
+        time_range: TimeRange = TimeRange.LAST_30_DAYS,
+        unique_callers: Optional[int] = None
+    ) -> Dict:
+        """Build the overview from call metrics and appointment status counts"""
+        total_appointments = appointment_counts.get("total", 0)
+        completed = appointment_counts.get("completed", 0)
+        cancelled = appointment_counts.get("cancelled", 0)
 
         return {
             "calls": {
@@ -368,12 +665,15 @@ class DashboardMetrics:
                 "answered": call_metrics["answered_calls"],
                 "missed": call_metrics["missed_calls"],
                 "answer_rate": call_metrics["answer_rate"],
-                "avg_duration": call_metrics["avg_call_duration_seconds"]
+                "avg_duration": call_metrics["avg_call_duration_seconds"],
+                "median_duration": percentiles["p50"],
+                "p90_duration": percentiles["p90"],
+                "unique_callers": unique_callers
             },
             "appointments": {
                 "total": total_appointments,
-                "pending": pending,
-                "confirmed": confirmed,
+                "pending": appointment_counts.get("pending", 0),
+                "confirmed": appointment_counts.get("confirmed", 0),
                 "completed": completed,
                 "cancelled": cancelled,
                 "show_rate": round((completed / (completed + cancelled) * 100) if (completed + cancelled) > 0 else 0, 2)
@@ -386,34 +686,67 @@ class DashboardMetrics:
         }
 
     @staticmethod
-    def generate_chart_data(calls: List[Dict], days: int = 30) -> Dict:
-        """Generate data for charts"""
-
-        # Daily call counts
-        daily_calls = defaultdict(int)
-        daily_appointments = defaultdict(int)
-        daily_duration = defaultdict(int)
-
-        for call in calls:
-            if call.get("created_at"):
-                date_key = call["created_at"].strftime("%Y-%m-%d") if isinstance(call["created_at"], datetime) else str(call["created_at"])[:10]
-                daily_calls[date_key] += 1
-                daily_duration[date_key] += call.get("duration", 0)
-                if call.get("appointment_booked"):
-                    daily_appointments[date_key] += 1
-
-        # Sort by date
-        dates = sorted(daily_calls.keys())
+    def generate_chart_data(
+        calls: Union[CallFrame, List[Dict]],
+        days: int = 30,
+        start_date: datetime = None,
+        end_date: datetime = None,
+        bucket: str = None
+    ) -> Dict:
+        """
+        Generate data for charts. With a date range the series bucket is sized
+        from it (see chart_bucket) and gaps are filled; without one the series
+        is daily over the span of the calls.
+        """
+        frame = CallFrame.of(calls)
+        timed = frame.timed
+        if start_date is None or end_date is None:
+            bucket = bucket or "day"
+            if len(timed):
+                start_date = UNIX_EPOCH + timedelta(seconds=int(timed.min()))
+                end_date = UNIX_EPOCH + timedelta(seconds=int(timed.max()))
+        else:
+            bucket = bucket or chart_bucket(start_date, end_date)
+
+        labels, series = [], {}
+        if start_date is not None:
+            labels, series = bucket_series(timed, {
+                "calls": np.ones(len(timed)),
+                "appointments": frame.booked[frame.has_time],
+                "duration": frame.duration[frame.has_time]
+            }, start_date, end_date, bucket)
+
+        return DashboardMetrics.chart_from_series(
+            labels,
+            series["calls"].astype(np.int64).tolist() if labels else [],
+            series["appointments"].astype(np.int64).tolist() if labels else [],
+            series["duration"].tolist() if labels else [],
+            CallAnalytics.calculate_hourly_distribution(frame),
+            CallAnalytics.calculate_daily_distribution(frame),
+            bucket
+        )
 
+    @staticmethod
+    def chart_from_series(
+        labels: List[str],
+        calls: List[int],
+        appointments: List[int],
+        duration_seconds: List[float],
+        hourly: Dict[int, int],
+        daily: Dict[str, int],
+        bucket: str = "day"
+    ) -> Dict:
+        """Build chart data from bucketed series and histograms"""
         return {
-            "labels": dates,
+            "bucket": bucket,
+            "labels": labels,
             "datasets": {
-                "calls": [daily_calls[d] for d in dates],
-                "appointments": [daily_appointments[d] for d in dates],
-                "duration_minutes": [round(daily_duration[d] / 60, 2) for d in dates]
+                "calls": calls,
+                "appointments": appointments,
+                "duration_minutes": [round(seconds / 60, 2) for seconds in duration_seconds]
             },
-            "hourly_distribution": CallAnalytics.calculate_hourly_distribution(calls),
-            "daily_distribution": CallAnalytics.calculate_daily_distribution(calls)
+            "hourly_distribution": hourly,
+            "daily_distribution": daily
         }
 
     @staticmethod
@@ -446,26 +779,294 @@ class DashboardMetrics:
 
 
 # Export functions for easy use
+def _dashboard_payload(overview: Dict, charts: Dict, roi: Dict, time_range: str,
+                       start_date: datetime, end_date: datetime) -> Dict:
+    return {
+        "overview": overview,
+        "charts": charts,
+        "roi": roi,
+        "time_range": {
+            "label": time_range,
+            "start": start_date.isoformat(),
+            "end": end_date.isoformat()
+        }
+    }
+
+
 def get_analytics_dashboard(calls: List[Dict], appointments: List[Dict], time_range: str = "last_30_days") -> Dict:
     """Get complete analytics dashboard data"""
     tr = TimeRange(time_range)
     start_date, end_date = get_date_range(tr)
 
-    # Filter data by date range
-    filtered_calls = [c for c in calls if c.get("created_at") and start_date <= c["created_at"] <= end_date] if calls else []
+    # Filter data by date range (calls are converted to columns once)
+    filtered_calls = CallFrame.of(calls).between(start_date, end_date)
     filtered_appointments = [a for a in appointments if a.get("created_at") and start_date <= a["created_at"] <= end_date] if appointments else []
 
     overview = DashboardMetrics.generate_overview(filtered_calls, filtered_appointments, tr)
-    charts = DashboardMetrics.generate_chart_data(filtered_calls)
+    charts = DashboardMetrics.generate_chart_data(filtered_calls, start_date=start_date, end_date=end_date)
     roi = ROIAnalytics().calculate_roi(filtered_calls, filtered_appointments)
 
+    return _dashboard_payload(overview, charts, roi, time_range, start_date, end_date)
+
+
+APPOINTMENT_AGGREGATES_SQL = """
+    SELECT
+        count(*) AS total,
+        count(*) FILTER (WHERE status = 'pending') AS pending,
+        count(*) FILTER (WHERE status = 'confirmed') AS confirmed,
+        count(*) FILTER (WHERE status = 'completed') AS completed,
+        count(*) FILTER (WHERE status = 'cancelled') AS cancelled
+    FROM appointments
+    WHERE business_id = $1 AND created_at >= $2 AND created_at <= $3
+"""
+
+
+def dashboard_from_aggregates(
+    call_rows: List[Dict],
+    appointment_row: Optional[Dict],
+    time_range: str = "last_30_days",
+    start_date: datetime = None,
+    end_date: datetime = None,
+    bucket: str = None
+) -> Dict:
+    """
+    Build the dashboard from rollup aggregate rows (see
+    analytics_rollups.rollup_aggregate_rows) and an APPOINTMENT_AGGREGATES_SQL
+    row. The result has the same shape as get_analytics_dashboard.
+    """
+    tr = TimeRange(time_range)
+    if start_date is None or end_date is None:
+        start_date, end_date = get_date_range(tr)
+    bucket = bucket or chart_bucket(start_date, end_date)
+
+    totals = {}
+    days, hours, weekdays = [], [], []
+    for row in call_rows:
+        grouping = row["grouping"]
+        if grouping == GROUPING_TOTAL:
+            totals = row
+        elif grouping == GROUPING_DAY:
+            days.append(row)
+        elif grouping == GROUPING_HOUR:
+            hours.append(row)
+        elif grouping == GROUPING_DOW:
+            weekdays.append(row)
+    days.sort(key=lambda r: r["day"])
+    hours.sort(key=lambda r: r["hour"])
+    weekdays.sort(key=lambda r: r["dow"])
+
+    total = totals.get("total", 0)
+    answered = totals.get("answered", 0)
+    talk_seconds = float(totals.get("talk_seconds") or 0)
+    call_metrics = CallAnalytics.format_metrics(
+        total=total,
+        answered=answered,
+        missed=totals.get("missed", 0),
+        talked=totals.get("talked", 0),
+        talk_seconds=talk_seconds,
+        appointments=totals.get("booked", 0)
+    )
+    percentiles = {
+        "p50": round(float(totals.get("p50") or 0), 2),
+        "p90": round(float(totals.get("p90") or 0), 2)
+    }
+    appointment_counts = dict(appointment_row or {})
+    appointment_counts.setdefault("total", 0)
+
+    overview = DashboardMetrics.overview_from_metrics(
+        call_metrics, percentiles, appointment_counts, tr, unique_callers=totals.get("unique_callers") if totals else 0
+    )
+    labels, series = bucket_series(
+        np.array([_epoch_seconds(row["day"]) for row in days], dtype=np.int64),
+        {
+            "calls": [row["total"] for row in days],
+            "appointments": [row["booked"] for row in days],
+            "duration": [float(row["talk_seconds"]) for row in days]
+        },
+        start_date, end_date, bucket
+    )
+    charts = DashboardMetrics.chart_from_series(
+        labels,
+        series["calls"].astype(np.int64).tolist(),
+        series["appointments"].astype(np.int64).tolist(),
+        series["duration"].tolist(),
+        {row["hour"]: row["total"] for row in hours},
+        {WEEKDAY_NAMES[row["dow"] - 1]: row["total"] for row in weekdays},
+        bucket
+    )
+    roi = ROIAnalytics().roi_from_totals(
+        total_calls=total,
+        answered=totals.get("talked", 0),
+        total_seconds=talk_seconds,
+        total_appointments=appointment_counts["total"],
+        confirmed_appointments=appointment_counts.get("confirmed", 0)
+    )
+    return _dashboard_payload(overview, charts, roi, time_range, start_date, end_date)
+
+
+async def fetch_period_aggregates(
+    business_id: str,
+    start_date: datetime,
+    end_date: datetime,
+    bucket: str = "day"
+) -> Tuple[List[Dict], Optional[Dict]]:
+    """Call aggregates from the hourly rollups plus appointment status counts"""
+    from database_postgres import get_connection
+
+    async with get_connection() as conn:
+        rollups = await fetch_rollups(conn, business_id, start_date, end_date)
+        appointment_row = await conn.fetchrow(
+            APPOINTMENT_AGGREGATES_SQL,
+            uuid.UUID(business_id),
+            start_date.replace(tzinfo=timezone.utc),
+            end_date.replace(tzinfo=timezone.utc)
+        )
+    return rollup_aggregate_rows(rollups, bucket), dict(appointment_row) if appointment_row else None
+
+
+PERIOD_APPOINTMENTS_SQL = """
+    SELECT p.period,
+           count(a.id) AS total,
+           count(a.id) FILTER (WHERE a.status = 'confirmed') AS confirmed
+    FROM unnest($2::text[], $3::timestamptz[], $4::timestamptz[]) AS p(period, period_start, period_end)
+    LEFT JOIN appointments a
+        ON a.business_id = $1 AND a.created_at >= p.period_start AND a.created_at < p.period_end
+    GROUP BY p.period
+"""
+
+
+def period_metrics(call_row: Optional[Dict], appointment_row: Optional[Dict],
+                   avg_customer_value: float = 500) -> Dict:
+    """Call metrics plus estimated revenue for one period's aggregate rows"""
+    call_row = call_row or {}
+    appointment_row = appointment_row or {}
+    talk_seconds = float(call_row.get("talk_seconds") or 0)
+    metrics = CallAnalytics.format_metrics(
+        total=call_row.get("total", 0),
+        answered=call_row.get("answered", 0),
+        missed=call_row.get("missed", 0),
+        talked=call_row.get("talked", 0),
+        talk_seconds=talk_seconds,
+        appointments=call_row.get("booked", 0)
+    )
+    roi = ROIAnalytics(avg_customer_value=avg_customer_value).roi_from_totals(
+        total_calls=call_row.get("total", 0),
+        answered=call_row.get("talked", 0),
+        total_seconds=talk_seconds,
+        total_appointments=appointment_row.get("total", 0),
+        confirmed_appointments=appointment_row.get("confirmed", 0)
+    )
+    metrics["revenue"] = roi["summary"]["estimated_value_generated"]
+    metrics["roi_percentage"] = roi["summary"]["roi_percentage"]
+    return metrics
+
+
+def comparison_from_periods(
+    call_rows: Dict[str, Dict],
+    appointment_rows: Dict[str, Dict],
+    windows: List[Tuple[str, datetime, datetime]],
+    avg_customer_value: float = 500
+) -> Dict:
+    """
+    Build the period comparison from aggregate rows keyed by period label
+    (see analytics_rollups.fetch_period_rollups and PERIOD_APPOINTMENTS_SQL)
+    """
+    periods = {
+        label: period_metrics(call_rows.get(label), appointment_rows.get(label), avg_customer_value)
+        for label, _, _ in windows
+    }
+    current, previous = periods["current"], periods["previous"]
     return {
-        "overview": overview,
-        "charts": charts,
-        "roi": roi,
-        "time_range": {
-            "label": time_range,
-            "start": start_date.isoformat(),
-            "end": end_date.isoformat()
-        }
+        "periods": {
+            label: {"start": start.isoformat(), "end": end.isoformat(), "metrics": periods[label]}
+            for label, start, end in windows
+        },
+        "changes": ROIAnalytics().compare_periods(current, previous),
+        "summary": DashboardMetrics.generate_performance_summary(current, previous)
     }
+
+
+_rollup_versions: Dict[str, Tuple[float, int]] = {}  # business_id -> (checked_at, version)
+
+
+async def get_rollup_version(business_id: str) -> int:
+    """
+    Current rollup version for a business. Re-read from Postgres at most every
+    ANALYTICS_VERSION_CHECK_SECONDS so polling dashboards share one lookup.
+    """
+    if not ANALYTICS_DB_ENABLED:
+        return 0
+    now = time.monotonic()
+    checked = _rollup_versions.get(business_id)
+    if checked and now - checked[0] < ANALYTICS_VERSION_CHECK_SECONDS:
+        return checked[1]
+
+    from database_postgres import get_connection
+
+    async with get_connection() as conn:
+        version = await fetch_rollup_version(conn, business_id)
+    _rollup_versions[business_id] = (now, version)
+    return version
+
+
+async def fetch_analytics_dashboard(business_id: str, time_range: str = "last_30_days") -> Dict:
+    """Dashboard for a business, aggregated in Postgres rather than in Python"""
+    tr = TimeRange(time_range)
+    if not ANALYTICS_DB_ENABLED:
+        return get_analytics_dashboard([], [], time_range)
+
+    start_date, end_date = get_date_range(tr)
+    bucket = chart_bucket(start_date, end_date)
+    call_rows, appointment_row = await fetch_period_aggregates(business_id, start_date, end_date, bucket)
+    return dashboard_from_aggregates(call_rows, appointment_row, time_range, start_date, end_date, bucket)
+
+
+async def fetch_roi(business_id: str, time_range: str = "last_30_days", avg_customer_value: float = 500) -> Dict:
+    """ROI for a business from the same aggregate queries as the dashboard"""
+    tr = TimeRange(time_range)
+    roi = ROIAnalytics(avg_customer_value=avg_customer_value)
+    if not ANALYTICS_DB_ENABLED:
+        return roi.calculate_roi([], [])
+
+    start_date, end_date = get_date_range(tr)
+    call_rows, appointment_row = await fetch_period_aggregates(business_id, start_date, end_date)
+    totals = next((row for row in call_rows if row["grouping"] == GROUPING_TOTAL), {})
+    appointments = appointment_row or {}
+    return roi.roi_from_totals(
+        total_calls=totals.get("total", 0),
+        answered=totals.get("talked", 0),
+        total_seconds=float(totals.get("talk_seconds") or 0),
+        total_appointments=appointments.get("total", 0),
+        confirmed_appointments=appointments.get("confirmed", 0)
+    )
+
+
+async def fetch_period_comparison(
+    business_id: str,
+    time_range: str = "last_7_days",
+    offset: str = "previous",
+    avg_customer_value: float = 500
+) -> Dict:
+    """
+    Current vs. earlier window (previous period, week, month or year before)
+    with one grouped rollup read and one grouped appointments read
+    """
+    start_date, end_date = get_date_range(TimeRange(time_range))
+    windows = comparison_windows(start_date, end_date, offset)
+    if not ANALYTICS_DB_ENABLED:
+        return comparison_from_periods({}, {}, windows, avg_customer_value)
+
+    from database_postgres import get_connection
+
+    async with get_connection() as conn:
+        call_rows = await fetch_period_rollups(conn, business_id, windows)
+        appointment_rows = await conn.fetch(
+            PERIOD_APPOINTMENTS_SQL,
+            uuid.UUID(business_id),
+            [label for label, _, _ in windows],
+            [start.replace(tzinfo=timezone.utc) for _, start, _ in windows],
+            [end.replace(tzinfo=timezone.utc) for _, _, end in windows]
+        )
+    return comparison_from_periods(
+        call_rows, {row["period"]: dict(row) for row in appointment_rows}, windows, avg_customer_value
+    )
@@ -0,0 +1,212 @@
+"""
+Analytics Sketches for CallBot AI
+Mergeable t-digests for duration percentiles and HyperLogLogs for distinct callers
+"""
+
+import math
+import hashlib
+from typing import Iterable, Optional
+
+import numpy as np
+
+TDIGEST_COMPRESSION = 100
+TDIGEST_BUFFER = 500  # Points buffered before a merge pass
+HLL_PRECISION = 12    # 4096 registers, ~1.6% standard error
+
+
+class TDigest:
+    """
+    Merging t-digest (Dunning & Ertl). Centroids near the tails stay small so
+    extreme quantiles are accurate; any two digests merge into one that
+    summarizes both inputs.
+    """
+
+    __slots__ = ("compression", "means", "weights", "min", "max", "_buffer")
+
+    def __init__(self, compression: float = TDIGEST_COMPRESSION,
+                 means: Optional[np.ndarray] = None, weights: Optional[np.ndarray] = None,
+                 min_value: float = math.inf, max_value: float = -math.inf):
+        self.compression = compression
+        self.means = np.empty(0) if means is None else means
+        self.weights = np.empty(0) if weights is None else weights
+        self.min = min_value
+        self.max = max_value
+        self._buffer = []
+
+    @property
+    def count(self) -> float:
+        self._flush()
+        return float(self.weights.sum())
+
+    def add(self, value: float, weight: float = 1):
+        self._buffer.append((float(value), float(weight)))
+        if len(self._buffer) >= TDIGEST_BUFFER:
+            self._flush()
+
+    def update(self, values: Iterable[float]):
+        """Add many unit-weight values at once"""
+        values = np.fromiter(values, dtype=np.float64)
+        if len(values):
+            self._merge(values, np.ones(len(values)))
+
+    def merge(self, other: "TDigest") -> "TDigest":
+        other._flush()
+        if len(other.means):
+            self._merge(other.means, other.weights, other.min, other.max)
+        return self
+
+    @classmethod
+    def merged(cls, digests: Iterable["TDigest"], compression: float = TDIGEST_COMPRESSION) -> "TDigest":
+        """One digest summarizing all of `digests`, built in a single merge pass"""
+        result = cls(compression)
+        digests = [d for d in digests if d.count]
+        if digests:
+            result._merge(
+                np.concatenate([d.means for d in digests]),
+                np.concatenate([d.weights for d in digests]),
+                min(d.min for d in digests),
+                max(d.max for d in digests)
+            )
+        return result
+
+    def _flush(self):
+        if self._buffer:
+            points = np.array(self._buffer, dtype=np.float64)
+            self._buffer = []
+            self._merge(points[:, 0], points[:, 1])
+
+    def _k(self, q):
+        return self.compression / (2 * math.pi) * np.arcsin(2 * q - 1)
+
+    def _q(self, k):
+        return (math.sin(min(k * 2 * math.pi / self.compression, math.pi / 2)) + 1) / 2
+
+    def _merge(self, means: np.ndarray, weights: np.ndarray,
+               min_value: Optional[float] = None, max_value: Optional[float] = None):
+        self._flush()
+        self.min = min(self.min, float(means.min()) if min_value is None else min_value)
+        self.max = max(self.max, float(means.max()) if max_value is None else max_value)
+
+        all_means = np.concatenate([self.means, means])
+        all_weights = np.concatenate([self.weights, weights])
+        order = np.argsort(all_means, kind="mergesort")
+        all_means, all_weights = all_means[order], all_weights[order]
+
+        total = all_weights.sum()
+        new_means, new_weights = [], []
+        mean, weight = all_means[0], all_weights[0]
+        so_far = 0.0
+        q_limit = self._q(self._k(0.0) + 1) * total
+        for m, w in zip(all_means[1:], all_weights[1:]):
+            if so_far + weight + w <= q_limit:
+                weight += w
+                mean += (m - mean) * w / weight
+            else:
+                new_means.append(mean)
+                new_weights.append(weight)
+                so_far += weight
+                q_limit = self._q(self._k(so_far / total) + 1) * total
+                mean, weight = m, w
+        new_means.append(mean)
+        new_weights.append(weight)
+        self.means = np.array(new_means)
+        self.weights = np.array(new_weights)
+
+    def quantile(self, q: float) -> float:
+        """Value below which a fraction q of the weight falls (0 when empty)"""
+        self._flush()
+        if not len(self.means):
+            return 0
+        if len(self.means) == 1:
+            return float(self.means[0])
+        total = self.weights.sum()
+        centers = np.cumsum(self.weights) - self.weights / 2
+        return float(np.interp(
+            q * total,
+            np.concatenate([[0], centers, [total]]),
+            np.concatenate([[self.min], self.means, [self.max]])
+        ))
+
+    def to_bytes(self) -> bytes:
+        self._flush()
+        header = np.array([self.compression, self.min, self.max], dtype="<f8")
+        return b"".join([header.tobytes(), self.means.astype("<f8").tobytes(), self.weights.astype("<f8").tobytes()])
+
+    @classmethod
+    def from_bytes(cls, data: Optional[bytes]) -> "TDigest":
+        if not data:
+            return cls()
+        values = np.frombuffer(data, dtype="<f8")
+        compression, min_value, max_value = values[:3]
+        n = (len(values) - 3) // 2
+        return cls(float(compression), values[3:3 + n].copy(), values[3 + n:].copy(),
+                   float(min_value), float(max_value))
+
+
+def caller_hash(caller: str) -> int:
+    """Stable 64-bit hash of a caller's phone number"""
+    return int.from_bytes(hashlib.blake2b(caller.strip().encode(), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct counter. Registers merge with an element-wise max,
+    so per-bucket sketches combine over any range. Serialized sparsely while
+    few registers are set, which keeps quiet hourly buckets small.
+    """
+
+    __slots__ = ("precision", "registers")
+
+    SPARSE, DENSE = 0, 1
+
+    def __init__(self, precision: int = HLL_PRECISION, registers: Optional[np.ndarray] = None):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8) if registers is None else registers
+
+    def add(self, caller: Optional[str]):
+        if not caller or not caller.strip():
+            return
+        self.add_hash(caller_hash(caller))
+
+    def add_hash(self, value: int):
+        index = value >> (64 - self.precision)
+        rest = value & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self) -> int:
+        m = len(self.registers)
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if zeros == m:
+            return 0
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / float(np.sum(np.ldexp(1.0, -self.registers.astype(np.int32))))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # Linear counting for small cardinalities
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        nonzero = np.flatnonzero(self.registers)
+        if len(nonzero) * 3 < len(self.registers):
+            pairs = np.empty(len(nonzero), dtype=[("index", "<u2"), ("rank", "u1")])
+            pairs["index"] = nonzero
+            pairs["rank"] = self.registers[nonzero]
+            return bytes([self.SPARSE, self.precision]) + pairs.tobytes()
+        return bytes([self.DENSE, self.precision]) + self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: Optional[bytes]) -> "HyperLogLog":
+        if not data:
+            return cls()
+        kind, precision = data[0], data[1]
+        if kind == cls.DENSE:
+            return cls(precision, np.frombuffer(data[2:], dtype=np.uint8).copy())
+        sketch = cls(precision)
+        pairs = np.frombuffer(data[2:], dtype=[("index", "<u2"), ("rank", "u1")])
+        sketch.registers[pairs["index"]] = pairs["rank"]
+        return sketch
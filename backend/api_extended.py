@@ -4,33 +4,39 @@ New features: SMS, Campaigns, Agency, Integrations, Analytics, Widget, Knowledge
 """
 
 import os
+import json
 from datetime import datetime
 from typing import Dict, Any, Optional, List
 
 from fastapi import APIRouter, HTTPException, Request, BackgroundTasks, UploadFile, File
-from fastapi.responses import JSONResponse, Response
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, EmailStr
 
 # Import services
 from sms_service import (
-    send_sms, send_missed_call_textback, send_appointment_confirmation,
-    send_appointment_reminder, FollowUpSequence, send_batch_sms,
-    clean_phone_number, is_valid_phone_for_sms
+    send_sms, send_appointment_confirmation,
+    send_appointment_reminder, FollowUpSequence, send_batch_sms, iter_batch_sms, personalize_message,
+    render_template, estimate_batch, template_renderer,
+    clean_phone_number, is_valid_phone_for_sms, check_opt_out_keywords, check_opt_in_keywords,
+    TWILIO_AUTH_TOKEN, VONAGE_SIGNATURE_SECRET, VONAGE_SIGNATURE_METHOD
 )
+from security import verify_twilio_signature, verify_vonage_signature
+from sms_suppression import SMS_SUPPRESSION_ENABLED, record_opt_in, record_opt_out
 from outbound_campaigns import (
     Campaign, CampaignType, CampaignStatus, make_outbound_call,
     run_campaign_batch, parse_contacts_csv, generate_campaign_report,
     CAMPAIGN_TEMPLATES, PowerDialer
 )
 from knowledge_base import (
-    KnowledgeBase, KnowledgeBaseEntry, process_uploaded_file,
-    scrape_website_content, kb_manager
+    KnowledgeBase, KnowledgeBaseEntry, kb_manager, new_entry_id
 )
+from knowledge_ingestion import ingestion_manager, spool_upload, validate_upload_filename
+from website_crawler import WebsiteCrawler, crawl_manager, CRAWL_MAX_PAGES, CRAWL_MAX_DEPTH, CRAWL_STATE_DB_ENABLED
 from webhook_automations import (
     WebhookEndpoint, WebhookEventType, webhook_manager, deliver_webhook
 )
 from agency_service import (
-    Agency, AgencyTier, SubAccount, agency_manager,
+    Agency, AgencyTier, SubAccount, agency_manager, AGENCY_DB_ENABLED, fetch_agency_analytics,
     create_agency_subscription, generate_agency_api_key,
     get_white_label_config, update_agency_branding
 )
@@ -41,8 +47,13 @@ from integrations import (
 )
 from analytics_service import (
     CallAnalytics, ROIAnalytics, LeadScoring, DashboardMetrics,
-    get_analytics_dashboard, TimeRange
+    get_analytics_dashboard, fetch_analytics_dashboard, fetch_roi, fetch_period_comparison,
+    get_rollup_version, TimeRange, COMPARISON_OFFSETS, ANALYTICS_DB_ENABLED
 )
+from sms_outbox import SMS_OUTBOX_ENABLED, enqueue_sms, schedule_textback
+from delayed_jobs import DELAYED_JOBS_ENABLED
+from lead_scoring import get_call_score, rescore_business, save_rules, top_leads
+from response_cache import response_cache, cached_json_response
 from web_widget import (
     WidgetConfig, WidgetType, widget_manager,
     generate_embed_code, generate_widget_loader_js
@@ -95,6 +106,13 @@ class KnowledgeBaseEntryRequest(BaseModel):
     category: Optional[str] = "general"
 
 
+class LeadScoringRulesRequest(BaseModel):
+    signals: Optional[Dict[str, Dict]] = None
+    duration_thresholds: Optional[List[List[int]]] = None
+    appointment_booked: Optional[int] = None
+    callback_requested: Optional[int] = None
+
+
 class WidgetCreateRequest(BaseModel):
     widget_type: Optional[str] = "full"
     appearance: Optional[Dict] = None
@@ -127,7 +145,7 @@ class WidgetCallRequest(BaseModel):
 async def send_sms_endpoint(business_id: str, data: SMSRequest, request: Request):
     """Send a single SMS"""
     # Auth check would happen here
-    result = await send_sms(data.phone, data.message)
+    result = await send_sms(data.phone, data.message, business_id=business_id)
     return result
 
 
@@ -135,25 +153,63 @@ async def send_sms_endpoint(business_id: str, data: SMSRequest, request: Request
 async def send_batch_sms_endpoint(
     business_id: str,
     request: Request,
-    background_tasks: BackgroundTasks
+    background_tasks: BackgroundTasks,
+    stream: bool = False
 ):
-    """Send batch SMS"""
+    """Send batch SMS (stream=true returns NDJSON progress as messages complete)"""
     body = await request.json()
     recipients = body.get("recipients", [])
     message_template = body.get("message", "")
+    from_numbers = body.get("from_numbers") or None
 
     if not recipients or not message_template:
         raise HTTPException(status_code=400, detail="Recipients and message required")
 
+    # Billed segments, for pricing the batch before (or while) it goes out
+    estimate = estimate_batch(recipients, message_template)
+
+    if SMS_OUTBOX_ENABLED and not stream:
+        # Durable: queued rows survive restarts and are drained by the outbox workers
+        import secrets
+        from database_postgres import get_connection
+
+        batch_key = body.get("idempotency_key") or secrets.token_hex(8)
+        messages = [
+            {
+                "idempotency_key": f"batch:{batch_key}:{index}",
+                "to_phone": recipient.get("phone", ""),
+                "from_phone": from_numbers[index % len(from_numbers)] if from_numbers else None,
+                "message": personalize_message(message_template, recipient)
+            }
+            for index, recipient in enumerate(recipients)
+        ]
+        async with get_connection() as conn:
+            queued = await enqueue_sms(conn, business_id, messages, sms_type="marketing")
+        return {
+            "success": True,
+            "batch_id": batch_key,
+            "queued": queued,
+            "estimate": estimate,
+            "message": f"Queued SMS to {queued} recipients"
+        }
+
+    if stream:
+        async def progress():
+            async for event in iter_batch_sms(recipients, message_template, business_id, from_numbers=from_numbers):
+                yield json.dumps(event) + "\n"
+
+        return StreamingResponse(progress(), media_type="application/x-ndjson")
+
     # Run in background
     background_tasks.add_task(
         send_batch_sms,
         recipients,
         message_template,
-        business_id
+        business_id,
+        from_numbers=from_numbers
     )
 
-    return {"success": True, "message": f"Sending SMS to {len(recipients)} recipients"}
+    return {"success": True, "estimate": estimate, "message": f"Sending SMS to {len(recipients)} recipients"}
 
 
 @router.get("/api/business/{business_id}/sms/history")
@@ -163,6 +219,70 @@ async def get_sms_history(business_id: str, request: Request, limit: int = 50):
     return {"sms_logs": [], "total": 0}
 
 
+@router.get("/api/sms/templates/stats")
+async def get_sms_template_stats():
+    """Encoding and segment counts of rendered template messages since startup (per process)"""
+    return {"templates": template_renderer.template_stats()}
+
+
+@router.post("/api/webhooks/sms/inbound")
+async def handle_inbound_sms(request: Request, business_id: str):
+    """
+    Inbound SMS webhook (Twilio form post or Vonage JSON), configured per
+    number as /api/webhooks/sms/inbound?business_id=... - records STOP / START.
+    Requests must carry a valid Twilio or Vonage signature.
+    """
+    if request.headers.get("content-type", "").startswith("application/json"):
+        body = await request.json()
+    else:
+        body = dict(await request.form())
+
+    twilio_signature = request.headers.get("x-twilio-signature")
+    if twilio_signature is not None:
+        if not TWILIO_AUTH_TOKEN:
+            return {"status": "not configured"}
+        # Twilio signs the URL it was configured with, not the one behind our proxy
+        base_url = os.getenv("BASE_URL", str(request.base_url)).rstrip("/")
+        url = base_url + request.url.path + (f"?{request.url.query}" if request.url.query else "")
+        if not verify_twilio_signature(url, body, twilio_signature, TWILIO_AUTH_TOKEN):
+            raise HTTPException(status_code=403, detail="Invalid signature")
+    elif "sig" in body:
+        if not VONAGE_SIGNATURE_SECRET:
+            return {"status": "not configured"}
+        if not verify_vonage_signature(body, VONAGE_SIGNATURE_SECRET, VONAGE_SIGNATURE_METHOD):
+            raise HTTPException(status_code=403, detail="Invalid signature")
+    else:
+        raise HTTPException(status_code=403, detail="Missing signature")
+    phone = clean_phone_number(body.get("From") or body.get("msisdn") or "")
+    text = body.get("Body") or body.get("text") or ""
+    if not phone:
+        return {"status": "missing_data"}
+
+    if check_opt_out_keywords(text):
+        record = record_opt_out
+    elif check_opt_in_keywords(text):
+        record = record_opt_in
+    else:
+        return {"status": "received"}
+
+    if SMS_SUPPRESSION_ENABLED:
+        from database_postgres import get_connection
+
+        async with get_connection() as conn:
+            await record(conn, business_id, phone)
+    else:
+        await record(None, business_id, phone)
+
+    if record is record_opt_out:
+        await webhook_manager.trigger_event(
+            business_id,
+            WebhookEventType.SMS_OPT_OUT,
+            {"phone": phone, "timestamp": datetime.utcnow().isoformat()}
+        )
+        return {"status": "opted_out"}
+    return {"status": "opted_in"}
+
+
 # =============================================================================
 # Campaign Endpoints
 # =============================================================================
@@ -248,7 +368,7 @@ async def get_campaign_templates():
 @router.get("/api/business/{business_id}/knowledge-base")
 async def get_knowledge_base(business_id: str, request: Request):
     """Get knowledge base entries"""
-    kb = kb_manager.get_or_create(business_id)
+    kb = await kb_manager.get(business_id)
     return {
         "entries": [
             {
@@ -271,74 +391,142 @@ async def add_knowledge_entry(
     request: Request
 ):
     """Add entry to knowledge base"""
-    import secrets
-
-    kb = kb_manager.get_or_create(business_id)
     entry = KnowledgeBaseEntry(
-        entry_id=f"kb_{secrets.token_hex(8)}",
+        entry_id=new_entry_id(),
         business_id=business_id,
         title=data.title,
         content=data.content,
         category=data.category
     )
 
-    kb.add_entry(entry)
+    added = await kb_manager.add_entry(business_id, entry)
 
     return {
         "success": True,
-        "entry_id": entry.id
+        "entry_id": entry.id,
+        "duplicate": not added
     }
 
 
-@router.post("/api/business/{business_id}/knowledge-base/upload")
+@router.delete("/api/business/{business_id}/knowledge-base/{entry_id}")
+async def delete_knowledge_entry(business_id: str, entry_id: str, request: Request):
+    """Remove entry from knowledge base"""
+    removed = await kb_manager.remove_entry(business_id, entry_id)
+
+    if not removed:
+        raise HTTPException(status_code=404, detail="Entry not found")
+
+    return {"success": True}
+
+
+@router.post("/api/business/{business_id}/knowledge-base/upload", status_code=202)
 async def upload_knowledge_file(
     business_id: str,
     file: UploadFile = File(...),
     request: Request = None
 ):
-    """Upload file to knowledge base"""
-    content = await file.read()
-    result = process_uploaded_file(file.filename, content, business_id)
+    """Upload file to knowledge base (extracted in the background)"""
+    error = validate_upload_filename(file.filename)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
 
-    if not result["success"]:
-        raise HTTPException(status_code=400, detail=result["error"])
+    try:
+        path, size = await spool_upload(file)
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
 
-    # Add to knowledge base
-    import secrets
-    kb = kb_manager.get_or_create(business_id)
-    entry = KnowledgeBaseEntry(
-        entry_id=f"kb_{secrets.token_hex(8)}",
-        business_id=business_id,
-        title=file.filename,
-        content=result["content"],
-        category="upload",
-        source_type="upload"
-    )
-    kb.add_entry(entry)
+    job = ingestion_manager.submit(business_id, file.filename, path, size)
 
     return {
         "success": True,
-        "entry_id": entry.id,
+        "job_id": job.id,
+        "status": job.status.value,
         "filename": file.filename,
-        "chars_extracted": result["extracted_chars"]
+        "status_url": f"/api/business/{business_id}/knowledge-base/jobs/{job.id}"
     }
 
 
+@router.get("/api/business/{business_id}/knowledge-base/jobs/{job_id}")
+async def get_knowledge_upload_job(business_id: str, job_id: str, request: Request):
+    """Get status of a knowledge base upload"""
+    job = ingestion_manager.get_job(business_id, job_id)
+
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return job.to_dict()
+
+
 @router.post("/api/business/{business_id}/knowledge-base/scrape")
 async def scrape_website(business_id: str, request: Request):
-    """Scrape website for knowledge base"""
+    """Crawl website into knowledge base (only changed pages are re-processed)"""
     body = await request.json()
     url = body.get("url")
 
     if not url:
         raise HTTPException(status_code=400, detail="URL required")
 
-    result = await scrape_website_content(url)
+    try:
+        max_pages = min(int(body.get("max_pages", CRAWL_MAX_PAGES)), CRAWL_MAX_PAGES)
+        max_depth = min(int(body.get("max_depth", CRAWL_MAX_DEPTH)), CRAWL_MAX_DEPTH)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="max_pages and max_depth must be integers")
+
+    crawler = WebsiteCrawler(max_pages=max_pages, max_depth=max_depth)
+    if CRAWL_STATE_DB_ENABLED:
+        from database_postgres import get_connection
+
+        async with get_connection() as conn:
+            state = await crawl_manager.load_state(conn, business_id, url)
+    else:
+        state = await crawl_manager.load_state(None, business_id, url)
+    result = await crawler.crawl(url, state)
 
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result["error"])
 
-    return result
+    entries = [
+        KnowledgeBaseEntry(
+            entry_id=new_entry_id(),
+            business_id=business_id,
+            title=page["title"],
+            content=page["content"],
+            category="website",
+            source_type="website"
+        )
+        for page in result["pages"]
+    ]
+    # Add the new content before removing the old, so a failed add loses nothing
+    # and the pages (their hashes never recorded) are picked up again next crawl
+    added = set(await kb_manager.add_entries(business_id, entries))
+
+    entry_ids = []
+    for page, entry in zip(result["pages"], entries):
+        old_entry_id = state.pages[page["url"]].entry_id
+        if old_entry_id:
+            await kb_manager.remove_entry(business_id, old_entry_id)
+        # A page whose content was already in the knowledge base (a duplicate) keeps no entry of its own
+        entry_id = entry.id if entry.id in added else None
+        state.record_ingested(page, entry_id)
+        if entry_id:
+            entry_ids.append(entry_id)
+
+    # Validators, hashes and entry ids for the next (incremental) crawl
+    if CRAWL_STATE_DB_ENABLED:
+        async with get_connection() as conn:
+            await crawl_manager.save_state(conn, business_id, url, state)
+
+    return {
+        "success": True,
+        "url": result["url"],
+        "pages_fetched": result["pages_fetched"],
+        "pages_changed": len(result["pages"]),
+        "pages_unchanged": len(result["unchanged"]),
+        "blocked_by_robots": len(result["blocked"]),
+        "errors": result["errors"],
+        "entry_ids": entry_ids,
+        "extracted_chars": result["extracted_chars"]
+    }
 
 
 # =============================================================================
@@ -464,31 +652,113 @@ async def get_business_analytics(
     time_range: str = "last_30_days"
 ):
     """Get comprehensive analytics dashboard"""
-    # In production, fetch real data from database
-    # For now return sample structure
-    return get_analytics_dashboard([], [], time_range)
+    try:
+        TimeRange(time_range)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid time_range: {time_range}")
+
+    cached = await response_cache.get_or_build(
+        business_id, "analytics", time_range, await get_rollup_version(business_id),
+        lambda: fetch_analytics_dashboard(business_id, time_range)
+    )
+    return cached_json_response(request, cached)
 
 
 @router.get("/api/business/{business_id}/analytics/roi")
 async def get_roi_analytics(
     business_id: str,
     request: Request,
-    avg_customer_value: float = 500
+    avg_customer_value: float = 500,
+    time_range: str = "last_30_days"
 ):
     """Get ROI calculations"""
-    roi = ROIAnalytics(avg_customer_value=avg_customer_value)
-    return roi.calculate_roi([], [])
+    try:
+        TimeRange(time_range)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid time_range: {time_range}")
+
+    cached = await response_cache.get_or_build(
+        business_id, "roi", (time_range, avg_customer_value), await get_rollup_version(business_id),
+        lambda: fetch_roi(business_id, time_range, avg_customer_value)
+    )
+    return cached_json_response(request, cached)
+
+
+@router.get("/api/business/{business_id}/analytics/compare")
+async def get_period_comparison(
+    business_id: str,
+    request: Request,
+    time_range: str = "last_7_days",
+    offset: str = "previous",
+    avg_customer_value: float = 500
+):
+    """Compare a time range with the previous period, or the same range a week/month/year earlier"""
+    try:
+        TimeRange(time_range)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid time_range: {time_range}")
+    if offset not in COMPARISON_OFFSETS:
+        raise HTTPException(status_code=400, detail=f"offset must be one of {', '.join(COMPARISON_OFFSETS)}")
+
+    cached = await response_cache.get_or_build(
+        business_id, "compare", (time_range, offset, avg_customer_value), await get_rollup_version(business_id),
+        lambda: fetch_period_comparison(business_id, time_range, offset, avg_customer_value)
+    )
+    return cached_json_response(request, cached)
 
 
 @router.get("/api/business/{business_id}/calls/{call_id}/score")
 async def get_lead_score(business_id: str, call_id: str, request: Request):
     """Get lead score for a specific call"""
-    # Would fetch call data from database
-    call_data = {"duration": 180, "appointment_booked": True}
-    score = LeadScoring.score_lead(call_data)
+    if not ANALYTICS_DB_ENABLED:
+        raise HTTPException(status_code=503, detail="Lead scoring requires a database")
+    from database_postgres import get_connection
+
+    async with get_connection() as conn:
+        score = await get_call_score(conn, business_id, call_id)
+    if score is None:
+        raise HTTPException(status_code=404, detail="Call not found")
     return score
 
 
+@router.get("/api/business/{business_id}/leads/top")
+async def get_top_leads(business_id: str, request: Request, limit: int = 20):
+    """Highest-scoring leads for a business"""
+    if not ANALYTICS_DB_ENABLED:
+        raise HTTPException(status_code=503, detail="Lead scoring requires a database")
+    from database_postgres import get_connection
+
+    async with get_connection() as conn:
+        leads = await top_leads(conn, business_id, min(max(limit, 1), 100))
+    return {"leads": leads}
+
+
+@router.put("/api/business/{business_id}/lead-scoring/rules")
+async def update_lead_scoring_rules(
+    business_id: str,
+    data: LeadScoringRulesRequest,
+    request: Request,
+    background_tasks: BackgroundTasks
+):
+    """Set a business's lead scoring rules and rescore its calls"""
+    if not ANALYTICS_DB_ENABLED:
+        raise HTTPException(status_code=503, detail="Lead scoring requires a database")
+    from database_postgres import get_connection
+
+    try:
+        async with get_connection() as conn:
+            rules = await save_rules(conn, business_id, data.dict(exclude_none=True))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def rescore():
+        async with get_connection() as conn:
+            await rescore_business(conn, business_id)
+
+    background_tasks.add_task(rescore)
+    return {"success": True, "rules": rules}
+
+
 # =============================================================================
 # Widget Endpoints
 # =============================================================================
@@ -625,9 +895,22 @@ async def get_agency(agency_id: str, request: Request):
 
 
 @router.get("/api/agency/{agency_id}/dashboard")
-async def get_agency_dashboard(agency_id: str, request: Request):
-    """Get agency dashboard stats"""
-    stats = agency_manager.get_agency_dashboard_stats(agency_id)
+async def get_agency_dashboard(
+    agency_id: str,
+    request: Request,
+    page: int = 1,
+    page_size: int = 50,
+    sort: str = "calls",
+    order: str = "desc"
+):
+    """Get agency dashboard stats with a sortable, paginated per-client breakdown"""
+    if AGENCY_DB_ENABLED:
+        try:
+            stats = await fetch_agency_analytics(agency_id, page, page_size, sort, order)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
+        stats = agency_manager.get_agency_dashboard_stats(agency_id)
 
     if not stats:
         raise HTTPException(status_code=404, detail="Agency not found")
@@ -747,16 +1030,18 @@ async def handle_missed_call(request: Request, background_tasks: BackgroundTasks
     business_name = "Demo Business"
     callback_number = "+15551234567"
 
-    # Send text-back in background
-    background_tasks.add_task(
-        send_missed_call_textback,
-        business_id,
-        business_name,
-        caller_phone,
-        callback_number,
-        False,  # is_after_hours
-        30  # delay_seconds
-    )
+    message = render_template("missed_call_textback", {
+        "business_name": business_name,
+        "callback_number": callback_number
+    })
+    if DELAYED_JOBS_ENABLED:
+        # Due in 30 seconds, cancelled if the caller gets through first (survives restarts)
+        from database_postgres import get_connection
+
+        async with get_connection() as conn:
+            await schedule_textback(conn, business_id, caller_phone, message)
+    else:
+        await schedule_textback(None, business_id, caller_phone, message)
 
     # Trigger webhooks
     await webhook_manager.trigger_event(
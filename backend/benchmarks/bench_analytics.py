@@ -0,0 +1,90 @@
+"""
+Analytics engine benchmark: row-wise dict loops vs columnar NumPy
+Run: python benchmarks/bench_analytics.py
+"""
+
+import os
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics_service import CallAnalytics, CallFrame, DashboardMetrics, ROIAnalytics
+
+
+def make_calls(n: int):
+    rng = random.Random(42)
+    start = datetime(2026, 1, 1)
+    calls = []
+    for _ in range(n):
+        duration = 0 if rng.random() < 0.2 else rng.randint(5, 900)
+        calls.append({
+            "duration": duration,
+            "status": "missed" if duration == 0 else "completed",
+            "appointment_booked": duration > 60 and rng.random() < 0.3,
+            "created_at": start + timedelta(seconds=rng.randint(0, 90 * 86400)),
+        })
+    return calls
+
+
+def rowwise_dashboard(calls):
+    """The previous implementation: several Python passes with .get()"""
+    total = len(calls)
+    answered = sum(1 for c in calls if c.get("status") == "completed" or c.get("duration", 0) > 0)
+    missed = sum(1 for c in calls if c.get("status") == "missed" or c.get("duration", 0) == 0)
+    durations = [c.get("duration", 0) for c in calls if c.get("duration", 0) > 0]
+    statistics.mean(durations) if durations else 0
+    sum(1 for c in calls if c.get("appointment_booked", False))
+
+    daily_calls, daily_appointments, daily_duration = defaultdict(int), defaultdict(int), defaultdict(int)
+    for call in calls:
+        if call.get("created_at"):
+            key = call["created_at"].strftime("%Y-%m-%d")
+            daily_calls[key] += 1
+            daily_duration[key] += call.get("duration", 0)
+            if call.get("appointment_booked"):
+                daily_appointments[key] += 1
+    sorted(daily_calls)
+
+    hourly, weekday = defaultdict(int), defaultdict(int)
+    for call in calls:
+        if call.get("created_at"):
+            hourly[call["created_at"].hour] += 1
+            weekday[call["created_at"].weekday()] += 1
+
+    sum(1 for c in calls if c.get("duration", 0) > 0)
+    sum(c.get("duration", 0) for c in calls) / 60
+    return total, answered, missed
+
+
+def vectorized_dashboard(frame):
+    CallAnalytics.calculate_metrics(frame)
+    DashboardMetrics.generate_chart_data(frame)
+    ROIAnalytics().calculate_roi(frame, [])
+
+
+def timed(fn, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    print(f"{'calls':>10} {'row-wise':>10} {'build':>10} {'compute':>10} {'speedup':>9} {'e2e':>7}")
+    for n in (100_000, 1_000_000):
+        calls = make_calls(n)
+        rowwise = timed(rowwise_dashboard, calls)
+        build = timed(CallFrame.from_calls, calls)
+        frame = CallFrame.from_calls(calls)
+        compute = timed(vectorized_dashboard, frame)
+        print(
+            f"{n:>10,} {rowwise * 1000:>8.0f}ms {build * 1000:>8.0f}ms {compute * 1000:>8.1f}ms "
+            f"{rowwise / compute:>8.0f}x {rowwise / (build + compute):>6.1f}x"
+        )
@@ -0,0 +1,99 @@
+"""
+Knowledge base search benchmark
+Run: python benchmarks/bench_knowledge_base.py
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from knowledge_base import KnowledgeBase, KnowledgeBaseEntry
+
+VOCABULARY = [
+    "air", "conditioning", "repair", "furnace", "install", "maintenance", "filter", "duct",
+    "thermostat", "heat", "pump", "warranty", "estimate", "emergency", "service", "plumbing",
+    "water", "heater", "leak", "drain", "inspection", "financing", "weekend", "appointment",
+] + [f"term{i}" for i in range(5000)]
+
+
+def build_kb(num_docs: int, total_bytes: int) -> KnowledgeBase:
+    rng = random.Random(42)
+    kb = KnowledgeBase("biz_bench")
+    words_per_doc = total_bytes // num_docs // 9
+    for i in range(num_docs):
+        content = " ".join(rng.choice(VOCABULARY) for _ in range(words_per_doc))
+        kb.add_entry(KnowledgeBaseEntry(f"kb_{i}", "biz_bench", f"Document {i}", content))
+    return kb
+
+
+def bench_entry_operations(num_entries: int = 10_000):
+    """Per-operation cost of id/hash/category bookkeeping on a large KB"""
+    rng = random.Random(7)
+    entries = [
+        KnowledgeBaseEntry(
+            f"kb_{i}", "biz_bench", f"FAQ {i}",
+            " ".join(rng.choice(VOCABULARY) for _ in range(40)),
+            rng.choice(["faq", "pricing", "services", "policies"])
+        )
+        for i in range(num_entries)
+    ]
+    kb = KnowledgeBase("biz_bench")
+
+    start = time.perf_counter()
+    for entry in entries:
+        kb.add_entry(entry)
+    add_us = (time.perf_counter() - start) / num_entries * 1e6
+
+    start = time.perf_counter()
+    for entry in entries:
+        kb.add_entry(KnowledgeBaseEntry("dup", "biz_bench", entry.title, entry.content))
+    dup_us = (time.perf_counter() - start) / num_entries * 1e6
+
+    ids = [e.id for e in entries]
+    start = time.perf_counter()
+    for entry_id in ids:
+        kb.get_entry(entry_id)
+    get_us = (time.perf_counter() - start) / num_entries * 1e6
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        kb.stats
+    stats_us = (time.perf_counter() - start) / 1000 * 1e6
+
+    start = time.perf_counter()
+    for entry_id in ids[::2]:
+        kb.remove_entry(entry_id)
+    remove_us = (time.perf_counter() - start) / len(ids[::2]) * 1e6
+
+    print(f"{num_entries} entries:")
+    print(f"  add_entry       {add_us:8.1f} us/op (includes chunking + indexing)")
+    print(f"  duplicate check {dup_us:8.1f} us/op (includes hashing)")
+    print(f"  get_entry       {get_us:8.2f} us/op")
+    print(f"  stats           {stats_us:8.2f} us/op")
+    print(f"  remove_entry    {remove_us:8.1f} us/op")
+
+
+def main():
+    bench_entry_operations()
+
+    start = time.perf_counter()
+    kb = build_kb(50, 10 * 1024 * 1024)
+    build_seconds = time.perf_counter() - start
+    total_chars = sum(len(e.content) for e in kb.entries)
+    print(f"Indexed {len(kb.entries)} docs / {total_chars / 1e6:.1f}M chars in {build_seconds:.2f}s")
+
+    queries = ["air conditioning repair", "emergency weekend service", "water heater leak", "term42 term4242"]
+    iterations = 2000
+    for query in queries:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            kb.search(query, limit=5)
+        per_query_ms = (time.perf_counter() - start) / iterations * 1000
+        print(f"  {query!r:32} {per_query_ms:.3f} ms/query")
+
+
+if __name__ == "__main__":
+    main()
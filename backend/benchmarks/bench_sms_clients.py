@@ -0,0 +1,99 @@
+"""
+SMS provider client benchmark: new client per message vs shared pooled client
+Run: python benchmarks/bench_sms_clients.py
+
+Sends through send_sms_twilio against a local stub of the Twilio Messages
+API. The stub is plain HTTP on loopback, so the per-message cost measured
+here is only TCP setup and client construction; against the real API each
+new client also pays a TLS handshake, which widens the gap.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+import sms_service
+
+RESPONSE_BODY = json.dumps({"sid": "SM00000000000000000000000000000000", "status": "queued"}).encode()
+
+
+async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Minimal HTTP/1.1 keep-alive server answering every request like Twilio"""
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+            if length:
+                await reader.readexactly(length)
+            writer.write(
+                b"HTTP/1.1 201 Created\r\nContent-Type: application/json\r\n"
+                b"Content-Length: " + str(len(RESPONSE_BODY)).encode() + b"\r\n\r\n" + RESPONSE_BODY
+            )
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionResetError):
+        pass
+    finally:
+        writer.close()
+
+
+async def send_with_new_client(to_number: str, message: str):
+    """The previous implementation: one AsyncClient (and connection) per message"""
+    url = f"{sms_service.TWILIO_API_URL}/2010-04-01/Accounts/{sms_service.TWILIO_ACCOUNT_SID}/Messages.json"
+    async with httpx.AsyncClient() as client:
+        response = await client.post(
+            url,
+            auth=(sms_service.TWILIO_ACCOUNT_SID, sms_service.TWILIO_AUTH_TOKEN),
+            data={"To": to_number, "From": sms_service.TWILIO_PHONE_NUMBER, "Body": message},
+            timeout=30.0
+        )
+        return response.json()
+
+
+async def run(send, messages: int, concurrency: int) -> float:
+    """Messages per second sending `messages` texts with `concurrency` in flight"""
+    queue = asyncio.Queue()
+    for i in range(messages):
+        queue.put_nowait(f"+1555{i:07d}")
+
+    async def worker():
+        while not queue.empty():
+            await send(queue.get_nowait(), "Hi! This is Acme Plumbing returning your call.")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return messages / (time.perf_counter() - start)
+
+
+async def main():
+    server = await asyncio.start_server(handle_connection, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+
+    sms_service.TWILIO_API_URL = f"http://127.0.0.1:{port}"
+    sms_service.TWILIO_ACCOUNT_SID = "ACbench"
+    sms_service.TWILIO_AUTH_TOKEN = "token"
+    sms_service.TWILIO_PHONE_NUMBER = "+15550000000"
+
+    messages = 500
+    print(f"{messages} messages to a local stub provider")
+    for concurrency in (1, 10, 50):
+        new_client = await run(send_with_new_client, messages, concurrency)
+        shared = await run(sms_service.send_sms_twilio, messages, concurrency)
+        print(f"  concurrency {concurrency:3}: new client {new_client:8.0f} msg/s   "
+              f"shared client {shared:8.0f} msg/s   ({shared / new_client:.1f}x)")
+
+    await sms_service.close_sms_clients()
+    server.close()
+    await server.wait_closed()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,310 @@
+"""
+Delayed Jobs for CallBot AI
+Timed work (missed-call text-backs) kept in a Postgres due-time index and fired from a timer wheel
+
+Jobs are keyed by (business_id, job_key): scheduling the same key again
+moves the pending job, and cancelling the key (e.g. the caller got through
+on a later call) stops it from firing. Each process keeps jobs due within
+DELAYED_JOBS_HORIZON on an in-memory hierarchical timer wheel and claims them
+from the table when they fire, so a job fires once however many processes
+hold it, and a job whose process died is picked up on the next reload.
+Without a database the scheduler keeps jobs in memory only.
+"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+DELAYED_JOBS_ENABLED = bool(os.getenv("DATABASE_URL"))
+DELAYED_JOBS_TICK_SECONDS = float(os.getenv("DELAYED_JOBS_TICK_SECONDS", "1"))
+DELAYED_JOBS_HORIZON = int(os.getenv("DELAYED_JOBS_HORIZON", "300"))  # seconds ahead held in memory
+DELAYED_JOBS_RELOAD_SECONDS = int(os.getenv("DELAYED_JOBS_RELOAD_SECONDS", "60"))
+DELAYED_JOBS_LOAD_LIMIT = int(os.getenv("DELAYED_JOBS_LOAD_LIMIT", "10000"))
+
+WHEEL_SLOTS = 64
+WHEEL_LEVELS = 3  # 64^3 ticks, about three days at one second per tick
+
+
+# =============================================================================
+# SQL
+# =============================================================================
+
+# Rescheduling a pending key replaces its payload and due time
+SCHEDULE_SQL = """
+    INSERT INTO delayed_jobs (business_id, job_key, kind, payload, due_at)
+    VALUES ($1, $2, $3, $4::jsonb, $5)
+    ON CONFLICT (business_id, job_key) WHERE status = 'pending' DO UPDATE
+    SET kind = EXCLUDED.kind, payload = EXCLUDED.payload, due_at = EXCLUDED.due_at, updated_at = NOW()
+    RETURNING id, due_at
+"""
+
+CANCEL_SQL = """
+    UPDATE delayed_jobs
+    SET status = 'cancelled', updated_at = NOW()
+    WHERE business_id = $1 AND job_key = $2 AND status = 'pending'
+    RETURNING id
+"""
+
+# Served by idx_delayed_jobs_due; overdue jobs (from a process that died) come first
+LOAD_DUE_SQL = """
+    SELECT id, due_at
+    FROM delayed_jobs
+    WHERE status = 'pending' AND due_at <= NOW() + make_interval(secs => $1)
+    ORDER BY due_at
+    LIMIT $2
+"""
+
+# Only still-pending, actually-due jobs are claimed: jobs cancelled, moved or
+# already claimed by another process since they were put on the wheel are skipped
+CLAIM_SQL = """
+    UPDATE delayed_jobs
+    SET status = 'dispatched', updated_at = NOW()
+    WHERE id = ANY($1::uuid[]) AND status = 'pending' AND due_at <= NOW() + make_interval(secs => $2)
+    RETURNING id, business_id, job_key, kind, payload, due_at
+"""
+
+FAIL_SQL = """
+    UPDATE delayed_jobs SET status = 'failed', last_error = $2, updated_at = NOW() WHERE id = $1
+"""
+
+
+# =============================================================================
+# Timer Wheel
+# =============================================================================
+
+class TimerWheel:
+    """
+    Hierarchical timer wheel. Level 0 has one slot per tick; each higher
+    level has one slot per full turn of the level below and is cascaded down
+    when the lower level wraps. Schedule and cancel are O(1), and advancing
+    costs one slot per elapsed tick plus the cascades. Timers past the top
+    level wait in an overflow set until they come in range.
+    """
+
+    def __init__(self, tick: float = DELAYED_JOBS_TICK_SECONDS, slots: int = WHEEL_SLOTS,
+                 levels: int = WHEEL_LEVELS, now: Optional[float] = None):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.current = int((time.time() if now is None else now) // tick)  # last tick processed
+        self.wheels: List[List[Dict[str, int]]] = [[{} for _ in range(slots)] for _ in range(levels)]
+        self.overflow: Dict[str, int] = {}
+        self.entries: Dict[str, Tuple[int, int]] = {}  # key -> (level, slot); level -1 is overflow
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def _place(self, key: str, due_tick: int):
+        delta = due_tick - self.current
+        span = 1
+        for level in range(self.levels):
+            if delta < span * self.slots:
+                slot = (due_tick // span) % self.slots
+                self.wheels[level][slot][key] = due_tick
+                self.entries[key] = (level, slot)
+                return
+            span *= self.slots
+        self.overflow[key] = due_tick
+        self.entries[key] = (-1, 0)
+
+    def schedule(self, key: str, when: float):
+        """Fire `key` at the first tick at or after `when` (replacing any earlier timer)"""
+        self.cancel(key)
+        self._place(key, max(int(-(-when // self.tick)), self.current + 1))
+
+    def cancel(self, key: str) -> bool:
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return False
+        level, slot = entry
+        if level < 0:
+            del self.overflow[key]
+        else:
+            del self.wheels[level][slot][key]
+        return True
+
+    def advance(self, now: float) -> List[str]:
+        """Move to `now` and return the keys that came due, in due order"""
+        target = int(now // self.tick)
+        fired = []
+        while self.current < target:
+            self.current += 1
+            tick = self.current
+            top = self.slots ** (self.levels - 1)
+            if tick % top == 0 and self.overflow:
+                waiting, self.overflow = self.overflow, {}
+                for key, due_tick in waiting.items():
+                    self._place(key, due_tick)
+            span = top
+            for level in range(self.levels - 1, 0, -1):
+                if tick % span == 0:
+                    slot = (tick // span) % self.slots
+                    cascading, self.wheels[level][slot] = self.wheels[level][slot], {}
+                    for key, due_tick in cascading.items():
+                        self._place(key, due_tick)
+                span //= self.slots
+            slot = tick % self.slots
+            if self.wheels[0][slot]:
+                fired.extend(self.wheels[0][slot])
+                for key in self.wheels[0][slot]:
+                    del self.entries[key]
+                self.wheels[0][slot] = {}
+        return fired
+
+
+# =============================================================================
+# Scheduler
+# =============================================================================
+
+JobHandler = Callable[[Optional[object], Dict], Awaitable[None]]
+
+
+def job_from_row(row) -> Dict:
+    job = dict(row)
+    job["id"] = str(job["id"])
+    job["business_id"] = str(job["business_id"])
+    if isinstance(job.get("payload"), str):
+        job["payload"] = json.loads(job["payload"])
+    return job
+
+
+class DelayedJobScheduler:
+    """
+    Schedules keyed jobs and dispatches them to the handler registered for
+    their kind. Handlers are called as handler(conn, job) inside the claiming
+    transaction (conn is None in memory-only mode), so work they write
+    through conn commits together with the claim.
+    """
+
+    def __init__(self, tick: float = DELAYED_JOBS_TICK_SECONDS, horizon: int = DELAYED_JOBS_HORIZON):
+        self.wheel = TimerWheel(tick)
+        self.horizon = horizon
+        self.handlers: Dict[str, JobHandler] = {}
+        self.acquire = None
+        # Memory-only mode
+        self.jobs: Dict[str, Dict] = {}
+        self.keys: Dict[Tuple[str, str], str] = {}
+
+    def register(self, kind: str, handler: JobHandler):
+        self.handlers[kind] = handler
+
+    async def schedule(self, conn, business_id: str, job_key: str, kind: str,
+                       payload: Dict, delay_seconds: float) -> str:
+        """Schedule (or move) the pending job for this key; returns the job id"""
+        due_at = datetime.now(timezone.utc).timestamp() + delay_seconds
+        if conn is None:
+            job_id = self.keys.get((business_id, job_key)) or str(uuid.uuid4())
+            self.keys[(business_id, job_key)] = job_id
+            self.jobs[job_id] = {
+                "id": job_id, "business_id": business_id, "job_key": job_key,
+                "kind": kind, "payload": payload,
+                "due_at": datetime.fromtimestamp(due_at, timezone.utc)
+            }
+            self.wheel.schedule(job_id, due_at)
+            return job_id
+
+        row = await conn.fetchrow(
+            SCHEDULE_SQL, uuid.UUID(business_id), job_key, kind, json.dumps(payload),
+            datetime.fromtimestamp(due_at, timezone.utc)
+        )
+        job_id = str(row["id"])
+        if delay_seconds <= self.horizon:
+            self.wheel.schedule(job_id, row["due_at"].timestamp())
+        return job_id
+
+    async def cancel(self, conn, business_id: str, job_key: str) -> bool:
+        """Cancel the pending job for this key; False if there was none"""
+        if conn is None:
+            job_id = self.keys.pop((business_id, job_key), None)
+            if job_id is None:
+                return False
+            self.jobs.pop(job_id, None)
+            self.wheel.cancel(job_id)
+            return True
+
+        rows = await conn.fetch(CANCEL_SQL, uuid.UUID(business_id), job_key)
+        for row in rows:
+            self.wheel.cancel(str(row["id"]))
+        return bool(rows)
+
+    async def load_due(self, conn) -> int:
+        """Put every pending job due within the horizon on the wheel"""
+        rows = await conn.fetch(LOAD_DUE_SQL, self.horizon, DELAYED_JOBS_LOAD_LIMIT)
+        for row in rows:
+            self.wheel.schedule(str(row["id"]), row["due_at"].timestamp())
+        return len(rows)
+
+    async def _handle(self, conn, job: Dict):
+        handler = self.handlers.get(job["kind"])
+        if handler is None:
+            raise ValueError(f"No handler for delayed job kind {job['kind']}")
+        await handler(conn, job)
+
+    async def dispatch(self, job_ids: List[str]) -> int:
+        """Claim and run fired jobs; returns how many ran"""
+        if self.acquire is None:
+            ran = 0
+            for job_id in job_ids:
+                job = self.jobs.pop(job_id, None)
+                if job is None:
+                    continue
+                self.keys.pop((job["business_id"], job["job_key"]), None)
+                try:
+                    await self._handle(None, job)
+                    ran += 1
+                except Exception as e:
+                    print(f"Delayed job {job_id} failed: {e}")
+            return ran
+
+        ran = 0
+        async with self.acquire() as conn:
+            async with conn.transaction():
+                rows = await conn.fetch(CLAIM_SQL, [uuid.UUID(i) for i in job_ids], self.wheel.tick)
+                for row in rows:
+                    job = job_from_row(row)
+                    try:
+                        # Savepoint per job, so one failure doesn't undo the others
+                        async with conn.transaction():
+                            await self._handle(conn, job)
+                        ran += 1
+                    except Exception as e:
+                        print(f"Delayed job {job['id']} failed: {e}")
+                        await conn.execute(FAIL_SQL, row["id"], str(e)[:1000])
+        return ran
+
+    async def run(self, acquire=None):
+        """
+        Fire jobs until cancelled. `acquire` is an async context manager
+        factory yielding a connection (e.g. pool.acquire); None runs in
+        memory only.
+        """
+        self.acquire = acquire
+        next_reload = 0.0
+        while True:
+            try:
+                now = time.time()
+                if acquire is not None and now >= next_reload:
+                    async with acquire() as conn:
+                        await self.load_due(conn)
+                    next_reload = now + DELAYED_JOBS_RELOAD_SECONDS
+                fired = self.wheel.advance(now)
+                if fired:
+                    await self.dispatch(fired)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Jobs that fired here are still pending and come back on the next reload
+                print(f"Delayed job dispatch failed: {e}")
+                next_reload = 0.0
+            await asyncio.sleep(self.wheel.tick)
+
+
+# Global scheduler instance
+job_scheduler = DelayedJobScheduler()
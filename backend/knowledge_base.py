@@ -5,21 +5,80 @@ Handles document upload, processing, and AI context injection
 
 import os
 import re
+import math
+import time
+import uuid
+import asyncio
+import heapq
 import hashlib
+from collections import Counter, OrderedDict
 from datetime import datetime
-from typing import Dict, Optional, List, Any
-import httpx
-from io import BytesIO
+from typing import Dict, Optional, List, Any, Tuple
+from io import BytesIO, StringIO
+
+from logging_service import logger
 
 # File size limits
 MAX_FILE_SIZE_MB = 10
 MAX_FILES_PER_BUSINESS = 50
 ALLOWED_EXTENSIONS = {'.txt', '.pdf', '.doc', '.docx', '.md', '.csv', '.json'}
 
+# Manager cache / persistence
+KB_CACHE_MAX_BYTES = int(os.getenv("KB_CACHE_MAX_MB", "256")) * 1024 * 1024
+KB_VERSION_CHECK_SECONDS = float(os.getenv("KB_VERSION_CHECK_SECONDS", "5"))
+KB_PERSISTENCE_ENABLED = bool(os.getenv("DATABASE_URL"))
+KB_VECTOR_SEARCH_ENABLED = os.getenv("KB_VECTOR_SEARCH", "false").lower() == "true"
+
+# Search configuration
+BM25_K1 = 1.5
+BM25_B = 0.75
+TITLE_WEIGHT = 2  # Title terms count this many times toward term frequency
+
+STOPWORDS = frozenset("""
+a about above after again all am an and any are as at be because been before being
+below between both but by can could did do does doing down during each few for from
+further had has have having he her here hers him his how i if in into is it its itself
+just me more most my no nor not of off on once only or other our ours out over own same
+she should so some such than that the their theirs them then there these they this those
+through to too under until up very was we were what when where which while who whom why
+will with would you your yours
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Retrieval configuration
+CHARS_PER_TOKEN = 4
+CHUNK_SIZE_CHARS = 1200  # ~300 tokens per chunk
+CHUNK_OVERLAP_CHARS = 200
+
+# Approximate per-item overhead used when sizing cached knowledge bases
+POSTING_BYTES = 120
+CHUNK_BYTES = 200
+
+# Category order for the always-on "static core" context
+CORE_CATEGORY_PRIORITY = {
+    "faq": 0,
+    "pricing": 1,
+    "services": 2,
+    "policies": 3,
+    "procedures": 4,
+    "general": 5,
+}
+
+
+def content_digest(content: str) -> str:
+    """Stable 128-bit content fingerprint used for deduplication"""
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
 
 class KnowledgeBaseEntry:
     """Single knowledge base document/entry"""
 
+    __slots__ = (
+        "id", "business_id", "title", "content", "category",
+        "source_type", "created_at", "updated_at", "content_hash"
+    )
+
     def __init__(
         self,
         entry_id: str,
@@ -34,100 +93,488 @@ class KnowledgeBaseEntry:
         self.title = title
         self.content = content
         self.category = category
-        self.source_type = source_type  # manual, upload, website, api
-        self.created_at = datetime.utcnow()
-        self.updated_at = datetime.utcnow()
-        self.content_hash = hashlib.md5(content.encode()).hexdigest()
+        self.source_type = source_type  # manual, upload, website, api, record
+        self.created_at = self.updated_at = datetime.utcnow()
+        self.content_hash = content_digest(content)
+
+    @property
+    def size_chars(self) -> int:
+        return len(self.title) + len(self.content)
+
+
+def stem_token(token: str) -> str:
+    """Light suffix stripping so 'repairs', 'repaired' and 'repairing' share a term"""
+    if len(token) <= 3 or token.isdigit():
+        return token
+    if token.endswith("ies") and len(token) > 4:
+        return token[:-3] + "y"
+    for suffix in ("ing", "ed"):
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            token = token[:-len(suffix)]
+            break
+    else:
+        if token.endswith("es") and token[-3:-2] in ("s", "x", "z", "h"):
+            token = token[:-2]
+        elif token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+    # Drop a trailing 'e' so 'price', 'prices' and 'pricing' agree
+    if token.endswith("e") and len(token) > 3:
+        token = token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, split on non-alphanumerics, drop stopwords and stem"""
+    return [
+        stem_token(tok)
+        for tok in _TOKEN_RE.findall(text.lower())
+        if tok not in STOPWORDS
+    ]
+
+
+def document_terms(title: str, content: str) -> Counter:
+    """Term frequencies of a document, with title terms weighted up"""
+    terms = Counter(tokenize(content))
+    for term in tokenize(title):
+        terms[term] += TITLE_WEIGHT
+    return terms
+
+
+class KnowledgeIndex:
+    """Incrementally maintained inverted index with BM25 ranking"""
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {}  # term -> {entry_id: tf}
+        self.doc_terms: Dict[str, Counter] = {}  # entry_id -> term counts
+        self.doc_lengths: Dict[str, int] = {}
+        self.total_length = 0
+        self.posting_count = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def add(self, doc_id: str, title: str, content: str):
+        """Index a document (replaces any previous version with the same id)"""
+        self.add_terms(doc_id, document_terms(title, content))
+
+    def add_terms(self, doc_id: str, terms: Counter):
+        """Index a document from its document_terms"""
+        if doc_id in self.doc_lengths:
+            self.remove(doc_id)
+
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+
+        length = sum(terms.values())
+        self.posting_count += len(terms)
+        self.doc_terms[doc_id] = terms
+        self.doc_lengths[doc_id] = length
+        self.total_length += length
+
+    def remove(self, doc_id: str) -> bool:
+        """Drop a document's postings"""
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return False
+
+        for term in terms:
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(doc_id, None)
+                if not docs:
+                    del self.postings[term]
+
+        self.posting_count -= len(terms)
+        self.total_length -= self.doc_lengths.pop(doc_id)
+        return True
+
+    def rank(
+        self,
+        query: str,
+        allowed: Optional[set] = None,
+        limit: Optional[int] = None
+    ) -> List[Tuple[str, float]]:
+        """Score documents against a query, best first"""
+        n_docs = len(self.doc_lengths)
+        if not n_docs:
+            return []
+
+        avg_length = self.total_length / n_docs or 1.0
+        k1, b = self.k1, self.b
+        scores: Dict[str, float] = {}
+
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            df = len(docs)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for doc_id, tf in docs.items():
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                norm = k1 * (1 - b + b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+
+        if limit:
+            return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (4 chars per token)"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def chunk_spans(
+    text: str,
+    size: int = CHUNK_SIZE_CHARS,
+    overlap: int = CHUNK_OVERLAP_CHARS
+) -> List[Tuple[int, int]]:
+    """Split text into overlapping (start, end) windows, preferring paragraph/sentence breaks"""
+    length = len(text)
+    if length <= size:
+        return [(0, length)] if text.strip() else []
+
+    spans = []
+    start = 0
+    while start < length:
+        end = min(start + size, length)
+        if end < length:
+            # Snap back to a natural break in the last fifth of the window
+            floor = start + size * 4 // 5
+            for sep in ("\n\n", "\n", ". ", " "):
+                cut = text.rfind(sep, floor, end)
+                if cut != -1:
+                    end = cut + len(sep)
+                    break
+        spans.append((start, end))
+        if end >= length:
+            break
+
+        # Overlap with the previous window, starting on a word boundary
+        next_start = max(end - overlap, start + 1)
+        space = text.find(" ", next_start, end)
+        start = space + 1 if space != -1 else next_start
+
+    return spans
+
+
+class KnowledgeChunk:
+    """A retrievable window of an entry's content (stored as offsets, not copies)"""
+
+    __slots__ = ("id", "entry", "position", "start", "end")
+
+    def __init__(self, entry: "KnowledgeBaseEntry", position: int, start: int, end: int):
+        self.id = f"{entry.id}#{position}"
+        self.entry = entry
+        self.position = position
+        self.start = start
+        self.end = end
+
+    @property
+    def text(self) -> str:
+        return self.entry.content[self.start:self.end]
+
+    @property
+    def tokens(self) -> int:
+        return (self.end - self.start) // CHARS_PER_TOKEN + 1
 
 
 class KnowledgeBase:
     """Knowledge base for a business"""
 
-    def __init__(self, business_id: str):
+    def __init__(self, business_id: str, vectors=None):
         self.business_id = business_id
-        self.entries: List[KnowledgeBaseEntry] = []
         self.categories = ["general", "faq", "pricing", "services", "policies", "procedures"]
+        self._by_id: Dict[str, KnowledgeBaseEntry] = {}  # insertion-ordered
+        self._by_hash: Dict[str, str] = {}  # content_hash -> entry_id
+        self._by_category: Dict[str, Dict[str, KnowledgeBaseEntry]] = {}
+        self._category_chars: Counter = Counter()
+        self.total_chars = 0  # content characters
+        self.total_size_chars = 0  # title + content characters
+        self.chunks: Dict[str, KnowledgeChunk] = {}  # chunk_id -> chunk
+        self.entry_chunks: Dict[str, List[KnowledgeChunk]] = {}  # entry_id -> chunks in order
+        self.index = KnowledgeIndex()  # indexes chunks, not whole entries
+        self.vectors = vectors  # optional knowledge_vectors.VectorIndex for hybrid search
+        self.revision = 0  # bumped on every add/remove
+        self._core_context: Dict[int, str] = {}  # max_tokens -> static-core context at this revision
+
+    @property
+    def entries(self) -> List[KnowledgeBaseEntry]:
+        """Entries in insertion order"""
+        return list(self._by_id.values())
 
-    def add_entry(self, entry: KnowledgeBaseEntry):
-        """Add an entry to the knowledge base"""
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def add_entry(self, entry: KnowledgeBaseEntry, prepared: Optional[Tuple] = None):
+        """Add an entry to the knowledge base (prepared: from prepare_entry, else done here)"""
         # Check for duplicates by content hash
-        for existing in self.entries:
-            if existing.content_hash == entry.content_hash:
-                return False
-        self.entries.append(entry)
+        if entry.content_hash in self._by_hash or entry.id in self._by_id:
+            return False
+
+        self._by_id[entry.id] = entry
+        self._by_hash[entry.content_hash] = entry.id
+        self._by_category.setdefault(entry.category, {})[entry.id] = entry
+        self._category_chars[entry.category] += len(entry.content)
+        self.total_chars += len(entry.content)
+        self.total_size_chars += entry.size_chars
+        self._index_entry(entry, prepared)
+        self._changed()
         return True
 
     def remove_entry(self, entry_id: str) -> bool:
         """Remove an entry from the knowledge base"""
-        for i, entry in enumerate(self.entries):
-            if entry.id == entry_id:
-                self.entries.pop(i)
-                return True
-        return False
+        entry = self._by_id.pop(entry_id, None)
+        if entry is None:
+            return False
+
+        if self._by_hash.get(entry.content_hash) == entry_id:
+            del self._by_hash[entry.content_hash]
+        category_entries = self._by_category.get(entry.category)
+        if category_entries is not None:
+            category_entries.pop(entry_id, None)
+            if not category_entries:
+                del self._by_category[entry.category]
+        self._category_chars[entry.category] -= len(entry.content)
+        if self._category_chars[entry.category] <= 0:
+            del self._category_chars[entry.category]
+        self.total_chars -= len(entry.content)
+        self.total_size_chars -= entry.size_chars
+        self._unindex_entry(entry_id)
+        self._changed()
+        return True
+
+    def _changed(self):
+        self.revision += 1
+        self._core_context.clear()
+
+    def get_by_hash(self, content_hash: str) -> Optional[KnowledgeBaseEntry]:
+        """Find the entry holding identical content"""
+        entry_id = self._by_hash.get(content_hash)
+        return self._by_id.get(entry_id) if entry_id else None
+
+    def prepare_entry(self, entry: KnowledgeBaseEntry) -> Tuple:
+        """
+        Chunk, tokenize and embed an entry without touching the knowledge
+        base, so the CPU-heavy part of add_entry can run in a worker thread
+        """
+        spans = chunk_spans(entry.content) or [(0, 0)]  # Title-only entries still need to be findable
+        terms = [document_terms(entry.title, entry.content[start:end]) for start, end in spans]
+        embedded = None
+        if self.vectors is not None:
+            embedded = self.vectors.embed_missing(
+                (f"{entry.id}#{position}", f"{entry.title}\n{entry.content[start:end]}")
+                for position, (start, end) in enumerate(spans)
+            )
+        return spans, terms, embedded
+
+    def _index_entry(self, entry: KnowledgeBaseEntry, prepared: Optional[Tuple] = None):
+        """Chunk an entry and add its chunks to the search index"""
+        spans, terms, embedded = prepared or self.prepare_entry(entry)
+        chunks = [KnowledgeChunk(entry, position, start, end) for position, (start, end) in enumerate(spans)]
+
+        self.entry_chunks[entry.id] = chunks
+        for chunk, chunk_terms in zip(chunks, terms):
+            self.chunks[chunk.id] = chunk
+            self.index.add_terms(chunk.id, chunk_terms)
+        if self.vectors is not None:
+            self.vectors.add_many(((chunk.id, f"{entry.title}\n{chunk.text}") for chunk in chunks), embedded)
+
+    def _unindex_entry(self, entry_id: str):
+        for chunk in self.entry_chunks.pop(entry_id, []):
+            self.chunks.pop(chunk.id, None)
+            self.index.remove(chunk.id)
+            if self.vectors is not None:
+                self.vectors.remove(chunk.id)
 
     def get_entry(self, entry_id: str) -> Optional[KnowledgeBaseEntry]:
         """Get a specific entry"""
-        for entry in self.entries:
-            if entry.id == entry_id:
-                return entry
-        return None
-
-    def search(self, query: str, category: Optional[str] = None) -> List[KnowledgeBaseEntry]:
-        """Search entries by keyword"""
-        query_lower = query.lower()
-        results = []
+        return self._by_id.get(entry_id)
 
-        for entry in self.entries:
-            if category and entry.category != category:
-                continue
+    def search(
+        self,
+        query: str,
+        category: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> List[KnowledgeBaseEntry]:
+        """Search entries by keyword, ranked by BM25 relevance"""
+        return [entry for entry, _ in self.search_scored(query, category, limit)]
+
+    def search_scored(
+        self,
+        query: str,
+        category: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> List[Tuple[KnowledgeBaseEntry, float]]:
+        """Search entries and return (entry, score) pairs, best first"""
+        best: Dict[str, Tuple[KnowledgeBaseEntry, float]] = {}
+        for chunk, score in self.search_chunks(query, category):
+            if chunk.entry.id not in best:  # chunks arrive best-first
+                best[chunk.entry.id] = (chunk.entry, score)
+                if limit and len(best) >= limit:
+                    break
+        return list(best.values())
+
+    def search_chunks(
+        self,
+        query: str,
+        category: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> List[Tuple[KnowledgeChunk, float]]:
+        """
+        Search chunks and return (chunk, score) pairs, best first.
+
+        With a vector index attached, BM25 and embedding rankings are merged by
+        reciprocal rank fusion, so paraphrases match even without shared words.
+        A category restricts both rankings before they are cut off.
+        """
+        allowed = None
+        if category:
+            allowed = {
+                chunk.id
+                for entry_id in self._by_category.get(category, {})
+                for chunk in self.entry_chunks.get(entry_id, ())
+            }
+            if not allowed:
+                return []
 
-            if query_lower in entry.title.lower() or query_lower in entry.content.lower():
-                results.append(entry)
+        if self.vectors is not None:
+            from knowledge_vectors import reciprocal_rank_fusion, expand_query, VECTOR_TOP_K
 
+            keyword = [chunk_id for chunk_id, _ in self.index.rank(expand_query(query), allowed, VECTOR_TOP_K)]
+            semantic = [chunk_id for chunk_id, _ in self.vectors.search(query, VECTOR_TOP_K, allowed=allowed)]
+            ranked = reciprocal_rank_fusion(keyword, semantic)
+        else:
+            ranked = self.index.rank(query, allowed, limit)
+
+        results = []
+        for chunk_id, score in ranked:
+            # The vector index can hold ids this KB no longer has (e.g. after reading another worker's flush)
+            chunk = self.chunks.get(chunk_id)
+            if chunk is None:
+                continue
+            results.append((chunk, score))
+            if limit and len(results) >= limit:
+                break
         return results
 
     def get_by_category(self, category: str) -> List[KnowledgeBaseEntry]:
         """Get all entries in a category"""
-        return [e for e in self.entries if e.category == category]
-
-    def generate_context_prompt(self, max_tokens: int = 4000) -> str:
-        """Generate a context prompt from knowledge base for AI"""
+        return list(self._by_category.get(category, {}).values())
 
-        sections = []
-
-        # Group by category
-        by_category = {}
-        for entry in self.entries:
-            if entry.category not in by_category:
-                by_category[entry.category] = []
-            by_category[entry.category].append(entry)
-
-        # Build context
-        for category, entries in by_category.items():
-            section_content = f"\n## {category.upper()}\n"
-            for entry in entries:
-                section_content += f"\n### {entry.title}\n{entry.content}\n"
-            sections.append(section_content)
+    def select_chunks(
+        self,
+        max_tokens: int = 4000,
+        query: Optional[str] = None,
+        topics: Optional[List[str]] = None
+    ) -> List[KnowledgeChunk]:
+        """
+        Pick the chunks worth sending to the model within a token budget.
+
+        With a query or topics, chunks are taken in relevance order (topics are
+        interleaved so each one gets coverage). Without either, the "static core"
+        is built: leading chunks of every entry first, higher-priority
+        categories first, then later chunks while budget remains. Records
+        from structured uploads are left out of the static core.
+        """
+        queries = [q for q in ([query] if query else []) + (topics or []) if q]
+        if queries:
+            rankings = [[chunk for chunk, _ in self.search_chunks(q)] for q in queries]
+            candidates = []
+            for rank in range(max((len(r) for r in rankings), default=0)):
+                for ranking in rankings:
+                    if rank < len(ranking):
+                        candidates.append(ranking[rank])
+        else:
+            # Row-level records (price lists, catalogs) are only pulled in by queries
+            entry_order = {entry_id: i for i, entry_id in enumerate(self._by_id)}
+            candidates = sorted(
+                (c for c in self.chunks.values() if c.entry.source_type != "record"),
+                key=lambda c: (
+                    c.position,
+                    CORE_CATEGORY_PRIORITY.get(c.entry.category, len(CORE_CATEGORY_PRIORITY)),
+                    entry_order[c.entry.id]
+                )
+            )
 
-        full_context = "\n".join(sections)
+        selected = []
+        seen = set()
+        budget = max_tokens
+        for chunk in candidates:
+            if chunk.id in seen or chunk.tokens > budget:
+                continue
+            seen.add(chunk.id)
+            selected.append(chunk)
+            budget -= chunk.tokens
+            if budget <= 0:
+                break
+        return selected
+
+    def generate_context_prompt(
+        self,
+        max_tokens: int = 4000,
+        query: Optional[str] = None,
+        topics: Optional[List[str]] = None
+    ) -> str:
+        """Generate a context prompt from the most relevant knowledge within budget"""
+        if not query and not topics:
+            # The static core only changes with the KB, so build it once per revision
+            context = self._core_context.get(max_tokens)
+            if context is None:
+                context = self._core_context[max_tokens] = self._render_context(self.select_chunks(max_tokens))
+            return context
+        return self._render_context(self.select_chunks(max_tokens, query, topics))
+
+    def _render_context(self, selected: List[KnowledgeChunk]) -> str:
+        if not selected:
+            return ""
+
+        # Merge overlapping windows per entry, keep entries in KB order
+        spans: Dict[str, List[List[int]]] = {}
+        for chunk in sorted(selected, key=lambda c: (c.entry.id, c.start)):
+            ranges = spans.setdefault(chunk.entry.id, [])
+            if ranges and chunk.start <= ranges[-1][1]:
+                ranges[-1][1] = max(ranges[-1][1], chunk.end)
+            else:
+                ranges.append([chunk.start, chunk.end])
+
+        by_category: Dict[str, List[str]] = {}
+        for entry in self._by_id.values():
+            ranges = spans.get(entry.id)
+            if ranges is None:
+                continue
+            parts = [entry.content[start:end].strip() for start, end in ranges]
+            body = "\n[...]\n".join(p for p in parts if p)
+            by_category.setdefault(entry.category, []).append(f"\n### {entry.title}\n{body}\n")
 
-        # Truncate if too long (rough token estimate: 4 chars per token)
-        max_chars = max_tokens * 4
-        if len(full_context) > max_chars:
-            full_context = full_context[:max_chars] + "\n\n[Knowledge base truncated due to length...]"
+        sections = [
+            f"\n## {category.upper()}\n" + "".join(items)
+            for category, items in by_category.items()
+        ]
+        return "\n".join(sections)
 
-        return full_context
+    @property
+    def memory_bytes(self) -> int:
+        """Approximate resident size: entry text plus index postings"""
+        size = self.total_size_chars + self.index.posting_count * POSTING_BYTES + len(self.chunks) * CHUNK_BYTES
+        if self.vectors is not None:
+            size += self.vectors.memory_bytes
+        return size
 
     @property
     def stats(self) -> Dict:
         return {
-            "total_entries": len(self.entries),
-            "categories": list(set(e.category for e in self.entries)),
-            "total_chars": sum(len(e.content) for e in self.entries),
+            "total_entries": len(self._by_id),
+            "categories": list(self._by_category),
+            "total_chars": self.total_chars,
             "entries_by_category": {
-                cat: len([e for e in self.entries if e.category == cat])
+                cat: len(self._by_category.get(cat, ()))
                 for cat in self.categories
-            }
+            },
+            "chars_by_category": dict(self._category_chars)
         }
 
 
@@ -189,18 +636,15 @@ def process_uploaded_file(
         elif ext in ['.doc', '.docx']:
             text = extract_text_from_docx(content)
         elif ext == '.csv':
-            text = content.decode('utf-8', errors='ignore')
-            # Convert CSV to readable format
-            lines = text.split('\n')
-            if lines:
-                headers = lines[0].split(',')
-                formatted = []
-                for line in lines[1:]:
-                    values = line.split(',')
-                    row = ", ".join(f"{h}: {v}" for h, v in zip(headers, values) if v.strip())
-                    if row:
-                        formatted.append(row)
-                text = "\n".join(formatted)
+            import csv
+            # Convert CSV to readable format (the csv module handles quoted fields)
+            reader = csv.DictReader(StringIO(content.decode('utf-8-sig', errors='ignore')))
+            formatted = []
+            for record in reader:
+                row = ", ".join(f"{h}: {v.strip()}" for h, v in record.items() if h and v and v.strip())
+                if row:
+                    formatted.append(row)
+            text = "\n".join(formatted)
         elif ext == '.json':
             import json
             data = json.loads(content.decode('utf-8'))
@@ -253,45 +697,23 @@ def generate_faq_prompt(faqs: List[Dict]) -> str:
 
 
 async def scrape_website_content(url: str) -> Dict:
-    """Scrape content from a website URL for knowledge base"""
-
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                url,
-                headers={"User-Agent": "CallBotAI Knowledge Scraper/1.0"},
-                timeout=30.0,
-                follow_redirects=True
-            )
+    """Scrape content from a single website URL for knowledge base"""
+    from website_crawler import WebsiteCrawler
 
-            if response.status_code != 200:
-                return {"success": False, "error": f"HTTP {response.status_code}"}
+    result = await WebsiteCrawler(max_pages=1, max_depth=0, concurrency=1).crawl(url)
+    if not result["success"]:
+        return result
+    if not result["pages"]:
+        error = result["errors"][0]["error"] if result["errors"] else "No content"
+        return {"success": False, "error": error}
 
-            html = response.text
-
-            # Basic HTML to text conversion (for production, use BeautifulSoup)
-            # Remove scripts and styles
-            html = re.sub(r'<script[^>]*>.*?</script>', '', html, flags=re.DOTALL)
-            html = re.sub(r'<style[^>]*>.*?</style>', '', html, flags=re.DOTALL)
-
-            # Remove HTML tags
-            text = re.sub(r'<[^>]+>', ' ', html)
-
-            # Clean up whitespace
-            text = re.sub(r'\s+', ' ', text).strip()
-
-            # Remove common boilerplate
-            text = re.sub(r'Cookie Policy.*?Accept', '', text, flags=re.IGNORECASE)
-
-            return {
-                "success": True,
-                "url": url,
-                "content": text[:50000],  # Limit to 50k chars
-                "extracted_chars": len(text)
-            }
-
-    except Exception as e:
-        return {"success": False, "error": str(e)}
+    page = result["pages"][0]
+    return {
+        "success": True,
+        "url": page["url"],
+        "content": page["content"],
+        "extracted_chars": len(page["content"])
+    }
 
 
 def create_pricing_context(pricing_data: Dict) -> str:
@@ -342,31 +764,353 @@ def create_services_context(services: List[Dict]) -> str:
     return context
 
 
+def with_kb_context(kb: KnowledgeBase, base_prompt: str, query: Optional[str] = None, max_tokens: int = 4000) -> str:
+    """An assistant prompt with the knowledge base's context appended"""
+    kb_context = kb.generate_context_prompt(max_tokens=max_tokens, query=query)
+    if kb_context:
+        return base_prompt + f"\n\nKNOWLEDGE BASE:\n{kb_context}"
+    return base_prompt
+
+
+def new_entry_id() -> str:
+    """Entry ids double as knowledge_base primary keys"""
+    return str(uuid.uuid4())
+
+
 class KnowledgeBaseManager:
-    """Manages knowledge bases for multiple businesses"""
+    """
+    Manages knowledge bases for multiple businesses.
+
+    Knowledge bases are loaded from the knowledge_base table on first access
+    and kept in an LRU cache capped by approximate byte size. Writes go
+    through to Postgres and bump a per-business version in
+    knowledge_base_versions; other workers notice the new version on their
+    next check and reload.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = KB_CACHE_MAX_BYTES,
+        persistent: bool = KB_PERSISTENCE_ENABLED,
+        version_check_seconds: float = KB_VERSION_CHECK_SECONDS,
+        vector_search: bool = KB_VECTOR_SEARCH_ENABLED
+    ):
+        self.knowledge_bases: "OrderedDict[str, KnowledgeBase]" = OrderedDict()
+        self.max_bytes = max_bytes
+        self.persistent = persistent
+        self.vector_search = vector_search
+        self.version_check_seconds = version_check_seconds
+        self.versions: Dict[str, int] = {}
+        self.checked_at: Dict[str, float] = {}
+        self.sizes: Dict[str, int] = {}
+        self.total_bytes = 0
+        self._loading: Dict[str, asyncio.Future] = {}
+
+    # -------------------------------------------------------------------------
+    # Cache bookkeeping
+    # -------------------------------------------------------------------------
+
+    def _cache(self, business_id: str, kb: KnowledgeBase, version: Optional[int] = 0):
+        self._drop(business_id)
+        self.knowledge_bases[business_id] = kb
+        self.versions[business_id] = version
+        self.checked_at[business_id] = time.monotonic()
+        self._resize(business_id)
+
+    def _drop(self, business_id: str):
+        if self.knowledge_bases.pop(business_id, None) is not None:
+            self.total_bytes -= self.sizes.pop(business_id, 0)
+        self.versions.pop(business_id, None)
+        self.checked_at.pop(business_id, None)
+
+    def _resize(self, business_id: str):
+        """Re-measure a cached KB and evict least-recently-used ones over the cap"""
+        kb = self.knowledge_bases.get(business_id)
+        if kb is None:
+            return
+        size = kb.memory_bytes
+        self.total_bytes += size - self.sizes.get(business_id, 0)
+        self.sizes[business_id] = size
+
+        while self.total_bytes > self.max_bytes and len(self.knowledge_bases) > 1:
+            oldest = next(iter(self.knowledge_bases))
+            if oldest == business_id:
+                self.knowledge_bases.move_to_end(business_id)
+                continue
+            self._drop(oldest)
+
+    def evict(self, business_id: str):
+        """Forget a cached knowledge base (it will be reloaded on next access)"""
+        self._drop(business_id)
 
-    def __init__(self):
-        self.knowledge_bases: Dict[str, KnowledgeBase] = {}
+    def _new_knowledge_base(self, business_id: str) -> KnowledgeBase:
+        if not self.vector_search:
+            return KnowledgeBase(business_id)
+        from knowledge_vectors import open_vector_index
+        return KnowledgeBase(business_id, vectors=open_vector_index(business_id))
 
     def get_or_create(self, business_id: str) -> KnowledgeBase:
-        """Get or create a knowledge base for a business"""
-        if business_id not in self.knowledge_bases:
-            self.knowledge_bases[business_id] = KnowledgeBase(business_id)
-        return self.knowledge_bases[business_id]
+        """
+        Get or create a knowledge base for a business (cache only, no DB
+        access). With persistence, a KB created here has no known version, so
+        the next get() loads it from Postgres.
+        """
+        kb = self.knowledge_bases.get(business_id)
+        if kb is None:
+            kb = self._new_knowledge_base(business_id)
+            self._cache(business_id, kb, None if self.persistent else 0)
+        else:
+            self.knowledge_bases.move_to_end(business_id)
+        return kb
+
+    # -------------------------------------------------------------------------
+    # Loading
+    # -------------------------------------------------------------------------
+
+    async def get(self, business_id: str) -> KnowledgeBase:
+        """Get a business's knowledge base, loading or refreshing it from Postgres"""
+        if not self.persistent:
+            return self.get_or_create(business_id)
+
+        kb = self.knowledge_bases.get(business_id)
+        if kb is not None and self.versions.get(business_id) is not None:
+            self.knowledge_bases.move_to_end(business_id)
+            if time.monotonic() - self.checked_at.get(business_id, 0) < self.version_check_seconds:
+                return kb
+            try:
+                version = await self._fetch_version(business_id)
+            except Exception as e:
+                logger.warning("Knowledge base version check failed", business_id=business_id, error=str(e))
+                return kb
+            self.checked_at[business_id] = time.monotonic()
+            if version == self.versions.get(business_id):
+                return kb
+
+        # Share one load between concurrent callers
+        pending = self._loading.get(business_id)
+        if pending is not None:
+            return await pending
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[business_id] = future
+        try:
+            kb, version = await self._load(business_id)
+            self._cache(business_id, kb, version)
+            future.set_result(kb)
+            return kb
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._loading.pop(business_id, None)
+            if future.done() and not future.cancelled():
+                future.exception()  # Mark retrieved so unawaited failures don't warn
+
+    async def _fetch_version(self, business_id: str) -> int:
+        from database_postgres import get_connection
+
+        async with get_connection() as conn:
+            version = await conn.fetchval(
+                "SELECT version FROM knowledge_base_versions WHERE business_id = $1",
+                uuid.UUID(business_id)
+            )
+        return version or 0
+
+    async def _load(self, business_id: str) -> Tuple[KnowledgeBase, int]:
+        from database_postgres import get_connection
+
+        bid = uuid.UUID(business_id)
+        async with get_connection() as conn:
+            # Read the version first so a concurrent write can only make us reload again
+            version = await conn.fetchval(
+                "SELECT version FROM knowledge_base_versions WHERE business_id = $1",
+                bid
+            ) or 0
+            rows = await conn.fetch("""
+                SELECT id, title, content, category, source_type, created_at, updated_at
+                FROM knowledge_base
+                WHERE business_id = $1 AND is_active = true
+                ORDER BY created_at
+            """, bid)
+
+        # Chunking, tokenizing and embedding a whole knowledge base is CPU-bound;
+        # the new KnowledgeBase isn't shared until it's returned
+        return await asyncio.to_thread(self._build, business_id, rows), version
+
+    def _build(self, business_id: str, rows) -> KnowledgeBase:
+        kb = self._new_knowledge_base(business_id)
+        for row in rows:
+            entry = KnowledgeBaseEntry(
+                entry_id=str(row['id']),
+                business_id=business_id,
+                title=row['title'],
+                content=row['content'],
+                category=row['category'] or "general",
+                source_type=row['source_type'] or "manual"
+            )
+            entry.created_at = row['created_at'] or entry.created_at
+            entry.updated_at = row['updated_at'] or entry.updated_at
+            kb.add_entry(entry)
+
+        if kb.vectors is not None:
+            # Rows for entries deleted elsewhere are dropped; new ones were embedded above
+            kb.vectors.retain(kb.chunks)
+            if kb.vectors.dirty:
+                kb.vectors.flush()
+        return kb
+
+    # -------------------------------------------------------------------------
+    # Write-through
+    # -------------------------------------------------------------------------
+
+    async def add_entry(
+        self,
+        business_id: str,
+        entry: KnowledgeBaseEntry,
+        filename: str = None,
+        file_size: int = None
+    ) -> bool:
+        """Add an entry and persist it; returns False for duplicates"""
+        return bool(await self.add_entries(business_id, [entry], filename, file_size))
+
+    async def add_entries(
+        self,
+        business_id: str,
+        entries: List[KnowledgeBaseEntry],
+        filename: str = None,
+        file_size: int = None
+    ) -> List[str]:
+        """
+        Add entries and persist them in one transaction with one version
+        bump; returns the ids that were added (duplicates are skipped)
+        """
+        kb = await self.get(business_id)
+        entries = [e for e in entries if not kb.get_by_hash(e.content_hash) and not kb.get_entry(e.id)]
+        if not entries:
+            return []
+        prepared = await asyncio.to_thread(lambda: [kb.prepare_entry(e) for e in entries])
+        added = [e for e, p in zip(entries, prepared) if kb.add_entry(e, p)]
+        if not added:
+            return []
+
+        if self.persistent:
+            from database_postgres import get_connection
+
+            try:
+                async with get_connection() as conn:
+                    async with conn.transaction():
+                        rows = await conn.fetch("""
+                            INSERT INTO knowledge_base
+                            (id, business_id, title, content, category, source_type, filename, file_size, content_hash)
+                            SELECT e.id, $1, e.title, e.content, e.category, e.source_type, $2, $3, e.content_hash
+                            FROM unnest($4::uuid[], $5::text[], $6::text[], $7::text[], $8::text[], $9::text[])
+                                AS e(id, title, content, category, source_type, content_hash)
+                            ON CONFLICT DO NOTHING
+                            RETURNING id
+                        """,
+                            uuid.UUID(business_id),
+                            filename,
+                            file_size,
+                            [uuid.UUID(e.id) for e in added],
+                            [e.title[:255] for e in added],
+                            [e.content for e in added],
+                            [e.category for e in added],
+                            [e.source_type for e in added],
+                            [e.content_hash for e in added]
+                        )
+                        inserted = {str(row['id']) for row in rows}
+                        if inserted:
+                            version = await self._bump_version(conn, business_id)
+            except Exception:
+                for entry in added:
+                    kb.remove_entry(entry.id)
+                raise
+
+            if len(inserted) < len(added):
+                # Another worker already stored some of the same content; reload to pick up its rows
+                for entry in added:
+                    if entry.id not in inserted:
+                        kb.remove_entry(entry.id)
+                self.checked_at[business_id] = 0
+                added = [e for e in added if e.id in inserted]
+            else:
+                self.versions[business_id] = version
+
+        if kb.vectors is not None:
+            kb.vectors.maybe_flush()
+        self._resize(business_id)
+        return [e.id for e in added]
+
+    async def remove_entry(self, business_id: str, entry_id: str) -> bool:
+        """Deactivate an entry in Postgres, then remove it from the cached KB"""
+        kb = await self.get(business_id)
+        if kb.get_entry(entry_id) is None:
+            return False
+
+        # Postgres first: if it fails the entry stays both there and here
+        version = None
+        if self.persistent:
+            from database_postgres import get_connection
+
+            async with get_connection() as conn:
+                async with conn.transaction():
+                    await conn.execute(
+                        "UPDATE knowledge_base SET is_active = false WHERE id = $1 AND business_id = $2",
+                        uuid.UUID(entry_id),
+                        uuid.UUID(business_id)
+                    )
+                    version = await self._bump_version(conn, business_id)
+
+        if not kb.remove_entry(entry_id):
+            return False
+        if version is not None:
+            self.versions[business_id] = version
+        if kb.vectors is not None:
+            kb.vectors.maybe_flush()
+        self._resize(business_id)
+        return True
 
-    def update_assistant_context(self, business_id: str, base_prompt: str) -> str:
+    @staticmethod
+    async def _bump_version(conn, business_id: str) -> int:
+        return await conn.fetchval("""
+            INSERT INTO knowledge_base_versions (business_id, version)
+            VALUES ($1, 1)
+            ON CONFLICT (business_id) DO UPDATE
+            SET version = knowledge_base_versions.version + 1, updated_at = NOW()
+            RETURNING version
+        """, uuid.UUID(business_id))
+
+    # -------------------------------------------------------------------------
+    # Prompt / stats helpers
+    # -------------------------------------------------------------------------
+
+    async def kb_version(self, business_id: str) -> Tuple[int, int]:
+        """Version of a business's KB: (persisted version, local revision)"""
+        kb = await self.get(business_id)
+        return (self.versions.get(business_id) or 0, kb.revision)
+
+    async def update_assistant_context(
+        self,
+        business_id: str,
+        base_prompt: str,
+        query: Optional[str] = None,
+        max_tokens: int = 4000
+    ) -> str:
         """Generate updated assistant prompt with knowledge base context"""
-        kb = self.get_or_create(business_id)
-        kb_context = kb.generate_context_prompt()
+        return with_kb_context(await self.get(business_id), base_prompt, query, max_tokens)
 
-        if kb_context:
-            return base_prompt + f"\n\nKNOWLEDGE BASE:\n{kb_context}"
-        return base_prompt
-
-    def get_stats(self, business_id: str) -> Dict:
+    async def get_stats(self, business_id: str) -> Dict:
         """Get knowledge base stats for a business"""
-        kb = self.get_or_create(business_id)
-        return kb.stats
+        return (await self.get(business_id)).stats
+
+    def cache_stats(self) -> Dict:
+        """Cache occupancy for health/debug endpoints"""
+        return {
+            "cached_knowledge_bases": len(self.knowledge_bases),
+            "cached_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "persistent": self.persistent
+        }
 
 
 # Global manager instance
@@ -0,0 +1,640 @@
+"""
+Knowledge Base Ingestion for CallBot AI
+Background document extraction in a process pool with per-tenant limits
+"""
+
+import os
+import re
+import csv
+import json
+import asyncio
+import secrets
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from knowledge_base import (
+    KnowledgeBaseEntry, kb_manager, new_entry_id, process_uploaded_file,
+    MAX_FILE_SIZE_MB, ALLOWED_EXTENSIONS
+)
+
+# Configuration
+EXTRACTION_WORKERS = int(os.getenv("KB_EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1))))
+MAX_JOBS_PER_TENANT = int(os.getenv("KB_MAX_JOBS_PER_TENANT", "2"))
+PDF_PAGES_PER_TASK = int(os.getenv("KB_PDF_PAGES_PER_TASK", "8"))
+UPLOAD_SPOOL_DIR = os.getenv("KB_UPLOAD_SPOOL_DIR") or None  # None = system temp dir
+SPOOL_CHUNK_BYTES = 1024 * 1024
+JOB_RETENTION = timedelta(hours=1)
+
+# Structured (CSV / JSON) uploads
+MAX_RECORDS_PER_FILE = int(os.getenv("KB_MAX_RECORDS_PER_FILE", "5000"))
+MAX_RECORD_CHARS = 2000
+RECORD_BATCH_SIZE = 200  # Records parsed per worker-thread hop
+JSON_READ_CHUNK = 64 * 1024
+STRUCTURED_EXTENSIONS = {".csv", ".json"}
+
+TITLE_COLUMNS = ("name", "title", "service", "item", "product", "question", "description")
+PRICE_COLUMNS = ("price", "cost", "rate", "fee", "amount")
+
+
+class JobStatus(Enum):
+    QUEUED = "queued"
+    PROCESSING = "processing"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class IngestionJob:
+    """A single uploaded file moving through extraction"""
+
+    def __init__(self, job_id: str, business_id: str, filename: str, path: str, size_bytes: int):
+        self.id = job_id
+        self.business_id = business_id
+        self.filename = filename
+        self.path = path
+        self.size_bytes = size_bytes
+        self.status = JobStatus.QUEUED
+        self.parts_total = 0
+        self.parts_done = 0
+        self.entry_ids: List[str] = []
+        self.extracted_chars = 0
+        self.records = 0
+        self.truncated = False
+        self.columns: Dict[str, str] = {}
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "status": self.status.value,
+            "size_bytes": self.size_bytes,
+            "progress": {
+                "parts_done": self.parts_done,
+                "parts_total": self.parts_total
+            },
+            "entry_ids": self.entry_ids,
+            "chars_extracted": self.extracted_chars,
+            "records": self.records,
+            "truncated": self.truncated,
+            "columns": self.columns,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+# =============================================================================
+# Worker-side extraction (runs in the process pool)
+# =============================================================================
+
+def _open_pdf(path: str):
+    try:
+        import PyPDF2
+    except ImportError:
+        raise RuntimeError("PDF extraction requires PyPDF2 library")
+    return PyPDF2.PdfReader(path)
+
+
+def _pdf_page_count(path: str) -> int:
+    return len(_open_pdf(path).pages)
+
+
+def _extract_pdf_pages(path: str, start: int, end: int) -> str:
+    """Extract text from pages [start, end) of a PDF on disk"""
+    reader = _open_pdf(path)
+    return "\n".join((reader.pages[i].extract_text() or "") for i in range(start, end)).strip()
+
+
+def _extract_docx_file(path: str) -> str:
+    try:
+        import docx
+    except ImportError:
+        raise RuntimeError("DOCX extraction requires python-docx library")
+    return "\n".join(para.text for para in docx.Document(path).paragraphs).strip()
+
+
+def _extract_other_file(path: str, filename: str, business_id: str) -> str:
+    with open(path, "rb") as f:
+        result = process_uploaded_file(filename, f.read(), business_id)
+    if not result["success"]:
+        raise RuntimeError(result["error"])
+    return result["content"]
+
+
+def _read_text_file(path: str) -> str:
+    with open(path, "rb") as f:
+        return f.read().decode("utf-8", errors="ignore")
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_extraction_pool() -> ProcessPoolExecutor:
+    """Get or create the shared extraction process pool"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=EXTRACTION_WORKERS)
+    return _pool
+
+
+def shutdown_extraction_pool():
+    """Stop extraction workers (call on app shutdown)"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+# =============================================================================
+# Spooling & Streaming Extraction
+# =============================================================================
+
+async def spool_upload(upload, max_bytes: int = MAX_FILE_SIZE_MB * 1024 * 1024) -> Tuple[str, int]:
+    """
+    Copy an UploadFile to a temp file in fixed-size chunks.
+    Returns (path, size_bytes); raises ValueError if the upload exceeds max_bytes.
+    """
+    suffix = os.path.splitext(upload.filename or "")[1].lower()
+    fd, path = tempfile.mkstemp(prefix="kb_upload_", suffix=suffix, dir=UPLOAD_SPOOL_DIR)
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await upload.read(SPOOL_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ValueError(f"File too large. Max size: {MAX_FILE_SIZE_MB}MB")
+                out.write(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path, size
+
+
+async def extract_document_parts(
+    path: str,
+    filename: str,
+    business_id: str,
+    on_total=None
+) -> AsyncIterator[Tuple[Optional[str], str]]:
+    """
+    Yield (label, text) parts of a document in order as they finish extracting.
+
+    PDFs are split into page ranges that extract in parallel across the pool;
+    other formats yield a single part. on_total(n) is called once the number
+    of parts is known.
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_extraction_pool()
+    ext = os.path.splitext(filename)[1].lower()
+
+    if ext == ".pdf":
+        page_count = await loop.run_in_executor(pool, _pdf_page_count, path)
+        ranges = [
+            (start, min(start + PDF_PAGES_PER_TASK, page_count))
+            for start in range(0, page_count, PDF_PAGES_PER_TASK)
+        ]
+        if on_total:
+            on_total(len(ranges))
+        futures = [
+            loop.run_in_executor(pool, _extract_pdf_pages, path, start, end)
+            for start, end in ranges
+        ]
+        try:
+            for (start, end), future in zip(ranges, futures):
+                text = await future
+                label = f"pages {start + 1}-{end}" if len(ranges) > 1 else None
+                yield label, text
+        finally:
+            for future in futures:
+                future.cancel()
+        return
+
+    if on_total:
+        on_total(1)
+    if ext in (".txt", ".md"):
+        text = await asyncio.to_thread(_read_text_file, path)
+    elif ext in (".doc", ".docx"):
+        text = await loop.run_in_executor(pool, _extract_docx_file, path)
+    else:
+        text = await loop.run_in_executor(pool, _extract_other_file, path, filename, business_id)
+    yield None, text
+
+
+# =============================================================================
+# Structured Records (CSV / JSON)
+# =============================================================================
+
+_NUMBER_RE = re.compile(r"^[-+]?\$?\s*(\d{1,3}(,\d{3})+|\d+)(\.\d+)?$")
+
+
+def infer_value(raw: Any) -> Any:
+    """Convert a cell to bool/int/float where it clearly is one; '$1,250.00' -> 1250.0"""
+    if not isinstance(raw, str):
+        return raw
+    value = raw.strip()
+    lowered = value.lower()
+    if lowered in ("true", "yes"):
+        return True
+    if lowered in ("false", "no"):
+        return False
+    if _NUMBER_RE.match(value):
+        number = value.replace("$", "").replace(",", "").replace(" ", "")
+        return float(number) if "." in number else int(number)
+    return value
+
+
+def value_type(value: Any) -> str:
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, int):
+        return "integer"
+    if isinstance(value, float):
+        return "number"
+    if isinstance(value, (list, dict)):
+        return "object"
+    return "string"
+
+
+def merge_types(seen: Optional[str], kind: str) -> str:
+    """Widen a column's inferred type to cover a new value"""
+    if seen is None or seen == kind:
+        return kind
+    if {seen, kind} == {"integer", "number"}:
+        return "number"
+    return "string"
+
+
+def _flatten(record: Dict, prefix: str = "") -> Iterator[Tuple[str, Any]]:
+    for key, value in record.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from _flatten(value, name + ".")
+        elif isinstance(value, list):
+            yield name, ", ".join(str(v) for v in value if not isinstance(v, (dict, list)))
+        else:
+            yield name, value
+
+
+def iter_csv_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Stream rows of a CSV file as dicts (empty cells dropped)"""
+    with open(path, newline="", encoding="utf-8-sig", errors="replace") as f:
+        sample = f.read(8192)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+        except csv.Error:
+            dialect = csv.excel
+
+        for row in csv.DictReader(f, dialect=dialect):
+            record = {
+                key.strip(): value.strip()
+                for key, value in row.items()
+                if key and isinstance(value, str) and value.strip()
+            }
+            if record:
+                yield record
+
+
+class _JSONReader:
+    """Incremental JSON reader over a text file; only the value being decoded is buffered"""
+
+    WHITESPACE = " \t\r\n"
+
+    def __init__(self, f, chunk_size: int = JSON_READ_CHUNK):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size: Optional[int] = None) -> bool:
+        chunk = self.f.read(size or self.chunk_size)
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        self.eof = not chunk
+        return bool(chunk)
+
+    def peek(self, skip: str = WHITESPACE) -> str:
+        """The next character after any in `skip` ("" at the end of the file)"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in skip:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def take(self):
+        """Consume the character peek() returned"""
+        self.pos += 1
+
+    def decode(self) -> Any:
+        """Decode the value at the current position"""
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                # Grow geometrically so one large value isn't re-parsed per chunk
+                self._fill(max(self.chunk_size, len(self.buffer) - self.pos))
+                continue
+            # A number at the very end of the buffer might continue in the next chunk
+            if end == len(self.buffer) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def iter_array(self) -> Iterator[Any]:
+        """Elements of the array whose "[" was just taken"""
+        while True:
+            char = self.peek(self.WHITESPACE + ",")
+            if char in ("]", ""):
+                if char:
+                    self.take()
+                return
+            yield self.decode()
+
+    def iter_keys(self) -> Iterator[str]:
+        """Keys of the object whose "{" was just taken; the caller reads each value before the next key"""
+        while True:
+            char = self.peek(self.WHITESPACE + ",")
+            if char in ("}", ""):
+                if char:
+                    self.take()
+                return
+            key = self.decode()
+            self.peek(self.WHITESPACE + ":")
+            yield key
+
+
+def iter_json_values(path: str, chunk_size: int = JSON_READ_CHUNK) -> Iterator[Any]:
+    """
+    Incrementally decode a JSON file.
+
+    A top-level array yields its elements one at a time; a file of
+    concatenated values (JSON Lines) yields each value. Only the value being
+    decoded is held in memory.
+    """
+    with open(path, encoding="utf-8-sig", errors="replace") as f:
+        reader = _JSONReader(f, chunk_size)
+        if reader.peek() == "[":
+            reader.take()
+            yield from reader.iter_array()
+            return
+        while reader.peek():
+            yield reader.decode()
+
+
+def _value_records(value: Any) -> Iterator[Dict[str, Any]]:
+    if isinstance(value, dict):
+        lists = [(k, v) for k, v in value.items() if isinstance(v, list) and v and isinstance(v[0], dict)]
+        if lists:
+            for key, items in lists:
+                for item in items:
+                    if isinstance(item, dict):
+                        yield {"section": key, **item}
+        else:
+            yield value
+    elif isinstance(value, list):
+        for item in value:
+            if isinstance(item, dict):
+                yield item
+
+
+_END = object()
+
+
+def _stream_object_records(reader: _JSONReader) -> Iterator[Dict[str, Any]]:
+    """_value_records for the object whose "{" was just taken, streaming its lists of objects"""
+    rest: Dict[str, Any] = {}
+    unpacked = False
+    for key in reader.iter_keys():
+        if reader.peek() != "[":
+            rest[key] = reader.decode()
+            continue
+        reader.take()
+        items = reader.iter_array()
+        first = next(items, _END)
+        if isinstance(first, dict):
+            unpacked = True
+            yield {"section": key, **first}
+            for item in items:
+                if isinstance(item, dict):
+                    yield {"section": key, **item}
+        else:
+            rest[key] = ([] if first is _END else [first]) + list(items)
+    if not unpacked:
+        yield rest
+
+
+def iter_json_records(path: str, chunk_size: int = JSON_READ_CHUNK) -> Iterator[Dict[str, Any]]:
+    """
+    Stream JSON objects. A top-level object is streamed too: each of its
+    lists of objects yields one record per item (tagged with the list's key
+    as "section"); an object without any is a single record.
+    """
+    with open(path, encoding="utf-8-sig", errors="replace") as f:
+        reader = _JSONReader(f, chunk_size)
+        if reader.peek() == "[":
+            reader.take()
+            for value in reader.iter_array():
+                yield from _value_records(value)
+            return
+        while True:
+            char = reader.peek()
+            if not char:
+                return
+            if char == "{":
+                reader.take()
+                yield from _stream_object_records(reader)
+            else:
+                yield from _value_records(reader.decode())
+
+
+def record_entry_fields(record: Dict[str, Any], filename: str) -> Tuple[str, str, str]:
+    """Build (title, content, category) for one record"""
+    fields = [(key, value) for key, value in _flatten(record) if value not in ("", None)]
+    lowered = {key.lower(): value for key, value in fields}
+
+    title = next((str(lowered[c]) for c in TITLE_COLUMNS if c in lowered and isinstance(lowered[c], str)), None)
+    if title is None:
+        title = next((str(v) for _, v in fields if isinstance(v, str)), filename)
+
+    if "question" in lowered and "answer" in lowered:
+        category = "faq"
+    elif any(any(p in key for p in PRICE_COLUMNS) for key in lowered):
+        category = "pricing"
+    else:
+        category = "services"
+
+    content = "\n".join(f"{key}: {value}" for key, value in fields)
+    return title[:255], content[:MAX_RECORD_CHARS], category
+
+
+def _read_batch(records: Iterator[Dict[str, Any]], size: int) -> List[Dict[str, Any]]:
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            break
+    return batch
+
+
+async def ingest_structured_file(job: "IngestionJob", max_records: int = MAX_RECORDS_PER_FILE):
+    """Turn each CSV row / JSON object into its own knowledge base record"""
+    ext = os.path.splitext(job.filename)[1].lower()
+    records = iter_csv_records(job.path) if ext == ".csv" else iter_json_records(job.path)
+
+    while True:
+        batch = await asyncio.to_thread(_read_batch, records, RECORD_BATCH_SIZE)
+        if not batch:
+            break
+        entries = []
+        for record in batch:
+            if job.records >= max_records:
+                job.truncated = True
+                break
+            job.records += 1
+            for key, value in _flatten(record):
+                job.columns[key] = merge_types(job.columns.get(key), value_type(infer_value(value)))
+
+            title, content, category = record_entry_fields(record, job.filename)
+            entries.append(KnowledgeBaseEntry(
+                entry_id=new_entry_id(),
+                business_id=job.business_id,
+                title=title,
+                content=content,
+                category=category,
+                source_type="record"
+            ))
+            job.extracted_chars += len(content)
+
+        # One transaction and one version bump per batch
+        job.entry_ids.extend(await kb_manager.add_entries(
+            job.business_id, entries, filename=job.filename, file_size=job.size_bytes
+        ))
+        job.parts_done = job.parts_total = job.records
+        if job.truncated:
+            return
+
+
+# =============================================================================
+# Job Manager
+# =============================================================================
+
+class IngestionJobManager:
+    """Runs extraction jobs in the background, a few at a time per business"""
+
+    def __init__(self, max_jobs_per_tenant: int = MAX_JOBS_PER_TENANT):
+        self.max_jobs_per_tenant = max_jobs_per_tenant
+        self.jobs: Dict[str, IngestionJob] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._active: Dict[str, int] = {}
+        self._tasks = set()
+
+    def submit(self, business_id: str, filename: str, path: str, size_bytes: int) -> IngestionJob:
+        """Queue a spooled file for extraction; returns immediately"""
+        self._prune()
+        job = IngestionJob(f"job_{secrets.token_hex(8)}", business_id, filename, path, size_bytes)
+        self.jobs[job.id] = job
+
+        task = asyncio.create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get_job(self, business_id: str, job_id: str) -> Optional[IngestionJob]:
+        job = self.jobs.get(job_id)
+        if job and job.business_id == business_id:
+            return job
+        return None
+
+    def get_business_jobs(self, business_id: str) -> List[IngestionJob]:
+        return [j for j in self.jobs.values() if j.business_id == business_id]
+
+    async def wait(self):
+        """Wait for all in-flight jobs (used on shutdown and in tests)"""
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def _run(self, job: IngestionJob):
+        business_id = job.business_id
+        semaphore = self._semaphores.get(business_id)
+        if semaphore is None:
+            semaphore = self._semaphores[business_id] = asyncio.Semaphore(self.max_jobs_per_tenant)
+        self._active[business_id] = self._active.get(business_id, 0) + 1
+
+        try:
+            async with semaphore:
+                job.status = JobStatus.PROCESSING
+
+                if os.path.splitext(job.filename)[1].lower() in STRUCTURED_EXTENSIONS:
+                    await ingest_structured_file(job)
+                    job.status = JobStatus.COMPLETED
+                    return
+
+                def set_total(total: int):
+                    job.parts_total = total
+
+                async for label, text in extract_document_parts(job.path, job.filename, business_id, set_total):
+                    job.parts_done += 1
+                    if not text.strip():
+                        continue
+                    entry = KnowledgeBaseEntry(
+                        entry_id=new_entry_id(),
+                        business_id=business_id,
+                        title=f"{job.filename} ({label})" if label else job.filename,
+                        content=text,
+                        category="upload",
+                        source_type="upload"
+                    )
+                    if await kb_manager.add_entry(business_id, entry, filename=job.filename, file_size=job.size_bytes):
+                        job.entry_ids.append(entry.id)
+                    job.extracted_chars += len(text)
+
+                job.status = JobStatus.COMPLETED
+        except Exception as e:
+            job.status = JobStatus.FAILED
+            job.error = f"Error processing file: {str(e)}"
+        finally:
+            job.finished_at = datetime.utcnow()
+            try:
+                os.unlink(job.path)
+            except OSError:
+                pass
+            self._active[business_id] -= 1
+            if not self._active[business_id]:
+                del self._active[business_id]
+                self._semaphores.pop(business_id, None)
+
+    def _prune(self):
+        """Forget finished jobs past the retention window"""
+        cutoff = datetime.utcnow() - JOB_RETENTION
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.finished_at and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+
+def validate_upload_filename(filename: str) -> Optional[str]:
+    """Return an error message if the file type isn't accepted"""
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext not in ALLOWED_EXTENSIONS:
+        return f"File type not allowed. Allowed: {', '.join(ALLOWED_EXTENSIONS)}"
+    return None
+
+
+# Global ingestion manager
+ingestion_manager = IngestionJobManager()
@@ -0,0 +1,447 @@
+"""
+Knowledge Base Vector Index for CallBot AI
+Offline chunk embeddings stored as int8 arrays for semantic and hybrid search
+"""
+
+import os
+import re
+import json
+import uuid
+import zlib
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from knowledge_base import tokenize, stem_token
+
+# Configuration
+VECTOR_INDEX_DIR = os.getenv("KB_VECTOR_DIR")  # None = keep vectors in memory only
+EMBEDDING_DIM = int(os.getenv("KB_EMBEDDING_DIM", "512"))
+VECTOR_TOP_K = 50
+VECTOR_MIN_SIMILARITY = 0.12
+VECTOR_FLUSH_ROWS = 256  # Pending rows before they are written to disk
+IVF_MIN_ROWS = 50000  # Below this, brute force is faster than probing lists
+IVF_PROBES = 8
+RRF_K = 60  # Reciprocal rank fusion constant
+
+# Phrases and words that mean the same thing to a caller, mapped to one concept
+CONCEPT_PHRASES = {
+    "how much": "price",
+    "what does it cost": "price",
+    "air conditioning": "hvac",
+    "air conditioner": "hvac",
+    "a/c": "hvac",
+    "heat pump": "hvac",
+    "hot water": "water heater",
+    "same day": "emergency",
+    "right away": "emergency",
+    "after hours": "emergency",
+}
+
+CONCEPT_WORDS = {
+    "ac": "hvac",
+    "furnace": "hvac",
+    "heating": "hvac",
+    "cooling": "hvac",
+    "fix": "repair",
+    "broken": "repair",
+    "service": "repair",
+    "cost": "price",
+    "charge": "price",
+    "fee": "price",
+    "rate": "price",
+    "quote": "estimate",
+    "urgent": "emergency",
+    "asap": "emergency",
+    "book": "appointment",
+    "schedule": "appointment",
+    "open": "hours",
+    "close": "hours",
+}
+
+_PHRASE_RE = re.compile("|".join(re.escape(p) for p in sorted(CONCEPT_PHRASES, key=len, reverse=True)))
+_CONCEPT_STEMS = {stem_token(word): stem_token(concept) for word, concept in CONCEPT_WORDS.items()}
+
+
+def expand_query(query: str) -> str:
+    """Append concept words to a query so keyword search also catches paraphrases"""
+    expanded = _PHRASE_RE.sub(lambda m: f"{m.group(0)} {CONCEPT_PHRASES[m.group(0)]}", query.lower())
+    concepts = [CONCEPT_WORDS[word] for word in re.findall(r"[a-z0-9]+", expanded) if word in CONCEPT_WORDS]
+    return " ".join([expanded] + concepts)
+
+
+# =============================================================================
+# Embedding
+# =============================================================================
+
+class HashingEmbedder:
+    """
+    Feature-hashing embedder that needs no model, network or GPU.
+
+    Words, word bigrams and character trigrams are hashed into a fixed number
+    of signed buckets; a small concept table folds common caller paraphrases
+    ("how much to fix AC") onto the wording businesses use ("air conditioning
+    repair pricing"). Any object with `name`, `dim` and `embed(texts)` can be
+    used instead.
+    """
+
+    name = "hashing-v1"
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+
+    def features(self, text: str) -> Dict[str, float]:
+        text = _PHRASE_RE.sub(lambda m: f" {CONCEPT_PHRASES[m.group(0)]} ", text.lower())
+        tokens = tokenize(text)
+        features: Dict[str, float] = {}
+
+        for i, token in enumerate(tokens):
+            features["w:" + token] = features.get("w:" + token, 0.0) + 1.0
+            concept = _CONCEPT_STEMS.get(token)
+            if concept:
+                features["w:" + concept] = features.get("w:" + concept, 0.0) + 1.0
+            if i:
+                bigram = f"b:{tokens[i - 1]}_{token}"
+                features[bigram] = features.get(bigram, 0.0) + 0.5
+            padded = f"#{token}#"
+            for j in range(len(padded) - 2):
+                gram = "c:" + padded[j:j + 3]
+                features[gram] = features.get(gram, 0.0) + 0.25
+        return features
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts as L2-normalized float32 rows"""
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, weight in self.features(text).items():
+                h = zlib.crc32(feature.encode())
+                sign = 1.0 if h & 0x80000000 else -1.0
+                vectors[row, h % self.dim] += sign * (1.0 + np.log(weight) if weight > 1 else weight)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+def quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-row symmetric int8 quantization; returns (codes, scales)"""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+# =============================================================================
+# Vector Index
+# =============================================================================
+
+class VectorIndex:
+    """
+    Chunk embeddings for one business.
+
+    Saved rows are int8 codes with a per-row scale, kept in .npy files that
+    are memory-mapped read-only; new rows sit in a small float32 buffer until
+    flushed, and removed rows are tombstoned until the next flush compacts
+    the arrays. Large indexes get an IVF layer (k-means lists) so a query
+    only scores a few lists.
+    """
+
+    def __init__(self, business_id: str, directory: Optional[str] = None, embedder=None):
+        self.business_id = business_id
+        self.directory = directory
+        self.embedder = embedder or HashingEmbedder()
+
+        self.ids: List[str] = []  # saved row -> chunk id
+        self.rows: Dict[str, int] = {}  # chunk id -> saved row
+        self.codes = np.zeros((0, self.embedder.dim), dtype=np.int8)
+        self.scales = np.zeros(0, dtype=np.float32)
+        self.deleted = np.zeros(0, dtype=bool)
+        self.centroids: Optional[np.ndarray] = None
+        self.lists: Optional[np.ndarray] = None  # saved row -> IVF list
+
+        self.pending_ids: List[str] = []
+        self.pending: List[np.ndarray] = []
+        self.pending_rows: Dict[str, int] = {}
+        self.generation: Optional[str] = None  # files on disk this index last wrote or loaded
+
+        if directory:
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self.rows) - int(self.deleted.sum()) + len(self.pending_rows)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        row = self.rows.get(chunk_id)
+        return chunk_id in self.pending_rows or (row is not None and not self.deleted[row])
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self.pending_ids) or bool(self.deleted.any())
+
+    @property
+    def memory_bytes(self) -> int:
+        """Resident bytes (mapped rows are page cache, not heap)"""
+        return len(self.pending_ids) * (self.embedder.dim * 4 + 64) + len(self.rows) * 64
+
+    # -------------------------------------------------------------------------
+    # Updates
+    # -------------------------------------------------------------------------
+
+    def embed_missing(self, items: Iterable[Tuple[str, str]]) -> Dict[str, np.ndarray]:
+        """
+        Embed the (chunk_id, text) pairs not already indexed, without changing
+        the index, so callers can do it in a worker thread and hand the result
+        to add_many
+        """
+        new = [(chunk_id, text) for chunk_id, text in items
+               if chunk_id not in self.rows and chunk_id not in self.pending_rows]
+        if not new:
+            return {}
+        return dict(zip((chunk_id for chunk_id, _ in new), self.embedder.embed([text for _, text in new])))
+
+    def add_many(self, items: Iterable[Tuple[str, str]], embedded: Optional[Dict[str, np.ndarray]] = None):
+        """
+        Embed and add (chunk_id, text) pairs; ids already indexed are skipped,
+        and vectors in `embedded` (from embed_missing) are used as they are
+        """
+        new = []
+        for chunk_id, text in items:
+            row = self.rows.get(chunk_id)
+            if row is not None:
+                self.deleted[row] = False  # Chunk ids are immutable, so the saved row is still valid
+            elif chunk_id not in self.pending_rows:
+                new.append((chunk_id, text))
+        if not new:
+            return
+
+        embedded = dict(embedded or {})
+        missing = [(chunk_id, text) for chunk_id, text in new if chunk_id not in embedded]
+        if missing:
+            embedded.update(zip((chunk_id for chunk_id, _ in missing), self.embedder.embed([text for _, text in missing])))
+        for chunk_id, _ in new:
+            self.pending_rows[chunk_id] = len(self.pending_ids)
+            self.pending_ids.append(chunk_id)
+            self.pending.append(embedded[chunk_id])
+
+    def remove(self, chunk_id: str):
+        if chunk_id in self.pending_rows:
+            i = self.pending_rows.pop(chunk_id)
+            self.pending_ids[i] = None
+            return
+        row = self.rows.get(chunk_id)
+        if row is not None:
+            self.deleted[row] = True
+
+    def retain(self, chunk_ids: Iterable[str]):
+        """Tombstone every saved row not in chunk_ids (after a reload)"""
+        keep = set(chunk_ids)
+        for chunk_id, row in self.rows.items():
+            if chunk_id not in keep:
+                self.deleted[row] = True
+
+    # -------------------------------------------------------------------------
+    # Search
+    # -------------------------------------------------------------------------
+
+    def search(
+        self,
+        query: str,
+        k: int = VECTOR_TOP_K,
+        min_similarity: float = VECTOR_MIN_SIMILARITY,
+        allowed: Optional[Set[str]] = None
+    ) -> List[Tuple[str, float]]:
+        """Cosine top-k over saved and pending rows (only `allowed` ids, if given), best first"""
+        q = self.embedder.embed([query])[0]
+        if not q.any():
+            return []
+
+        candidates: List[Tuple[str, float]] = []
+
+        if allowed is not None:
+            # Scan exactly the allowed rows rather than the probed IVF lists
+            rows = np.array(sorted(self.rows[c] for c in allowed if c in self.rows), dtype=np.int64)
+        else:
+            rows = self._probe(q) if len(self.ids) else np.zeros(0, dtype=np.int64)
+        if rows is None or len(rows):
+            codes = self.codes if rows is None else self.codes[rows]
+            scores = (codes @ q) * (self.scales if rows is None else self.scales[rows])
+            deleted = self.deleted if rows is None else self.deleted[rows]
+            scores[deleted] = -1.0
+            top = np.argpartition(-scores, min(k, len(scores) - 1))[:k]
+            for i in top:
+                if scores[i] >= min_similarity:
+                    row = i if rows is None else rows[i]
+                    candidates.append((self.ids[row], float(scores[i])))
+
+        live = [i for chunk_id, i in self.pending_rows.items() if allowed is None or chunk_id in allowed]
+        if live:
+            matrix = np.stack([self.pending[i] for i in live])
+            scores = matrix @ q
+            for i, score in zip(live, scores):
+                if score >= min_similarity:
+                    candidates.append((self.pending_ids[i], float(score)))
+
+        candidates.sort(key=lambda item: item[1], reverse=True)
+        return candidates[:k]
+
+    def _probe(self, q: np.ndarray) -> Optional[np.ndarray]:
+        """Rows in the IVF lists nearest the query, or None to scan everything"""
+        if self.centroids is None:
+            return None
+        nearest = np.argsort(-(self.centroids @ q))[:IVF_PROBES]
+        return np.flatnonzero(np.isin(self.lists, nearest))
+
+    # -------------------------------------------------------------------------
+    # Persistence
+    # -------------------------------------------------------------------------
+
+    def maybe_flush(self):
+        """Flush once enough rows are pending or tombstoned"""
+        if len(self.pending_ids) >= VECTOR_FLUSH_ROWS or self.deleted.sum() >= max(VECTOR_FLUSH_ROWS, len(self.ids) // 10):
+            self.flush()
+
+    def flush(self):
+        """Compact tombstones, fold pending rows in and (if configured) write to disk"""
+        keep = np.flatnonzero(~self.deleted)
+        ids = [self.ids[i] for i in keep]
+        codes = [np.asarray(self.codes[keep])]
+        scales = [np.asarray(self.scales[keep])]
+
+        live = [(self.pending_ids[i], self.pending[i]) for i in self.pending_rows.values()]
+        if live:
+            pending_codes, pending_scales = quantize(np.stack([vector for _, vector in live]))
+            ids.extend(chunk_id for chunk_id, _ in live)
+            codes.append(pending_codes)
+            scales.append(pending_scales)
+
+        codes = np.concatenate(codes) if ids else np.zeros((0, self.embedder.dim), dtype=np.int8)
+        scales = np.concatenate(scales).astype(np.float32) if ids else np.zeros(0, dtype=np.float32)
+        centroids, lists = self._build_ivf(codes, scales)
+
+        if self.directory:
+            generation = self._write(ids, codes, scales, centroids, lists)
+            if not self._load() or self.generation != generation:
+                # Another worker's manifest replaced ours before we read it back; it
+                # lacks this index's pending rows, so keep what was just flushed
+                self._remove_generation(generation)
+                self._set(ids, codes, scales, centroids, lists)
+                self.generation = None
+        else:
+            self._set(ids, codes, scales, centroids, lists)
+
+        self.pending_ids, self.pending, self.pending_rows = [], [], {}
+
+    def _build_ivf(self, codes: np.ndarray, scales: np.ndarray, iterations: int = 8):
+        n = len(codes)
+        if n < IVF_MIN_ROWS:
+            return None, None
+
+        n_lists = int(np.sqrt(n))
+        rng = np.random.default_rng(0)
+        sample = rng.choice(n, size=min(n, n_lists * 64), replace=False)
+        vectors = codes[sample].astype(np.float32) * scales[sample, None]
+        centroids = vectors[rng.choice(len(vectors), size=n_lists, replace=False)]
+        for _ in range(iterations):
+            assign = np.argmax(vectors @ centroids.T, axis=1)
+            for c in range(n_lists):
+                members = vectors[assign == c]
+                if len(members):
+                    centroid = members.mean(axis=0)
+                    centroids[c] = centroid / (np.linalg.norm(centroid) or 1.0)
+
+        lists = np.empty(n, dtype=np.int32)
+        for start in range(0, n, 65536):
+            block = codes[start:start + 65536].astype(np.float32)
+            lists[start:start + 65536] = np.argmax(block @ centroids.T, axis=1)
+        return centroids.astype(np.float32), lists
+
+    def _set(self, ids, codes, scales, centroids=None, lists=None):
+        self.ids = list(ids)
+        self.rows = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        self.codes = codes
+        self.scales = scales
+        self.deleted = np.zeros(len(self.ids), dtype=bool)
+        self.centroids = centroids
+        self.lists = lists
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, self.business_id, name)
+
+    def _array_path(self, name: str, generation: Optional[str]) -> str:
+        return self._path(f"{name}-{generation}.npy" if generation else f"{name}.npy")
+
+    def _write(self, ids, codes, scales, centroids, lists):
+        # Each flush writes a new generation of arrays under its own names and
+        # then swaps the manifest to point at it, so workers flushing the same
+        # business at once can't truncate or mix each other's files
+        os.makedirs(os.path.join(self.directory, self.business_id), exist_ok=True)
+        generation = uuid.uuid4().hex
+        arrays = {"codes": codes, "scales": scales}
+        if centroids is not None:
+            arrays.update({"centroids": centroids, "lists": lists})
+        for name, array in arrays.items():
+            with open(self._array_path(name, generation), "wb") as f:
+                np.save(f, array)
+
+        tmp = self._path(f"manifest.json.{generation}.tmp")
+        with open(tmp, "w") as f:
+            json.dump({
+                "embedder": self.embedder.name, "dim": self.embedder.dim,
+                "generation": generation, "arrays": sorted(arrays), "ids": ids
+            }, f)
+        os.replace(tmp, self._path("manifest.json"))
+
+        previous, self.generation = self.generation, generation
+        if previous != generation:
+            self._remove_generation(previous)
+        return generation
+
+    def _remove_generation(self, generation: Optional[str]):
+        # Mapped files stay readable after unlink, so only the names go
+        for name in ("codes", "scales", "centroids", "lists"):
+            try:
+                os.unlink(self._array_path(name, generation))
+            except OSError:
+                pass
+
+    def _load(self, attempts: int = 3) -> bool:
+        """Read the current manifest's arrays; False if there is nothing usable"""
+        for _ in range(attempts):
+            try:
+                with open(self._path("manifest.json")) as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                return False
+            if manifest.get("embedder") != self.embedder.name or manifest.get("dim") != self.embedder.dim:
+                return False  # Embeddings from another model; rebuild from scratch
+
+            generation = manifest.get("generation")
+            arrays = manifest.get("arrays", ["codes", "scales"])
+            try:
+                codes = np.load(self._array_path("codes", generation), mmap_mode="r")
+                scales = np.load(self._array_path("scales", generation))
+                centroids = lists = None
+                if "centroids" in arrays or (not generation and os.path.exists(self._array_path("centroids", None))):
+                    centroids = np.load(self._array_path("centroids", generation))
+                    lists = np.load(self._array_path("lists", generation), mmap_mode="r")
+            except (OSError, ValueError):
+                continue  # Another worker replaced this generation; read the new manifest
+            if len(codes) != len(manifest["ids"]) or len(scales) != len(codes):
+                return False
+            self.generation = generation
+            self._set(manifest["ids"], codes, scales, centroids, lists)
+            return True
+        return False
+
+
+def open_vector_index(business_id: str) -> VectorIndex:
+    """Open (or create) a business's vector index in the configured directory"""
+    return VectorIndex(business_id, VECTOR_INDEX_DIR)
+
+
+def reciprocal_rank_fusion(*rankings: List[str], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """Merge ranked id lists; ids ranked well by any list rise to the top"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,235 @@
+"""
+Lead Scoring Jobs for CallBot AI
+Per-business scoring rules and batch scoring of new calls into lead_scores
+"""
+
+import os
+import json
+import uuid
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from analytics_service import CompiledLeadRules, LeadScoring
+
+LEAD_SCORING_BATCH_SIZE = int(os.getenv("LEAD_SCORING_BATCH_SIZE", "500"))
+LEAD_SCORING_INTERVAL = int(os.getenv("LEAD_SCORING_INTERVAL", "60"))  # seconds
+
+# Calls that have no score yet, oldest first (anti-join on the unique call_id index)
+SELECT_UNSCORED_CALLS_SQL = """
+    SELECT c.id, c.business_id, c.duration, c.appointment_booked, c.callback_requested, c.transcript
+    FROM calls c
+    WHERE NOT EXISTS (SELECT 1 FROM lead_scores s WHERE s.call_id = c.id)
+    ORDER BY c.created_at
+    LIMIT $1
+"""
+
+# Keyset pagination over one business's calls
+SELECT_BUSINESS_CALLS_SQL = """
+    SELECT id, business_id, duration, appointment_booked, callback_requested, transcript
+    FROM calls
+    WHERE business_id = $1 AND ($2::uuid IS NULL OR id > $2)
+    ORDER BY id
+    LIMIT $3
+"""
+
+SELECT_RULES_SQL = """
+    SELECT business_id, rules, updated_at
+    FROM lead_scoring_rules
+    WHERE business_id = ANY($1::uuid[])
+"""
+
+UPSERT_RULES_SQL = """
+    INSERT INTO lead_scoring_rules (business_id, rules, updated_at)
+    VALUES ($1, $2::jsonb, NOW())
+    ON CONFLICT (business_id) DO UPDATE
+    SET rules = EXCLUDED.rules, updated_at = NOW()
+    RETURNING updated_at
+"""
+
+UPSERT_SCORE_SQL = """
+    INSERT INTO lead_scores (business_id, call_id, score, grade, label, priority, breakdown)
+    VALUES ($1, $2, $3, $4, $5, $6, $7::jsonb)
+    ON CONFLICT (call_id) DO UPDATE SET
+        score = EXCLUDED.score,
+        grade = EXCLUDED.grade,
+        label = EXCLUDED.label,
+        priority = EXCLUDED.priority,
+        breakdown = EXCLUDED.breakdown
+"""
+
+# Served by idx_lead_scores_business_score
+TOP_LEADS_SQL = """
+    SELECT s.call_id, s.score, s.grade, s.label, s.priority, s.breakdown, s.created_at,
+           c.caller_phone, c.caller_name
+    FROM lead_scores s
+    JOIN calls c ON c.id = s.call_id
+    WHERE s.business_id = $1
+    ORDER BY s.score DESC, s.created_at DESC
+    LIMIT $2
+"""
+
+
+def validate_rules(config: Dict) -> Dict:
+    """Check a rules document and return it normalized; raises ValueError"""
+    if not isinstance(config, dict):
+        raise ValueError("Rules must be an object")
+    normalized = {}
+
+    signals = config.get("signals") or {}
+    if not isinstance(signals, dict):
+        raise ValueError("signals must be an object of {name: {keywords, points}}")
+    normalized["signals"] = {}
+    for name, rule in signals.items():
+        if not isinstance(rule, dict):
+            raise ValueError(f"Signal {name} must be an object")
+        keywords = rule.get("keywords", [])
+        if not isinstance(keywords, list) or not all(isinstance(k, str) for k in keywords):
+            raise ValueError(f"Signal {name} keywords must be a list of strings")
+        normalized["signals"][name] = {
+            "keywords": [k.strip() for k in keywords if k.strip()],
+            "points": int(rule.get("points", 0))
+        }
+
+    if "duration_thresholds" in config:
+        normalized["duration_thresholds"] = [[int(t), int(p)] for t, p in config["duration_thresholds"]]
+    for key in ("appointment_booked", "callback_requested"):
+        if key in config:
+            normalized[key] = int(config[key])
+
+    CompiledLeadRules.from_config(normalized)  # Fails early on anything that won't compile
+    return normalized
+
+
+class LeadRulesCache:
+    """Compiled rules per business, recompiled when the stored rules change"""
+
+    def __init__(self):
+        self.compiled: Dict[str, Tuple[object, CompiledLeadRules]] = {}  # business_id -> (updated_at, rules)
+
+    def get(self, business_id: str, config: Optional[Dict], updated_at=None) -> CompiledLeadRules:
+        if config is None:
+            return LeadScoring.default_rules()
+        cached = self.compiled.get(business_id)
+        if cached is not None and cached[0] == updated_at:
+            return cached[1]
+        rules = CompiledLeadRules.from_config(config)
+        self.compiled[business_id] = (updated_at, rules)
+        return rules
+
+    async def load(self, conn, business_ids: List) -> Dict[str, CompiledLeadRules]:
+        """Compiled rules for each business (defaults where none are stored)"""
+        rows = await conn.fetch(SELECT_RULES_SQL, [uuid.UUID(str(b)) for b in business_ids])
+        stored = {str(row["business_id"]): row for row in rows}
+        result = {}
+        for business_id in business_ids:
+            row = stored.get(str(business_id))
+            if row is None:
+                result[str(business_id)] = LeadScoring.default_rules()
+                continue
+            config = json.loads(row["rules"]) if isinstance(row["rules"], str) else row["rules"]
+            result[str(business_id)] = self.get(str(business_id), config, row["updated_at"])
+        return result
+
+
+async def save_rules(conn, business_id: str, config: Dict) -> Dict:
+    rules = validate_rules(config)
+    await conn.fetchval(UPSERT_RULES_SQL, uuid.UUID(business_id), json.dumps(rules))
+    lead_rules_cache.compiled.pop(business_id, None)
+    return rules
+
+
+def score_batch(rows: List[Dict], rules_by_business: Dict[str, CompiledLeadRules]) -> List[Tuple]:
+    """Score call rows and build lead_scores upsert arguments"""
+    args = []
+    for row in rows:
+        business_id = str(row["business_id"])
+        result = LeadScoring.score_lead(row, rules_by_business.get(business_id))
+        args.append((
+            row["business_id"], row["id"], result["score"], result["grade"], result["label"],
+            result["priority"], json.dumps(result["breakdown"])
+        ))
+    return args
+
+
+async def score_new_calls(conn, batch_size: int = LEAD_SCORING_BATCH_SIZE) -> int:
+    """Score one batch of unscored calls; returns how many were scored"""
+    rows = [dict(row) for row in await conn.fetch(SELECT_UNSCORED_CALLS_SQL, batch_size)]
+    if not rows:
+        return 0
+    rules = await lead_rules_cache.load(conn, sorted({str(row["business_id"]) for row in rows}))
+    await conn.executemany(UPSERT_SCORE_SQL, score_batch(rows, rules))
+    return len(rows)
+
+
+async def rescore_business(conn, business_id: str, batch_size: int = LEAD_SCORING_BATCH_SIZE) -> int:
+    """Rescore all of a business's calls with its current rules (after a rules change)"""
+    bid = uuid.UUID(business_id)
+    rules = await lead_rules_cache.load(conn, [business_id])
+    after, total = None, 0
+    while True:
+        rows = [dict(row) for row in await conn.fetch(SELECT_BUSINESS_CALLS_SQL, bid, after, batch_size)]
+        if not rows:
+            return total
+        await conn.executemany(UPSERT_SCORE_SQL, score_batch(rows, rules))
+        total += len(rows)
+        after = rows[-1]["id"]
+
+
+async def get_call_score(conn, business_id: str, call_id: str) -> Optional[Dict]:
+    """A call's stored score, scoring (and storing) it now if the batch job hasn't yet"""
+    bid, cid = uuid.UUID(business_id), uuid.UUID(call_id)
+    row = await conn.fetchrow(
+        "SELECT score, grade, label, priority, breakdown FROM lead_scores WHERE call_id = $1 AND business_id = $2",
+        cid, bid
+    )
+    if row is not None:
+        result = dict(row)
+        if isinstance(result["breakdown"], str):
+            result["breakdown"] = json.loads(result["breakdown"])
+        return result
+
+    call = await conn.fetchrow(
+        "SELECT id, business_id, duration, appointment_booked, callback_requested, transcript "
+        "FROM calls WHERE id = $1 AND business_id = $2",
+        cid, bid
+    )
+    if call is None:
+        return None
+    rules = await lead_rules_cache.load(conn, [business_id])
+    (args,) = score_batch([dict(call)], rules)
+    await conn.execute(UPSERT_SCORE_SQL, *args)
+    return LeadScoring.score_lead(dict(call), rules[business_id])
+
+
+async def top_leads(conn, business_id: str, limit: int = 20) -> List[Dict]:
+    rows = await conn.fetch(TOP_LEADS_SQL, uuid.UUID(business_id), limit)
+    leads = []
+    for row in rows:
+        lead = dict(row)
+        lead["call_id"] = str(lead["call_id"])
+        if isinstance(lead["breakdown"], str):
+            lead["breakdown"] = json.loads(lead["breakdown"])
+        leads.append(lead)
+    return leads
+
+
+async def scoring_loop(acquire, interval: int = LEAD_SCORING_INTERVAL):
+    """
+    Score new calls in the background. Drains full batches back to back,
+    then sleeps. `acquire` is an async context manager factory yielding a
+    connection (e.g. pool.acquire).
+    """
+    while True:
+        try:
+            async with acquire() as conn:
+                while await score_new_calls(conn) == LEAD_SCORING_BATCH_SIZE:
+                    pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Lead scoring failed: {e}")
+        await asyncio.sleep(interval)
+
+
+# Global compiled-rules cache
+lead_rules_cache = LeadRulesCache()
@@ -7,9 +7,11 @@ import os
 import sys
 import json
 import logging
+import threading
 import traceback
 from datetime import datetime
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
+from collections import OrderedDict
 from functools import wraps
 import time
 
@@ -19,6 +21,16 @@ LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json or text
 LOG_FILE = os.getenv("LOG_FILE", "")  # Optional file path
 SERVICE_NAME = os.getenv("SERVICE_NAME", "callbotai")
 ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
+LOG_SAMPLING_ENABLED = os.getenv("LOG_SAMPLING_ENABLED", "false").lower() == "true"
+
+# Per-logger sampling rules, applied when LOG_SAMPLING_ENABLED is set.
+#   success_sample_rate: emit 1 in N records below WARNING (failures always pass)
+#   burst: identical messages allowed through before suppression kicks in
+#   refill_per_second: rate at which suppressed messages are allowed again
+SAMPLING_RULES = {
+    "callbotai.webhook": {"success_sample_rate": 10, "burst": 20, "refill_per_second": 2.0},
+    "callbotai.calls": {"success_sample_rate": 5, "burst": 50, "refill_per_second": 5.0},
+}
 
 
 class JSONFormatter(logging.Formatter):
@@ -87,6 +99,92 @@ class TextFormatter(logging.Formatter):
         return base
 
 
+# =============================================================================
+# Sampling & Suppression
+# =============================================================================
+
+class LogSampler:
+    """
+    Per-logger sampling and duplicate suppression.
+
+    Records below WARNING are sampled 1-in-N, and identical ones (same level
+    and text) draw from a token bucket; anything dropped there is reported
+    as a summary count the next time that message is allowed through (or on
+    flush). WARNING and above are never sampled or suppressed.
+    """
+
+    def __init__(
+        self,
+        success_sample_rate: int = 1,
+        burst: int = 0,
+        refill_per_second: float = 1.0,
+        max_keys: int = 1024
+    ):
+        self.success_sample_rate = max(1, int(success_sample_rate))
+        self.burst = int(burst)
+        self.refill_per_second = float(refill_per_second)
+        self.max_keys = max_keys
+        self._counter = 0
+        # key -> [tokens, last_refill, suppressed_count, first_suppressed_at]
+        self._buckets: "OrderedDict[Tuple[int, str], list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def should_sample(self, level: int) -> bool:
+        """1-in-N sampling for successes; failures are never sampled out"""
+        if level >= logging.WARNING or self.success_sample_rate == 1:
+            return True
+        with self._lock:
+            self._counter += 1
+            return self._counter % self.success_sample_rate == 1
+
+    def acquire(self, level: int, message: str) -> Tuple[bool, int, float]:
+        """
+        Take a token for this message (failures always pass).
+        Returns (allowed, suppressed_since_last_emit, suppressed_window_seconds)
+        """
+        if self.burst <= 0 or level >= logging.WARNING:
+            return True, 0, 0.0
+
+        key = (level, message)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._buckets.popitem(last=False)
+                bucket = [float(self.burst), now, 0, 0.0]
+                self._buckets[key] = bucket
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(
+                    float(self.burst),
+                    bucket[0] + (now - bucket[1]) * self.refill_per_second
+                )
+                bucket[1] = now
+
+            if bucket[0] < 1.0:
+                if bucket[2] == 0:
+                    bucket[3] = now
+                bucket[2] += 1
+                return False, 0, 0.0
+
+            bucket[0] -= 1.0
+            suppressed, since = bucket[2], bucket[3]
+            bucket[2] = 0
+            return True, suppressed, (now - since) if suppressed else 0.0
+
+    def drain_suppressed(self) -> list:
+        """Pop pending suppression counts as (level, message, count, window_seconds)"""
+        now = time.monotonic()
+        pending = []
+        with self._lock:
+            for (level, message), bucket in self._buckets.items():
+                if bucket[2]:
+                    pending.append((level, message, bucket[2], now - bucket[3]))
+                    bucket[2] = 0
+        return pending
+
+
 class StructuredLogger:
     """Logger with structured logging support"""
 
@@ -115,8 +213,59 @@ class StructuredLogger:
             file_handler.setFormatter(JSONFormatter())
             self.logger.addHandler(file_handler)
 
+        # Sampling is opt-in; None keeps the hot path to a single attribute check
+        self.sampler: Optional[LogSampler] = None
+        if LOG_SAMPLING_ENABLED and name in SAMPLING_RULES:
+            self.configure_sampling(**SAMPLING_RULES[name])
+
+    def configure_sampling(self, **rule):
+        """Enable sampling/suppression for this logger (see SAMPLING_RULES)"""
+        self.sampler = LogSampler(**rule)
+
+    def disable_sampling(self):
+        """Turn sampling off, emitting any pending suppression summaries first"""
+        self.flush_suppressed()
+        self.sampler = None
+
+    def flush_suppressed(self):
+        """Emit summary lines for messages still being suppressed"""
+        if self.sampler is None:
+            return
+        for level, message, count, window in self.sampler.drain_suppressed():
+            self._emit_suppressed_summary(level, message, count, window)
+
+    def _emit_suppressed_summary(self, level: int, message: str, count: int, window: float):
+        self._emit(
+            level,
+            f"Suppressed {count} repeated log messages",
+            {
+                "suppressed_message": message,
+                "suppressed_count": count,
+                "suppressed_window_seconds": round(window, 2)
+            }
+        )
+
     def _log(self, level: int, message: str, **kwargs):
         """Log with extra fields"""
+        sampler = self.sampler
+        if sampler is not None:
+            if not self.logger.isEnabledFor(level):
+                return
+            # Failures skip both stages: every WARNING and above is emitted
+            if level < logging.WARNING:
+                if not sampler.should_sample(level):
+                    return
+                allowed, suppressed, window = sampler.acquire(level, message)
+                if not allowed:
+                    return
+                if suppressed:
+                    self._emit_suppressed_summary(level, message, suppressed, window)
+                if sampler.success_sample_rate > 1:
+                    kwargs["sample_rate"] = sampler.success_sample_rate
+
+        self._emit(level, message, kwargs)
+
+    def _emit(self, level: int, message: str, extra_fields: Dict):
         record = self.logger.makeRecord(
             self.logger.name,
             level,
@@ -126,7 +275,7 @@ class StructuredLogger:
             (),
             None
         )
-        record.extra_fields = kwargs
+        record.extra_fields = extra_fields
         self.logger.handle(record)
 
     def debug(self, message: str, **kwargs):
@@ -366,6 +515,12 @@ webhook_logger = WebhookLogger()
 payment_logger = PaymentLogger()
 
 
+def flush_suppressed_logs():
+    """Emit pending suppression summaries for all loggers (call on shutdown)"""
+    for structured_logger in (logger, request_logger, audit_logger, call_logger, webhook_logger, payment_logger):
+        structured_logger.flush_suppressed()
+
+
 # =============================================================================
 # Decorators
 # =============================================================================
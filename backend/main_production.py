@@ -18,6 +18,17 @@ from pydantic import BaseModel, EmailStr
 import stripe
 import httpx
 
+from analytics_rollups import record_end_of_call, repair_loop
+from lead_scoring import scoring_loop
+from response_cache import response_cache, cached_json_response
+from sms_service import close_sms_clients
+from website_crawler import close_crawl_client
+from knowledge_ingestion import shutdown_extraction_pool
+from logging_service import flush_suppressed_logs
+from sms_outbox import cancel_textback, run_outbox_workers
+from delayed_jobs import job_scheduler
+from sms_suppression import listen_for_opt_outs
+
 # =============================================================================
 # Configuration
 # =============================================================================
@@ -79,6 +90,42 @@ async def db_fetchrow(query: str, *args):
     async with pool.acquire() as conn:
         return await conn.fetchrow(query, *args)
 
+@asynccontextmanager
+async def db_connection():
+    pool = await get_pool()
+    if not pool:
+        raise RuntimeError("Database not configured")
+    async with pool.acquire() as conn:
+        yield conn
+
+async def rollup_repair_loop():
+    if DATABASE_URL:
+        await repair_loop(db_connection)
+
+async def lead_scoring_loop():
+    if DATABASE_URL:
+        await scoring_loop(db_connection)
+
+async def sms_outbox_loop():
+    if DATABASE_URL:
+        await run_outbox_workers(db_connection)
+
+async def sms_suppression_loop():
+    if DATABASE_URL:
+        await listen_for_opt_outs(db_connection)
+
+async def delayed_jobs_loop():
+    await job_scheduler.run(db_connection if DATABASE_URL else None)
+
+def parse_vapi_timestamp(value: Optional[str]) -> Optional[datetime]:
+    """Vapi sends ISO 8601 times like 2026-03-02T09:15:00.000Z"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
 # =============================================================================
 # In-Memory Session Store (Redis fallback)
 # =============================================================================
@@ -215,10 +262,25 @@ async def lifespan(app: FastAPI):
     print(f"Starting CallBot AI on port {PORT}")
     # Initialize database in background
     asyncio.create_task(get_pool())
+    background = [
+        asyncio.create_task(rollup_repair_loop()),
+        asyncio.create_task(lead_scoring_loop()),
+        asyncio.create_task(sms_outbox_loop()),
+        asyncio.create_task(delayed_jobs_loop()),
+        asyncio.create_task(sms_suppression_loop())
+    ]
     yield
     print("Shutting down CallBot AI")
+    for task in background:
+        task.cancel()
+    # Let the loops unwind (release connections, finish their finally blocks) before the pool closes
+    await asyncio.gather(*background, return_exceptions=True)
+    shutdown_extraction_pool()
+    await close_sms_clients()
+    await close_crawl_client()
     if _pool:
         await _pool.close()
+    flush_suppressed_logs()
 
 app = FastAPI(
     title="CallBot AI",
@@ -454,24 +516,36 @@ async def get_business_stats(business_id: str, request: Request):
     if not business:
         raise HTTPException(status_code=404, detail="Business not found")
 
-    # Get call stats
-    total_calls = await db_fetchrow(
-        "SELECT COUNT(*) as count FROM calls WHERE business_id = $1",
+    async def build_stats():
+        # Get call stats (from hourly rollups rather than scanning calls)
+        total_calls = await db_fetchrow(
+            "SELECT COALESCE(SUM(calls), 0) as count FROM call_metrics_hourly WHERE business_id = $1",
+            business_id
+        )
+        appointments = await db_fetchrow(
+            "SELECT COUNT(*) as count FROM appointments WHERE business_id = $1",
+            business_id
+        )
+        return {
+            "stats": {
+                "total_calls": total_calls["count"] if total_calls else 0,
+                "total_appointments": appointments["count"] if appointments else 0,
+                "status": business["status"],
+                "tier": business["tier"]
+            }
+        }
+
+    # Polled by open dashboards: reuse the serialized response until calls land
+    version = await db_fetchrow(
+        "SELECT version FROM call_metrics_versions WHERE business_id = $1",
         business_id
     )
-    appointments = await db_fetchrow(
-        "SELECT COUNT(*) as count FROM appointments WHERE business_id = $1",
-        business_id
+    cached = await response_cache.get_or_build(
+        business_id, "stats", (business["status"], business["tier"]),
+        version["version"] if version else 0,
+        build_stats
     )
-
-    return {
-        "stats": {
-            "total_calls": total_calls["count"] if total_calls else 0,
-            "total_appointments": appointments["count"] if appointments else 0,
-            "status": business["status"],
-            "tier": business["tier"]
-        }
-    }
+    return cached_json_response(request, cached)
 
 @app.get("/api/business/{business_id}/calls")
 async def get_business_calls(business_id: str, request: Request, limit: int = 50):
@@ -646,18 +720,34 @@ async def vapi_webhook(request: Request, background_tasks: BackgroundTasks):
                 assistant_id
             )
 
-            if business:
-                call_id = f"call_{secrets.token_hex(8)}"
-                await db_execute(
-                    "INSERT INTO calls (id, business_id, vapi_call_id, caller_phone, duration, summary, created_at) VALUES ($1, $2, $3, $4, $5, $6, $7)",
-                    call_id,
-                    business["id"],
-                    call_data.get("id"),
-                    call_data.get("customer", {}).get("number"),
-                    call_data.get("duration", 0),
-                    body.get("summary", ""),
-                    datetime.utcnow()
+            pool = await get_pool()
+            if business and pool:
+                # The call and its hourly rollup are written in one transaction;
+                # repeated reports for the same Vapi call are ignored
+                async with pool.acquire() as conn:
+                    await record_end_of_call(
+                        conn,
+                        business["id"],
+                        call_data.get("id"),
+                        call_data.get("customer", {}).get("number"),
+                        call_data.get("duration", 0),
+                        body.get("summary", ""),
+                        parse_vapi_timestamp(call_data.get("startedAt"))
+                    )
+
+        elif event_type == "status-update":
+            # The caller got through, so a text-back for an earlier missed call is moot
+            message = body.get("message", body)
+            call_data = message.get("call", body.get("call", {}))
+            caller_phone = call_data.get("customer", {}).get("number")
+            if message.get("status") == "in-progress" and caller_phone:
+                business = await db_fetchrow(
+                    "SELECT id FROM businesses WHERE vapi_assistant_id = $1",
+                    call_data.get("assistantId")
                 )
+                if business:
+                    async with db_connection() as conn:
+                        await cancel_textback(conn, str(business["id"]), caller_phone)
 
         elif event_type == "function-call":
             func = body.get("functionCall", {})
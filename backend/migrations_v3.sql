@@ -0,0 +1,149 @@
+-- CallBot AI Database Migrations V3
+-- Caching, rollups and delivery infrastructure
+
+-- =============================================================================
+-- Knowledge Base Versions (cross-worker cache invalidation)
+-- =============================================================================
+CREATE TABLE IF NOT EXISTS knowledge_base_versions (
+    business_id UUID PRIMARY KEY REFERENCES businesses(id) ON DELETE CASCADE,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Active entries are what workers load on first access
+CREATE INDEX IF NOT EXISTS idx_knowledge_base_business_active
+    ON knowledge_base(business_id, created_at) WHERE is_active = true;
+
+-- Lets concurrent workers deduplicate inserts with ON CONFLICT DO NOTHING
+CREATE UNIQUE INDEX IF NOT EXISTS idx_knowledge_base_business_hash_active
+    ON knowledge_base(business_id, content_hash) WHERE is_active = true;
+
+-- =============================================================================
+-- Analytics (dashboard aggregates run in SQL)
+-- =============================================================================
+-- Range scans per business for the dashboard and ROI aggregate queries
+CREATE INDEX IF NOT EXISTS idx_calls_business_created
+    ON calls(business_id, created_at);
+
+CREATE INDEX IF NOT EXISTS idx_appointments_business_created
+    ON appointments(business_id, created_at);
+
+-- =============================================================================
+-- Hourly Call Rollups (upserted on call ingest, repaired from raw calls)
+-- =============================================================================
+CREATE TABLE IF NOT EXISTS call_metrics_hourly (
+    business_id UUID NOT NULL REFERENCES businesses(id) ON DELETE CASCADE,
+    hour_bucket TIMESTAMP WITH TIME ZONE NOT NULL,
+    calls INTEGER NOT NULL DEFAULT 0,
+    answered INTEGER NOT NULL DEFAULT 0,
+    missed INTEGER NOT NULL DEFAULT 0,
+    talked INTEGER NOT NULL DEFAULT 0,
+    booked INTEGER NOT NULL DEFAULT 0,
+    duration_seconds BIGINT NOT NULL DEFAULT 0,
+    -- Talk-time histogram, buckets defined by analytics_rollups.DURATION_BOUNDS
+    duration_histogram INTEGER[] NOT NULL DEFAULT '{0,0,0,0,0,0,0,0,0}',
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (business_id, hour_bucket)
+);
+
+-- Bumped whenever a business's rollups change (response cache invalidation)
+CREATE TABLE IF NOT EXISTS call_metrics_versions (
+    business_id UUID PRIMARY KEY REFERENCES businesses(id) ON DELETE CASCADE,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Mergeable sketches per bucket: t-digest of talk time, HyperLogLog of callers
+ALTER TABLE call_metrics_hourly ADD COLUMN IF NOT EXISTS duration_digest BYTEA;
+ALTER TABLE call_metrics_hourly ADD COLUMN IF NOT EXISTS caller_hll BYTEA;
+
+-- =============================================================================
+-- Lead Scoring (per-business rules, batch-scored calls)
+-- =============================================================================
+CREATE TABLE IF NOT EXISTS lead_scoring_rules (
+    business_id UUID PRIMARY KEY REFERENCES businesses(id) ON DELETE CASCADE,
+    rules JSONB NOT NULL DEFAULT '{}'::jsonb,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- One score per call, upserted by the batch scorer
+CREATE UNIQUE INDEX IF NOT EXISTS idx_lead_scores_call_id ON lead_scores(call_id);
+
+-- Leaderboards: top scores per business
+CREATE INDEX IF NOT EXISTS idx_lead_scores_business_score
+    ON lead_scores(business_id, score DESC, created_at DESC);
+
+-- =============================================================================
+-- SMS Outbox (durable sends, drained by sms_outbox workers)
+-- =============================================================================
+CREATE TABLE IF NOT EXISTS sms_outbox (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    business_id UUID NOT NULL REFERENCES businesses(id) ON DELETE CASCADE,
+    idempotency_key VARCHAR(255) NOT NULL,
+
+    to_phone VARCHAR(50) NOT NULL,
+    from_phone VARCHAR(50),
+    message TEXT NOT NULL,
+    sms_type VARCHAR(50),
+    provider VARCHAR(50),
+    call_id UUID,
+    campaign_id UUID,
+
+    -- pending, sending (leased until next_attempt_at), sent, failed, suppressed (opted out)
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    lease_token UUID,  -- the claim currently holding a 'sending' row
+    last_error TEXT,
+    provider_message_id VARCHAR(255),
+
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+
+    UNIQUE(business_id, idempotency_key)
+);
+
+ALTER TABLE sms_outbox ADD COLUMN IF NOT EXISTS lease_token UUID;
+
+-- Claim scans: only unfinished rows, oldest due first
+CREATE INDEX IF NOT EXISTS idx_sms_outbox_due
+    ON sms_outbox(next_attempt_at) WHERE status IN ('pending', 'sending');
+
+-- =============================================================================
+-- Delayed Jobs (timed work such as missed-call text-backs, fired by delayed_jobs)
+-- =============================================================================
+CREATE TABLE IF NOT EXISTS delayed_jobs (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    business_id UUID NOT NULL REFERENCES businesses(id) ON DELETE CASCADE,
+    job_key VARCHAR(255) NOT NULL,
+    kind VARCHAR(50) NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    due_at TIMESTAMP WITH TIME ZONE NOT NULL,
+
+    -- pending, dispatched, cancelled, failed
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    last_error TEXT,
+
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- One pending job per key, so a later call can find and cancel it
+CREATE UNIQUE INDEX IF NOT EXISTS idx_delayed_jobs_pending_key
+    ON delayed_jobs(business_id, job_key) WHERE status = 'pending';
+
+-- Due-time index the schedulers load from
+CREATE INDEX IF NOT EXISTS idx_delayed_jobs_due
+    ON delayed_jobs(due_at) WHERE status = 'pending';
+
+-- =============================================================================
+-- Crawl State (validators and hashes so website re-scrapes are incremental)
+-- =============================================================================
+CREATE TABLE IF NOT EXISTS crawl_states (
+    business_id UUID NOT NULL REFERENCES businesses(id) ON DELETE CASCADE,
+    site VARCHAR(255) NOT NULL,
+    state JSONB NOT NULL DEFAULT '{}',
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+
+    PRIMARY KEY (business_id, site)
+);
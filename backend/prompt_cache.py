@@ -0,0 +1,135 @@
+"""
+Prompt Artifact Cache for CallBot AI
+Rendered assistant prompts keyed by business, knowledge base version and language
+"""
+
+import json
+import hashlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple
+
+PROMPT_CACHE_MAX_ENTRIES = 2048
+
+
+def prompt_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def payload_hash(payload: Dict) -> str:
+    """Hash of everything an assistant update sends (prompts, name, tools)"""
+    return prompt_hash(json.dumps(payload, sort_keys=True, default=str))
+
+
+def business_version(business_data: Dict) -> str:
+    """
+    Version of a business's settings.
+
+    Rows from the businesses table carry updated_at, which a trigger bumps on
+    every update. Dicts without it (API payloads, tests) fall back to a
+    fingerprint of their contents.
+    """
+    updated_at = business_data.get("updated_at")
+    if updated_at:
+        return updated_at.isoformat() if isinstance(updated_at, datetime) else str(updated_at)
+    payload = json.dumps(business_data, sort_keys=True, default=str)
+    return "fp:" + hashlib.blake2b(payload.encode(), digest_size=8).hexdigest()
+
+
+class PromptArtifact:
+    """A rendered system prompt and first message, with their hashes"""
+
+    __slots__ = ("key", "system_prompt", "first_message", "system_prompt_hash", "first_message_hash", "created_at")
+
+    def __init__(self, key: Tuple, system_prompt: str, first_message: str):
+        self.key = key
+        self.system_prompt = system_prompt
+        self.first_message = first_message
+        self.system_prompt_hash = prompt_hash(system_prompt)
+        self.first_message_hash = prompt_hash(first_message)
+        self.created_at = datetime.utcnow()
+
+    @property
+    def fingerprint(self) -> Tuple[str, str]:
+        return (self.system_prompt_hash, self.first_message_hash)
+
+
+class PromptArtifactCache:
+    """
+    LRU cache of rendered prompts keyed by
+    (business_id, business_version, kb_version, language).
+
+    Keys change whenever the business or its knowledge base changes, so a hit
+    is always current; superseded artifacts for the same business and
+    language are dropped as soon as a newer one is stored. The cache also
+    remembers the payload_hash last pushed to each assistant.
+    """
+
+    def __init__(self, max_entries: int = PROMPT_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.artifacts: "OrderedDict[Tuple, PromptArtifact]" = OrderedDict()
+        self.latest: Dict[Tuple[str, str], Tuple] = {}  # (business_id, language) -> key
+        self.pushed: Dict[str, str] = {}  # assistant_id -> payload_hash
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(
+        self,
+        business_id: str,
+        business_version: str,
+        kb_version,
+        language: str,
+        render: Callable[[], Tuple[str, str]]
+    ) -> PromptArtifact:
+        """Return the cached artifact for this key, rendering it on a miss"""
+        key = (business_id, business_version, kb_version, language)
+        artifact = self.artifacts.get(key)
+        if artifact is not None:
+            self.artifacts.move_to_end(key)
+            self.hits += 1
+            return artifact
+
+        self.misses += 1
+        system_prompt, first_message = render()
+        artifact = PromptArtifact(key, system_prompt, first_message)
+
+        previous = self.latest.get((business_id, language))
+        if previous is not None:
+            self.artifacts.pop(previous, None)
+        self.latest[(business_id, language)] = key
+        self.artifacts[key] = artifact
+
+        while len(self.artifacts) > self.max_entries:
+            old_key, _ = self.artifacts.popitem(last=False)
+            if self.latest.get((old_key[0], old_key[3])) == old_key:
+                del self.latest[(old_key[0], old_key[3])]
+        return artifact
+
+    def invalidate(self, business_id: str):
+        """Drop every artifact for a business"""
+        for key in [k for k in self.artifacts if k[0] == business_id]:
+            del self.artifacts[key]
+        for latest_key in [k for k in self.latest if k[0] == business_id]:
+            del self.latest[latest_key]
+
+    def needs_push(self, assistant_id: str, payload_hash: str) -> bool:
+        """True if the assistant wasn't last updated with this exact payload"""
+        return self.pushed.get(assistant_id) != payload_hash
+
+    def mark_pushed(self, assistant_id: str, payload_hash: str):
+        self.pushed[assistant_id] = payload_hash
+
+    def forget_assistant(self, assistant_id: str):
+        self.pushed.pop(assistant_id, None)
+
+    def stats(self) -> Dict:
+        return {
+            "artifacts": len(self.artifacts),
+            "hits": self.hits,
+            "misses": self.misses,
+            "tracked_assistants": len(self.pushed)
+        }
+
+
+# Global prompt cache
+prompt_cache = PromptArtifactCache()
@@ -0,0 +1,138 @@
+"""
+Response Cache for CallBot AI
+Pre-serialized analytics responses with strong ETags
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from fastapi import Request, Response
+
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "4096"))
+# Responses embed "now" (e.g. the end of the time range), so they are reused
+# within a time bucket of this many seconds
+RESPONSE_CACHE_BUCKET_SECONDS = int(os.getenv("RESPONSE_CACHE_BUCKET_SECONDS", "60"))
+
+
+def serialize(payload) -> bytes:
+    """Same JSON FastAPI would produce, minus the whitespace"""
+    return json.dumps(
+        payload, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=str
+    ).encode("utf-8")
+
+
+def time_bucket(now: Optional[float] = None, seconds: int = RESPONSE_CACHE_BUCKET_SECONDS) -> int:
+    return int((time.time() if now is None else now) // seconds)
+
+
+class CachedResponse:
+    """Serialized body and its strong ETag"""
+
+    __slots__ = ("body", "etag", "created_at")
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        self.created_at = time.time()
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        # Strong comparison: weak validators never match
+        return self.etag in (tag.strip() for tag in if_none_match.split(","))
+
+
+class ResponseCache:
+    """
+    LRU of serialized responses keyed by (business_id, endpoint, params,
+    version, time bucket). The version changes whenever the business's
+    underlying data does, so entries are never served stale; superseded keys
+    for the same (business_id, endpoint, params) are dropped on store.
+    Concurrent misses for one key share a single build.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Tuple, CachedResponse]" = OrderedDict()
+        self.latest: Dict[Tuple, Tuple] = {}  # (business_id, endpoint, params) -> key
+        self._building: Dict[Tuple, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get_or_build(
+        self,
+        business_id: str,
+        endpoint: str,
+        params: Hashable,
+        version: Hashable,
+        build: Callable[[], Awaitable]
+    ) -> CachedResponse:
+        """Return the cached response for this key, building and serializing it on a miss"""
+        key = (business_id, endpoint, params, version, time_bucket())
+        cached = self.entries.get(key)
+        if cached is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return cached
+
+        pending = self._building.get(key)
+        if pending is not None:
+            self.hits += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._building[key] = future
+        try:
+            cached = CachedResponse(serialize(await build()))
+            self._store(key, cached)
+            future.set_result(cached)
+            return cached
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # Mark retrieved so unawaited failures don't warn
+            raise
+        finally:
+            self._building.pop(key, None)
+
+    def _store(self, key: Tuple, cached: CachedResponse):
+        base = key[:3]
+        previous = self.latest.get(base)
+        if previous is not None and previous != key:
+            self.entries.pop(previous, None)
+        self.latest[base] = key
+        self.entries[key] = cached
+
+        while len(self.entries) > self.max_entries:
+            old_key, _ = self.entries.popitem(last=False)
+            if self.latest.get(old_key[:3]) == old_key:
+                del self.latest[old_key[:3]]
+
+    def invalidate(self, business_id: str):
+        """Drop every response for a business"""
+        for key in [k for k in self.entries if k[0] == business_id]:
+            del self.entries[key]
+        for base in [k for k in self.latest if k[0] == business_id]:
+            del self.latest[base]
+
+    def stats(self) -> Dict:
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+def cached_json_response(request: Request, cached: CachedResponse) -> Response:
+    """200 with the cached bytes, or 304 when the client already has them"""
+    headers = {"ETag": cached.etag, "Cache-Control": "private, no-cache"}
+    if cached.matches(request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+
+# Global response cache
+response_cache = ResponseCache()
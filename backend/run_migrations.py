@@ -67,7 +67,7 @@ async def main():
         sys.exit(1)
     
     # Run migrations
-    migrations = ['init.sql', 'migrations_v2.sql']
+    migrations = ['init.sql', 'migrations_v2.sql', 'migrations_v3.sql']
     
     for migration in migrations:
         await run_migration(conn, migration)
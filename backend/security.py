@@ -5,10 +5,12 @@ Rate limiting, CSRF protection, input validation, and more
 
 import os
 import re
+import hmac
+import base64
 import hashlib
 import secrets
 import time
-from typing import Optional, Callable, List
+from typing import Any, Dict, Optional, Callable, List
 from datetime import datetime, timedelta
 from functools import wraps
 
@@ -458,3 +460,49 @@ def verify_webhook_signature(
 
     except (ValueError, KeyError):
         return False
+
+
+def verify_twilio_signature(url: str, params: Dict[str, Any], signature: str, auth_token: str) -> bool:
+    """
+    Verify an X-Twilio-Signature header: base64 HMAC-SHA1 (keyed with the
+    auth token) of the full webhook URL followed by every POST parameter's
+    name and value, sorted by name
+    """
+    data = url + "".join(f"{key}{params[key]}" for key in sorted(params))
+    computed = base64.b64encode(hmac.new(auth_token.encode(), data.encode(), hashlib.sha1).digest()).decode()
+    return secrets.compare_digest(computed, signature or "")
+
+
+VONAGE_SIGNATURE_DIGESTS = {"md5": hashlib.md5, "sha1": hashlib.sha1, "sha256": hashlib.sha256, "sha512": hashlib.sha512}
+
+
+def verify_vonage_signature(
+    params: Dict[str, Any],
+    secret: str,
+    method: str = "md5hash",
+    tolerance_seconds: int = 300
+) -> bool:
+    """
+    Verify a Vonage signed webhook. `sig` covers the other parameters as
+    "&name=value" sorted by name (with & and = in values replaced by _):
+    md5hash appends the secret and takes MD5, md5/sha1/sha256/sha512 are
+    HMACs keyed with it. `timestamp` must be within the tolerance.
+    """
+    try:
+        timestamp = int(params.get("timestamp", 0))
+    except (TypeError, ValueError):
+        return False
+    if abs(int(time.time()) - timestamp) > tolerance_seconds:
+        return False
+
+    data = "".join(
+        f"&{key}={str(value).replace('&', '_').replace('=', '_')}"
+        for key, value in sorted(params.items()) if key != "sig"
+    )
+    if method == "md5hash":
+        computed = hashlib.md5((data + secret).encode()).hexdigest()
+    elif method in VONAGE_SIGNATURE_DIGESTS:
+        computed = hmac.new(secret.encode(), data.encode(), VONAGE_SIGNATURE_DIGESTS[method]).hexdigest()
+    else:
+        return False
+    return secrets.compare_digest(computed.lower(), str(params.get("sig", "")).lower())
@@ -0,0 +1,181 @@
+"""
+SMS Encoding for CallBot AI
+GSM-7 / UCS-2 detection, segment counting and precompiled SMS templates
+
+A message that is entirely GSM-7 fits 160 characters in one segment (153 per
+segment once split); a single character outside it (a curly quote, an emoji)
+switches the whole message to UCS-2 at 70 (67). GSM-7 extension characters
+such as {, } and the euro sign take two units, and neither they nor UCS-2
+surrogate pairs are split across segments. Providers bill and throttle per
+segment.
+"""
+
+import os
+import string
+from typing import Any, Dict, List, Optional, Tuple
+
+SMS_TRANSLITERATE = os.getenv("SMS_TRANSLITERATE", "true").lower() == "true"
+
+GSM7_BASIC = (
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+GSM7_EXTENDED = "\f^{}\\[~]|€"
+
+GSM7 = "GSM-7"
+UCS2 = "UCS-2"
+SEGMENT_SIZES = {GSM7: (160, 153), UCS2: (70, 67)}  # (single message, per part of a multipart one)
+
+# str.translate tables: deleting every GSM-7 character leaves only what forces UCS-2
+_STRIP_GSM7 = str.maketrans("", "", GSM7_BASIC + GSM7_EXTENDED)
+_STRIP_EXTENDED = str.maketrans("", "", GSM7_EXTENDED)
+
+# Smart punctuation and typographic spaces that word processors and phones
+# substitute for plain GSM-7 characters
+SMART_PUNCTUATION = str.maketrans({
+    "\u2018": "'", "\u2019": "'", "\u201a": "'", "\u201b": "'", "\u2032": "'", "\u2039": "'", "\u203a": "'",
+    "\u201c": '"', "\u201d": '"', "\u201e": '"', "\u201f": '"', "\u2033": '"', "\u00ab": '"', "\u00bb": '"',
+    "\u2010": "-", "\u2011": "-", "\u2012": "-", "\u2013": "-", "\u2014": "-", "\u2015": "-", "\u2212": "-",
+    "\u2026": "...",
+    "\u00a0": " ", "\u2007": " ", "\u2009": " ", "\u200a": " ", "\u202f": " ",
+    "\u200b": None, "\u2060": None, "\ufeff": None,
+})
+
+
+# =============================================================================
+# Encoding and Segments
+# =============================================================================
+
+def transliterate(text: str) -> str:
+    """Replace smart punctuation with its GSM-7 equivalent"""
+    return text.translate(SMART_PUNCTUATION)
+
+
+def sms_encoding(text: str) -> str:
+    return GSM7 if not text.translate(_STRIP_GSM7) else UCS2
+
+
+def _unit_widths(text: str, encoding: str) -> List[int]:
+    if encoding == GSM7:
+        return [2 if ch in GSM7_EXTENDED else 1 for ch in text]
+    return [2 if ord(ch) > 0xFFFF else 1 for ch in text]
+
+
+def _pack(widths: List[int], per_segment: int) -> int:
+    segments, used = 1, 0
+    for width in widths:
+        if used + width > per_segment:
+            segments += 1
+            used = 0
+        used += width
+    return segments
+
+
+def segment_info(text: str) -> Dict[str, Any]:
+    """Encoding, length in encoding units and billed segment count of a message"""
+    encoding = sms_encoding(text)
+    if encoding == GSM7:
+        units = 2 * len(text) - len(text.translate(_STRIP_EXTENDED))
+    else:
+        units = len(text.encode("utf-16-le")) // 2
+    single, per_segment = SEGMENT_SIZES[encoding]
+    if units <= single:
+        segments = 1 if text else 0
+    elif units == len(text):
+        segments = -(-units // per_segment)
+    else:
+        # Two-unit characters can't straddle a segment boundary
+        segments = _pack(_unit_widths(text, encoding), per_segment)
+    return {"encoding": encoding, "characters": len(text), "units": units, "segments": segments}
+
+
+def truncate_to_segments(text: str, max_segments: int, ellipsis: str = "...") -> str:
+    """Cut a message to at most max_segments segments (ending in ellipsis) in its own encoding"""
+    info = segment_info(text)
+    if info["segments"] <= max_segments:
+        return text
+    single, per_segment = SEGMENT_SIZES[info["encoding"]]
+    budget = (single if max_segments == 1 else per_segment * max_segments) - len(ellipsis)
+    widths = _unit_widths(text, info["encoding"])
+    end, used = 0, 0
+    while end < len(text) and used + widths[end] <= budget:
+        used += widths[end]
+        end += 1
+    while end and segment_info(text[:end] + ellipsis)["segments"] > max_segments:
+        end -= 1
+    return text[:end] + ellipsis
+
+
+# =============================================================================
+# Templates
+# =============================================================================
+
+_formatter = string.Formatter()
+
+
+class SMSTemplate:
+    """
+    A template parsed once into literal runs and {fields}. Renders like
+    str.format, except that a missing variable leaves its placeholder in
+    place, and (with transliterate) smart punctuation in the template and
+    the values is replaced so it doesn't force UCS-2.
+    """
+
+    def __init__(self, text: str, transliterate: bool = SMS_TRANSLITERATE):
+        self.transliterate = transliterate
+        self.text = text.translate(SMART_PUNCTUATION) if transliterate else text
+        self.parts: List[Tuple[str, Optional[str], str, Optional[str]]] = list(_formatter.parse(self.text))
+        self.fields = [field for _, field, _, _ in self.parts if field is not None]
+
+    def render(self, variables: Dict[str, Any]) -> str:
+        out = []
+        for literal, field, spec, conversion in self.parts:
+            out.append(literal)
+            if field is None:
+                continue
+            try:
+                value, _ = _formatter.get_field(field, (), variables)
+            except (KeyError, IndexError, AttributeError):
+                out.append("{" + field + ("!" + conversion if conversion else "") + (":" + spec if spec else "") + "}")
+                continue
+            value = _formatter.format_field(_formatter.convert_field(value, conversion), spec)
+            out.append(value.translate(SMART_PUNCTUATION) if self.transliterate else value)
+        return "".join(out)
+
+
+class SMSTemplateRenderer:
+    """Named precompiled templates, with segment statistics for what each one renders to"""
+
+    def __init__(self, templates: Dict[str, str], transliterate: bool = SMS_TRANSLITERATE):
+        self.templates = {name: SMSTemplate(text, transliterate) for name, text in templates.items()}
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def render_with_info(self, name: str, variables: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The rendered message and its segment_info; None for an unknown template"""
+        template = self.templates.get(name)
+        if template is None:
+            return None
+        message = template.render(variables)
+        info = segment_info(message)
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = {"renders": 0, "segments": 0, "max_segments": 0, "ucs2": 0}
+        stats["renders"] += 1
+        stats["segments"] += info["segments"]
+        stats["max_segments"] = max(stats["max_segments"], info["segments"])
+        stats["ucs2"] += info["encoding"] == UCS2
+        return {"message": message, **info}
+
+    def render(self, name: str, variables: Dict[str, Any]) -> str:
+        rendered = self.render_with_info(name, variables)
+        return rendered["message"] if rendered else ""
+
+    def template_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per template: renders, total/average/max segments and how many rendered as UCS-2"""
+        return {
+            name: {
+                **stats,
+                "avg_segments": round(stats["segments"] / stats["renders"], 2) if stats["renders"] else 0
+            }
+            for name, stats in self.stats.items()
+        }
@@ -0,0 +1,317 @@
+"""
+SMS Outbox for CallBot AI
+Durable queue of outgoing texts, claimed with SKIP LOCKED and drained by async workers
+
+Run standalone workers with: python sms_outbox.py
+(set SMS_OUTBOX_WORKERS=0 on the web processes to leave draining to them)
+"""
+
+import os
+import uuid
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from delayed_jobs import job_scheduler
+from sms_service import (
+    OPTED_OUT_ERROR, SMS_PROVIDER, SMSType, clean_phone_number, is_transient_failure, retry_delay,
+    send_sms, send_with_retries, sms_rate_limiter
+)
+from sms_suppression import listen_for_opt_outs, suppression_list
+
+SMS_OUTBOX_ENABLED = bool(os.getenv("DATABASE_URL"))
+SMS_OUTBOX_WORKERS = int(os.getenv("SMS_OUTBOX_WORKERS", "2"))  # per process, 0 = don't drain here
+SMS_OUTBOX_BATCH_SIZE = int(os.getenv("SMS_OUTBOX_BATCH_SIZE", "50"))
+SMS_OUTBOX_CONCURRENCY = int(os.getenv("SMS_OUTBOX_CONCURRENCY", "10"))  # sends in flight per worker
+SMS_OUTBOX_LEASE_SECONDS = int(os.getenv("SMS_OUTBOX_LEASE_SECONDS", "120"))
+SMS_OUTBOX_POLL_SECONDS = float(os.getenv("SMS_OUTBOX_POLL_SECONDS", "1"))
+SMS_OUTBOX_MAX_ATTEMPTS = int(os.getenv("SMS_OUTBOX_MAX_ATTEMPTS", "5"))
+TEXTBACK_DELAY_SECONDS = int(os.getenv("TEXTBACK_DELAY_SECONDS", "30"))  # room to call straight back
+
+TEXTBACK_JOB = "missed_call_textback"
+
+
+# =============================================================================
+# SQL
+# =============================================================================
+
+# Duplicate idempotency keys (retried requests, redelivered webhooks) are dropped
+ENQUEUE_SQL = """
+    INSERT INTO sms_outbox (
+        business_id, idempotency_key, to_phone, from_phone, message, sms_type, provider,
+        call_id, campaign_id, next_attempt_at
+    )
+    SELECT $1, m.idempotency_key, m.to_phone, m.from_phone, m.message, $2, $3, $4, $5,
+           COALESCE(m.send_at, NOW())
+    FROM unnest($6::text[], $7::text[], $8::text[], $9::text[], $10::timestamptz[])
+        AS m(idempotency_key, to_phone, from_phone, message, send_at)
+    ON CONFLICT (business_id, idempotency_key) DO NOTHING
+    RETURNING id
+"""
+
+# A claim is a lease: next_attempt_at moves to the lease expiry, so rows held
+# by a worker that died become due again without a separate sweep. The lease
+# token identifies the claim, so a worker whose lease ran out can't write back
+CLAIM_SQL = """
+    WITH due AS (
+        SELECT id
+        FROM sms_outbox
+        WHERE status IN ('pending', 'sending') AND next_attempt_at <= NOW()
+        ORDER BY next_attempt_at
+        LIMIT $1
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE sms_outbox o
+    SET status = 'sending',
+        attempts = o.attempts + 1,
+        next_attempt_at = NOW() + make_interval(secs => $2),
+        lease_token = $3,
+        updated_at = NOW()
+    FROM due
+    WHERE o.id = due.id
+    RETURNING o.id, o.business_id, o.to_phone, o.from_phone, o.message, o.sms_type, o.provider, o.attempts
+"""
+
+# Extends a claim's lease while its rows wait on rate limits; returns the rows it still holds
+RENEW_SQL = """
+    UPDATE sms_outbox
+    SET next_attempt_at = NOW() + make_interval(secs => $2), updated_at = NOW()
+    WHERE lease_token = $1 AND status = 'sending'
+    RETURNING id
+"""
+
+# Write back a batch of outcomes and log the finished ones in one statement
+COMPLETE_SQL = """
+    WITH updated AS (
+        UPDATE sms_outbox o
+        SET status = r.status,
+            next_attempt_at = COALESCE(NOW() + make_interval(secs => r.retry_in), o.next_attempt_at),
+            last_error = r.error,
+            provider_message_id = r.message_id,
+            updated_at = NOW()
+        FROM unnest($1::uuid[], $2::text[], $3::float8[], $4::text[], $5::text[])
+            AS r(id, status, retry_in, error, message_id)
+        WHERE o.id = r.id AND o.status = 'sending' AND o.lease_token = $6
+        RETURNING o.*
+    )
+    INSERT INTO sms_logs (
+        business_id, to_phone, from_phone, message, sms_type, status, provider,
+        provider_message_id, error_message, call_id, campaign_id, sent_at
+    )
+    SELECT business_id, to_phone, from_phone, message, sms_type, status, provider,
+           provider_message_id, last_error, call_id, campaign_id,
+           CASE WHEN status = 'sent' THEN NOW() END
+    FROM updated
+    WHERE status IN ('sent', 'failed', 'suppressed')
+"""
+
+
+# =============================================================================
+# Enqueue
+# =============================================================================
+
+async def enqueue_sms(
+    conn,
+    business_id: str,
+    messages: List[Dict],
+    sms_type: str = "notification",
+    provider: Optional[str] = None,
+    call_id: Optional[str] = None,
+    campaign_id: Optional[str] = None
+) -> int:
+    """
+    Queue messages for delivery; each needs to_phone, message and
+    idempotency_key, optionally from_phone and send_at. Returns how many were
+    new (the rest were already queued under the same key).
+    """
+    messages = [m for m in messages if clean_phone_number(m.get("to_phone", ""))]
+    if not messages:
+        return 0
+    rows = await conn.fetch(
+        ENQUEUE_SQL,
+        uuid.UUID(business_id),
+        sms_type,
+        provider or SMS_PROVIDER,
+        uuid.UUID(call_id) if call_id else None,
+        uuid.UUID(campaign_id) if campaign_id else None,
+        [m["idempotency_key"] for m in messages],
+        [clean_phone_number(m["to_phone"]) for m in messages],
+        [m.get("from_phone") for m in messages],
+        [m["message"] for m in messages],
+        [m.get("send_at") for m in messages]
+    )
+    return len(rows)
+
+
+# =============================================================================
+# Missed-Call Text-Backs
+# =============================================================================
+
+def textback_job_key(caller_phone: str) -> str:
+    return f"textback:{clean_phone_number(caller_phone)}"
+
+
+async def schedule_textback(conn, business_id: str, caller_phone: str, message: str,
+                            delay_seconds: float = TEXTBACK_DELAY_SECONDS) -> str:
+    """
+    Text the caller after the delay unless they get through first. Another
+    missed call from the same number moves the pending text-back rather
+    than adding a second one. conn is None without a database.
+    """
+    return await job_scheduler.schedule(
+        conn, business_id, textback_job_key(caller_phone), TEXTBACK_JOB,
+        {"to_phone": clean_phone_number(caller_phone), "message": message},
+        delay_seconds
+    )
+
+
+async def cancel_textback(conn, business_id: str, caller_phone: str) -> bool:
+    """The caller got through; drop their pending text-back"""
+    return await job_scheduler.cancel(conn, business_id, textback_job_key(caller_phone))
+
+
+async def textback_job(conn, job: Dict):
+    """Due text-back: queue it in the outbox (same transaction as the claim), or send it directly"""
+    payload = job["payload"]
+    if conn is None:
+        await send_sms(payload["to_phone"], payload["message"], business_id=job["business_id"])
+        return
+    await enqueue_sms(conn, job["business_id"], [{
+        "idempotency_key": f"textback:{job['id']}",
+        "to_phone": payload["to_phone"],
+        "message": payload["message"]
+    }], sms_type=SMSType.MISSED_CALL_TEXTBACK.value)
+
+
+job_scheduler.register(TEXTBACK_JOB, textback_job)
+
+
+# =============================================================================
+# Workers
+# =============================================================================
+
+def outcome(result: Dict, attempts: int, max_attempts: int = SMS_OUTBOX_MAX_ATTEMPTS) -> Tuple:
+    """(status, retry_in_seconds, error, provider_message_id) for a send result"""
+    if result.get("success"):
+        return "sent", None, None, result.get("message_id")
+    error = str(result.get("error") or "Unknown error")[:1000]
+    if is_transient_failure(result) and attempts < max_attempts:
+        return "pending", retry_delay(attempts), error, None
+    return "failed", None, error, None
+
+
+async def deliver(row: Dict, suppressed: bool = False) -> Tuple:
+    """Send one claimed row (a single attempt; retries are rescheduled in the outbox)"""
+    if suppressed:
+        return row["id"], "suppressed", None, OPTED_OUT_ERROR, None
+    try:
+        result = await send_with_retries(
+            row["to_phone"], row["message"], row["from_phone"], row["provider"] or SMS_PROVIDER,
+            sms_rate_limiter, max_retries=0
+        )
+    except Exception as e:
+        result = {"success": False, "error": str(e)}
+    return (row["id"],) + outcome(result, row["attempts"])
+
+
+async def renew_lease(acquire, lease_token: uuid.UUID, held: set,
+                      lease_seconds: float = SMS_OUTBOX_LEASE_SECONDS):
+    """
+    Keep a claimed batch's lease from expiring until cancelled. Rows that
+    are no longer held (another worker re-claimed them after a missed
+    renewal) are removed from `held`.
+    """
+    while True:
+        await asyncio.sleep(lease_seconds / 3)
+        try:
+            async with acquire() as conn:
+                rows = await conn.fetch(RENEW_SQL, lease_token, lease_seconds)
+            held.intersection_update(row["id"] for row in rows)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"SMS outbox lease renewal failed: {e}")
+
+
+async def drain_once(acquire, batch_size: int = SMS_OUTBOX_BATCH_SIZE,
+                     concurrency: int = SMS_OUTBOX_CONCURRENCY) -> int:
+    """Claim one batch, send it, write the outcomes back; returns how many were claimed"""
+    # Nothing is claimed until opt-outs are loaded (raises SuppressionUnavailable on timeout)
+    await suppression_list.wait_loaded()
+    lease_token = uuid.uuid4()
+    async with acquire() as conn:
+        rows = [dict(row) for row in await conn.fetch(CLAIM_SQL, batch_size, SMS_OUTBOX_LEASE_SECONDS, lease_token)]
+    if not rows:
+        return 0
+
+    # Opt-outs are checked at send time, so ones recorded after queueing still apply
+    suppressed = set()
+    for business_id in {row["business_id"] for row in rows}:
+        phones = [row["to_phone"] for row in rows if row["business_id"] == business_id]
+        suppressed.update((business_id, phone) for phone in await suppression_list.suppressed(business_id, phones))
+
+    semaphore = asyncio.Semaphore(concurrency)
+    held = {row["id"] for row in rows}
+
+    async def bounded(row):
+        async with semaphore:
+            if row["id"] not in held:
+                return None  # Lease lost; the worker that re-claimed the row sends it
+            return await deliver(row, (row["business_id"], row["to_phone"]) in suppressed)
+
+    renewer = asyncio.create_task(renew_lease(acquire, lease_token, held, SMS_OUTBOX_LEASE_SECONDS))
+    try:
+        outcomes = [o for o in await asyncio.gather(*(bounded(row) for row in rows)) if o is not None]
+    finally:
+        renewer.cancel()
+        await asyncio.gather(renewer, return_exceptions=True)
+    if outcomes:
+        async with acquire() as conn:
+            await conn.execute(COMPLETE_SQL, *(list(column) for column in zip(*outcomes)), lease_token)
+    return len(rows)
+
+
+async def outbox_worker(acquire, batch_size: int = SMS_OUTBOX_BATCH_SIZE,
+                        poll_seconds: float = SMS_OUTBOX_POLL_SECONDS):
+    """Drain full batches back to back, then poll"""
+    while True:
+        try:
+            while await drain_once(acquire, batch_size) == batch_size:
+                pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"SMS outbox worker failed: {e}")
+        await asyncio.sleep(poll_seconds)
+
+
+async def run_outbox_workers(acquire, workers: int = SMS_OUTBOX_WORKERS):
+    """
+    Run `workers` outbox workers until cancelled. `acquire` is an async
+    context manager factory yielding a connection (e.g. pool.acquire).
+    """
+    if workers <= 0:
+        return
+    await asyncio.gather(*(outbox_worker(acquire) for _ in range(workers)))
+
+
+async def run_outbox_process(acquire, workers: int = SMS_OUTBOX_WORKERS):
+    """Outbox workers plus the opt-out listener they filter through, for a standalone process"""
+    await asyncio.gather(listen_for_opt_outs(acquire), run_outbox_workers(acquire, workers))
+
+
+async def _main():
+    import asyncpg
+    from sms_service import close_sms_clients
+
+    # One extra connection is held by the opt-out listener
+    pool = await asyncpg.create_pool(os.environ["DATABASE_URL"], min_size=2, max_size=max(3, SMS_OUTBOX_WORKERS * 2 + 1))
+    print(f"SMS outbox: {SMS_OUTBOX_WORKERS} workers")
+    try:
+        await run_outbox_process(pool.acquire, max(1, SMS_OUTBOX_WORKERS))
+    finally:
+        await close_sms_clients()
+        await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -5,13 +5,20 @@ Supports Twilio and Vonage (Nexmo) as providers
 """
 
 import os
+import time
+import random
 import asyncio
 from datetime import datetime, timedelta
-from typing import Dict, Optional, List, Any
+from typing import AsyncIterator, Dict, Optional, List, Any
 from enum import Enum
 import httpx
 import json
 
+from sms_encoding import (
+    SMS_TRANSLITERATE, UCS2, SMSTemplateRenderer, segment_info, transliterate, truncate_to_segments
+)
+from sms_suppression import SuppressionUnavailable, suppression_list
+
 # Configuration
 SMS_PROVIDER = os.getenv("SMS_PROVIDER", "twilio")  # twilio, vonage
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID", "")
@@ -20,6 +27,36 @@ TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER", "")
 VONAGE_API_KEY = os.getenv("VONAGE_API_KEY", "")
 VONAGE_API_SECRET = os.getenv("VONAGE_API_SECRET", "")
 VONAGE_PHONE_NUMBER = os.getenv("VONAGE_PHONE_NUMBER", "")
+VONAGE_SIGNATURE_SECRET = os.getenv("VONAGE_SIGNATURE_SECRET", "")  # signs inbound webhooks
+VONAGE_SIGNATURE_METHOD = os.getenv("VONAGE_SIGNATURE_METHOD", "md5hash")  # md5hash, md5, sha1, sha256, sha512
+TWILIO_API_URL = os.getenv("TWILIO_API_URL", "https://api.twilio.com")
+VONAGE_API_URL = os.getenv("VONAGE_API_URL", "https://rest.nexmo.com")
+
+# Provider HTTP clients
+SMS_HTTP_TIMEOUT = float(os.getenv("SMS_HTTP_TIMEOUT", "15"))  # seconds, per request
+SMS_CONNECT_TIMEOUT = float(os.getenv("SMS_CONNECT_TIMEOUT", "5"))
+SMS_MAX_CONNECTIONS = int(os.getenv("SMS_MAX_CONNECTIONS", "50"))  # per provider
+SMS_MAX_KEEPALIVE = int(os.getenv("SMS_MAX_KEEPALIVE", str(SMS_MAX_CONNECTIONS)))
+
+# Longest message sent; providers reject more than 10 concatenated segments
+SMS_MAX_SEGMENTS = int(os.getenv("SMS_MAX_SEGMENTS", "10"))
+
+# Batch sending: throughput caps per provider account and per sending number, in
+# segments (10DLC / toll-free numbers are throttled by carriers well below account limits)
+SMS_BATCH_WORKERS = int(os.getenv("SMS_BATCH_WORKERS", "20"))
+SMS_ACCOUNT_RATE = float(os.getenv("SMS_ACCOUNT_RATE", "100"))  # segments/second per provider account
+SMS_NUMBER_RATE = float(os.getenv("SMS_NUMBER_RATE", "4"))  # segments/second per sending number
+SMS_MAX_RETRIES = int(os.getenv("SMS_MAX_RETRIES", "3"))
+SMS_RETRY_BASE_SECONDS = float(os.getenv("SMS_RETRY_BASE_SECONDS", "1"))
+SMS_RETRY_MAX_SECONDS = float(os.getenv("SMS_RETRY_MAX_SECONDS", "30"))
+
+OPTED_OUT_ERROR = "Recipient opted out"
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
 
 
 class SMSStatus(Enum):
@@ -61,96 +98,134 @@ SMS_TEMPLATES = {
 }
 
 
-async def send_sms_twilio(to_number: str, message: str, from_number: Optional[str] = None) -> Dict:
+# =============================================================================
+# Provider HTTP Clients
+# =============================================================================
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def get_sms_client(provider: str) -> httpx.AsyncClient:
+    """
+    Process-wide pooled client for a provider. Connections are kept alive
+    between messages so batch sends skip the TCP/TLS handshake; HTTP/2 is
+    negotiated when h2 is installed and the provider offers it.
+    """
+    client = _clients.get(provider)
+    if client is None or client.is_closed:
+        base_url = TWILIO_API_URL if provider == "twilio" else VONAGE_API_URL
+        client = httpx.AsyncClient(
+            base_url=base_url,
+            http2=HTTP2_AVAILABLE,
+            timeout=httpx.Timeout(SMS_HTTP_TIMEOUT, connect=SMS_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=SMS_MAX_CONNECTIONS,
+                max_keepalive_connections=SMS_MAX_KEEPALIVE,
+                keepalive_expiry=60
+            )
+        )
+        _clients[provider] = client
+    return client
+
+
+async def close_sms_clients():
+    """Close the provider clients (call on app shutdown)"""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+async def send_sms_twilio(to_number: str, message: str, from_number: Optional[str] = None,
+                          timeout: Optional[float] = None) -> Dict:
     """Send SMS via Twilio"""
     if not TWILIO_ACCOUNT_SID or not TWILIO_AUTH_TOKEN:
         return {"success": False, "error": "Twilio not configured"}
 
     from_num = from_number or TWILIO_PHONE_NUMBER
-    url = f"https://api.twilio.com/2010-04-01/Accounts/{TWILIO_ACCOUNT_SID}/Messages.json"
-
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            url,
-            auth=(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN),
-            data={
-                "To": to_number,
-                "From": from_num,
-                "Body": message
-            },
-            timeout=30.0
-        )
-
-        if response.status_code in [200, 201]:
-            data = response.json()
-            return {
-                "success": True,
-                "message_id": data.get("sid"),
-                "status": data.get("status"),
-                "provider": "twilio"
-            }
-        else:
-            return {
-                "success": False,
-                "error": response.text,
-                "status_code": response.status_code,
-                "provider": "twilio"
-            }
+    url = f"/2010-04-01/Accounts/{TWILIO_ACCOUNT_SID}/Messages.json"
+
+    response = await get_sms_client("twilio").post(
+        url,
+        auth=(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN),
+        data={
+            "To": to_number,
+            "From": from_num,
+            "Body": message
+        },
+        timeout=timeout or httpx.USE_CLIENT_DEFAULT
+    )
+
+    if response.status_code in [200, 201]:
+        data = response.json()
+        return {
+            "success": True,
+            "message_id": data.get("sid"),
+            "status": data.get("status"),
+            "provider": "twilio"
+        }
+    else:
+        return {
+            "success": False,
+            "error": response.text,
+            "status_code": response.status_code,
+            "provider": "twilio"
+        }
 
 
-async def send_sms_vonage(to_number: str, message: str, from_number: Optional[str] = None) -> Dict:
+async def send_sms_vonage(to_number: str, message: str, from_number: Optional[str] = None,
+                          timeout: Optional[float] = None) -> Dict:
     """Send SMS via Vonage (Nexmo)"""
     if not VONAGE_API_KEY or not VONAGE_API_SECRET:
         return {"success": False, "error": "Vonage not configured"}
 
     from_num = from_number or VONAGE_PHONE_NUMBER
-    url = "https://rest.nexmo.com/sms/json"
-
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            url,
-            json={
-                "api_key": VONAGE_API_KEY,
-                "api_secret": VONAGE_API_SECRET,
-                "to": to_number.replace("+", ""),
-                "from": from_num.replace("+", ""),
-                "text": message
-            },
-            timeout=30.0
-        )
 
-        if response.status_code == 200:
-            data = response.json()
-            messages = data.get("messages", [{}])
-            if messages and messages[0].get("status") == "0":
-                return {
-                    "success": True,
-                    "message_id": messages[0].get("message-id"),
-                    "status": "sent",
-                    "provider": "vonage"
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": messages[0].get("error-text", "Unknown error"),
-                    "provider": "vonage"
-                }
+    response = await get_sms_client("vonage").post(
+        "/sms/json",
+        json={
+            "api_key": VONAGE_API_KEY,
+            "api_secret": VONAGE_API_SECRET,
+            "to": to_number.replace("+", ""),
+            "from": from_num.replace("+", ""),
+            "text": message
+        },
+        timeout=timeout or httpx.USE_CLIENT_DEFAULT
+    )
+
+    if response.status_code == 200:
+        data = response.json()
+        messages = data.get("messages", [{}])
+        if messages and messages[0].get("status") == "0":
+            return {
+                "success": True,
+                "message_id": messages[0].get("message-id"),
+                "status": "sent",
+                "provider": "vonage"
+            }
         else:
             return {
                 "success": False,
-                "error": response.text,
-                "status_code": response.status_code,
+                "error": messages[0].get("error-text", "Unknown error"),
                 "provider": "vonage"
             }
+    else:
+        return {
+            "success": False,
+            "error": response.text,
+            "status_code": response.status_code,
+            "provider": "vonage"
+        }
 
 
 async def send_sms(
     to_number: str,
     message: str,
     from_number: Optional[str] = None,
-    provider: Optional[str] = None
+    provider: Optional[str] = None,
+    business_id: Optional[str] = None
 ) -> Dict:
-    """Send SMS using configured provider"""
+    """Send SMS using configured provider (skipped if the number opted out of business_id's texts)"""
     provider = provider or SMS_PROVIDER
 
     # Clean phone number
@@ -158,9 +233,15 @@ async def send_sms(
     if not to_number:
         return {"success": False, "error": "Invalid phone number"}
 
-    # Truncate message if too long (160 chars standard, 1600 for concatenated)
-    if len(message) > 1600:
-        message = message[:1597] + "..."
+    if business_id:
+        try:
+            if await suppression_list.is_suppressed(business_id, to_number):
+                return {"success": False, "error": OPTED_OUT_ERROR, "suppressed": True, "provider": provider}
+        except SuppressionUnavailable as e:
+            # Fail closed; 503 marks it as worth retrying
+            return {"success": False, "error": str(e), "status_code": 503, "provider": provider}
+
+    message = prepare_message(message)
 
     if provider == "twilio":
         return await send_sms_twilio(to_number, message, from_number)
@@ -188,17 +269,24 @@ def clean_phone_number(phone: str) -> str:
     return cleaned
 
 
-def render_template(template_name: str, variables: Dict[str, Any]) -> str:
-    """Render an SMS template with variables"""
-    template = SMS_TEMPLATES.get(template_name, "")
-    if not template:
-        return ""
+def prepare_message(message: str) -> str:
+    """
+    Swap smart punctuation for GSM-7 (unless SMS_TRANSLITERATE is off) and cut
+    to SMS_MAX_SEGMENTS in the message's encoding
+    """
+    if SMS_TRANSLITERATE:
+        message = transliterate(message)
+    return truncate_to_segments(message, SMS_MAX_SEGMENTS)
 
-    try:
-        return template.format(**variables)
-    except KeyError as e:
-        # Return template with missing variable placeholder
-        return template
+
+def message_segments(message: str) -> int:
+    """Billed segments once the message is prepared for sending"""
+    return segment_info(prepare_message(message))["segments"]
+
+
+def render_template(template_name: str, variables: Dict[str, Any]) -> str:
+    """Render an SMS template with variables (missing ones keep their placeholder)"""
+    return template_renderer.render(template_name, variables)
 
 
 async def send_missed_call_textback(
@@ -207,11 +295,14 @@ async def send_missed_call_textback(
     caller_phone: str,
     callback_number: str,
     is_after_hours: bool = False,
-    delay_seconds: int = 30
+    delay_seconds: int = 0
 ) -> Dict:
-    """Send automatic text-back for missed calls - speed to lead!"""
+    """
+    Send automatic text-back for missed calls - speed to lead!
+    Webhooks should schedule it with sms_outbox.schedule_textback instead of
+    passing a delay, so the wait holds no coroutine and a call-back cancels it.
+    """
 
-    # Small delay to avoid texting if they call right back
     if delay_seconds > 0:
         await asyncio.sleep(delay_seconds)
 
@@ -221,7 +312,7 @@ async def send_missed_call_textback(
         "callback_number": callback_number
     })
 
-    result = await send_sms(caller_phone, message)
+    result = await send_sms(caller_phone, message, business_id=business_id)
     result["type"] = SMSType.MISSED_CALL_TEXTBACK.value
     result["business_id"] = business_id
 
@@ -232,16 +323,17 @@ async def send_appointment_confirmation(
     customer_phone: str,
     business_name: str,
     appointment_date: str,
-    appointment_time: str
+    appointment_time: str,
+    business_id: Optional[str] = None
 ) -> Dict:
-    """Send appointment confirmation SMS"""
+    """Send appointment confirmation SMS (skipped if the number opted out of business_id's texts)"""
     message = render_template("appointment_confirmation", {
         "business_name": business_name,
         "date": appointment_date,
         "time": appointment_time
     })
 
-    result = await send_sms(customer_phone, message)
+    result = await send_sms(customer_phone, message, business_id=business_id)
     result["type"] = SMSType.APPOINTMENT_REMINDER.value
 
     return result
@@ -252,9 +344,10 @@ async def send_appointment_reminder(
     business_name: str,
     appointment_time: str,
     address: str = "",
-    reminder_type: str = "24h"
+    reminder_type: str = "24h",
+    business_id: Optional[str] = None
 ) -> Dict:
-    """Send appointment reminder SMS"""
+    """Send appointment reminder SMS (skipped if the number opted out of business_id's texts)"""
     template = f"appointment_reminder_{reminder_type}"
     message = render_template(template, {
         "business_name": business_name,
@@ -262,7 +355,7 @@ async def send_appointment_reminder(
         "address": address
     })
 
-    result = await send_sms(customer_phone, message)
+    result = await send_sms(customer_phone, message, business_id=business_id)
     result["type"] = SMSType.APPOINTMENT_REMINDER.value
 
     return result
@@ -300,7 +393,7 @@ class FollowUpSequence:
             "callback_number": self.callback_number
         })
 
-        result = await send_sms(customer_phone, message)
+        result = await send_sms(customer_phone, message, business_id=self.business_id)
         result["type"] = SMSType.FOLLOW_UP.value
         result["step"] = step_index
         result["next_step_days"] = self.sequence[step_index + 1]["delay_days"] if step_index + 1 < len(self.sequence) else None
@@ -315,50 +408,240 @@ async def send_custom_sms(
     sms_type: SMSType = SMSType.NOTIFICATION
 ) -> Dict:
     """Send a custom SMS message"""
-    result = await send_sms(to_number, message)
+    result = await send_sms(to_number, message, business_id=business_id)
     result["type"] = sms_type.value
     result["business_id"] = business_id
     return result
 
 
+# =============================================================================
+# Batch Sending
+# =============================================================================
+
+class TokenBucket:
+    """
+    Async token bucket. Each acquire reserves a token immediately (the balance
+    may go negative) and sleeps until that token would have been refilled, so
+    waiters are served in arrival order without a lock.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """Take tokens; returns how long to wait before using them"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= tokens
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    async def acquire(self, tokens: float = 1.0):
+        wait = self.reserve(tokens)
+        if wait:
+            await asyncio.sleep(wait)
+
+
+class SMSRateLimiter:
+    """Token buckets per provider account and per sending number, shared by every batch"""
+
+    def __init__(self, account_rate: float = SMS_ACCOUNT_RATE, number_rate: float = SMS_NUMBER_RATE):
+        self.account_rate = account_rate
+        self.number_rate = number_rate
+        self.accounts: Dict[str, TokenBucket] = {}
+        self.numbers: Dict[str, TokenBucket] = {}
+
+    def account(self, provider: str) -> TokenBucket:
+        bucket = self.accounts.get(provider)
+        if bucket is None:
+            bucket = self.accounts[provider] = TokenBucket(self.account_rate)
+        return bucket
+
+    def number(self, from_number: str, rate: Optional[float] = None) -> TokenBucket:
+        bucket = self.numbers.get(from_number)
+        if bucket is None:
+            bucket = self.numbers[from_number] = TokenBucket(rate or self.number_rate)
+        return bucket
+
+    async def acquire(self, provider: str, from_number: str, number_rate: Optional[float] = None,
+                      segments: int = 1):
+        # The (slower) number bucket first, so waiting on it doesn't hold account capacity
+        await self.number(from_number, number_rate).acquire(segments)
+        await self.account(provider).acquire(segments)
+
+
+def is_transient_failure(result: Dict) -> bool:
+    """Rate limited or provider-side errors are worth retrying; bad numbers etc. are not"""
+    status = result.get("status_code")
+    return status == 429 or (status is not None and status >= 500)
+
+
+def retry_delay(attempt: int, base: float = SMS_RETRY_BASE_SECONDS, cap: float = SMS_RETRY_MAX_SECONDS) -> float:
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def personalize_message(message_template: str, recipient: Dict[str, str]) -> str:
+    name = recipient.get("name", "there")
+    return message_template.replace("{name}", name).replace("{customer_name}", name)
+
+
+def estimate_batch(recipients: List[Dict[str, str]], message_template: str) -> Dict:
+    """Messages, billed segments and UCS-2 messages a batch will send, for pricing and pacing"""
+    estimate = {"messages": len(recipients), "segments": 0, "ucs2_messages": 0}
+    for recipient in recipients:
+        info = segment_info(prepare_message(personalize_message(message_template, recipient)))
+        estimate["segments"] += info["segments"]
+        estimate["ucs2_messages"] += info["encoding"] == UCS2
+    return estimate
+
+
+async def send_with_retries(
+    to_number: str,
+    message: str,
+    from_number: Optional[str],
+    provider: str,
+    limiter: "SMSRateLimiter",
+    max_retries: int = SMS_MAX_RETRIES,
+    number_rate: Optional[float] = None
+) -> Dict:
+    """Send one message under the rate limits (charged per segment), retrying transient failures"""
+    sender = from_number or (TWILIO_PHONE_NUMBER if provider == "twilio" else VONAGE_PHONE_NUMBER)
+    segments = max(1, message_segments(message))
+    attempt = 0
+    while True:
+        await limiter.acquire(provider, sender, number_rate, segments)
+        try:
+            result = await send_sms(to_number, message, from_number, provider)
+        except httpx.HTTPError as e:
+            result = {"success": False, "error": f"{type(e).__name__}: {e}", "status_code": 503, "provider": provider}
+        attempt += 1
+        result["attempts"] = attempt
+        result["segments"] = segments
+        if result.get("success") or attempt > max_retries or not is_transient_failure(result):
+            return result
+        await asyncio.sleep(retry_delay(attempt - 1))
+
+
+async def iter_batch_sms(
+    recipients: List[Dict[str, str]],
+    message_template: str,
+    business_id: str,
+    from_numbers: Optional[List[str]] = None,
+    provider: Optional[str] = None,
+    workers: int = SMS_BATCH_WORKERS,
+    max_retries: int = SMS_MAX_RETRIES,
+    number_rate: Optional[float] = None,
+    limiter: Optional["SMSRateLimiter"] = None
+) -> AsyncIterator[Dict]:
+    """
+    Send a batch with a pool of workers and yield a progress event as each
+    message finishes. Recipients are spread round-robin over from_numbers;
+    throughput is governed by the shared account and per-number buckets.
+    Recipients who opted out are reported as suppressed without a send.
+    Closing the iterator early cancels the remaining sends.
+    """
+    provider = provider or SMS_PROVIDER
+    unavailable = None
+    try:
+        await suppression_list.wait_loaded()
+    except SuppressionUnavailable as e:
+        # Fail closed: without the opt-out list nobody in the batch is texted
+        unavailable = str(e)
+    limiter = limiter or sms_rate_limiter
+    numbers = from_numbers or [None]
+    pending: asyncio.Queue = asyncio.Queue()
+    for index, recipient in enumerate(recipients):
+        pending.put_nowait((index, recipient))
+    finished: asyncio.Queue = asyncio.Queue()
+
+    async def worker():
+        while True:
+            try:
+                index, recipient = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            phone = recipient.get("phone")
+            if unavailable:
+                finished.put_nowait((phone, {"success": False, "error": unavailable, "status_code": 503, "attempts": 0}))
+                continue
+            # Checked per recipient, so a STOP received mid-batch applies to the rest of it
+            if await suppression_list.is_suppressed(business_id, clean_phone_number(phone or "")):
+                finished.put_nowait((phone, {"success": False, "error": OPTED_OUT_ERROR, "suppressed": True, "attempts": 0}))
+                continue
+            try:
+                result = await send_with_retries(
+                    phone, personalize_message(message_template, recipient),
+                    numbers[index % len(numbers)], provider, limiter, max_retries, number_rate
+                )
+            except Exception as e:
+                result = {"success": False, "error": str(e), "attempts": 1}
+            finished.put_nowait((phone, result))
+
+    tasks = [asyncio.create_task(worker()) for _ in range(max(1, min(workers, len(recipients))))]
+    progress = {"business_id": business_id, "total": len(recipients), "done": 0, "sent": 0, "failed": 0,
+                "suppressed": 0}
+    try:
+        for _ in range(len(recipients)):
+            phone, result = await finished.get()
+            progress["done"] += 1
+            if result.get("success"):
+                progress["sent"] += 1
+            else:
+                progress["suppressed" if result.get("suppressed") else "failed"] += 1
+            yield {
+                **progress,
+                "phone": phone,
+                "success": bool(result.get("success")),
+                "suppressed": bool(result.get("suppressed")),
+                "attempts": result.get("attempts", 1),
+                "segments": result.get("segments", 0),
+                "error": result.get("error")
+            }
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
 # Batch SMS for campaigns
 async def send_batch_sms(
     recipients: List[Dict[str, str]],
     message_template: str,
     business_id: str,
-    rate_limit_per_second: float = 1.0
+    rate_limit_per_second: Optional[float] = None,
+    from_numbers: Optional[List[str]] = None
 ) -> Dict:
-    """Send SMS to multiple recipients with rate limiting"""
+    """
+    Send SMS to multiple recipients concurrently within the rate limits.
+    rate_limit_per_second caps each sending number (default SMS_NUMBER_RATE).
+    """
     results = {
         "total": len(recipients),
         "sent": 0,
         "failed": 0,
+        "suppressed": 0,
+        "segments": 0,
         "errors": []
     }
 
-    delay = 1.0 / rate_limit_per_second
-
-    for recipient in recipients:
-        phone = recipient.get("phone")
-        name = recipient.get("name", "there")
-
-        # Personalize message
-        message = message_template.replace("{name}", name)
-        message = message.replace("{customer_name}", name)
-
-        result = await send_sms(phone, message)
-
-        if result.get("success"):
+    async for event in iter_batch_sms(recipients, message_template, business_id,
+                                      from_numbers=from_numbers, number_rate=rate_limit_per_second):
+        if event["success"]:
             results["sent"] += 1
+            results["segments"] += event["segments"]
+        elif event["suppressed"]:
+            results["suppressed"] += 1
         else:
             results["failed"] += 1
             results["errors"].append({
-                "phone": phone,
-                "error": result.get("error")
+                "phone": event["phone"],
+                "error": event["error"]
             })
 
-        await asyncio.sleep(delay)
-
     return results
 
 
@@ -380,3 +663,10 @@ def check_opt_in_keywords(message: str) -> bool:
     opt_in_keywords = ["start", "subscribe", "yes", "unstop"]
     message_lower = message.lower().strip()
     return message_lower in opt_in_keywords
+
+
+# Global rate limiter
+sms_rate_limiter = SMSRateLimiter()
+
+# Global precompiled templates
+template_renderer = SMSTemplateRenderer(SMS_TEMPLATES)
@@ -0,0 +1,256 @@
+"""
+SMS Suppression for CallBot AI
+In-memory per-business opt-out lists checked before every send, kept current over LISTEN/NOTIFY
+
+Each process loads sms_opt_outs once and then applies the opt-outs and
+opt-ins that any process records, which arrive as notifications on
+SUPPRESSION_CHANNEL. Lookups are set membership. Businesses with very large
+lists can be held as Bloom filters instead (SMS_SUPPRESSION_BLOOM_THRESHOLD);
+a Bloom hit is then confirmed against sms_opt_outs, so false positives never
+block a send, and without a database a hit is treated as opted out.
+With a database, lookups wait for the first load and fail closed (raise
+SuppressionUnavailable) if it doesn't finish in SMS_SUPPRESSION_LOAD_TIMEOUT.
+Phone numbers are expected in E.164 (sms_service.clean_phone_number).
+"""
+
+import os
+import json
+import math
+import uuid
+import asyncio
+import hashlib
+from typing import Dict, Iterable, List, Optional, Set
+
+SMS_SUPPRESSION_ENABLED = bool(os.getenv("DATABASE_URL"))
+SUPPRESSION_CHANNEL = "sms_opt_outs"
+SMS_SUPPRESSION_RELOAD_SECONDS = int(os.getenv("SMS_SUPPRESSION_RELOAD_SECONDS", "900"))
+SMS_SUPPRESSION_BLOOM_THRESHOLD = int(os.getenv("SMS_SUPPRESSION_BLOOM_THRESHOLD", "0"))  # 0 = always exact
+SMS_SUPPRESSION_BLOOM_ERROR_RATE = float(os.getenv("SMS_SUPPRESSION_BLOOM_ERROR_RATE", "0.001"))
+SMS_SUPPRESSION_LOAD_TIMEOUT = float(os.getenv("SMS_SUPPRESSION_LOAD_TIMEOUT", "30"))  # seconds
+
+
+# =============================================================================
+# SQL
+# =============================================================================
+
+LOAD_SQL = "SELECT business_id, phone FROM sms_opt_outs"
+
+CONFIRM_SQL = "SELECT phone FROM sms_opt_outs WHERE business_id = $1 AND phone = ANY($2::text[])"
+
+# The notification goes out when the change commits
+OPT_OUT_SQL = """
+    WITH inserted AS (
+        INSERT INTO sms_opt_outs (business_id, phone) VALUES ($1, $2)
+        ON CONFLICT (business_id, phone) DO NOTHING
+    )
+    SELECT pg_notify($3, $4)
+"""
+
+OPT_IN_SQL = """
+    WITH deleted AS (
+        DELETE FROM sms_opt_outs WHERE business_id = $1 AND phone = $2
+    )
+    SELECT pg_notify($3, $4)
+"""
+
+
+# =============================================================================
+# Suppression List
+# =============================================================================
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (double hashing on one blake2b digest)"""
+
+    def __init__(self, capacity: int, error_rate: float = SMS_SUPPRESSION_BLOOM_ERROR_RATE):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class SuppressionUnavailable(Exception):
+    """The opt-out list hasn't loaded, so no one can be texted yet"""
+
+
+class SuppressionList:
+    """Opted-out numbers per business"""
+
+    def __init__(self, bloom_threshold: int = SMS_SUPPRESSION_BLOOM_THRESHOLD, require_load: bool = False):
+        self.bloom_threshold = bloom_threshold
+        self.loaded = asyncio.Event()  # set once the stored opt-outs are in memory
+        if not require_load:
+            self.loaded.set()
+        self.exact: Dict[str, Set[str]] = {}
+        self.blooms: Dict[str, BloomFilter] = {}
+        self.cleared: Dict[str, Set[str]] = {}  # opted back in since the business's filter was built
+        self.pending: Optional[List] = None  # changes that arrive while a reload is running
+
+    def replace_all(self, rows: Iterable):
+        """Rebuild from (business_id, phone) rows"""
+        by_business: Dict[str, Set[str]] = {}
+        for business_id, phone in rows:
+            by_business.setdefault(str(business_id), set()).add(phone)
+
+        exact, blooms = {}, {}
+        for business_id, phones in by_business.items():
+            if self.bloom_threshold and len(phones) >= self.bloom_threshold:
+                bloom = BloomFilter(len(phones) * 2)  # room for growth until the next reload
+                for phone in phones:
+                    bloom.add(phone)
+                blooms[business_id] = bloom
+            else:
+                exact[business_id] = phones
+        self.exact, self.blooms, self.cleared = exact, blooms, {}
+
+    def add(self, business_id: str, phone: str):
+        business_id = str(business_id)
+        if self.pending is not None:
+            self.pending.append((business_id, phone, True))
+        if business_id in self.blooms:
+            self.blooms[business_id].add(phone)
+            self.cleared.get(business_id, set()).discard(phone)
+        else:
+            self.exact.setdefault(business_id, set()).add(phone)
+
+    def discard(self, business_id: str, phone: str):
+        business_id = str(business_id)
+        if self.pending is not None:
+            self.pending.append((business_id, phone, False))
+        if business_id in self.blooms:
+            self.cleared.setdefault(business_id, set()).add(phone)
+        else:
+            self.exact.get(business_id, set()).discard(phone)
+
+    def might_be_suppressed(self, business_id: str, phone: str) -> bool:
+        """O(1); exact unless the business is held as a Bloom filter"""
+        business_id = str(business_id)
+        phones = self.exact.get(business_id)
+        if phones is not None:
+            return phone in phones
+        bloom = self.blooms.get(business_id)
+        return bloom is not None and phone in bloom and phone not in self.cleared.get(business_id, ())
+
+    async def wait_loaded(self, timeout: Optional[float] = None):
+        if self.loaded.is_set():
+            return
+        try:
+            await asyncio.wait_for(self.loaded.wait(), SMS_SUPPRESSION_LOAD_TIMEOUT if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            raise SuppressionUnavailable("SMS opt-out list not loaded")
+
+    async def suppressed(self, business_id: str, phones: Iterable[str]) -> Set[str]:
+        """
+        The numbers among `phones` that have opted out of this business's
+        texts; raises SuppressionUnavailable before the list has loaded
+        """
+        await self.wait_loaded()
+        business_id = str(business_id)
+        candidates = {phone for phone in phones if phone and self.might_be_suppressed(business_id, phone)}
+        if candidates and business_id in self.blooms:
+            candidates = await self._confirm(business_id, candidates)
+        return candidates
+
+    async def is_suppressed(self, business_id: str, phone: str) -> bool:
+        return bool(await self.suppressed(business_id, [phone]))
+
+    async def _confirm(self, business_id: str, candidates: Set[str]) -> Set[str]:
+        try:
+            from database_postgres import get_connection
+
+            async with get_connection() as conn:
+                rows = await conn.fetch(CONFIRM_SQL, uuid.UUID(business_id), sorted(candidates))
+            return {row["phone"] for row in rows}
+        except Exception as e:
+            # Can't confirm: err on the side of not texting
+            print(f"SMS suppression confirm failed: {e}")
+            return candidates
+
+    async def load(self, conn) -> int:
+        """Reload from sms_opt_outs, replaying changes notified while the query ran"""
+        self.pending = []
+        try:
+            rows = await conn.fetch(LOAD_SQL)
+            changes = self.pending
+        finally:
+            self.pending = None
+        self.replace_all((row["business_id"], row["phone"]) for row in rows)
+        for business_id, phone, opted_out in changes:
+            (self.add if opted_out else self.discard)(business_id, phone)
+        self.loaded.set()
+        return len(rows)
+
+    def apply_notification(self, payload: str):
+        change = json.loads(payload)
+        if change["opted_out"]:
+            self.add(change["business_id"], change["phone"])
+        else:
+            self.discard(change["business_id"], change["phone"])
+
+
+# =============================================================================
+# Recording and Listening
+# =============================================================================
+
+async def record_opt_out(conn, business_id: str, phone: str):
+    """Store an opt-out and tell every process; conn is None without a database"""
+    if conn is not None:
+        payload = json.dumps({"business_id": business_id, "phone": phone, "opted_out": True})
+        await conn.execute(OPT_OUT_SQL, uuid.UUID(business_id), phone, SUPPRESSION_CHANNEL, payload)
+    suppression_list.add(business_id, phone)
+
+
+async def record_opt_in(conn, business_id: str, phone: str):
+    """Remove an opt-out (the number texted START) and tell every process"""
+    if conn is not None:
+        payload = json.dumps({"business_id": business_id, "phone": phone, "opted_out": False})
+        await conn.execute(OPT_IN_SQL, uuid.UUID(business_id), phone, SUPPRESSION_CHANNEL, payload)
+    suppression_list.discard(business_id, phone)
+
+
+def _on_notification(connection, pid, channel, payload):
+    try:
+        suppression_list.apply_notification(payload)
+    except Exception as e:
+        print(f"Bad SMS suppression notification {payload!r}: {e}")
+
+
+async def listen_for_opt_outs(acquire, reload_seconds: int = SMS_SUPPRESSION_RELOAD_SECONDS):
+    """
+    Load the suppression list and keep it current until cancelled. Holds one
+    connection from `acquire` (e.g. pool.acquire) for LISTEN; reloads
+    periodically, which also compacts Bloom filters and recovers anything
+    missed while the connection was down.
+    """
+    while True:
+        try:
+            async with acquire() as conn:
+                # Listen before loading so no change falls between the two
+                await conn.add_listener(SUPPRESSION_CHANNEL, _on_notification)
+                try:
+                    while True:
+                        await suppression_list.load(conn)
+                        await asyncio.sleep(reload_seconds)
+                finally:
+                    await conn.remove_listener(SUPPRESSION_CHANNEL, _on_notification)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"SMS suppression listener failed: {e}")
+            await asyncio.sleep(5)
+
+
+# Global suppression list (with a database, sends wait for its first load)
+suppression_list = SuppressionList(require_load=SMS_SUPPRESSION_ENABLED)
@@ -0,0 +1,73 @@
+"""
+CallBot AI - Agency Analytics Tests
+Per-client breakdowns and overage projections from the hourly rollups
+"""
+
+import sys
+import os
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agency_service import agency_analytics_from_rows, agency_analytics_sql, billing_period
+
+
+def _rows():
+    return [
+        {"kind": "total", "position": 0, "agency_name": "Acme Agency", "tier": "starter",
+         "sub_account_id": None, "business_id": None, "client_name": None, "status": None,
+         "clients": 3, "active_clients": 2, "client_monthly_price": 600, "calls": 900,
+         "booked": 90, "talk_seconds": 180000},
+        {"kind": "client", "position": 1, "agency_name": None, "tier": None,
+         "sub_account_id": "s1", "business_id": "b1", "client_name": "Dental Co", "status": "active",
+         "clients": 1, "active_clients": 1, "client_monthly_price": 300, "calls": 600,
+         "booked": 60, "talk_seconds": 120000},
+        {"kind": "client", "position": 2, "agency_name": None, "tier": None,
+         "sub_account_id": "s2", "business_id": "b2", "client_name": "HVAC Pros", "status": "active",
+         "clients": 1, "active_clients": 1, "client_monthly_price": 300, "calls": 300,
+         "booked": 30, "talk_seconds": 60000},
+    ]
+
+
+class TestAgencyAnalytics:
+    """Test the agency analytics response"""
+
+    def test_totals_and_projection(self):
+        # Halfway through April: 3000 minutes so far projects to 6000
+        now = datetime(2026, 4, 16)
+        result = agency_analytics_from_rows(_rows(), now, page=1, page_size=2)
+
+        assert result["usage"]["total_calls"] == 900
+        assert result["usage"]["total_minutes"] == 3000
+        assert result["usage"]["projected_minutes"] == 6000
+        assert result["usage"]["remaining_minutes"] == 2000
+        assert result["financials"]["overage_amount"] == 0
+        assert result["financials"]["projected_overage_amount"] == 80.0  # 1000 min over at $0.08
+        assert result["financials"]["net_profit"] == 600 - 997
+        assert result["sub_accounts"] == {"total": 3, "active": 2, "limit": 5}
+        assert result["pagination"]["total"] == 3
+
+    def test_clients(self):
+        result = agency_analytics_from_rows(_rows(), datetime(2026, 4, 16))
+        first, second = result["clients"]
+        assert first["client_name"] == "Dental Co"
+        assert first["minutes"] == 2000 and first["projected_minutes"] == 4000
+        # Projected overage is shared by projected minutes
+        assert first["projected_overage_share"] + second["projected_overage_share"] == pytest.approx(80)
+
+    def test_missing_agency(self):
+        assert agency_analytics_from_rows([], datetime(2026, 4, 16)) is None
+
+    def test_sort_whitelist(self):
+        assert "ORDER BY talk_seconds DESC" in agency_analytics_sql("minutes", "desc")
+        assert "ORDER BY client_name ASC" in agency_analytics_sql("client_name", "asc")
+        with pytest.raises(ValueError):
+            agency_analytics_sql("calls; DROP TABLE agencies", "desc")
+        with pytest.raises(ValueError):
+            agency_analytics_sql("calls", "sideways")
+
+    def test_billing_period(self):
+        assert billing_period(datetime(2026, 2, 10, 5)) == (datetime(2026, 2, 1), datetime(2026, 3, 1))
+        assert billing_period(datetime(2026, 12, 31)) == (datetime(2026, 12, 1), datetime(2027, 1, 1))
@@ -0,0 +1,219 @@
+"""
+CallBot AI - Analytics Rollup Tests
+Hourly call rollups and dashboards built from them
+"""
+
+import sys
+import os
+import uuid
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analytics_rollups
+from analytics_rollups import (
+    HISTOGRAM_SIZE, call_delta, duration_bucket, histogram_percentile, hour_bucket,
+    record_end_of_call, repair_loop, repair_rollups, rollup_aggregate_rows
+)
+from analytics_sketches import HyperLogLog, TDigest
+from analytics_service import dashboard_from_aggregates, get_analytics_dashboard
+
+
+def build_rollups(calls):
+    """Fold calls into hourly rows the way the ingest upsert does"""
+    buckets = {}
+    for call in calls:
+        delta = call_delta(call["duration"], call.get("status"), call.get("appointment_booked"))
+        key = hour_bucket(call["created_at"])
+        row = buckets.setdefault(key, {
+            "hour_bucket": key, "calls": 0, "answered": 0, "missed": 0, "talked": 0,
+            "booked": 0, "duration_seconds": 0, "duration_histogram": [0] * HISTOGRAM_SIZE
+        })
+        for name in ("calls", "answered", "missed", "talked", "booked", "duration_seconds"):
+            row[name] += delta[name]
+        row["duration_histogram"] = [a + b for a, b in zip(row["duration_histogram"], delta["duration_histogram"])]
+    return list(buckets.values())
+
+
+class TestBuckets:
+    """Test per-call deltas and histogram percentiles"""
+
+    def test_duration_buckets(self):
+        assert [duration_bucket(d) for d in (0, 1, 14, 15, 59, 60, 1199, 1200, 5000)] == [0, 1, 1, 2, 3, 4, 7, 8, 8]
+
+    def test_call_delta(self):
+        delta = call_delta(45, "completed", True)
+        assert delta["answered"] == delta["talked"] == delta["booked"] == 1
+        assert delta["missed"] == 0
+        assert delta["duration_histogram"][3] == 1 and sum(delta["duration_histogram"]) == 1
+        assert call_delta(None, "missed", None)["missed"] == 1
+
+    def test_histogram_percentile(self):
+        # Ten calls spread evenly through the 60-120s bucket
+        histogram = [3, 0, 0, 0, 10, 0, 0, 0, 0]
+        assert histogram_percentile(histogram, 0.5) == 90.0
+        assert histogram_percentile(histogram, 0.9) == 114.0
+        assert histogram_percentile([5] + [0] * 8, 0.5) == 0
+
+    def test_hour_bucket_is_utc(self):
+        local = datetime(2026, 3, 2, 9, 45, tzinfo=timezone(timedelta(hours=-5)))
+        assert hour_bucket(local) == datetime(2026, 3, 2, 14, tzinfo=timezone.utc)
+
+
+class TestDashboardFromRollups:
+    """Test dashboards from rollups match the raw-call dashboard"""
+
+    def test_matches_raw_calls(self):
+        rng = np.random.default_rng(11)
+        start = datetime.utcnow() - timedelta(days=25)
+        calls = [
+            {
+                "duration": int(d),
+                "status": "missed" if d == 0 else "completed",
+                "appointment_booked": bool(b),
+                "created_at": start + timedelta(seconds=int(s))
+            }
+            for d, b, s in zip(rng.integers(0, 900, 3000), rng.random(3000) < 0.2, rng.integers(0, 20 * 86400, 3000))
+        ]
+        rollups = build_rollups(calls)
+        assert len(rollups) < len(calls)
+
+        from_rollups = dashboard_from_aggregates(rollup_aggregate_rows(rollups), None, "last_30_days")
+        raw = get_analytics_dashboard(calls, [], "last_30_days")
+
+        assert from_rollups["charts"] == raw["charts"]
+        assert from_rollups["roi"] == raw["roi"]
+        exact = raw["overview"]["calls"]
+        approx = from_rollups["overview"]["calls"]
+        for key in ("total", "answered", "missed", "answer_rate", "avg_duration"):
+            assert approx[key] == exact[key]
+        # Histogram percentiles land within one bucket width of the exact value
+        assert abs(approx["median_duration"] - exact["median_duration"]) < 300
+        assert abs(approx["p90_duration"] - exact["p90_duration"]) < 600
+
+    def test_empty(self):
+        assert rollup_aggregate_rows([]) == []
+
+
+class _Connection:
+    """Records rollup writes; the calls table already holds vapi call 'dup'"""
+
+    def __init__(self):
+        self.executed = []
+        self.version_bumps = 0
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def fetchrow(self, query, *args):
+        if "call_metrics_hourly" in query:
+            self.executed.append(args)
+            return {"duration_digest": None, "caller_hll": None}
+        if args[1] == "dup":
+            return None
+        return {"id": "c1", "created_at": args[5], "duration": args[3], "status": "completed",
+                "appointment_booked": False}
+
+    async def execute(self, query, *args):
+        self.sketches = args
+
+    async def fetchval(self, query, *args):
+        self.version_bumps += 1
+        return self.version_bumps
+
+
+class TestIngest:
+    """Test the end-of-call ingest path"""
+
+    @pytest.mark.asyncio
+    async def test_records_call_and_rollup(self):
+        conn = _Connection()
+        started = datetime(2026, 3, 2, 9, 15, tzinfo=timezone.utc)
+        call_id = await record_end_of_call(
+            conn, "00000000-0000-0000-0000-000000000001", "vapi_1", "+15550100", 75, "", started
+        )
+        assert call_id == "c1"
+        (args,) = conn.executed
+        assert args[1] == datetime(2026, 3, 2, 9, tzinfo=timezone.utc)
+        assert args[2:8] == (1, 1, 0, 1, 0, 75)
+        assert conn.version_bumps == 1
+        assert TDigest.from_bytes(conn.sketches[2]).quantile(0.5) == 75
+        assert HyperLogLog.from_bytes(conn.sketches[3]).count() == 1
+
+    @pytest.mark.asyncio
+    async def test_duplicate_report_ignored(self):
+        conn = _Connection()
+        assert await record_end_of_call(conn, "00000000-0000-0000-0000-000000000001", "dup", None, 75) is None
+        assert conn.executed == []
+        assert conn.version_bumps == 0
+
+
+class _RepairConnection:
+    """Records repair transactions: the advisory lock taken and the window rebuilt"""
+
+    def __init__(self, businesses, rollups_exist=True):
+        self.businesses = businesses
+        self.rollups_exist = rollups_exist
+        self.locks = []
+        self.windows = []
+        self.in_transaction = False
+
+    @asynccontextmanager
+    async def transaction(self):
+        self.in_transaction = True
+        yield
+        self.in_transaction = False
+
+    async def execute(self, query, *args):
+        assert query == analytics_rollups.ROLLUP_LOCK_SQL and self.in_transaction
+        self.locks.append(args[0])
+
+    async def fetch(self, query, *args):
+        if query == analytics_rollups.REPAIR_BUSINESSES_SQL:
+            return [{"business_id": b} for b in self.businesses]
+        assert query == analytics_rollups.REPAIR_ROLLUPS_SQL and self.locks[-1] == args[1]
+        self.windows.append((args[1], args[0], args[2]))
+        return [{"business_id": args[1], "hour_bucket": args[0], "removed": True}]
+
+    async def fetchval(self, query, *args):
+        if "EXISTS" in query:
+            return self.rollups_exist
+        return datetime(2026, 3, 1, 5, 30, tzinfo=timezone.utc)
+
+
+class TestRepair:
+    """Test per-business, windowed rollup repair"""
+
+    @pytest.mark.asyncio
+    async def test_each_business_locked_and_chunked(self, monkeypatch):
+        monkeypatch.setattr(analytics_rollups, "ROLLUP_REPAIR_CHUNK_HOURS", 24)
+        a, b = uuid.uuid4(), uuid.uuid4()
+        conn = _RepairConnection([a, b])
+        since = datetime(2026, 3, 1, 0, 20, tzinfo=timezone.utc)
+        until = datetime(2026, 3, 2, 23, 59, tzinfo=timezone.utc)
+
+        assert await repair_rollups(conn, since, until=until) == 4
+        assert conn.locks == [a, a, b, b]
+        start, middle, end = (datetime(2026, 3, d, tzinfo=timezone.utc) for d in (1, 2, 3))
+        assert conn.windows == [(a, start, middle), (a, middle, end), (b, start, middle), (b, middle, end)]
+
+    @pytest.mark.asyncio
+    async def test_loop_repairs_at_startup(self, monkeypatch):
+        conn = _RepairConnection([uuid.uuid4()], rollups_exist=False)
+
+        @asynccontextmanager
+        async def acquire():
+            yield conn
+
+        loop = asyncio.ensure_future(repair_loop(acquire, interval=3600))
+        await asyncio.sleep(0.05)
+        loop.cancel()
+        await asyncio.gather(loop, return_exceptions=True)
+        # Backfilled from the oldest call without waiting an interval first
+        assert conn.windows and conn.windows[0][1] == datetime(2026, 3, 1, 5, tzinfo=timezone.utc)
@@ -0,0 +1,300 @@
+"""
+CallBot AI - Analytics Service Tests
+Columnar call frames and vectorized dashboard metrics
+"""
+
+import sys
+import os
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analytics_service
+from analytics_service import (
+    CallAnalytics, CallFrame, DashboardMetrics, ROIAnalytics, get_analytics_dashboard,
+    GROUPING_TOTAL, GROUPING_DAY, GROUPING_HOUR, GROUPING_DOW,
+    dashboard_from_aggregates, fetch_analytics_dashboard,
+    comparison_from_periods, comparison_windows, fetch_period_comparison, shift_months,
+    chart_bucket
+)
+
+
+# Monday 2026-03-02 09:15 UTC and friends
+CALLS = [
+    {"duration": 120, "status": "completed", "appointment_booked": True, "created_at": datetime(2026, 3, 2, 9, 15)},
+    {"duration": 0, "status": "missed", "created_at": datetime(2026, 3, 2, 18, 0)},
+    {"duration": 45, "status": "completed", "created_at": datetime(2026, 3, 4, 9, 30, tzinfo=timezone.utc)},
+    {"duration": 300, "appointment_booked": True, "created_at": "2026-03-04T14:00:00"},
+    {"duration": None, "status": "missed", "created_at": None},
+]
+
+
+class TestCallFrame:
+    """Test conversion of call dicts to columns"""
+
+    def test_columns(self):
+        frame = CallFrame.from_calls(CALLS)
+        assert len(frame) == 5
+        assert frame.duration.tolist() == [120, 0, 45, 300, 0]
+        assert frame.booked.tolist() == [True, False, False, True, False]
+        assert frame.status.tolist() == [1, 2, 1, 0, 2]
+        assert frame.has_time.tolist() == [True, True, True, True, False]
+        assert frame.created_at[0] == int(datetime(2026, 3, 2, 9, 15, tzinfo=timezone.utc).timestamp())
+
+    def test_between(self):
+        frame = CallFrame.from_calls(CALLS).between(datetime(2026, 3, 3), datetime(2026, 3, 5))
+        assert frame.duration.tolist() == [45, 300]
+
+
+class TestVectorizedMetrics:
+    """Test metrics match the row-wise definitions"""
+
+    def test_calculate_metrics(self):
+        metrics = CallAnalytics.calculate_metrics(CALLS)
+        assert metrics == {
+            "total_calls": 5,
+            "answered_calls": 3,
+            "missed_calls": 2,
+            "answer_rate": 60.0,
+            "total_duration_minutes": 7.75,
+            "avg_call_duration_seconds": 155.0,
+            "appointments_booked": 2,
+            "conversion_rate": 66.67
+        }
+        assert CallAnalytics.calculate_metrics([])["total_calls"] == 0
+
+    def test_distributions(self):
+        assert CallAnalytics.calculate_hourly_distribution(CALLS) == {9: 2, 14: 1, 18: 1}
+        assert CallAnalytics.calculate_daily_distribution(CALLS) == {"Monday": 2, "Wednesday": 2}
+
+    def test_chart_data(self):
+        charts = DashboardMetrics.generate_chart_data(CALLS)
+        # Days without calls are filled with zeros
+        assert charts["labels"] == ["2026-03-02", "2026-03-03", "2026-03-04"]
+        assert charts["datasets"] == {
+            "calls": [2, 0, 2],
+            "appointments": [1, 0, 1],
+            "duration_minutes": [2.0, 0.0, 5.75]
+        }
+
+    def test_roi_accepts_frame_or_list(self):
+        frame = CallFrame.from_calls(CALLS)
+        assert ROIAnalytics().calculate_roi(frame, []) == ROIAnalytics().calculate_roi(CALLS, [])
+
+    def test_matches_rowwise_on_random_calls(self):
+        rng = np.random.default_rng(3)
+        start = datetime(2026, 1, 1)
+        calls = [
+            {
+                "duration": int(d),
+                "appointment_booked": bool(b),
+                "created_at": start + timedelta(seconds=int(s))
+            }
+            for d, b, s in zip(rng.integers(0, 600, 2000), rng.random(2000) < 0.2, rng.integers(0, 30 * 86400, 2000))
+        ]
+        hourly = {}
+        for call in calls:
+            hourly[call["created_at"].hour] = hourly.get(call["created_at"].hour, 0) + 1
+        assert CallAnalytics.calculate_hourly_distribution(calls) == hourly
+        assert sum(DashboardMetrics.generate_chart_data(calls)["datasets"]["appointments"]) == sum(
+            c["appointment_booked"] for c in calls
+        )
+
+    def test_dashboard_filters_by_range(self):
+        recent = datetime.utcnow() - timedelta(days=1)
+        calls = [
+            {"duration": 60, "created_at": recent},
+            {"duration": 60, "created_at": recent - timedelta(days=400)},
+        ]
+        dashboard = get_analytics_dashboard(calls, [], "last_30_days")
+        assert dashboard["overview"]["calls"]["total"] == 1
+        assert dashboard["roi"]["call_metrics"]["total_calls"] == 1
+
+
+def _sql_rows(calls):
+    """What CALL_AGGREGATES_SQL returns for these calls, computed row by row"""
+    groups = {}
+    callers = set()
+    for call in calls:
+        created = call["created_at"]
+        duration = call.get("duration") or 0
+        keys = [
+            (GROUPING_TOTAL, None, None, None),
+            (GROUPING_DAY, created.replace(hour=0, minute=0, second=0), None, None),
+            (GROUPING_HOUR, None, created.hour, None),
+            (GROUPING_DOW, None, None, created.isoweekday()),
+        ]
+        for key in keys:
+            groups.setdefault(key, []).append((duration, call.get("status"), call.get("appointment_booked", False)))
+        callers.add(call.get("caller_phone"))
+
+    rows = []
+    for (grouping, day, hour, dow), members in groups.items():
+        talked = sorted(d for d, _, _ in members if d > 0)
+        rows.append({
+            "grouping": grouping, "day": day, "hour": hour, "dow": dow,
+            "total": len(members),
+            "answered": sum(1 for d, s, _ in members if s == "completed" or d > 0),
+            "missed": sum(1 for d, s, _ in members if s == "missed" or d == 0),
+            "talked": len(talked),
+            "talk_seconds": sum(d for d, _, _ in members),
+            "booked": sum(1 for _, _, b in members if b),
+            "p50": float(np.percentile(talked, 50)) if talked else None,
+            "p90": float(np.percentile(talked, 90)) if talked else None,
+        })
+        if grouping == GROUPING_TOTAL:
+            rows[-1]["unique_callers"] = len(callers - {None})
+    return rows
+
+
+class TestSqlAggregates:
+    """Test the SQL pushdown path produces the in-memory dashboard"""
+
+    def test_same_shape_and_values(self):
+        rng = np.random.default_rng(7)
+        start = datetime.utcnow() - timedelta(days=20)
+        calls = [
+            {
+                "duration": int(d),
+                "status": "missed" if d == 0 else "completed",
+                "appointment_booked": bool(b),
+                "caller_phone": f"+1555{p:07d}",
+                "created_at": start + timedelta(seconds=int(s))
+            }
+            for d, b, s, p in zip(
+                rng.integers(0, 300, 500), rng.random(500) < 0.2, rng.integers(0, 15 * 86400, 500),
+                rng.integers(0, 200, 500)
+            )
+        ]
+        appointments = [
+            {"status": status, "created_at": start + timedelta(days=1)}
+            for status in ["pending", "confirmed", "confirmed", "completed", "cancelled"]
+        ]
+        appointment_row = {"total": 5, "pending": 1, "confirmed": 2, "completed": 1, "cancelled": 1}
+
+        in_memory = get_analytics_dashboard(calls, appointments, "last_30_days")
+        pushed = dashboard_from_aggregates(_sql_rows(calls), appointment_row, "last_30_days")
+
+        assert pushed["overview"] == in_memory["overview"]
+        assert pushed["charts"] == in_memory["charts"]
+        assert pushed["roi"] == in_memory["roi"]
+        assert pushed.keys() == in_memory.keys()
+
+    def test_empty_period(self):
+        pushed = dashboard_from_aggregates([], None, "last_7_days")
+        in_memory = get_analytics_dashboard([], [], "last_7_days")
+        assert pushed["overview"] == in_memory["overview"]
+        assert pushed["charts"] == in_memory["charts"]
+        assert len(pushed["charts"]["labels"]) == 8
+        assert not any(pushed["charts"]["datasets"]["calls"])
+
+    def test_percentiles(self):
+        assert CallAnalytics.duration_percentiles(CALLS) == {"p50": 120.0, "p90": 264.0}
+        assert CallAnalytics.duration_percentiles([]) == {"p50": 0, "p90": 0}
+
+    @pytest.mark.asyncio
+    async def test_without_database_falls_back(self, monkeypatch):
+        monkeypatch.setattr(analytics_service, "ANALYTICS_DB_ENABLED", False)
+        dashboard = await fetch_analytics_dashboard("00000000-0000-0000-0000-000000000001", "today")
+        assert dashboard["overview"]["calls"]["total"] == 0
+        with pytest.raises(ValueError):
+            await fetch_analytics_dashboard("00000000-0000-0000-0000-000000000001", "fortnight")
+
+
+class TestChartBuckets:
+    """Test adaptive series buckets and gap filling"""
+
+    def test_bucket_sizing(self):
+        start = datetime(2026, 1, 1)
+        assert chart_bucket(start, start + timedelta(hours=20)) == "hour"
+        assert chart_bucket(start, start + timedelta(days=30)) == "day"
+        assert chart_bucket(start, start + timedelta(days=364)) == "week"
+        assert chart_bucket(start, start + timedelta(days=5 * 365)) == "month"
+
+    def test_series_stay_bounded(self):
+        calls = [{"duration": 60, "created_at": datetime(2022, 1, 1) + timedelta(days=d)} for d in range(0, 1200, 3)]
+        charts = DashboardMetrics.generate_chart_data(
+            calls, start_date=datetime(2022, 1, 1), end_date=datetime(2026, 2, 1)
+        )
+        assert charts["bucket"] == "month"
+        assert len(charts["labels"]) == 50
+        assert charts["labels"][:2] == ["2022-01", "2022-02"]
+        assert sum(charts["datasets"]["calls"]) == len(calls)
+        assert charts["datasets"]["calls"][-1] == 0  # Gap after the last call
+
+    def test_weeks_start_on_monday(self):
+        calls = [{"duration": 60, "created_at": datetime(2026, 3, 4)}, {"duration": 60, "created_at": datetime(2026, 3, 9)}]
+        charts = DashboardMetrics.generate_chart_data(calls, start_date=datetime(2026, 1, 1),
+                                                      end_date=datetime(2026, 12, 31), bucket="week")
+        assert charts["labels"][0] == "2025-12-29"
+        march = charts["labels"].index("2026-03-02")
+        assert charts["datasets"]["calls"][march:march + 2] == [1, 1]
+
+    def test_rollups_match_raw_calls_by_hour(self):
+        start = datetime(2026, 3, 2, 0)
+        end = start + timedelta(hours=23, minutes=59)
+        calls = [{"duration": 30 * h, "appointment_booked": h % 5 == 0, "created_at": start + timedelta(hours=h, minutes=h)}
+                 for h in range(0, 24, 3)]
+        rows = [row for row in _sql_rows(calls) if row["grouping"] != GROUPING_DAY] + [
+            {"grouping": GROUPING_DAY, "day": call["created_at"].replace(minute=0), "total": 1,
+             "booked": int(call["appointment_booked"]), "talk_seconds": call["duration"]}
+            for call in calls
+        ]
+        pushed = dashboard_from_aggregates(rows, None, "custom", start, end)
+        in_memory = DashboardMetrics.generate_chart_data(calls, start_date=start, end_date=end)
+        assert pushed["charts"]["bucket"] == "hour"
+        assert pushed["charts"]["labels"][:2] == ["2026-03-02T00:00", "2026-03-02T01:00"]
+        assert pushed["charts"]["datasets"] == in_memory["datasets"]
+
+
+class TestPeriodComparison:
+    """Test period-over-period comparisons from rows keyed by period label"""
+
+    def test_windows(self):
+        start, end = datetime(2026, 3, 1), datetime(2026, 3, 31, 12)
+        assert comparison_windows(start, end)[1] == ("previous", datetime(2026, 1, 29, 12), datetime(2026, 3, 1))
+        assert comparison_windows(start, end, "week")[1][1:] == (datetime(2026, 2, 22), datetime(2026, 3, 24, 12))
+        assert comparison_windows(start, end, "month")[1][2] == datetime(2026, 2, 28, 12)
+        assert comparison_windows(start, end, "year")[1][1] == datetime(2025, 3, 1)
+        with pytest.raises(ValueError):
+            comparison_windows(start, end, "fortnight")
+
+    def test_shift_months(self):
+        assert shift_months(datetime(2024, 3, 31), -1) == datetime(2024, 2, 29)
+        assert shift_months(datetime(2026, 1, 15), -1) == datetime(2025, 12, 15)
+        assert shift_months(datetime(2024, 2, 29), -12) == datetime(2023, 2, 28)
+
+    def test_matches_separate_metrics(self):
+        windows = comparison_windows(datetime(2026, 3, 9), datetime(2026, 3, 16), "week")
+        current_calls = [
+            {"duration": 120, "status": "completed", "appointment_booked": True, "created_at": datetime(2026, 3, 10, 9)},
+            {"duration": 0, "status": "missed", "created_at": datetime(2026, 3, 11, 18)},
+        ]
+        previous_calls = [
+            {"duration": 45, "status": "completed", "created_at": datetime(2026, 3, 3, 9)},
+            {"duration": 300, "appointment_booked": True, "created_at": datetime(2026, 3, 4, 14)},
+        ]
+        call_rows = {label: _sql_rows(calls)[0] | {"period": label}
+                     for label, calls in (("current", current_calls), ("previous", previous_calls))}
+        appointment_rows = {"current": {"total": 2, "confirmed": 1}, "previous": {"total": 1, "confirmed": 0}}
+
+        result = comparison_from_periods(call_rows, appointment_rows, windows)
+
+        current = CallAnalytics.calculate_metrics(current_calls)
+        previous = CallAnalytics.calculate_metrics(previous_calls)
+        assert {k: result["periods"]["current"]["metrics"][k] for k in current} == current
+        assert {k: result["periods"]["previous"]["metrics"][k] for k in previous} == previous
+        assert result["periods"]["previous"]["start"] == "2026-03-02T00:00:00"
+        assert result["changes"]["calls_change"] == 0
+        assert result["changes"]["revenue_change"] == 100.0
+        assert result["summary"]["trends"]["calls_trend"] == "flat"
+
+    @pytest.mark.asyncio
+    async def test_without_database(self, monkeypatch):
+        monkeypatch.setattr(analytics_service, "ANALYTICS_DB_ENABLED", False)
+        result = await fetch_period_comparison("00000000-0000-0000-0000-000000000001", "last_7_days", "year")
+        assert result["periods"]["current"]["metrics"]["total_calls"] == 0
+        assert result["changes"]["calls_change"] == 0
@@ -0,0 +1,110 @@
+"""
+CallBot AI - Analytics Sketch Tests
+t-digest percentiles and HyperLogLog distinct callers
+"""
+
+import sys
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics_rollups import HISTOGRAM_SIZE, rollup_aggregate_rows
+from analytics_sketches import HyperLogLog, TDigest
+
+
+class TestTDigest:
+    """Test quantile accuracy, merging and serialization"""
+
+    def test_quantiles_close_to_exact(self):
+        values = np.random.default_rng(1).exponential(120, 50000)
+        digest = TDigest()
+        digest.update(values)
+        for q in (0.5, 0.9, 0.99):
+            exact = np.percentile(values, q * 100)
+            assert abs(digest.quantile(q) - exact) / exact < 0.02
+        assert len(digest.means) < 200
+
+    def test_merged_hourly_digests_match_one_digest(self):
+        values = np.random.default_rng(2).lognormal(4, 1, 20000)
+        parts = []
+        for chunk in np.array_split(values, 400):
+            part = TDigest()
+            for value in chunk:
+                part.add(value)
+            parts.append(TDigest.from_bytes(part.to_bytes()))
+
+        merged = TDigest.merged(parts)
+        assert merged.count == len(values)
+        assert merged.min == values.min() and merged.max == values.max()
+        exact = np.percentile(values, 90)
+        assert abs(merged.quantile(0.9) - exact) / exact < 0.03
+
+    def test_small_and_empty(self):
+        assert TDigest().quantile(0.5) == 0
+        assert TDigest.from_bytes(None).count == 0
+        digest = TDigest()
+        for value in (10, 20, 30):
+            digest.add(value)
+        assert digest.quantile(0.5) == 20
+
+
+class TestHyperLogLog:
+    """Test distinct counts and register merging"""
+
+    def test_estimate_within_error(self):
+        sketch = HyperLogLog()
+        for i in range(20000):
+            sketch.add(f"+1555{i:07d}")
+            sketch.add(f"+1555{i:07d}")  # Repeat callers count once
+        assert abs(sketch.count() - 20000) / 20000 < 0.05
+
+    def test_merge_is_union(self):
+        a, b = HyperLogLog(), HyperLogLog()
+        for i in range(300):
+            a.add(f"+1{i}")
+        for i in range(200, 500):
+            b.add(f"+1{i}")
+        assert abs(a.merge(b).count() - 500) <= 10
+
+    def test_sparse_serialization(self):
+        sketch = HyperLogLog()
+        for caller in ("+15550100", "+15550101", None, "  "):
+            sketch.add(caller)
+        data = sketch.to_bytes()
+        assert len(data) < 20
+        assert HyperLogLog.from_bytes(data).count() == 2
+
+
+class TestRollupSketches:
+    """Test sketches merge across buckets into dashboard totals"""
+
+    def _bucket(self, hour, durations, callers):
+        digest, hll = TDigest(), HyperLogLog()
+        for duration in durations:
+            digest.add(duration)
+        for caller in callers:
+            hll.add(caller)
+        return {
+            "hour_bucket": datetime(2026, 3, 2, hour, tzinfo=timezone.utc),
+            "calls": len(durations), "answered": len(durations), "missed": 0,
+            "talked": len(durations), "booked": 0, "duration_seconds": sum(durations),
+            "duration_histogram": [0] * HISTOGRAM_SIZE,
+            "duration_digest": digest.to_bytes(), "caller_hll": hll.to_bytes()
+        }
+
+    def test_totals_use_sketches(self):
+        rows = [
+            self._bucket(9, [30, 40, 50], ["+1", "+2", "+3"]),
+            self._bucket(10, [60, 70], ["+3", "+4"]),
+        ]
+        (totals, *_) = rollup_aggregate_rows(rows)
+        assert totals["unique_callers"] == 4
+        assert totals["p50"] == 50
+
+    def test_unrepaired_bucket_disables_sketches(self):
+        rows = [self._bucket(9, [30], ["+1"]), dict(self._bucket(10, [60], ["+2"]), caller_hll=None)]
+        (totals, *_) = rollup_aggregate_rows(rows)
+        assert totals["unique_callers"] is None
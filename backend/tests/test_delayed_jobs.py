@@ -0,0 +1,194 @@
+"""
+CallBot AI - Delayed Jobs Tests
+Timer wheel ordering, keyed scheduling/cancelling and missed-call text-backs
+"""
+
+import sys
+import os
+import json
+import random
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sms_outbox
+from delayed_jobs import CANCEL_SQL, CLAIM_SQL, SCHEDULE_SQL, DelayedJobScheduler, TimerWheel
+from sms_outbox import ENQUEUE_SQL, TEXTBACK_JOB, cancel_textback, schedule_textback, textback_job
+
+BUSINESS_ID = "00000000-0000-0000-0000-000000000001"
+
+
+class _Connection:
+    """Stores jobs like the delayed_jobs table and records outbox inserts"""
+
+    def __init__(self):
+        self.jobs = {}
+        self.enqueued = []
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def fetchrow(self, query, *args):
+        assert query == SCHEDULE_SQL
+        business_id, job_key, kind, payload, due_at = args
+        for job in self.jobs.values():
+            if job["status"] == "pending" and (job["business_id"], job["job_key"]) == (business_id, job_key):
+                job.update(kind=kind, payload=payload, due_at=due_at)
+                return job
+        job = {"id": uuid.uuid4(), "business_id": business_id, "job_key": job_key, "kind": kind,
+               "payload": payload, "due_at": due_at, "status": "pending"}
+        self.jobs[job["id"]] = job
+        return job
+
+    async def fetch(self, query, *args):
+        if query == CANCEL_SQL:
+            business_id, job_key = args
+            cancelled = []
+            for job in self.jobs.values():
+                if job["status"] == "pending" and (job["business_id"], job["job_key"]) == (business_id, job_key):
+                    job["status"] = "cancelled"
+                    cancelled.append(job)
+            return cancelled
+        if query == CLAIM_SQL:
+            now = datetime.now(timezone.utc) + timedelta(seconds=args[1])
+            claimed = []
+            for job_id in args[0]:
+                job = self.jobs[job_id]
+                if job["status"] == "pending" and job["due_at"] <= now:
+                    job["status"] = "dispatched"
+                    claimed.append(job)
+            return claimed
+        assert query == ENQUEUE_SQL
+        self.enqueued.append(args)
+        return [{"id": uuid.uuid4()}]
+
+
+def _acquire(conn):
+    @asynccontextmanager
+    async def acquire():
+        yield conn
+    return acquire
+
+
+class TestTimerWheel:
+    """Test the hierarchical timer wheel"""
+
+    def test_fires_each_timer_on_its_tick(self):
+        rng = random.Random(7)
+        wheel = TimerWheel(tick=1, slots=8, levels=3, now=0)
+        due = {}
+        for i in range(400):
+            due[f"t{i}"] = rng.randint(1, 700)  # past 8^3 ticks too, via overflow
+            wheel.schedule(f"t{i}", due[f"t{i}"])
+        fired = {}
+        for now in range(0, 720, 3):
+            for key in wheel.advance(now):
+                fired[key] = now
+        assert all(fired[key] - 3 < when <= fired[key] for key, when in due.items())
+        assert len(wheel) == 0
+
+    def test_cancel_and_reschedule(self):
+        wheel = TimerWheel(tick=1, slots=8, levels=2, now=100)
+        wheel.schedule("a", 105)
+        wheel.schedule("b", 130)
+        wheel.schedule("b", 103)
+        assert wheel.cancel("a") is True
+        assert wheel.cancel("a") is False
+        assert wheel.advance(104) == ["b"]
+        assert wheel.advance(200) == []
+
+    def test_past_due_fires_on_next_tick(self):
+        wheel = TimerWheel(tick=1, now=50)
+        wheel.schedule("late", 10)
+        assert wheel.advance(50) == []
+        assert wheel.advance(51) == ["late"]
+
+
+class TestScheduler:
+    """Test keyed jobs with and without a database"""
+
+    @pytest.mark.asyncio
+    async def test_memory_cancel_before_due(self):
+        scheduler = DelayedJobScheduler()
+        ran = []
+
+        async def handler(conn, job):
+            ran.append(job["payload"])
+
+        scheduler.register("ping", handler)
+        first = await scheduler.schedule(None, BUSINESS_ID, "k1", "ping", {"n": 1}, 0)
+        await scheduler.schedule(None, BUSINESS_ID, "k2", "ping", {"n": 2}, 0)
+        assert await scheduler.schedule(None, BUSINESS_ID, "k1", "ping", {"n": 3}, 0) == first
+        assert await scheduler.cancel(None, BUSINESS_ID, "k2") is True
+
+        fired = scheduler.wheel.advance(scheduler.wheel.current + 2)
+        assert await scheduler.dispatch(fired) == 1
+        assert ran == [{"n": 3}]
+        assert await scheduler.cancel(None, BUSINESS_ID, "k1") is False
+
+    @pytest.mark.asyncio
+    async def test_claim_skips_jobs_cancelled_elsewhere(self):
+        conn = _Connection()
+        scheduler = DelayedJobScheduler()
+        scheduler.acquire = _acquire(conn)
+        ran = []
+
+        async def handler(handler_conn, job):
+            assert handler_conn is conn
+            ran.append(job["job_key"])
+
+        scheduler.register("ping", handler)
+        kept = await scheduler.schedule(conn, BUSINESS_ID, "kept", "ping", {}, 0)
+        dropped = await scheduler.schedule(conn, BUSINESS_ID, "dropped", "ping", {}, 0)
+        # Cancelled by another process: still on this wheel, no longer pending
+        conn.jobs[uuid.UUID(dropped)]["status"] = "cancelled"
+
+        assert await scheduler.dispatch([kept, dropped]) == 1
+        assert ran == ["kept"]
+        assert await scheduler.dispatch([kept]) == 0
+
+    @pytest.mark.asyncio
+    async def test_jobs_past_horizon_stay_in_the_table(self):
+        conn = _Connection()
+        scheduler = DelayedJobScheduler(horizon=60)
+        await scheduler.schedule(conn, BUSINESS_ID, "later", "ping", {}, 3600)
+        assert len(scheduler.wheel) == 0
+        assert len(conn.jobs) == 1
+
+
+class TestTextBack:
+    """Test missed-call text-backs as delayed jobs"""
+
+    @pytest.mark.asyncio
+    async def test_call_back_cancels_textback(self, monkeypatch):
+        scheduler = DelayedJobScheduler()
+        scheduler.register(TEXTBACK_JOB, textback_job)
+        monkeypatch.setattr(sms_outbox, "job_scheduler", scheduler)
+        conn = _Connection()
+
+        await schedule_textback(conn, BUSINESS_ID, "(555) 010-0000", "Sorry we missed you")
+        assert await cancel_textback(conn, BUSINESS_ID, "+15550100000") is True
+        assert len(scheduler.wheel) == 0
+        assert await cancel_textback(conn, BUSINESS_ID, "+15550100000") is False
+
+    @pytest.mark.asyncio
+    async def test_due_textback_goes_to_outbox(self, monkeypatch):
+        scheduler = DelayedJobScheduler()
+        scheduler.register(TEXTBACK_JOB, textback_job)
+        monkeypatch.setattr(sms_outbox, "job_scheduler", scheduler)
+        conn = _Connection()
+        scheduler.acquire = _acquire(conn)
+
+        job_id = await schedule_textback(conn, BUSINESS_ID, "5550100000", "Sorry we missed you", delay_seconds=0)
+        assert json.loads(conn.jobs[uuid.UUID(job_id)]["payload"])["to_phone"] == "+15550100000"
+        assert await scheduler.dispatch([job_id]) == 1
+
+        (args,) = conn.enqueued
+        assert args[1] == "missed_call_textback"
+        assert args[5] == [f"textback:{job_id}"]
+        assert args[6] == ["+15550100000"]
@@ -0,0 +1,283 @@
+"""
+CallBot AI - Knowledge Base Tests
+Indexing, ranking and retrieval for business knowledge bases
+"""
+
+import sys
+import os
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from knowledge_base import (
+    KnowledgeBase, KnowledgeBaseEntry, KnowledgeBaseManager, tokenize, chunk_spans
+)
+
+
+def make_kb(entries):
+    kb = KnowledgeBase("biz_test")
+    for i, (title, content, category) in enumerate(entries):
+        kb.add_entry(KnowledgeBaseEntry(f"kb_{i}", "biz_test", title, content, category))
+    return kb
+
+
+SAMPLE_ENTRIES = [
+    ("AC Repair Pricing", "Air conditioning repair starts at $89 for the diagnostic visit.", "pricing"),
+    ("Furnace Installation", "We install high-efficiency furnaces. Installation takes one day.", "services"),
+    ("Emergency Service", "Emergency repairs are available 24/7 including weekends.", "services"),
+    ("Cancellation Policy", "Cancel at least 24 hours before your appointment to avoid a fee.", "policies"),
+]
+
+
+class TestTokenizer:
+    """Test tokenization and light stemming"""
+
+    def test_stopwords_removed(self):
+        assert tokenize("What is the price of a repair?") == ["pric", "repair"]
+
+    def test_inflections_share_terms(self):
+        assert tokenize("repairs repaired repairing") == ["repair"] * 3
+        assert tokenize("price prices pricing") == ["pric"] * 3
+
+
+class TestKnowledgeBaseSearch:
+    """Test BM25 search over the inverted index"""
+
+    def test_ranked_results(self):
+        kb = make_kb(SAMPLE_ENTRIES)
+        results = kb.search("repair pricing")
+        assert results[0].title == "AC Repair Pricing"
+        assert {e.title for e in results} == {"AC Repair Pricing", "Emergency Service"}
+
+    def test_category_filter(self):
+        kb = make_kb(SAMPLE_ENTRIES)
+        results = kb.search("repair", category="services")
+        assert [e.title for e in results] == ["Emergency Service"]
+
+    def test_limit(self):
+        kb = make_kb(SAMPLE_ENTRIES)
+        assert len(kb.search("repair", limit=1)) == 1
+
+    def test_no_match(self):
+        kb = make_kb(SAMPLE_ENTRIES)
+        assert kb.search("plumbing") == []
+        assert kb.search("the and of") == []
+
+    def test_index_updates_incrementally(self):
+        kb = make_kb(SAMPLE_ENTRIES)
+        kb.add_entry(KnowledgeBaseEntry("kb_new", "biz_test", "Duct Cleaning", "Duct cleaning for $199.", "services"))
+        assert [e.id for e in kb.search("duct")] == ["kb_new"]
+
+        assert kb.remove_entry("kb_new")
+        assert kb.search("duct") == []
+        assert "duct" not in kb.index.postings
+        assert len(kb.index) == len(SAMPLE_ENTRIES)
+
+
+class TestEntryIndexes:
+    """Test id/hash/category bookkeeping"""
+
+    def test_duplicate_content_rejected(self):
+        kb = make_kb(SAMPLE_ENTRIES)
+        dup = KnowledgeBaseEntry("kb_dup", "biz_test", "Other title", SAMPLE_ENTRIES[0][1])
+        assert not kb.add_entry(dup)
+        assert kb.get_by_hash(dup.content_hash).id == "kb_0"
+
+    def test_stats_maintained_incrementally(self):
+        kb = make_kb(SAMPLE_ENTRIES)
+        kb.remove_entry("kb_1")
+        stats = kb.stats
+
+        remaining = [e for i, e in enumerate(SAMPLE_ENTRIES) if i != 1]
+        assert stats["total_entries"] == 3
+        assert stats["total_chars"] == sum(len(c) for _, c, _ in remaining)
+        assert stats["entries_by_category"]["services"] == 1
+        assert sorted(stats["categories"]) == ["policies", "pricing", "services"]
+        assert [e.id for e in kb.get_by_category("services")] == ["kb_2"]
+
+        # Content can be re-added once the original is gone
+        assert kb.add_entry(KnowledgeBaseEntry("kb_1b", "biz_test", "Again", SAMPLE_ENTRIES[1][1]))
+
+    def test_entry_is_slotted(self):
+        entry = KnowledgeBaseEntry("kb_x", "biz_test", "Title", "Body")
+        assert not hasattr(entry, "__dict__")
+
+
+class TestChunking:
+    """Test overlapping chunk windows"""
+
+    def test_short_text_single_chunk(self):
+        assert chunk_spans("short text") == [(0, 10)]
+        assert chunk_spans("   ") == []
+
+    def test_windows_overlap_and_cover_text(self):
+        text = " ".join(f"word{i}" for i in range(2000))
+        spans = chunk_spans(text, size=500, overlap=100)
+        assert spans[0][0] == 0
+        assert spans[-1][1] == len(text)
+        for (s1, e1), (s2, e2) in zip(spans, spans[1:]):
+            assert s2 < e1  # overlapping
+            assert e1 - s1 <= 500
+
+
+class TestContextAssembly:
+    """Test retrieval-based context prompts"""
+
+    def _large_kb(self):
+        filler = " ".join(f"Our team handles general maintenance task number {i}." for i in range(400))
+        kb = make_kb(SAMPLE_ENTRIES)
+        kb.add_entry(KnowledgeBaseEntry(
+            "kb_big", "biz_test", "Company Handbook",
+            filler + " Water heater flush costs $149 and takes one hour.", "general"
+        ))
+        return kb
+
+    def test_query_retrieves_late_content_within_budget(self):
+        kb = self._large_kb()
+        context = kb.generate_context_prompt(max_tokens=400, query="water heater flush cost")
+        assert "Water heater flush costs $149" in context
+        assert len(context) <= 400 * 4 + 200
+
+    def test_static_core_covers_every_entry_first(self):
+        kb = self._large_kb()
+        context = kb.generate_context_prompt(max_tokens=600)
+        for title, _, _ in SAMPLE_ENTRIES:
+            assert f"### {title}" in context
+        assert "### Company Handbook" in context
+        assert "task number 200." not in context  # middle of the large doc doesn't fit
+        assert context.index("## PRICING") < context.index("## GENERAL")
+
+    def test_topics_each_get_coverage(self):
+        kb = self._large_kb()
+        context = kb.generate_context_prompt(max_tokens=300, topics=["cancellation policy", "furnace installation"])
+        assert "Cancellation Policy" in context
+        assert "Furnace Installation" in context
+
+    def test_full_budget_has_no_duplicate_overlap(self):
+        kb = self._large_kb()
+        context = kb.generate_context_prompt(max_tokens=100000)
+        assert context.count("task number 250.") == 1
+        assert "[...]" not in context
+
+
+class TestKnowledgeBaseManager:
+    """Test the LRU-capped, versioned knowledge base cache"""
+
+    def _entry(self, business_id, n, size=1000):
+        return KnowledgeBaseEntry(f"kb_{business_id}_{n}", business_id, f"Entry {n}", f"content {n} " + "x" * size)
+
+    @pytest.mark.asyncio
+    async def test_lru_eviction_by_bytes(self):
+        one_kb = KnowledgeBase("probe")
+        one_kb.add_entry(self._entry("probe", 1, size=4000))
+        manager = KnowledgeBaseManager(max_bytes=int(one_kb.memory_bytes * 2.5), persistent=False)
+        for biz in ("a", "b", "c"):
+            await manager.add_entry(biz, self._entry(biz, 1, size=4000))
+
+        assert list(manager.knowledge_bases) == ["b", "c"]
+        assert manager.total_bytes <= manager.max_bytes
+
+        # Touching "b" makes "c" the eviction candidate
+        await manager.get("b")
+        await manager.add_entry("d", self._entry("d", 1, size=4000))
+        assert list(manager.knowledge_bases) == ["b", "d"]
+
+    @pytest.mark.asyncio
+    async def test_entries_are_prepared_off_the_event_loop(self):
+        manager = KnowledgeBaseManager(persistent=False)
+        kb = await manager.get("biz")
+        loop_thread = threading.get_ident()
+        threads = []
+        prepare = kb.prepare_entry
+
+        def spy(entry):
+            threads.append(threading.get_ident())
+            return prepare(entry)
+
+        kb.prepare_entry = spy
+        assert await manager.add_entry("biz", self._entry("biz", 1))
+        assert threads and threads[0] != loop_thread
+        assert kb.search("content")[0].title == "Entry 1"
+        assert not await manager.add_entry("biz", self._entry("biz", 1))
+        assert len(threads) == 1  # duplicates aren't prepared
+
+    @pytest.mark.asyncio
+    async def test_kb_created_in_cache_is_loaded_from_postgres(self):
+        """A tenant with rows but no knowledge_base_versions row (version 0)"""
+        manager = KnowledgeBaseManager(persistent=True, version_check_seconds=60)
+        loads = []
+
+        async def fetch_version(business_id):
+            return 0
+
+        async def load(business_id):
+            loads.append(business_id)
+            kb = KnowledgeBase(business_id)
+            kb.add_entry(self._entry(business_id, 1))
+            return kb, 0
+
+        manager._fetch_version = fetch_version
+        manager._load = load
+
+        assert len(manager.get_or_create("biz")) == 0
+        kb = await manager.get("biz")
+        assert len(kb) == 1 and loads == ["biz"]
+        assert await manager.kb_version("biz") == (0, kb.revision)
+        assert (await manager.get_stats("biz"))["total_entries"] == 1
+        assert loads == ["biz"]
+
+    @pytest.mark.asyncio
+    async def test_failed_remove_keeps_entry_cached(self, monkeypatch):
+        import database_postgres
+
+        manager = KnowledgeBaseManager(persistent=True, version_check_seconds=60)
+
+        async def fetch_version(business_id):
+            return 1
+
+        async def load(business_id):
+            kb = KnowledgeBase(business_id)
+            kb.add_entry(self._entry(business_id, 1))
+            return kb, 1
+
+        def get_connection():
+            raise ConnectionError("database unavailable")
+
+        manager._fetch_version = fetch_version
+        manager._load = load
+        monkeypatch.setattr(database_postgres, "get_connection", get_connection)
+
+        with pytest.raises(ConnectionError):
+            await manager.remove_entry("biz", "kb_biz_1")
+        kb = await manager.get("biz")
+        assert kb.get_entry("kb_biz_1") is not None
+        assert kb.search("content")[0].id == "kb_biz_1"
+
+    @pytest.mark.asyncio
+    async def test_reload_on_version_change(self):
+        manager = KnowledgeBaseManager(persistent=True, version_check_seconds=0)
+        db = {"version": 1, "loads": 0}
+
+        async def fetch_version(business_id):
+            return db["version"]
+
+        async def load(business_id):
+            db["loads"] += 1
+            kb = KnowledgeBase(business_id)
+            kb.add_entry(self._entry(business_id, db["version"]))
+            return kb, db["version"]
+
+        manager._fetch_version = fetch_version
+        manager._load = load
+
+        kb = await manager.get("biz")
+        assert await manager.get("biz") is kb
+        assert db["loads"] == 1
+
+        db["version"] = 2  # another worker wrote
+        reloaded = await manager.get("biz")
+        assert reloaded is not kb
+        assert db["loads"] == 2
+        assert reloaded.entries[0].title == "Entry 2"
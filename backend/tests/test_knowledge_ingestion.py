@@ -0,0 +1,296 @@
+"""
+CallBot AI - Knowledge Base Ingestion Tests
+Background extraction jobs, streamed PDF page groups and structured records
+"""
+
+import sys
+import os
+import json
+import asyncio
+import uuid
+from contextlib import asynccontextmanager
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database_postgres
+import knowledge_ingestion
+from knowledge_base import KnowledgeBaseEntry, KnowledgeBaseManager
+from knowledge_ingestion import (
+    IngestionJob, IngestionJobManager, JobStatus, spool_upload,
+    infer_value, iter_json_values, iter_json_records, iter_csv_records, ingest_structured_file
+)
+
+
+def build_pdf(page_texts):
+    """Write a minimal text PDF with one page per string"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in page_texts:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Contents {len(objects)} 0 R /Resources << /Font << /F1 3 0 R >> >> >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode()
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return out
+
+
+class _Upload:
+    """Just enough of UploadFile for spooling"""
+
+    def __init__(self, filename, data):
+        self.filename = filename
+        self._data = data
+        self._pos = 0
+
+    async def read(self, size=-1):
+        end = len(self._data) if size < 0 else self._pos + size
+        chunk = self._data[self._pos:end]
+        self._pos += len(chunk)
+        return chunk
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    kb = KnowledgeBaseManager(persistent=False)
+    monkeypatch.setattr(knowledge_ingestion, "kb_manager", kb)
+    yield IngestionJobManager(max_jobs_per_tenant=1), kb
+    knowledge_ingestion.shutdown_extraction_pool()
+
+
+class TestSpooling:
+    """Test spooling uploads to disk"""
+
+    @pytest.mark.asyncio
+    async def test_spool_writes_file(self, monkeypatch):
+        monkeypatch.setattr(knowledge_ingestion, "SPOOL_CHUNK_BYTES", 7)
+        path, size = await spool_upload(_Upload("notes.txt", b"x" * 100))
+        try:
+            assert size == 100
+            assert path.endswith(".txt")
+            with open(path, "rb") as f:
+                assert f.read() == b"x" * 100
+        finally:
+            os.unlink(path)
+
+    @pytest.mark.asyncio
+    async def test_spool_rejects_oversized(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(knowledge_ingestion, "UPLOAD_SPOOL_DIR", str(tmp_path))
+        with pytest.raises(ValueError):
+            await spool_upload(_Upload("big.txt", b"x" * 100), max_bytes=50)
+        assert list(tmp_path.iterdir()) == []
+
+
+class TestIngestionJobs:
+    """Test background extraction jobs"""
+
+    @pytest.mark.asyncio
+    async def test_text_job_completes(self, manager, tmp_path):
+        jobs, kb_manager = manager
+        path = tmp_path / "hours.txt"
+        path.write_text("We are open Monday to Friday, 9am to 5pm.")
+
+        job = jobs.submit("biz_1", "hours.txt", str(path), path.stat().st_size)
+        assert job.status == JobStatus.QUEUED
+        await jobs.wait()
+
+        assert job.status == JobStatus.COMPLETED
+        assert len(job.entry_ids) == 1
+        assert not path.exists()
+        kb = await kb_manager.get("biz_1")
+        assert kb.get_entry(job.entry_ids[0]).title == "hours.txt"
+
+    @pytest.mark.asyncio
+    async def test_pdf_pages_become_entries(self, manager, tmp_path, monkeypatch):
+        jobs, kb_manager = manager
+        monkeypatch.setattr(knowledge_ingestion, "PDF_PAGES_PER_TASK", 2)
+        path = tmp_path / "menu.pdf"
+        path.write_bytes(build_pdf([f"Menu page {i}" for i in range(1, 6)]))
+
+        job = jobs.submit("biz_1", "menu.pdf", str(path), path.stat().st_size)
+        await jobs.wait()
+
+        assert job.status == JobStatus.COMPLETED, job.error
+        assert job.parts_total == job.parts_done == 3
+        kb = await kb_manager.get("biz_1")
+        titles = [kb.get_entry(entry_id).title for entry_id in job.entry_ids]
+        assert titles == ["menu.pdf (pages 1-2)", "menu.pdf (pages 3-4)", "menu.pdf (pages 5-5)"]
+        assert "Menu page 3" in kb.get_entry(job.entry_ids[1]).content
+
+    @pytest.mark.asyncio
+    async def test_failed_job_reports_error(self, manager, tmp_path):
+        jobs, _ = manager
+        path = tmp_path / "broken.pdf"
+        path.write_bytes(b"not a pdf")
+
+        job = jobs.submit("biz_1", "broken.pdf", str(path), 9)
+        await jobs.wait()
+
+        assert job.status == JobStatus.FAILED
+        assert job.error.startswith("Error processing file")
+        assert not path.exists()
+
+    @pytest.mark.asyncio
+    async def test_per_tenant_limit(self, manager, tmp_path, monkeypatch):
+        jobs, _ = manager
+        running = {"now": 0, "peak": 0}
+
+        async def slow_parts(path, filename, business_id, on_total=None):
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+            await asyncio.sleep(0.01)
+            running["now"] -= 1
+            yield None, "text"
+
+        monkeypatch.setattr(knowledge_ingestion, "extract_document_parts", slow_parts)
+        for i in range(3):
+            path = tmp_path / f"doc{i}.txt"
+            path.write_text("x")
+            jobs.submit("biz_1", path.name, str(path), 1)
+        await jobs.wait()
+
+        assert running["peak"] == 1
+        assert jobs.get_job("biz_2", next(iter(jobs.jobs))) is None
+
+
+class TestStructuredRecords:
+    """Test CSV / JSON streaming and per-record entries"""
+
+    def test_infer_value(self):
+        assert infer_value("$1,250.00") == 1250.0
+        assert infer_value("42") == 42
+        assert infer_value("Yes") is True
+        assert infer_value("1,2,3") == "1,2,3"
+
+    def test_csv_handles_quoted_fields(self, tmp_path):
+        path = tmp_path / "prices.csv"
+        path.write_text('Service,Price\n"Drain cleaning, basic",$149\nWater heater,"1,200"\n')
+        assert list(iter_csv_records(str(path))) == [
+            {"Service": "Drain cleaning, basic", "Price": "$149"},
+            {"Service": "Water heater", "Price": "1,200"},
+        ]
+
+    def test_json_streams_across_chunk_boundaries(self, tmp_path):
+        path = tmp_path / "catalog.json"
+        items = [{"name": f"Item {i}", "price": i * 1000} for i in range(50)]
+        path.write_text(json.dumps(items))
+        assert list(iter_json_values(str(path), chunk_size=5)) == items
+
+        lines = tmp_path / "catalog.jsonl"
+        lines.write_text("\n".join(json.dumps(item) for item in items[:3]))
+        assert list(iter_json_values(str(lines), chunk_size=4)) == items[:3]
+
+    def test_top_level_object_is_streamed(self, tmp_path):
+        path = tmp_path / "catalog.json"
+        catalog = {
+            "company": "Acme",
+            "services": [{"name": f"Service {i}", "price": i} for i in range(30)],
+            "tags": ["plumbing", "heating"],
+            "faq": [{"question": "Open Sundays?", "answer": "No"}],
+        }
+        path.write_text(json.dumps(catalog, indent=1))
+        records = list(iter_json_records(str(path), chunk_size=7))
+        assert records == [{"section": "services", **item} for item in catalog["services"]] + [
+            {"section": "faq", "question": "Open Sundays?", "answer": "No"}
+        ]
+
+        # Objects without lists of objects are one record each, including JSON Lines
+        plain = {"name": "Acme", "tags": ["a", "b"], "empty": [], "hours": {"mon": "8-5"}}
+        path.write_text(json.dumps(plain) + "\n" + json.dumps({"name": "Other"}))
+        assert list(iter_json_records(str(path), chunk_size=3)) == [plain, {"name": "Other"}]
+
+    @pytest.mark.asyncio
+    async def test_rows_become_searchable_records(self, manager, tmp_path):
+        jobs, kb_manager = manager
+        path = tmp_path / "prices.csv"
+        path.write_text(
+            "Service,Price,Warranty\n"
+            + "".join(f"Service {i},${i}.00,yes\n" for i in range(30))
+            + '"Tankless water heater install, premium",$3499.00,no\n'
+        )
+
+        job = jobs.submit("biz_1", "prices.csv", str(path), path.stat().st_size)
+        await jobs.wait()
+
+        assert job.status == JobStatus.COMPLETED, job.error
+        assert job.records == 31
+        assert job.columns == {"Service": "string", "Price": "number", "Warranty": "boolean"}
+
+        kb = await kb_manager.get("biz_1")
+        top = kb.search("tankless water heater")[0]
+        assert top.title == "Tankless water heater install, premium"
+        assert top.category == "pricing" and top.source_type == "record"
+        # Records are retrieved by query, not stuffed into the static prompt
+        assert kb.generate_context_prompt() == ""
+
+    @pytest.mark.asyncio
+    async def test_nested_lists_and_record_limit(self, manager, tmp_path):
+        _, kb_manager = manager
+        path = tmp_path / "catalog.json"
+        path.write_text(json.dumps({"services": [{"name": f"Service {i}", "price": i} for i in range(20)]}))
+
+        job = IngestionJob("job_1", "biz_1", "catalog.json", str(path), path.stat().st_size)
+        await ingest_structured_file(job, max_records=5)
+
+        assert job.records == 5
+        assert job.truncated
+        kb = await kb_manager.get("biz_1")
+        assert "section: services" in kb.get_entry(job.entry_ids[0]).content
+
+    @pytest.mark.asyncio
+    async def test_batch_is_one_transaction_and_version_bump(self, monkeypatch):
+        class _Connection:
+            def __init__(self):
+                self.inserts = []
+                self.bumps = 0
+
+            @asynccontextmanager
+            async def transaction(self):
+                yield
+
+            async def fetch(self, query, *args):
+                self.inserts.append(args[3])
+                return [{"id": entry_id} for entry_id in args[3]]
+
+            async def fetchval(self, query, *args):
+                self.bumps += 1
+                return 7
+
+        conn = _Connection()
+
+        @asynccontextmanager
+        async def get_connection():
+            yield conn
+
+        monkeypatch.setattr(database_postgres, "get_connection", get_connection)
+        kb_manager = KnowledgeBaseManager(persistent=True)
+
+        async def get(business_id):
+            return kb_manager.get_or_create(business_id)
+
+        kb_manager.get = get
+        business_id = str(uuid.uuid4())
+        entries = [
+            KnowledgeBaseEntry(str(uuid.uuid4()), business_id, f"Record {i}", f"content {i % 3}")
+            for i in range(4)
+        ]
+        added = await kb_manager.add_entries(business_id, entries, filename="catalog.csv")
+
+        assert added == [e.id for e in entries[:3]]  # the fourth duplicates the first's content
+        assert len(conn.inserts) == 1 and len(conn.inserts[0]) == 3
+        assert conn.bumps == 1
+        assert kb_manager.versions[business_id] == 7
@@ -0,0 +1,177 @@
+"""
+CallBot AI - Knowledge Base Vector Index Tests
+Offline embeddings, int8 storage and hybrid ranking
+"""
+
+import sys
+import os
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import knowledge_vectors
+from knowledge_base import KnowledgeBase, KnowledgeBaseEntry
+from knowledge_vectors import HashingEmbedder, VectorIndex, quantize
+
+
+DOCS = [
+    ("Air Conditioning Repair Pricing", "Our air conditioning repair starts at $129 for diagnosis plus parts.", "pricing"),
+    ("Plumbing Services", "We clear drains, fix leaks and install water heaters.", "services"),
+    ("Business Hours", "We are open Monday through Friday 8am to 6pm.", "general"),
+    ("Warranty Policy", "All work carries a one year labor warranty.", "policies"),
+]
+
+
+def make_kb(vectors):
+    kb = KnowledgeBase("biz_1", vectors=vectors)
+    for i, (title, content, category) in enumerate(DOCS):
+        kb.add_entry(KnowledgeBaseEntry(
+            entry_id=f"e{i}", business_id="biz_1", title=title, content=content, category=category
+        ))
+    return kb
+
+
+class TestEmbedding:
+    """Test the offline embedder and quantization"""
+
+    def test_embeddings_are_normalized_and_stable(self):
+        embedder = HashingEmbedder(dim=128)
+        a = embedder.embed(["drain cleaning", ""])
+        assert a.shape == (2, 128)
+        assert np.isclose(np.linalg.norm(a[0]), 1.0)
+        assert not a[1].any()
+        assert np.array_equal(a[0], HashingEmbedder(dim=128).embed(["drain cleaning"])[0])
+
+    def test_quantization_preserves_cosine(self):
+        vectors = HashingEmbedder().embed([text for _, text, _ in DOCS])
+        codes, scales = quantize(vectors)
+        assert codes.dtype == np.int8
+        exact = vectors @ vectors[0]
+        approx = (codes @ vectors[0]) * scales
+        assert np.allclose(exact, approx, atol=0.02)
+
+
+class TestVectorIndex:
+    """Test storage, persistence and search"""
+
+    def test_paraphrase_found_by_hybrid_search(self):
+        kb = make_kb(VectorIndex("biz_1"))
+        assert kb.search_chunks("how much to fix AC")[0][0].entry.title == "Air Conditioning Repair Pricing"
+        assert kb.search("when are you open")[0].title == "Business Hours"
+
+        # Keyword-only search has nothing to go on
+        assert make_kb(None).search("how much to fix AC")[0].title != "Air Conditioning Repair Pricing"
+
+    def test_remove_entry_drops_vectors(self):
+        kb = make_kb(VectorIndex("biz_1"))
+        kb.remove_entry("e0")
+        assert "e0#0" not in kb.vectors
+        assert all(chunk_id != "e0#0" for chunk_id, _ in kb.vectors.search("air conditioning repair"))
+
+    def test_flush_memory_maps_from_disk(self, tmp_path):
+        vectors = VectorIndex("biz_1", str(tmp_path))
+        make_kb(vectors)
+        vectors.flush()
+        assert isinstance(vectors.codes, np.memmap)
+        assert vectors.pending_ids == []
+
+        reopened = VectorIndex("biz_1", str(tmp_path))
+        assert len(reopened) == len(DOCS)
+        assert reopened.search("warranty")[0][0] == "e3#0"
+
+        # Reloading the same entries reuses saved rows instead of re-embedding
+        make_kb(reopened)
+        assert reopened.pending_ids == []
+
+        reopened.retain(["e1#0", "e2#0"])
+        reopened.flush()
+        assert VectorIndex("biz_1", str(tmp_path)).ids == ["e1#0", "e2#0"]
+
+    def test_workers_flushing_one_business_never_mix_files(self, tmp_path):
+        first = VectorIndex("biz_1", str(tmp_path))
+        second = VectorIndex("biz_1", str(tmp_path))
+        make_kb(first)
+        first.flush()
+        second.add_many([("x#0", "gutter cleaning")])
+        second.flush()
+        first.remove("e0#0")
+        first.flush()
+
+        # Last writer wins as a whole: ids, codes and scales from one flush
+        reopened = VectorIndex("biz_1", str(tmp_path))
+        assert reopened.ids == ["e1#0", "e2#0", "e3#0"]
+        assert len(reopened.codes) == len(reopened.scales) == 3
+        assert reopened.search("warranty")[0][0] == "e3#0"
+        # Each flush removed the generation it replaced; no temp files are left behind
+        names = sorted(os.listdir(tmp_path / "biz_1"))
+        assert not any(name.endswith(".tmp") for name in names)
+        assert len(names) == 5  # second's generation, first's generation and the manifest
+
+    def test_flush_keeps_own_rows_when_another_manifest_wins(self, tmp_path):
+        first = VectorIndex("biz_1", str(tmp_path))
+        second = VectorIndex("biz_1", str(tmp_path))
+        kb = make_kb(first)
+        second.add_many([("x#0", "gutter cleaning")])
+        write = first._write
+
+        def racing_write(*args):
+            generation = write(*args)
+            second.flush()  # swaps in its manifest before first reads its own back
+            return generation
+
+        first._write = racing_write
+        first.flush()
+        assert sorted(first.ids) == ["e0#0", "e1#0", "e2#0", "e3#0"]
+        assert kb.search_chunks("warranty")[0][0].entry.id == "e3"
+        assert VectorIndex("biz_1", str(tmp_path)).ids == ["x#0"]
+        assert len(os.listdir(tmp_path / "biz_1")) == 3  # second's codes and scales and the manifest
+
+    def test_unknown_vector_ids_are_skipped(self):
+        kb = make_kb(VectorIndex("biz_1"))
+        kb.vectors.add_many([("gone#0", "air conditioning repair pricing")])
+        results = kb.search_chunks("air conditioning repair")
+        assert results and all(chunk.id != "gone#0" for chunk, _ in results)
+
+    def test_category_filter_applies_before_top_k(self, monkeypatch):
+        monkeypatch.setattr(knowledge_vectors, "VECTOR_TOP_K", 2)
+        kb = make_kb(VectorIndex("biz_1"))
+        for i in range(4):
+            kb.add_entry(KnowledgeBaseEntry(
+                entry_id=f"s{i}", business_id="biz_1", title=f"Warranty Service {i}",
+                content=f"Warranty repairs: warranty labor warranty work on every job {i}.", category="services"
+            ))
+        results = kb.search_chunks("warranty", category="policies")
+        assert [chunk.entry.id for chunk, _ in results] == ["e3"]
+        assert kb.search_chunks("warranty", category="missing") == []
+
+    def test_prepare_entry_matches_add_entry(self):
+        kb = KnowledgeBase("biz_1", vectors=VectorIndex("biz_1"))
+        entry = KnowledgeBaseEntry(entry_id="e9", business_id="biz_1", title="Hours", content="Open 8am to 6pm.")
+        prepared = kb.prepare_entry(entry)
+        assert kb.vectors.pending_ids == []  # preparing leaves the index alone
+        kb.add_entry(entry, prepared)
+
+        direct = make_kb(VectorIndex("biz_1"))
+        direct.add_entry(KnowledgeBaseEntry(entry_id="e9", business_id="biz_1", title="Hours", content="Open 8am to 6pm."))
+        assert np.array_equal(kb.vectors.pending[0], direct.vectors.pending[-1])
+        assert kb.index.doc_terms["e9#0"] == direct.index.doc_terms["e9#0"]
+
+    def test_ivf_search_matches_brute_force(self, monkeypatch):
+        monkeypatch.setattr(knowledge_vectors, "IVF_MIN_ROWS", 100)
+        monkeypatch.setattr(knowledge_vectors, "IVF_PROBES", 4)
+        words = ["drain", "leak", "furnace", "roof", "panel", "wiring", "pipe", "heater", "filter", "duct"]
+        rng = np.random.default_rng(1)
+
+        index = VectorIndex("biz_1")
+        index.add_many(
+            (f"c{i}", " ".join(rng.choice(words, size=6)))
+            for i in range(400)
+        )
+        brute = index.search("roof leak repair", k=5, min_similarity=0.0)
+        index.flush()
+        assert index.centroids is not None
+
+        ivf = index.search("roof leak repair", k=5, min_similarity=0.0)
+        assert ivf[0][0] == brute[0][0]
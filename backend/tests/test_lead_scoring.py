@@ -0,0 +1,102 @@
+"""
+CallBot AI - Lead Scoring Tests
+Compiled keyword rules, per-business configuration and batch scoring
+"""
+
+import sys
+import os
+import json
+import random
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics_service import CompiledLeadRules, LeadScoring
+from lead_scoring import score_batch, validate_rules
+
+
+def keyword_scan_signals(transcript):
+    """The per-keyword `in` scans the compiled pattern replaces"""
+    text = transcript.lower()
+    return {
+        name for name, keywords in LeadScoring.DEFAULT_KEYWORDS.items()
+        if any(keyword in text for keyword in keywords)
+    }
+
+
+class TestCompiledRules:
+    """Test the single-pass matcher"""
+
+    def test_matches_keyword_scans(self):
+        rng = random.Random(5)
+        words = ["hello", "PRICE", "water", "heater", "How much", "today", "leak", "Urgent", "separate", "thanks", "quote"]
+        rules = LeadScoring.default_rules()
+        for _ in range(500):
+            transcript = " ".join(rng.choice(words) for _ in range(rng.randint(0, 12)))
+            assert rules.match_signals(transcript) == keyword_scan_signals(transcript)
+
+    def test_score_lead(self):
+        result = LeadScoring.score_lead({
+            "duration": 200,
+            "appointment_booked": True,
+            "transcript": "How much for a new water heater? I need it ASAP."
+        })
+        assert result["breakdown"] == {
+            "call_duration": 15, "appointment_booked": 30, "pricing_discussed": 15, "urgency_expressed": 10
+        }
+        assert (result["score"], result["grade"]) == (70, "B")
+        assert LeadScoring.score_lead({"duration": None, "transcript": None})["grade"] == "F"
+
+    def test_business_rules(self):
+        rules = CompiledLeadRules.from_config({
+            "signals": {
+                "pricing_discussed": {"points": 5},
+                "commercial": {"keywords": ["restaurant", "office building"], "points": 25}
+            },
+            "appointment_booked": 40
+        })
+        result = LeadScoring.score_lead(
+            {"appointment_booked": True, "transcript": "Our restaurant needs a quote"}, rules
+        )
+        assert result["breakdown"] == {
+            "call_duration": 0, "appointment_booked": 40, "pricing_discussed": 5, "commercial": 25
+        }
+
+    def test_keywords_are_literal(self):
+        rules = CompiledLeadRules.from_config({"signals": {"odd": {"keywords": ["a+b (c)"], "points": 1}}})
+        assert rules.match_signals("we need A+B (C) installed") == {"odd"}
+        assert rules.match_signals("aab c") == set()
+
+    def test_overlapping_keywords_across_signals(self):
+        rules = CompiledLeadRules.from_config({"signals": {"insurance": {"keywords": ["insurance quote"], "points": 10}}})
+        assert rules.match_signals("Can I get an insurance quote?") == {"insurance", "pricing_discussed"}
+
+        # Same start, different signals
+        rules = CompiledLeadRules.from_config({"signals": {"rush": {"keywords": ["today only"], "points": 5}}})
+        assert rules.match_signals("Is that price good today only?") == {"rush", "pricing_discussed", "urgency_expressed"}
+
+
+class TestBatchScoring:
+    """Test rule validation and upsert rows"""
+
+    def test_validate_rules(self):
+        rules = validate_rules({"signals": {"warranty": {"keywords": [" warranty ", ""], "points": "10"}}})
+        assert rules == {"signals": {"warranty": {"keywords": ["warranty"], "points": 10}}}
+        with pytest.raises(ValueError):
+            validate_rules({"signals": {"bad": {"keywords": "price"}}})
+        with pytest.raises(ValueError):
+            validate_rules({"duration_thresholds": [["long", 5]]})
+
+    def test_score_batch_uses_each_business_rules(self):
+        biz_a, biz_b = uuid.uuid4(), uuid.uuid4()
+        rows = [
+            {"id": uuid.uuid4(), "business_id": biz_a, "duration": 0, "transcript": "what's the price"},
+            {"id": uuid.uuid4(), "business_id": biz_b, "duration": 0, "transcript": "what's the price"},
+        ]
+        rules = {str(biz_b): CompiledLeadRules.from_config({"signals": {"pricing_discussed": {"points": 50}}})}
+        args = score_batch(rows, rules)
+        assert [a[2] for a in args] == [15, 50]
+        assert args[1][:2] == (biz_b, rows[1]["id"])
+        assert json.loads(args[1][6]) == {"call_duration": 0, "pricing_discussed": 50}
@@ -0,0 +1,113 @@
+"""
+CallBot AI - Logging Service Tests
+Sampling and duplicate suppression for high-volume loggers
+"""
+
+import logging
+import sys
+import os
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logging_service import StructuredLogger, LogSampler
+
+
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def captured():
+    """StructuredLogger whose output is collected in a list"""
+    structured = StructuredLogger("callbotai.test.sampling")
+    handler = _ListHandler()
+    structured.logger.handlers = [handler]
+    structured.logger.setLevel(logging.DEBUG)
+    return structured, handler.records
+
+
+class TestLogSampling:
+    """Test 1-in-N sampling of successes"""
+
+    def test_sampling_off_by_default(self, captured):
+        structured, records = captured
+        assert structured.sampler is None
+        for _ in range(10):
+            structured.info("Webhook: vapi - call-started")
+        assert len(records) == 10
+
+    def test_successes_sampled_failures_kept(self, captured):
+        structured, records = captured
+        structured.configure_sampling(success_sample_rate=10)
+
+        for i in range(100):
+            structured.info(f"ok {i}")
+        for i in range(7):
+            structured.error(f"failed {i}")
+
+        infos = [r for r in records if r.levelno == logging.INFO]
+        errors = [r for r in records if r.levelno == logging.ERROR]
+        assert len(infos) == 10
+        assert len(errors) == 7
+        assert all(r.extra_fields["sample_rate"] == 10 for r in infos)
+
+
+class TestLogSuppression:
+    """Test token-bucket suppression of repeated messages"""
+
+    def test_repeated_messages_suppressed_with_summary(self, captured):
+        structured, records = captured
+        structured.configure_sampling(burst=3, refill_per_second=0.0001)
+
+        for _ in range(10):
+            structured.info("Webhook: stripe - invoice.paid")
+        structured.info("Different message")
+
+        assert [r.getMessage() for r in records] == ["Webhook: stripe - invoice.paid"] * 3 + ["Different message"]
+
+        structured.flush_suppressed()
+        summary = records[-1]
+        assert summary.extra_fields["suppressed_count"] == 7
+        assert summary.extra_fields["suppressed_message"] == "Webhook: stripe - invoice.paid"
+
+    def test_failures_never_suppressed(self, captured):
+        structured, records = captured
+        structured.configure_sampling(success_sample_rate=10, burst=20, refill_per_second=2.0)
+
+        for _ in range(200):
+            structured.error("Webhook failed: vapi - call-ended")
+        for _ in range(50):
+            structured.warning("Webhook retry: stripe - invoice.paid")
+
+        assert sum(r.levelno == logging.ERROR for r in records) == 200
+        assert sum(r.levelno == logging.WARNING for r in records) == 50
+        structured.flush_suppressed()
+        assert len(records) == 250
+
+    def test_summary_emitted_when_bucket_refills(self):
+        sampler = LogSampler(burst=1, refill_per_second=1000.0)
+        assert sampler.acquire(logging.INFO, "msg") == (True, 0, 0.0)
+
+        # Drain the bucket without letting it refill
+        sampler._buckets[(logging.INFO, "msg")][0] = 0.0
+        sampler._buckets[(logging.INFO, "msg")][1] += 10
+        allowed, _, _ = sampler.acquire(logging.INFO, "msg")
+        assert not allowed
+
+        sampler._buckets[(logging.INFO, "msg")][1] -= 20
+        allowed, suppressed, _ = sampler.acquire(logging.INFO, "msg")
+        assert allowed
+        assert suppressed == 1
+
+    def test_bucket_keys_bounded(self):
+        sampler = LogSampler(burst=1, max_keys=8)
+        for i in range(100):
+            sampler.acquire(logging.INFO, f"msg {i}")
+        assert len(sampler._buckets) == 8
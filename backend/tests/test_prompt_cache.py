@@ -0,0 +1,140 @@
+"""
+CallBot AI - Prompt Artifact Cache Tests
+Versioned assistant prompts and skipped re-pushes
+"""
+
+import sys
+import os
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import vapi_service
+from knowledge_base import KnowledgeBaseEntry, KnowledgeBaseManager
+from prompt_cache import PromptArtifactCache, business_version, payload_hash
+
+
+BUSINESS = {
+    "id": "biz_1",
+    "name": "Acme Plumbing",
+    "agent_name": "Alex",
+    "services": "Drain cleaning, water heaters",
+    "updated_at": datetime(2026, 1, 1),
+}
+
+
+@pytest.fixture
+def isolated(monkeypatch):
+    """Fresh KB manager and prompt cache for vapi_service"""
+    kb = KnowledgeBaseManager(persistent=False)
+    cache = PromptArtifactCache()
+    monkeypatch.setattr(vapi_service, "kb_manager", kb)
+    monkeypatch.setattr(vapi_service, "prompt_cache", cache)
+    return kb, cache
+
+
+class TestPromptArtifactCache:
+    """Test keying and invalidation"""
+
+    def test_renders_once_per_key(self):
+        cache = PromptArtifactCache()
+        calls = []
+
+        def render():
+            calls.append(1)
+            return "system", "hello"
+
+        first = cache.get_or_render("biz_1", "v1", (0, 1), "en", render)
+        second = cache.get_or_render("biz_1", "v1", (0, 1), "en", render)
+        assert first is second
+        assert len(calls) == 1
+        assert cache.stats()["hits"] == 1
+
+        # A new version supersedes the old artifact
+        cache.get_or_render("biz_1", "v2", (0, 1), "en", render)
+        assert len(cache.artifacts) == 1
+
+    def test_business_version(self):
+        assert business_version(BUSINESS) == "2026-01-01T00:00:00"
+        payload = {"name": "Acme"}
+        assert business_version(payload) == business_version(dict(payload))
+        assert business_version(payload) != business_version({"name": "Acme Co"})
+
+
+class TestAssistantPrompts:
+    """Test prompt builds through vapi_service"""
+
+    @pytest.mark.asyncio
+    async def test_kb_change_rerenders(self, isolated):
+        kb_manager, cache = isolated
+        first = await vapi_service.get_assistant_prompts(BUSINESS)
+        assert (await vapi_service.get_assistant_prompts(BUSINESS)) is first
+        assert "KNOWLEDGE BASE" not in first.system_prompt
+
+        await kb_manager.add_entry("biz_1", KnowledgeBaseEntry(
+            entry_id="e1", business_id="biz_1", title="Pricing", content="Drain cleaning is $149.", category="pricing"
+        ))
+        second = await vapi_service.get_assistant_prompts(BUSINESS)
+        assert second is not first
+        assert "$149" in second.system_prompt
+        assert second.first_message_hash == first.first_message_hash
+
+    @pytest.mark.asyncio
+    async def test_language_is_part_of_key(self, isolated):
+        english = await vapi_service.get_assistant_prompts(BUSINESS)
+        spanish = await vapi_service.get_assistant_prompts(BUSINESS, language="es")
+        assert english.system_prompt != spanish.system_prompt
+        assert english.key[3] == "en" and spanish.key[3] == "es"
+
+    @pytest.mark.asyncio
+    async def test_primary_language_column(self, isolated):
+        spanish = await vapi_service.get_assistant_prompts(dict(BUSINESS, primary_language="ES"))
+        assert spanish.key[3] == "es"
+
+        # Codes without a translation fall back to English
+        unknown = await vapi_service.get_assistant_prompts(dict(BUSINESS, primary_language="xx"))
+        assert unknown is await vapi_service.get_assistant_prompts(BUSINESS)
+
+    @pytest.mark.asyncio
+    async def test_unchanged_prompts_not_pushed(self, isolated):
+        _, cache = isolated
+        prompts = await vapi_service.get_assistant_prompts(BUSINESS)
+        cache.mark_pushed("asst_1", payload_hash(vapi_service.build_update_payload(BUSINESS, prompts)))
+
+        # No HTTP request is made when nothing changed
+        result = await vapi_service.update_assistant("asst_1", BUSINESS)
+        assert result == {"success": True, "unchanged": True}
+
+        changed = dict(BUSINESS, updated_at=datetime(2026, 2, 1), services="Roofing")
+        prompts = await vapi_service.get_assistant_prompts(changed)
+        assert cache.needs_push("asst_1", payload_hash(vapi_service.build_update_payload(changed, prompts)))
+
+    @pytest.mark.asyncio
+    async def test_name_change_is_pushed(self, isolated):
+        _, cache = isolated
+        prompts = await vapi_service.get_assistant_prompts(BUSINESS)
+        cache.mark_pushed("asst_1", payload_hash(vapi_service.build_update_payload(BUSINESS, prompts)))
+
+        # Same cached prompts (updated_at unchanged), different assistant name
+        renamed = dict(BUSINESS, name="Acme Plumbing & Heating")
+        assert await vapi_service.get_assistant_prompts(renamed) is prompts
+        assert cache.needs_push("asst_1", payload_hash(vapi_service.build_update_payload(renamed, prompts)))
+
+
+class TestStaticCoreContext:
+    """Test the KB's memoized static-core context"""
+
+    @pytest.mark.asyncio
+    async def test_context_reused_until_kb_changes(self):
+        kb_manager = KnowledgeBaseManager(persistent=False)
+        kb = kb_manager.get_or_create("biz_1")
+        kb.add_entry(KnowledgeBaseEntry(entry_id="e1", business_id="biz_1", title="Hours", content="Open 9-5."))
+
+        context = kb.generate_context_prompt()
+        assert kb.generate_context_prompt() is context
+
+        kb.add_entry(KnowledgeBaseEntry(entry_id="e2", business_id="biz_1", title="Area", content="We serve Austin."))
+        assert "Austin" in kb.generate_context_prompt()
+        assert await kb_manager.kb_version("biz_1") == (0, 2)
@@ -0,0 +1,99 @@
+"""
+CallBot AI - Response Cache Tests
+Serialized analytics responses, ETags and 304s
+"""
+
+import sys
+import os
+import asyncio
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from response_cache import CachedResponse, ResponseCache, cached_json_response, serialize
+
+
+class TestResponseCache:
+    """Test keying, versioning and shared builds"""
+
+    @pytest.mark.asyncio
+    async def test_builds_once_per_version(self):
+        cache = ResponseCache()
+        builds = []
+
+        async def build():
+            builds.append(1)
+            return {"total_calls": len(builds)}
+
+        first = await cache.get_or_build("biz_1", "stats", None, 1, build)
+        assert (await cache.get_or_build("biz_1", "stats", None, 1, build)) is first
+        assert first.body == b'{"total_calls":1}'
+
+        # New calls bump the version: rebuilt, and the old entry is dropped
+        second = await cache.get_or_build("biz_1", "stats", None, 2, build)
+        assert second.etag != first.etag
+        assert len(cache.entries) == 1
+        assert cache.stats() == {"entries": 1, "hits": 1, "misses": 2}
+
+    @pytest.mark.asyncio
+    async def test_concurrent_misses_share_one_build(self):
+        cache = ResponseCache()
+        builds = []
+
+        async def build():
+            builds.append(1)
+            await asyncio.sleep(0.01)
+            return {"ok": True}
+
+        results = await asyncio.gather(*[
+            cache.get_or_build("biz_1", "analytics", "last_7_days", 0, build) for _ in range(20)
+        ])
+        assert len(builds) == 1
+        assert all(result is results[0] for result in results)
+
+    @pytest.mark.asyncio
+    async def test_failed_build_not_cached(self):
+        cache = ResponseCache()
+
+        async def broken():
+            raise RuntimeError("database down")
+
+        with pytest.raises(RuntimeError):
+            await cache.get_or_build("biz_1", "roi", None, 0, broken)
+        assert cache.entries == {}
+
+    def test_etag_matching(self):
+        cached = CachedResponse(serialize({"a": 1}))
+        assert cached.matches(cached.etag)
+        assert cached.matches(f'"other", {cached.etag}')
+        assert cached.matches("*")
+        assert not cached.matches("W/" + cached.etag)
+        assert not cached.matches(None)
+
+
+class TestConditionalRequests:
+    """Test 304 handling end to end"""
+
+    def test_not_modified(self):
+        cache = ResponseCache()
+        app = FastAPI()
+
+        @app.get("/stats")
+        async def stats(request: Request):
+            async def build():
+                return {"total_calls": 3}
+            return cached_json_response(request, await cache.get_or_build("biz_1", "stats", None, 0, build))
+
+        client = TestClient(app)
+        response = client.get("/stats")
+        assert response.status_code == 200
+        assert response.json() == {"total_calls": 3}
+        etag = response.headers["etag"]
+
+        response = client.get("/stats", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
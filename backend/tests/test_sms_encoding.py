@@ -0,0 +1,94 @@
+"""
+CallBot AI - SMS Encoding Tests
+GSM-7 / UCS-2 detection, segment counting, truncation and precompiled templates
+"""
+
+import sys
+import os
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sms_service
+from sms_encoding import (
+    GSM7, UCS2, SMSTemplate, SMSTemplateRenderer, segment_info, transliterate, truncate_to_segments
+)
+from sms_service import estimate_batch, prepare_message, render_template
+
+
+class TestSegments:
+    """Test encoding detection and segment counts"""
+
+    def test_gsm7_boundaries(self):
+        assert segment_info("a" * 160) == {"encoding": GSM7, "characters": 160, "units": 160, "segments": 1}
+        assert segment_info("a" * 161)["segments"] == 2
+        assert segment_info("a" * 306)["segments"] == 2
+        assert segment_info("a" * 307)["segments"] == 3
+        assert segment_info("")["segments"] == 0
+
+    def test_extension_characters_take_two_units(self):
+        assert segment_info("€" * 80)["units"] == 160
+        assert segment_info("€" * 81)["segments"] == 2
+        # 152 plain + an escape pair can't share the first 153-unit part
+        assert segment_info("a" * 152 + "{" + "a" * 10)["segments"] == 2
+        assert segment_info("a" * 152 + "{" + "a" * 152)["segments"] == 3
+
+    def test_one_curly_quote_switches_to_ucs2(self):
+        plain = "We're open until 6pm today. " * 5
+        assert segment_info(plain) == {"encoding": GSM7, "characters": 140, "units": 140, "segments": 1}
+        curly = plain.replace("'", "’", 1)
+        assert segment_info(curly)["encoding"] == UCS2
+        assert segment_info(curly)["segments"] == 3
+        assert transliterate(curly) == plain
+
+    def test_emoji_are_surrogate_pairs(self):
+        assert segment_info("\U0001F600" * 35) == {"encoding": UCS2, "characters": 35, "units": 70, "segments": 1}
+        assert segment_info("\U0001F600" * 36)["segments"] == 2
+
+    def test_truncation_respects_encoding(self):
+        gsm = truncate_to_segments("a" * 2000, 10)
+        assert len(gsm) == 1530 and gsm.endswith("...")
+        ucs2 = truncate_to_segments("ç中" * 1000, 10)
+        assert segment_info(ucs2)["segments"] == 10 and len(ucs2) == 670
+        assert truncate_to_segments("short", 1) == "short"
+
+    def test_prepare_message(self):
+        assert prepare_message("Don’t miss out — call now…") == "Don't miss out - call now..."
+        assert segment_info(prepare_message("x" * 5000))["segments"] == sms_service.SMS_MAX_SEGMENTS
+
+
+class TestTemplates:
+    """Test precompiled template rendering and statistics"""
+
+    def test_renders_like_format(self):
+        template = SMSTemplate("Hi {name}! Total {amount:.2f} ({code!r})")
+        assert template.fields == ["name", "amount", "code"]
+        assert template.render({"name": "Ana", "amount": 3.5, "code": "X"}) == "Hi Ana! Total 3.50 ('X')"
+
+    def test_missing_variables_keep_placeholder(self):
+        template = SMSTemplate("Hi {name}, see you at {time}")
+        assert template.render({"name": "Ana"}) == "Hi Ana, see you at {time}"
+
+    def test_values_are_transliterated(self):
+        template = SMSTemplate("“Thanks” from {business_name}")
+        assert template.render({"business_name": "Joe’s Plumbing"}) == '"Thanks" from Joe\'s Plumbing'
+        assert SMSTemplate("’", transliterate=False).render({}) == "’"
+
+    def test_stats_per_template(self):
+        renderer = SMSTemplateRenderer({"hello": "Hello {name}!"})
+        renderer.render("hello", {"name": "Ana"})
+        renderer.render("hello", {"name": "王" * 80})
+        assert renderer.render("missing", {}) == ""
+        stats = renderer.template_stats()["hello"]
+        assert stats == {"renders": 2, "segments": 3, "max_segments": 2, "ucs2": 1, "avg_segments": 1.5}
+
+    def test_render_template_uses_registry(self):
+        message = render_template("thank_you", {"business_name": "Acme"})
+        assert message.startswith("Thank you for choosing Acme!")
+        assert render_template("no_such_template", {}) == ""
+
+    def test_estimate_batch(self):
+        recipients = [{"phone": "+15550000001", "name": "Ana"}, {"phone": "+15550000002", "name": "王小明"}]
+        estimate = estimate_batch(recipients, "Hi {name}! " + "x" * 60)
+        assert estimate == {"messages": 2, "segments": 2, "ucs2_messages": 1}
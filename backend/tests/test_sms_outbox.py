@@ -0,0 +1,185 @@
+"""
+CallBot AI - SMS Outbox Tests
+Durable queueing, claim/send/write-back batches and retry scheduling
+"""
+
+import sys
+import os
+import uuid
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sms_outbox
+from sms_outbox import CLAIM_SQL, COMPLETE_SQL, RENEW_SQL, drain_once, enqueue_sms, outcome
+import sms_suppression
+from sms_suppression import LOAD_SQL, SuppressionList
+
+BUSINESS_ID = "00000000-0000-0000-0000-000000000001"
+
+
+class _Connection:
+    """Serves claimed rows and records the write-back"""
+
+    def __init__(self, claimable=None):
+        self.claimable = list(claimable or [])
+        self.leases = {}  # row id -> lease token
+        self.fetched = []
+        self.completed = None
+
+    async def fetch(self, query, *args):
+        self.fetched.append((query, args))
+        if query == CLAIM_SQL:
+            batch, self.claimable = self.claimable[:args[0]], self.claimable[args[0]:]
+            self.leases.update((row["id"], args[2]) for row in batch)
+            return batch
+        if query == RENEW_SQL:
+            return [{"id": row_id} for row_id, token in self.leases.items() if token == args[0]]
+        return [{"id": uuid.uuid4()} for _ in args[5]]
+
+    async def execute(self, query, *args):
+        assert query == COMPLETE_SQL
+        self.completed = args
+
+
+@pytest.fixture(autouse=True)
+def _loaded_opt_outs(monkeypatch):
+    """An empty, already loaded opt-out list (the global one waits for a database load)"""
+    monkeypatch.setattr(sms_outbox, "suppression_list", SuppressionList())
+
+
+def _acquire(conn):
+    @asynccontextmanager
+    async def acquire():
+        yield conn
+    return acquire
+
+
+def _row(phone, attempts=1):
+    return {"id": uuid.uuid4(), "business_id": uuid.UUID(BUSINESS_ID), "to_phone": phone, "from_phone": None,
+            "message": "Hello", "sms_type": "marketing", "provider": "twilio", "attempts": attempts}
+
+
+class TestOutbox:
+    """Test enqueueing and draining the outbox"""
+
+    @pytest.mark.asyncio
+    async def test_enqueue_skips_invalid_numbers(self):
+        conn = _Connection()
+        queued = await enqueue_sms(conn, BUSINESS_ID, [
+            {"idempotency_key": "k1", "to_phone": "(555) 010-0000", "message": "Hi"},
+            {"idempotency_key": "k2", "to_phone": "", "message": "Hi"},
+        ], sms_type="marketing")
+        assert queued == 1
+        (_, args), = conn.fetched
+        assert args[5] == ["k1"] and args[6] == ["+15550100000"]
+
+    def test_outcome(self):
+        assert outcome({"success": True, "message_id": "SM1"}, 1) == ("sent", None, None, "SM1")
+        status, retry_in, error, _ = outcome({"success": False, "status_code": 503, "error": "busy"}, 1)
+        assert status == "pending" and retry_in >= 0 and error == "busy"
+        assert outcome({"success": False, "status_code": 503, "error": "busy"}, 5, max_attempts=5)[0] == "failed"
+        assert outcome({"success": False, "status_code": 400, "error": "bad number"}, 1)[0] == "failed"
+
+    @pytest.mark.asyncio
+    async def test_drain_writes_back_one_batch(self, monkeypatch):
+        async def fake_send(to_number, message, from_number, provider, limiter, max_retries=0):
+            if to_number.endswith("2"):
+                return {"success": False, "status_code": 429, "error": "rate limited"}
+            return {"success": True, "message_id": f"SM{to_number[-1]}"}
+
+        monkeypatch.setattr(sms_outbox, "send_with_retries", fake_send)
+        rows = [_row(f"+1555000000{i}") for i in range(4)]
+        conn = _Connection(rows)
+
+        assert await drain_once(_acquire(conn), batch_size=10) == 4
+        ids, statuses, retry_in, errors, message_ids, _ = conn.completed
+        assert ids == [row["id"] for row in rows]
+        assert statuses == ["sent", "sent", "pending", "sent"]
+        assert retry_in[2] is not None and retry_in[0] is None
+        assert message_ids == ["SM0", "SM1", None, "SM3"]
+        assert await drain_once(_acquire(conn), batch_size=10) == 0
+
+    @pytest.mark.asyncio
+    async def test_lease_renewed_while_rows_wait(self, monkeypatch):
+        sent = []
+
+        async def slow_send(to_number, message, from_number, provider, limiter, max_retries=0):
+            await asyncio.sleep(0.1)  # e.g. waiting on the number's token bucket
+            sent.append(to_number)
+            return {"success": True, "message_id": "SM1"}
+
+        monkeypatch.setattr(sms_outbox, "send_with_retries", slow_send)
+        monkeypatch.setattr(sms_outbox, "SMS_OUTBOX_LEASE_SECONDS", 0.03)
+        first, second = _row("+15550000001"), _row("+15550000002")
+        conn = _Connection([first, second])
+
+        drain = asyncio.ensure_future(drain_once(_acquire(conn), concurrency=1))
+        await asyncio.sleep(0.02)
+        conn.leases[second["id"]] = uuid.uuid4()  # a renewal was missed and another worker re-claimed it
+        assert await drain == 2
+
+        assert sum(query == RENEW_SQL for query, _ in conn.fetched) >= 2
+        assert sent == ["+15550000001"]
+        ids, statuses, _, _, _, lease_token = conn.completed
+        assert ids == [first["id"]] and statuses == ["sent"]
+        assert lease_token == conn.leases[first["id"]]
+
+    @pytest.mark.asyncio
+    async def test_opted_out_rows_are_suppressed_not_sent(self, monkeypatch):
+        sent = []
+
+        async def fake_send(to_number, message, from_number, provider, limiter, max_retries=0):
+            sent.append(to_number)
+            return {"success": True, "message_id": "SM1"}
+
+        opt_outs = SuppressionList()
+        opt_outs.add(BUSINESS_ID, "+15550000001")
+        monkeypatch.setattr(sms_outbox, "send_with_retries", fake_send)
+        monkeypatch.setattr(sms_outbox, "suppression_list", opt_outs)
+        conn = _Connection([_row("+15550000001"), _row("+15550000002")])
+
+        assert await drain_once(_acquire(conn)) == 2
+        _, statuses, _, errors, _, _ = conn.completed
+        assert statuses == ["suppressed", "sent"]
+        assert errors[0] == "Recipient opted out"
+        assert sent == ["+15550000002"]
+
+    @pytest.mark.asyncio
+    async def test_fresh_process_waits_for_opt_outs(self, monkeypatch):
+        """A standalone outbox process starting up must not text anyone before opt-outs load"""
+        sent = []
+
+        async def fake_send(to_number, message, from_number, provider, limiter, max_retries=0):
+            sent.append(to_number)
+            return {"success": True, "message_id": "SM1"}
+
+        class _StartupConnection(_Connection):
+            async def add_listener(self, channel, callback):
+                pass
+
+            async def remove_listener(self, channel, callback):
+                pass
+
+            async def fetch(self, query, *args):
+                if query == LOAD_SQL:
+                    await asyncio.sleep(0.05)  # the load finishes after the workers start
+                    return [{"business_id": uuid.UUID(BUSINESS_ID), "phone": "+15550000001"}]
+                return await super().fetch(query, *args)
+
+        fresh = SuppressionList(require_load=True)
+        monkeypatch.setattr(sms_suppression, "suppression_list", fresh)
+        monkeypatch.setattr(sms_outbox, "suppression_list", fresh)
+        monkeypatch.setattr(sms_outbox, "send_with_retries", fake_send)
+        conn = _StartupConnection([_row("+15550000001"), _row("+15550000002")])
+
+        process = asyncio.create_task(sms_outbox.run_outbox_process(_acquire(conn), workers=1))
+        await asyncio.sleep(0.2)
+        process.cancel()
+        await asyncio.gather(process, return_exceptions=True)
+
+        assert sent == ["+15550000002"]
+        assert conn.completed[1] == ["suppressed", "sent"]
@@ -0,0 +1,192 @@
+"""
+CallBot AI - SMS Service Tests
+Provider clients and sending
+"""
+
+import sys
+import os
+import time
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sms_service
+from sms_service import (
+    SMSRateLimiter, TokenBucket, close_sms_clients, get_sms_client, iter_batch_sms, retry_delay,
+    send_appointment_confirmation, send_appointment_reminder, send_batch_sms, send_sms_twilio
+)
+from sms_suppression import SuppressionList
+
+
+class TestProviderClients:
+    """Test the shared provider clients"""
+
+    @pytest.mark.asyncio
+    async def test_client_reused_until_closed(self):
+        twilio = get_sms_client("twilio")
+        assert get_sms_client("twilio") is twilio
+        assert get_sms_client("vonage") is not twilio
+        assert str(twilio.base_url).startswith(sms_service.TWILIO_API_URL)
+        await close_sms_clients()
+        assert twilio.is_closed
+        assert get_sms_client("twilio") is not twilio
+        await close_sms_clients()
+
+    @pytest.mark.asyncio
+    async def test_messages_share_one_client(self, monkeypatch):
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(201, json={"sid": f"SM{len(requests)}", "status": "queued"})
+
+        monkeypatch.setattr(sms_service, "TWILIO_ACCOUNT_SID", "ACtest")
+        monkeypatch.setattr(sms_service, "TWILIO_AUTH_TOKEN", "token")
+        monkeypatch.setitem(sms_service._clients, "twilio", httpx.AsyncClient(
+            base_url="https://api.twilio.com", transport=httpx.MockTransport(handler)
+        ))
+
+        results = [await send_sms_twilio(f"+1555000000{i}", "Hello", "+15550001111") for i in range(3)]
+        assert [r["message_id"] for r in results] == ["SM1", "SM2", "SM3"]
+        assert requests[0].url.path == "/2010-04-01/Accounts/ACtest/Messages.json"
+        await close_sms_clients()
+
+
+@pytest.fixture(autouse=True)
+def _loaded_opt_outs(monkeypatch):
+    """An empty, already loaded opt-out list (the global one waits for a database load)"""
+    monkeypatch.setattr(sms_service, "suppression_list", SuppressionList())
+
+
+class _FakeProvider:
+    """Stands in for send_sms; fails the listed numbers with the given status codes once each"""
+
+    def __init__(self, failures=None):
+        self.failures = dict(failures or {})
+        self.sent = []
+
+    async def __call__(self, to_number, message, from_number=None, provider=None):
+        status = self.failures.pop(to_number, None)
+        if status is not None:
+            return {"success": False, "error": f"HTTP {status}", "status_code": status}
+        self.sent.append((to_number, message, from_number))
+        return {"success": True, "message_id": f"SM{len(self.sent)}"}
+
+
+class TestBatchSending:
+    """Test the rate-limited worker pool"""
+
+    def test_token_bucket_reservations(self):
+        bucket = TokenBucket(rate=10, burst=2)
+        waits = [bucket.reserve() for _ in range(4)]
+        assert waits[:2] == [0.0, 0.0]
+        assert waits[2] == pytest.approx(0.1, abs=0.01)
+        assert waits[3] == pytest.approx(0.2, abs=0.01)
+
+    def test_retry_delay_is_jittered_and_capped(self):
+        delays = [retry_delay(10, base=1, cap=5) for _ in range(200)]
+        assert all(0 <= d <= 5 for d in delays)
+        assert len(set(delays)) > 1
+
+    @pytest.mark.asyncio
+    async def test_batch_sends_concurrently(self, monkeypatch):
+        provider = _FakeProvider()
+        monkeypatch.setattr(sms_service, "send_sms", provider)
+        monkeypatch.setattr(sms_service, "sms_rate_limiter", SMSRateLimiter(account_rate=10000))
+        recipients = [{"phone": f"+1555000{i:04d}", "name": f"Customer {i}"} for i in range(200)]
+
+        start = time.perf_counter()
+        result = await send_batch_sms(recipients, "Hi {name}!", "biz_1", rate_limit_per_second=1000)
+        assert time.perf_counter() - start < 1
+        assert result == {"total": 200, "sent": 200, "failed": 0, "suppressed": 0, "segments": 200,
+                          "errors": []}
+        assert ("+15550000007", "Hi Customer 7!", None) in provider.sent
+
+    @pytest.mark.asyncio
+    async def test_progress_and_retries(self, monkeypatch):
+        provider = _FakeProvider({"+15550000001": 503, "+15550000002": 400})
+        monkeypatch.setattr(sms_service, "send_sms", provider)
+        monkeypatch.setattr(sms_service, "retry_delay", lambda attempt: 0)
+        recipients = [{"phone": f"+155500000{i:02d}"} for i in range(5)]
+
+        events = [e async for e in iter_batch_sms(
+            recipients, "Hello", "biz_1", from_numbers=["+15551110000", "+15552220000"],
+            limiter=SMSRateLimiter(account_rate=1000, number_rate=1000)
+        )]
+        assert [e["done"] for e in events] == [1, 2, 3, 4, 5]
+        assert events[-1]["sent"] == 4 and events[-1]["failed"] == 1
+        by_phone = {e["phone"]: e for e in events}
+        assert by_phone["+15550000001"]["success"] and by_phone["+15550000001"]["attempts"] == 2
+        assert not by_phone["+15550000002"]["success"] and by_phone["+15550000002"]["attempts"] == 1
+        assert {from_number for _, _, from_number in provider.sent} == {"+15551110000", "+15552220000"}
+
+    @pytest.mark.asyncio
+    async def test_number_rate_limits_throughput(self, monkeypatch):
+        monkeypatch.setattr(sms_service, "send_sms", _FakeProvider())
+        limiter = SMSRateLimiter(account_rate=1000, number_rate=20)
+        recipients = [{"phone": f"+155500000{i:02d}"} for i in range(30)]
+
+        start = time.perf_counter()
+        async for _ in iter_batch_sms(recipients, "Hello", "biz_1", limiter=limiter):
+            pass
+        # 20 go out on the initial burst, the other 10 at 20/s
+        assert time.perf_counter() - start >= 0.45
+
+    @pytest.mark.asyncio
+    async def test_opted_out_recipients_are_not_sent(self, monkeypatch):
+        provider = _FakeProvider()
+        monkeypatch.setattr(sms_service, "send_sms", provider)
+        opt_outs = SuppressionList()
+        opt_outs.add("biz_1", "+15550000001")
+        monkeypatch.setattr(sms_service, "suppression_list", opt_outs)
+        recipients = [{"phone": "(555) 000-0001"}, {"phone": "+15550000002"}]
+
+        result = await send_batch_sms(recipients, "Hello", "biz_1", rate_limit_per_second=1000)
+        assert result["sent"] == 1 and result["suppressed"] == 1 and result["failed"] == 0
+        assert [to for to, _, _ in provider.sent] == ["+15550000002"]
+        # Other businesses can still text the number
+        assert (await send_batch_sms(recipients[:1], "Hello", "biz_2", rate_limit_per_second=1000))["sent"] == 1
+
+    @pytest.mark.asyncio
+    async def test_opt_out_mid_batch_applies_to_remaining_recipients(self, monkeypatch):
+        opt_outs = SuppressionList()
+        monkeypatch.setattr(sms_service, "suppression_list", opt_outs)
+        provider = _FakeProvider()
+
+        async def send(to_number, message, from_number=None, provider_name=None):
+            # +15550000002 texts STOP while the first message is going out
+            opt_outs.add("biz_1", "+15550000002")
+            return await provider(to_number, message, from_number)
+
+        monkeypatch.setattr(sms_service, "send_sms", send)
+        recipients = [{"phone": "+15550000001"}, {"phone": "+15550000002"}, {"phone": "+15550000003"}]
+        events = [e async for e in iter_batch_sms(
+            recipients, "Hello", "biz_1", workers=1, limiter=SMSRateLimiter(account_rate=1000, number_rate=1000)
+        )]
+        assert [to for to, _, _ in provider.sent] == ["+15550000001", "+15550000003"]
+        assert [e["phone"] for e in events if e["suppressed"]] == ["+15550000002"]
+
+
+class TestAppointmentMessages:
+    """Test that appointment texts go through the opt-out list"""
+
+    @pytest.mark.asyncio
+    async def test_opted_out_number_is_not_texted(self, monkeypatch):
+        opt_outs = SuppressionList()
+        opt_outs.add("biz_1", "+15550000001")
+        monkeypatch.setattr(sms_service, "suppression_list", opt_outs)
+
+        async def provider(*args, **kwargs):
+            raise AssertionError("opted-out number was texted")
+
+        monkeypatch.setattr(sms_service, "send_sms_twilio", provider)
+        monkeypatch.setattr(sms_service, "send_sms_vonage", provider)
+
+        confirmation = await send_appointment_confirmation(
+            "(555) 000-0001", "Acme Plumbing", "May 4", "10:00 AM", business_id="biz_1"
+        )
+        reminder = await send_appointment_reminder("+15550000001", "Acme Plumbing", "10:00 AM", business_id="biz_1")
+        assert confirmation["suppressed"] and not confirmation["success"]
+        assert reminder["suppressed"] and not reminder["success"]
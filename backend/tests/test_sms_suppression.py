@@ -0,0 +1,169 @@
+"""
+CallBot AI - SMS Suppression Tests
+Per-business opt-out lists, Bloom filter mode, change notifications and inbound webhook signatures
+"""
+
+import sys
+import os
+import json
+import time
+import uuid
+import hmac
+import base64
+import hashlib
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sms_service
+import sms_suppression
+from security import verify_twilio_signature, verify_vonage_signature
+from sms_suppression import (
+    LOAD_SQL, BloomFilter, SuppressionList, SuppressionUnavailable, record_opt_in, record_opt_out
+)
+
+BUSINESS_ID = "00000000-0000-0000-0000-000000000001"
+
+
+class _ConfirmingList(SuppressionList):
+    """Confirms Bloom hits against a stand-in for the sms_opt_outs table"""
+
+    def __init__(self, stored, **kwargs):
+        super().__init__(**kwargs)
+        self.stored = stored
+        self.confirmed = []
+
+    async def _confirm(self, business_id, candidates):
+        self.confirmed.append(set(candidates))
+        return {phone for phone in candidates if (business_id, phone) in self.stored}
+
+
+class TestSuppressionList:
+    """Test opt-out membership and updates"""
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000, error_rate=0.01)
+        phones = [f"+1555{i:07d}" for i in range(1000)]
+        for phone in phones:
+            bloom.add(phone)
+        assert all(phone in bloom for phone in phones)
+        false_positives = sum(f"+1666{i:07d}" in bloom for i in range(10000))
+        assert false_positives < 300
+
+    @pytest.mark.asyncio
+    async def test_exact_lists_are_per_business(self):
+        opt_outs = SuppressionList()
+        opt_outs.replace_all([(uuid.UUID(BUSINESS_ID), "+15550000001"), ("biz_2", "+15550000002")])
+        assert await opt_outs.suppressed(BUSINESS_ID, ["+15550000001", "+15550000002"]) == {"+15550000001"}
+        opt_outs.discard(BUSINESS_ID, "+15550000001")
+        opt_outs.add(BUSINESS_ID, "+15550000003")
+        assert await opt_outs.suppressed(BUSINESS_ID, ["+15550000001", "+15550000003"]) == {"+15550000003"}
+
+    @pytest.mark.asyncio
+    async def test_bloom_hits_are_confirmed(self):
+        stored = {("biz_1", f"+1555{i:07d}") for i in range(100)}
+        opt_outs = _ConfirmingList(stored, bloom_threshold=50)
+        opt_outs.replace_all(stored)
+        assert "biz_1" in opt_outs.blooms and "biz_1" not in opt_outs.exact
+
+        phones = [f"+1555{i:07d}" for i in range(95, 105)]
+        assert await opt_outs.suppressed("biz_1", phones) == {f"+1555{i:07d}" for i in range(95, 100)}
+        # Opted back in: cleared locally, no confirm round trip
+        opt_outs.discard("biz_1", "+15550000099")
+        stored.discard(("biz_1", "+15550000099"))
+        opt_outs.confirmed.clear()
+        assert await opt_outs.suppressed("biz_1", ["+15550000099"]) == set()
+        assert opt_outs.confirmed == []
+
+    @pytest.mark.asyncio
+    async def test_reload_replays_changes_made_during_the_query(self):
+        opt_outs = SuppressionList()
+
+        class _Connection:
+            async def fetch(self, query, *args):
+                assert query == LOAD_SQL
+                # Notified while the snapshot was being read
+                opt_outs.apply_notification(json.dumps(
+                    {"business_id": BUSINESS_ID, "phone": "+15550000002", "opted_out": True}
+                ))
+                return [{"business_id": uuid.UUID(BUSINESS_ID), "phone": "+15550000001"}]
+
+        assert await opt_outs.load(_Connection()) == 1
+        assert opt_outs.exact[BUSINESS_ID] == {"+15550000001", "+15550000002"}
+
+    @pytest.mark.asyncio
+    async def test_stop_then_start(self, monkeypatch):
+        opt_outs = SuppressionList()
+        monkeypatch.setattr(sms_suppression, "suppression_list", opt_outs)
+        monkeypatch.setattr(sms_service, "suppression_list", opt_outs)
+
+        await record_opt_out(None, BUSINESS_ID, "+15550000001")
+        result = await sms_service.send_sms("(555) 000-0001", "Hello", business_id=BUSINESS_ID)
+        assert result["suppressed"] and not result["success"]
+
+        await record_opt_in(None, BUSINESS_ID, "+15550000001")
+        assert not await opt_outs.is_suppressed(BUSINESS_ID, "+15550000001")
+
+    @pytest.mark.asyncio
+    async def test_sends_fail_closed_until_loaded(self, monkeypatch):
+        opt_outs = SuppressionList(require_load=True)
+        monkeypatch.setattr(sms_service, "suppression_list", opt_outs)
+        with pytest.raises(SuppressionUnavailable):
+            await opt_outs.wait_loaded(timeout=0.01)
+        monkeypatch.setattr(sms_suppression, "SMS_SUPPRESSION_LOAD_TIMEOUT", 0.01)
+
+        result = await sms_service.send_sms("+15550000001", "Hello", business_id=BUSINESS_ID)
+        assert not result["success"] and result["status_code"] == 503
+
+
+class TestInboundSignatures:
+    """Test Twilio and Vonage webhook signature checks"""
+
+    def test_twilio_reference_signature(self):
+        # Example from Twilio's webhook security documentation
+        params = {
+            "CallSid": "CA1234567890ABCDE", "Caller": "+12349013030", "Digits": "1234",
+            "From": "+12349013030", "To": "+18005551212"
+        }
+        url = "https://mycompany.com/myapp.php?foo=1&bar=2"
+        assert verify_twilio_signature(url, params, "0/KCTR6DLpKmkAf8muzZqo1nDgQ=", "12345")
+        assert not verify_twilio_signature(url, {**params, "Digits": "4321"}, "0/KCTR6DLpKmkAf8muzZqo1nDgQ=", "12345")
+        assert not verify_twilio_signature(url, params, "0/KCTR6DLpKmkAf8muzZqo1nDgQ=", "54321")
+
+    def test_vonage_signature_methods(self):
+        params = {"msisdn": "15550000001", "text": "STOP & go=now", "timestamp": str(int(time.time()))}
+        data = "".join(
+            f"&{key}={str(value).replace('&', '_').replace('=', '_')}" for key, value in sorted(params.items())
+        )
+        md5hash = hashlib.md5((data + "secret").encode()).hexdigest()
+        sha256 = hmac.new(b"secret", data.encode(), hashlib.sha256).hexdigest().upper()
+
+        assert verify_vonage_signature({**params, "sig": md5hash}, "secret")
+        assert verify_vonage_signature({**params, "sig": sha256}, "secret", method="sha256")
+        assert not verify_vonage_signature({**params, "sig": md5hash}, "other")
+        assert not verify_vonage_signature({**params, "text": "START", "sig": md5hash}, "secret")
+        stale = {**params, "timestamp": str(int(time.time()) - 3600)}
+        assert not verify_vonage_signature({**stale, "sig": md5hash}, "secret")
+
+    def test_inbound_webhook_rejects_unsigned_requests(self, monkeypatch):
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        import api_extended
+
+        monkeypatch.setattr(api_extended, "TWILIO_AUTH_TOKEN", "token")
+        monkeypatch.setenv("BASE_URL", "https://api.example.com")
+        app = FastAPI()
+        app.include_router(api_extended.router)
+        client = TestClient(app)
+        path = f"/api/webhooks/sms/inbound?business_id={BUSINESS_ID}"
+        form = {"From": "+15550000001", "Body": "hello"}
+        signature = base64.b64encode(hmac.new(
+            b"token", ("https://api.example.com" + path + "".join(k + v for k, v in sorted(form.items()))).encode(),
+            hashlib.sha1
+        ).digest()).decode()
+
+        assert client.post(path, data=form).status_code == 403
+        assert client.post(path, data=form, headers={"X-Twilio-Signature": "bogus"}).status_code == 403
+        response = client.post(path, data=form, headers={"X-Twilio-Signature": signature})
+        assert response.status_code == 200 and response.json() == {"status": "received"}
@@ -0,0 +1,276 @@
+"""
+CallBot AI - Website Crawler Tests
+Same-site crawling against a local static HTTP server
+"""
+
+import sys
+import os
+import json
+import threading
+import functools
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from website_crawler import CrawlManager, CrawlState, WebsiteCrawler, normalize_url, parse_html
+
+
+SITE = {
+    "index.html": """<html><head><title>Acme Plumbing</title><style>.x{}</style></head>
+        <body><h1>Welcome</h1><script>var x = 1;</script>
+        <a href="services.html">Services</a> <a href="/pricing.html#top">Pricing</a>
+        <a href="https://elsewhere.example.com/">Partner</a> <a href="mailto:hi@acme.test">Mail</a>
+        <a href="/private/notes.html">Private</a></body></html>""",
+    "services.html": '<html><title>Services</title><body>Drain cleaning. <a href="deep.html">More</a></body></html>',
+    "pricing.html": "<html><title>Pricing</title><body>Service call $89</body></html>",
+    "deep.html": '<html><body>Two links deep <a href="deeper.html">x</a></body></html>',
+    "deeper.html": "<html><body>Three links deep</body></html>",
+    "broken.html": '<html><body><a href="http://[bad/">Bad</a> <a href="pricing.html">Good</a></body></html>',
+    "private/notes.html": "<html><body>Secret</body></html>",
+    "robots.txt": "User-agent: *\nDisallow: /private/\n",
+}
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def site(tmp_path):
+    """Serve SITE from a temp directory; yields (base_url, root_path)"""
+    for name, body in SITE.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(body)
+
+    handler = functools.partial(_QuietHandler, directory=str(tmp_path))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", tmp_path
+    server.shutdown()
+    server.server_close()
+
+
+async def crawl(base_url, state=None, **options):
+    async with httpx.AsyncClient(follow_redirects=True) as client:
+        return await WebsiteCrawler(client=client, **options).crawl(f"{base_url}/index.html", state)
+
+
+def ingest(state, result):
+    """Record every changed page as stored, as scrape_website does after adding them"""
+    for page in result["pages"]:
+        state.record_ingested(page, f"entry:{page['url']}")
+
+
+class TestHtmlProcessing:
+    """Test text and link extraction"""
+
+    def test_parse_html_strips_scripts(self):
+        title, text, links = parse_html(SITE["index.html"])
+        assert title == "Acme Plumbing"
+        assert "Welcome" in text
+        assert "var x" not in text and ".x{}" not in text
+        assert "services.html" in links
+
+    def test_normalize_url(self):
+        assert normalize_url("/a.html#frag", "http://Example.com/b/") == "http://example.com/a.html"
+        assert normalize_url("mailto:x@y.z") is None
+        assert normalize_url("logo.png", "http://example.com/") is None
+        assert normalize_url("http://[bad/", "http://example.com/") is None
+
+
+class TestWebsiteCrawler:
+    """Test crawling a local site"""
+
+    @pytest.mark.asyncio
+    async def test_crawl_same_site_with_depth_and_robots(self, site):
+        base_url, _ = site
+        result = await crawl(base_url, max_depth=2)
+
+        urls = {page["url"] for page in result["pages"]}
+        assert urls == {
+            f"{base_url}/index.html", f"{base_url}/services.html",
+            f"{base_url}/pricing.html", f"{base_url}/deep.html"
+        }
+        assert result["blocked"] == [f"{base_url}/private/notes.html"]
+        assert result["errors"] == []
+
+    @pytest.mark.asyncio
+    async def test_page_budget(self, site):
+        base_url, _ = site
+        result = await crawl(base_url, max_pages=2, max_depth=5)
+        assert result["pages_fetched"] == 2
+        assert len(result["pages"]) == 2
+
+    @pytest.mark.asyncio
+    async def test_recrawl_only_returns_changed_pages(self, site):
+        base_url, root = site
+        state = CrawlState()
+        first = await crawl(base_url, state)
+        assert len(first["pages"]) == 4
+        ingest(state, first)
+
+        # Unchanged site: validators answer 304s, links still followed
+        second = await crawl(base_url, state)
+        assert second["pages"] == []
+        assert len(second["unchanged"]) == 4
+
+        # Rewritten with identical content: the hash catches it
+        os.utime(root / "services.html", (2_000_000_000, 2_000_000_000))
+        (root / "pricing.html").write_text("<html><title>Pricing</title><body>Service call $99</body></html>")
+        os.utime(root / "pricing.html", (2_000_000_000, 2_000_000_000))
+        third = await crawl(base_url, state)
+        assert [page["url"] for page in third["pages"]] == [f"{base_url}/pricing.html"]
+        assert "$99" in third["pages"][0]["content"]
+
+        # Not ingested (the knowledge base add failed): still changed on the next crawl
+        fourth = await crawl(base_url, state)
+        assert [page["url"] for page in fourth["pages"]] == [f"{base_url}/pricing.html"]
+
+    @pytest.mark.asyncio
+    async def test_malformed_link_does_not_stop_the_crawl(self, site):
+        base_url, _ = site
+        async with httpx.AsyncClient() as client:
+            result = await WebsiteCrawler(client=client, concurrency=1).crawl(f"{base_url}/broken.html")
+        assert {page["url"] for page in result["pages"]} == {f"{base_url}/broken.html", f"{base_url}/pricing.html"}
+        assert result["errors"] == []
+
+    @pytest.mark.asyncio
+    async def test_page_error_is_recorded_and_crawl_finishes(self, site):
+        base_url, _ = site
+
+        class _FailingCrawler(WebsiteCrawler):
+            async def _fetch(self, client, url, state, result):
+                if url.endswith("/services.html"):
+                    raise ValueError("boom")
+                return await super()._fetch(client, url, state, result)
+
+        async with httpx.AsyncClient() as client:
+            result = await _FailingCrawler(client=client, concurrency=1).crawl(f"{base_url}/index.html")
+        assert result["errors"] == [{"url": f"{base_url}/services.html", "error": "boom"}]
+        assert f"{base_url}/pricing.html" in {page["url"] for page in result["pages"]}
+
+
+class TestCrawlState:
+    """Test persisting crawl state between processes"""
+
+    @pytest.mark.asyncio
+    async def test_state_round_trips_through_the_table(self, site):
+        base_url, _ = site
+        stored = {}
+
+        class _Connection:
+            async def fetchval(self, query, business_id, site_name):
+                return stored.get((business_id, site_name))
+
+            async def execute(self, query, business_id, site_name, state):
+                stored[(business_id, site_name)] = state
+
+        business_id = "00000000-0000-0000-0000-000000000001"
+        state = await CrawlManager().load_state(_Connection(), business_id, base_url)
+        first = await crawl(base_url, state)
+        ingest(state, first)
+        state.pages[f"{base_url}/pricing.html"].entry_id = "entry_1"
+        await CrawlManager().save_state(_Connection(), business_id, base_url, state)
+
+        # A fresh process picks up the validators and entry ids
+        restored = await CrawlManager().load_state(_Connection(), business_id, base_url)
+        assert restored.pages[f"{base_url}/pricing.html"].entry_id == "entry_1"
+        second = await crawl(base_url, restored)
+        assert second["pages"] == [] and len(second["unchanged"]) == len(first["pages"])
+        assert json.loads(next(iter(stored.values())))["pages"]
+
+
+class _KnowledgeBase:
+    """Stands in for kb_manager: entries by id, optionally failing the next add"""
+
+    def __init__(self):
+        self.entries = {}
+        self.fail_next_add = False
+
+    async def add_entries(self, business_id, entries, filename=None, file_size=None):
+        if self.fail_next_add:
+            self.fail_next_add = False
+            raise ConnectionError("database unavailable")
+        contents = {entry.content for entry in self.entries.values()}
+        added = []
+        for entry in entries:
+            if entry.content not in contents:
+                self.entries[entry.id] = entry
+                contents.add(entry.content)
+                added.append(entry.id)
+        return added
+
+    async def remove_entry(self, business_id, entry_id):
+        return self.entries.pop(entry_id, None) is not None
+
+
+class TestScrapeEndpoint:
+    """Test re-scrapes replacing knowledge base entries"""
+
+    @pytest.fixture
+    def client(self, monkeypatch):
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        import api_extended
+
+        kb = _KnowledgeBase()
+        monkeypatch.setattr(api_extended, "kb_manager", kb)
+        monkeypatch.setattr(api_extended, "CRAWL_STATE_DB_ENABLED", False)
+        monkeypatch.setattr(api_extended, "crawl_manager", CrawlManager())
+        app = FastAPI()
+        app.include_router(api_extended.router)
+        return TestClient(app), kb
+
+    def test_failed_add_keeps_old_entry_and_recrawls(self, site, client):
+        base_url, root = site
+        client, kb = client
+        path = "/api/business/00000000-0000-0000-0000-000000000001/knowledge-base/scrape"
+        body = {"url": f"{base_url}/pricing.html", "max_depth": 0}
+
+        first = client.post(path, json=body).json()
+        assert len(first["entry_ids"]) == 1
+        (root / "pricing.html").write_text("<html><title>Pricing</title><body>Service call $99</body></html>")
+        os.utime(root / "pricing.html", (2_000_000_000, 2_000_000_000))
+
+        kb.fail_next_add = True
+        with pytest.raises(ConnectionError):
+            client.post(path, json=body)
+        assert list(kb.entries) == first["entry_ids"]
+
+        retried = client.post(path, json=body).json()
+        assert retried["pages_changed"] == 1
+        assert list(kb.entries) == retried["entry_ids"]
+        assert "$99" in kb.entries[retried["entry_ids"][0]].content
+
+    def test_duplicate_content_drops_old_entry(self, site, client):
+        base_url, root = site
+        client, kb = client
+        path = "/api/business/00000000-0000-0000-0000-000000000001/knowledge-base/scrape"
+        body = {"url": f"{base_url}/pricing.html", "max_depth": 0}
+
+        first = client.post(path, json=body).json()
+        page = "<html><title>Pricing</title><body>Service call $99</body></html>"
+        # The new text was already uploaded by hand
+        uploaded = next(iter(kb.entries.values()))
+        kb.entries["uploaded"] = type(uploaded)("uploaded", uploaded.business_id, "Price list", parse_html(page)[1])
+        (root / "pricing.html").write_text(page)
+        os.utime(root / "pricing.html", (2_000_000_000, 2_000_000_000))
+
+        second = client.post(path, json=body).json()
+        assert second["entry_ids"] == []
+        assert list(kb.entries) == ["uploaded"]
+        assert first["entry_ids"][0] not in kb.entries
+
+    def test_non_numeric_limits_rejected(self, client):
+        client, _ = client
+        response = client.post(
+            "/api/business/00000000-0000-0000-0000-000000000001/knowledge-base/scrape",
+            json={"url": "https://example.com", "max_pages": "lots"}
+        )
+        assert response.status_code == 400
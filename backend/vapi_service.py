@@ -7,6 +7,12 @@ import os
 import httpx
 from typing import Dict, Optional
 
+from knowledge_base import kb_manager, with_kb_context
+from multilingual import (
+    SupportedLanguage, generate_multilingual_system_prompt, generate_multilingual_first_message
+)
+from prompt_cache import PromptArtifact, prompt_cache, business_version, payload_hash
+
 VAPI_API_KEY = os.getenv("VAPI_API_KEY", "")
 VAPI_BASE_URL = "https://api.vapi.ai"
 
@@ -115,6 +121,49 @@ def generate_first_message(business_data: Dict) -> str:
     return f"Hi, thanks for calling {business_name}! This is {name}, your AI assistant. How can I help you today?"
 
 
+async def get_assistant_prompts(business_data: Dict, language: Optional[str] = None) -> PromptArtifact:
+    """
+    Rendered system prompt (with knowledge base context) and first message.
+
+    Artifacts are cached per (business, business version, KB version,
+    language), so unchanged inputs are never rendered twice.
+    """
+    business_id = str(business_data.get('id') or '')
+    language = (language or business_data.get('primary_language') or 'en').lower()
+    try:
+        lang = SupportedLanguage(language)
+    except ValueError:
+        print(f"Unsupported language {language!r} for business {business_id}, using English")
+        language, lang = 'en', SupportedLanguage.ENGLISH
+
+    kb = kb_version = None
+    if business_id:
+        try:
+            kb = await kb_manager.get(business_id)  # Refresh if another worker changed it
+            kb_version = await kb_manager.kb_version(business_id)
+        except Exception as e:
+            print(f"Knowledge base unavailable for prompt: {e}")
+
+    def render():
+        if language == 'en':
+            system_prompt = generate_system_prompt(business_data)
+            first_message = generate_first_message(business_data)
+        else:
+            system_prompt = generate_multilingual_system_prompt(lang, business_data)
+            first_message = generate_multilingual_first_message(
+                lang,
+                business_data.get('name', 'us'),
+                business_data.get('agent_name', 'Alex')
+            )
+        if kb_version is not None:
+            system_prompt = with_kb_context(kb, system_prompt)
+        return system_prompt, first_message
+
+    return prompt_cache.get_or_render(
+        business_id, business_version(business_data), kb_version, language, render
+    )
+
+
 def get_appointment_booking_tool() -> Dict:
     """Return the appointment booking function tool for Vapi"""
     return {
@@ -185,11 +234,27 @@ def get_transfer_call_tool() -> Dict:
     }
 
 
+def build_update_payload(business_data: Dict, prompts: PromptArtifact) -> Dict:
+    """The fields update_assistant PATCHes (and whose hash decides whether it needs to)"""
+    return {
+        "name": f"{business_data.get('name', 'Business')} - AI Receptionist",
+        "model": {
+            "systemPrompt": prompts.system_prompt,
+            "tools": [
+                get_appointment_booking_tool(),
+                get_transfer_call_tool()
+            ]
+        },
+        "firstMessage": prompts.first_message
+    }
+
+
 async def create_assistant(business_data: Dict, webhook_url: str) -> Dict:
     """Create a Vapi assistant for a business with compliance and quick pickup"""
 
-    system_prompt = generate_system_prompt(business_data)
-    first_message = generate_first_message(business_data)
+    prompts = await get_assistant_prompts(business_data)
+    system_prompt = prompts.system_prompt
+    first_message = prompts.first_message
 
     voice_map = {
         'rachel': '21m00Tcm4TlvDq8ikWAM',  # Rachel - warm female
@@ -253,28 +318,22 @@ async def create_assistant(business_data: Dict, webhook_url: str) -> Dict:
         )
 
         if response.status_code == 201:
-            return {"success": True, "assistant": response.json()}
+            assistant = response.json()
+            if assistant.get("id"):
+                prompt_cache.mark_pushed(assistant["id"], payload_hash(build_update_payload(business_data, prompts)))
+            return {"success": True, "assistant": assistant}
         else:
             return {"success": False, "error": response.text}
 
 
-async def update_assistant(assistant_id: str, business_data: Dict) -> Dict:
-    """Update an existing Vapi assistant"""
+async def update_assistant(assistant_id: str, business_data: Dict, force: bool = False) -> Dict:
+    """Update an existing Vapi assistant (skipped if nothing it would send has changed)"""
 
-    system_prompt = generate_system_prompt(business_data)
-    first_message = generate_first_message(business_data)
-
-    payload = {
-        "name": f"{business_data.get('name', 'Business')} - AI Receptionist",
-        "model": {
-            "systemPrompt": system_prompt,
-            "tools": [
-                get_appointment_booking_tool(),
-                get_transfer_call_tool()
-            ]
-        },
-        "firstMessage": first_message
-    }
+    prompts = await get_assistant_prompts(business_data)
+    payload = build_update_payload(business_data, prompts)
+    fingerprint = payload_hash(payload)
+    if not force and not prompt_cache.needs_push(assistant_id, fingerprint):
+        return {"success": True, "unchanged": True}
 
     async with httpx.AsyncClient() as client:
         response = await client.patch(
@@ -285,6 +344,7 @@ async def update_assistant(assistant_id: str, business_data: Dict) -> Dict:
         )
 
         if response.status_code == 200:
+            prompt_cache.mark_pushed(assistant_id, fingerprint)
             return {"success": True, "assistant": response.json()}
         else:
             return {"success": False, "error": response.text}
@@ -298,7 +358,10 @@ async def delete_assistant(assistant_id: str) -> bool:
             headers=get_headers(),
             timeout=30.0
         )
-        return response.status_code == 200
+        if response.status_code == 200:
+            prompt_cache.forget_assistant(assistant_id)
+            return True
+        return False
 
 
 async def get_assistant(assistant_id: str) -> Optional[Dict]:
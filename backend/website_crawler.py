@@ -0,0 +1,440 @@
+"""
+Website Crawler for CallBot AI
+Concurrent, incremental same-site crawling for knowledge base scraping
+"""
+
+import os
+import re
+import json
+import uuid
+import asyncio
+import hashlib
+from datetime import datetime
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import urljoin, urldefrag, urlparse
+from urllib.robotparser import RobotFileParser
+
+import httpx
+
+# Configuration
+CRAWL_USER_AGENT = "CallBotAI Knowledge Scraper/1.0"
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "5"))
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "50"))
+CRAWL_MAX_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH", "2"))
+CRAWL_TIMEOUT_SECONDS = float(os.getenv("CRAWL_TIMEOUT_SECONDS", "15"))
+CRAWL_STATE_DB_ENABLED = bool(os.getenv("DATABASE_URL"))
+MAX_PAGE_CHARS = 50000
+
+SKIPPED_EXTENSIONS = {
+    ".jpg", ".jpeg", ".png", ".gif", ".svg", ".webp", ".ico", ".pdf", ".zip",
+    ".mp3", ".mp4", ".mov", ".css", ".js", ".xml", ".json", ".woff", ".woff2"
+}
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+# =============================================================================
+# HTML Processing
+# =============================================================================
+
+class _PageParser(HTMLParser):
+    """Collects visible text, title and links in one pass"""
+
+    SKIP_TAGS = {"script", "style", "noscript", "template", "svg"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.links: List[str] = []
+        self.text: List[str] = []
+        self.title = ""
+        self._skip_depth = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag == "title":
+            self._in_title = True
+        elif tag == "a":
+            href = dict(attrs).get("href")
+            if href:
+                self.links.append(href)
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag == "title":
+            self._in_title = False
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        if self._in_title:
+            self.title += data
+        else:
+            self.text.append(data)
+
+
+def parse_html(html: str) -> Tuple[str, str, List[str]]:
+    """Return (title, text, raw hrefs) for an HTML page"""
+    parser = _PageParser()
+    parser.feed(html)
+    parser.close()
+
+    text = re.sub(r'\s+', ' ', " ".join(parser.text)).strip()
+    text = re.sub(r'Cookie Policy.*?Accept', '', text, flags=re.IGNORECASE)
+    return parser.title.strip(), text, parser.links
+
+
+def normalize_url(url: str, base: Optional[str] = None) -> Optional[str]:
+    """Resolve a link against base and drop fragments; None for non-http or malformed links"""
+    try:
+        if base:
+            url = urljoin(base, url)
+        url, _ = urldefrag(url)
+        parsed = urlparse(url)
+    except ValueError:
+        return None
+    if parsed.scheme not in ("http", "https") or not parsed.netloc:
+        return None
+    path = parsed.path or "/"
+    if os.path.splitext(path)[1].lower() in SKIPPED_EXTENSIONS:
+        return None
+    normalized = f"{parsed.scheme}://{parsed.netloc.lower()}{path}"
+    if parsed.query:
+        normalized += f"?{parsed.query}"
+    return normalized
+
+
+def same_site(url: str, root: str) -> bool:
+    host = urlparse(url).netloc.lower()
+    root_host = urlparse(root).netloc.lower()
+    return host.removeprefix("www.") == root_host.removeprefix("www.")
+
+
+def content_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+# =============================================================================
+# HTTP Client
+# =============================================================================
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_crawl_client() -> httpx.AsyncClient:
+    """Shared pooled client for crawling (HTTP/2 when h2 is installed)"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            headers={"User-Agent": CRAWL_USER_AGENT},
+            timeout=httpx.Timeout(CRAWL_TIMEOUT_SECONDS, connect=5.0),
+            limits=httpx.Limits(max_connections=CRAWL_CONCURRENCY * 4, max_keepalive_connections=CRAWL_CONCURRENCY * 2),
+            follow_redirects=True
+        )
+    return _client
+
+
+async def close_crawl_client():
+    """Close the shared client (call on app shutdown)"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+# =============================================================================
+# Crawl State
+# =============================================================================
+
+class PageRecord:
+    """What we remember about a crawled page between crawls"""
+
+    __slots__ = ("url", "etag", "last_modified", "content_hash", "links", "entry_id", "crawled_at")
+
+    def __init__(self, url: str, etag: str = None, last_modified: str = None,
+                 content_hash: str = None, links: List[str] = None, entry_id: str = None):
+        self.url = url
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_hash = content_hash
+        self.links = links or []
+        self.entry_id = entry_id
+        self.crawled_at = datetime.utcnow()
+
+    def to_dict(self) -> Dict:
+        return {
+            "url": self.url,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "content_hash": self.content_hash,
+            "links": self.links,
+            "entry_id": self.entry_id
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "PageRecord":
+        return cls(
+            data["url"], data.get("etag"), data.get("last_modified"),
+            data.get("content_hash"), data.get("links"), data.get("entry_id")
+        )
+
+
+class CrawlState:
+    """Per-site validators and hashes so re-crawls skip unchanged pages"""
+
+    def __init__(self):
+        self.pages: Dict[str, PageRecord] = {}
+
+    def to_dict(self) -> Dict:
+        return {"pages": [p.to_dict() for p in self.pages.values()]}
+
+    def record_ingested(self, page: Dict, entry_id: Optional[str] = None):
+        """Remember a changed page (from crawl results) once its content is in the knowledge base"""
+        record = self.pages.get(page["url"])
+        if record is None:
+            record = self.pages[page["url"]] = PageRecord(page["url"])
+        record.etag = page.get("etag")
+        record.last_modified = page.get("last_modified")
+        record.content_hash = page["content_hash"]
+        record.entry_id = entry_id
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "CrawlState":
+        state = cls()
+        for page in data.get("pages", []):
+            record = PageRecord.from_dict(page)
+            state.pages[record.url] = record
+        return state
+
+
+# =============================================================================
+# Crawler
+# =============================================================================
+
+class WebsiteCrawler:
+    """
+    Breadth-first same-site crawler with a worker pool.
+
+    Pages are fetched at most max_depth links away from the start URL and
+    at most max_pages in total. Only pages whose content hash changed since
+    the last crawl are returned as changed.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient = None,
+        max_pages: int = CRAWL_MAX_PAGES,
+        max_depth: int = CRAWL_MAX_DEPTH,
+        concurrency: int = CRAWL_CONCURRENCY,
+        respect_robots: bool = True
+    ):
+        self.client = client
+        self.max_pages = max_pages
+        self.max_depth = max_depth
+        self.concurrency = concurrency
+        self.respect_robots = respect_robots
+
+    async def _load_robots(self, client: httpx.AsyncClient, root: str) -> Optional[RobotFileParser]:
+        if not self.respect_robots:
+            return None
+        parsed = urlparse(root)
+        robots_url = f"{parsed.scheme}://{parsed.netloc}/robots.txt"
+        parser = RobotFileParser(robots_url)
+        try:
+            response = await client.get(robots_url)
+        except httpx.HTTPError:
+            return None
+        if response.status_code in (401, 403):
+            parser.disallow_all = True
+        elif response.status_code == 200:
+            parser.parse(response.text.splitlines())
+        else:
+            return None
+        return parser
+
+    async def crawl(self, start_url: str, state: CrawlState = None) -> Dict:
+        """Crawl a site; returns changed pages plus counts of everything else"""
+        state = state or CrawlState()
+        root = normalize_url(start_url)
+        if not root:
+            return {"success": False, "error": "Invalid URL"}
+
+        client = self.client or get_crawl_client()
+        robots = await self._load_robots(client, root)
+
+        queue: asyncio.Queue = asyncio.Queue()
+        seen: Set[str] = {root}
+        queue.put_nowait((root, 0))
+        budget = {"remaining": self.max_pages}
+
+        result = {
+            "success": True,
+            "url": root,
+            "pages": [],
+            "unchanged": [],
+            "blocked": [],
+            "errors": [],
+            "http2": HTTP2_AVAILABLE
+        }
+
+        async def worker():
+            while True:
+                url, depth = await queue.get()
+                try:
+                    if budget["remaining"] <= 0:
+                        continue
+                    if robots and not robots.can_fetch(CRAWL_USER_AGENT, url):
+                        result["blocked"].append(url)
+                        continue
+                    budget["remaining"] -= 1
+                    links = await self._fetch(client, url, state, result)
+                    if depth < self.max_depth:
+                        for link in links:
+                            if link not in seen and same_site(link, root):
+                                seen.add(link)
+                                queue.put_nowait((link, depth + 1))
+                except Exception as e:
+                    # One bad page must not kill the worker (queue.join would never return)
+                    result["errors"].append({"url": url, "error": str(e) or type(e).__name__})
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            await queue.join()
+        finally:
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        result["pages_fetched"] = self.max_pages - budget["remaining"]
+        result["extracted_chars"] = sum(len(p["content"]) for p in result["pages"])
+        return result
+
+    async def _fetch(self, client: httpx.AsyncClient, url: str, state: CrawlState, result: Dict) -> List[str]:
+        """Fetch one page, recording it in result; returns its outbound links"""
+        record = state.pages.get(url)
+        headers = {}
+        if record:
+            if record.etag:
+                headers["If-None-Match"] = record.etag
+            if record.last_modified:
+                headers["If-Modified-Since"] = record.last_modified
+
+        try:
+            response = await client.get(url, headers=headers)
+        except httpx.HTTPError as e:
+            result["errors"].append({"url": url, "error": str(e) or type(e).__name__})
+            return []
+
+        if response.status_code == 304 and record:
+            result["unchanged"].append(url)
+            return record.links
+
+        if response.status_code != 200:
+            result["errors"].append({"url": url, "error": f"HTTP {response.status_code}"})
+            return []
+
+        content_type = response.headers.get("content-type", "text/html")
+        if "html" not in content_type and "text/plain" not in content_type:
+            return []
+
+        if "html" in content_type:
+            title, text, hrefs = parse_html(response.text)
+        else:
+            title, text, hrefs = "", re.sub(r'\s+', ' ', response.text).strip(), []
+
+        # Links resolve against the final URL after redirects
+        final_url = str(response.url)
+        links = []
+        for href in hrefs:
+            link = normalize_url(href, final_url)
+            if link:
+                links.append(link)
+
+        digest = content_hash(text)
+        unchanged = record is not None and record.content_hash == digest
+
+        if record is None:
+            record = state.pages[url] = PageRecord(url)
+        record.links = links
+        record.crawled_at = datetime.utcnow()
+
+        if unchanged:
+            record.etag = response.headers.get("etag")
+            record.last_modified = response.headers.get("last-modified")
+            result["unchanged"].append(url)
+        else:
+            # Validators and hash are kept by record_ingested once the page is stored,
+            # so a page that fails to ingest comes back as changed next crawl
+            result["pages"].append({
+                "url": url,
+                "title": title or url,
+                "content": text[:MAX_PAGE_CHARS],
+                "content_hash": digest,
+                "etag": response.headers.get("etag"),
+                "last_modified": response.headers.get("last-modified")
+            })
+        return links
+
+
+class CrawlManager:
+    """
+    Keeps crawl state per business and site so re-scrapes are incremental.
+    With a database the state is stored in crawl_states, so it survives
+    restarts and is shared by workers.
+    """
+
+    def __init__(self):
+        self.states: Dict[str, Dict[str, CrawlState]] = {}
+
+    @staticmethod
+    def site_of(start_url: str) -> str:
+        return urlparse(normalize_url(start_url) or start_url).netloc
+
+    def get_state(self, business_id: str, start_url: str) -> CrawlState:
+        site = self.site_of(start_url)
+        sites = self.states.setdefault(business_id, {})
+        if site not in sites:
+            sites[site] = CrawlState()
+        return sites[site]
+
+    async def load_state(self, conn, business_id: str, start_url: str) -> CrawlState:
+        """The stored state for this site (conn None: this process's copy only)"""
+        if conn is None:
+            return self.get_state(business_id, start_url)
+        site = self.site_of(start_url)
+        stored = await conn.fetchval(
+            "SELECT state FROM crawl_states WHERE business_id = $1 AND site = $2",
+            uuid.UUID(business_id), site
+        )
+        if stored is None:
+            state = CrawlState()
+        else:
+            state = CrawlState.from_dict(json.loads(stored) if isinstance(stored, str) else stored)
+        self.states.setdefault(business_id, {})[site] = state
+        return state
+
+    async def save_state(self, conn, business_id: str, start_url: str, state: CrawlState):
+        if conn is None:
+            return
+        await conn.execute(
+            """
+            INSERT INTO crawl_states (business_id, site, state, updated_at)
+            VALUES ($1, $2, $3::jsonb, NOW())
+            ON CONFLICT (business_id, site) DO UPDATE SET state = EXCLUDED.state, updated_at = NOW()
+            """,
+            uuid.UUID(business_id), self.site_of(start_url), json.dumps(state.to_dict())
+        )
+
+
+# Global crawl manager
+crawl_manager = CrawlManager()